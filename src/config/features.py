@@ -38,6 +38,7 @@ class FeatureFlags(metaclass=FeatureFlagsMeta):
         'ENABLE_BALANCE_CONSISTENCY_CHECK': False,
         'ENABLE_EOD_DEBUG_LOGGING': True,
         'ENABLE_PERFORMANCE_MONITORING': False,
+        'ENABLE_SET_BASED_THEORETICAL_BALANCE': True,  # 日结步骤3按集合计算理论余额（关闭时回退逐币种计算）
     }
     
     # 缓存配置（避免频繁数据库查询）
@@ -14,6 +14,35 @@ dotenv_path = os.path.join(project_root, '.env')
 load_dotenv(dotenv_path)
 print(f"[ENV] 加载环境配置文件: {dotenv_path}")
 
+def _write_if_changed(path, content, normalize=None):
+    """
+    内容有变化时才写入文件，返回是否写入
+    normalize 用于比较前去掉生成时间等每次都会变化的部分
+    """
+    normalize = normalize or (lambda text: text)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            if normalize(f.read()) == normalize(content):
+                return False
+    except (OSError, ValueError):
+        pass
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return True
+
+
+def _without_generated_at(text):
+    """比较 environment_config.json 时忽略 generated_at"""
+    data = json.loads(text)
+    data.pop('generated_at', None)
+    return data
+
+
+def _without_header_comment(text):
+    """比较 env-config.js 时忽略首行的生成时间注释"""
+    return text.split('\n', 1)[-1]
+
+
 # 自动同步环境配置到所有配置文件
 def auto_sync_environment():
     """自动同步.env到所有配置文件（.env.local, environment_config.json, env-config.js）"""
@@ -35,9 +64,8 @@ VUE_APP_CURRENT_IP={current_ip}
 VUE_APP_BACKEND_PORT={backend_port}
 VUE_APP_FRONTEND_PORT={frontend_port}
 """
-        with open(env_local_path, 'w', encoding='utf-8') as f:
-            f.write(env_local_content)
-        print(f"[ENV] [OK] .env.local 已同步")
+        if _write_if_changed(env_local_path, env_local_content):
+            print(f"[ENV] [OK] .env.local 已同步")
 
         # 2. 更新 environment_config.json
         config_path = os.path.join(project_root, 'environment_config.json')
@@ -61,9 +89,8 @@ VUE_APP_FRONTEND_PORT={frontend_port}
                 f"http://{current_ip}:5173"
             ]
         }
-        with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(config_data, f, indent=2, ensure_ascii=False)
-        print(f"[ENV] [OK] environment_config.json 已同步")
+        if _write_if_changed(config_path, json.dumps(config_data, indent=2, ensure_ascii=False), _without_generated_at):
+            print(f"[ENV] [OK] environment_config.json 已同步")
 
         # 3. 更新 src/static/env-config.js
         default_branch = os.getenv('DEFAULT_BRANCH', 'A005')
@@ -85,11 +112,10 @@ console.log('[ENV_CONFIG] CURRENT_IP:', window.ENV_CONFIG.CURRENT_IP);
         static_dir = os.path.join(project_root, 'src', 'static')
         os.makedirs(static_dir, exist_ok=True)
         env_config_path = os.path.join(static_dir, 'env-config.js')
-        with open(env_config_path, 'w', encoding='utf-8') as f:
-            f.write(env_config_js)
-        print(f"[ENV] [OK] src/static/env-config.js 已同步")
+        if _write_if_changed(env_config_path, env_config_js, _without_header_comment):
+            print(f"[ENV] [OK] src/static/env-config.js 已同步")
 
-        print(f"[ENV] 所有配置文件已自动同步！")
+        print(f"[ENV] 配置文件同步检查完成")
         return True
     except Exception as e:
         print(f"[ENV] [WARNING] 配置同步失败: {e}")
@@ -106,55 +132,16 @@ from utils.safe_error_handler import safe_error_response
 from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler
 from config.log_config import LogConfig
 
-# Import blueprints
-# 然后将相对导入改为从exchange_system开始的导入
-from routes.app_rates import rates_bp
-from routes.app_end_of_day import end_of_day_bp
-from routes.app_query_transactions import transactions_bp
-from routes.app_query_balances import balances_bp  # 保留blueprint定义
-# operators_bp 已删除，功能合并到 user_bp
-from routes.app_roles import roles_bp
-from routes.app_auth import auth_bp
-from routes.app_dashboard import dashboard_bp
-from routes.app_system import system_bp
-from routes.app_exchange import exchange_bp
-from routes.app_currencies import currencies_bp
-from routes.app_balance import balance_bp
-from routes.app_reversal_query import reversal_query_bp
-from routes.app_balance_adjust_query import balance_adjust_query_bp
-from routes.app_user_management import user_bp
-from routes.app_user_management import perm_bp
-from routes.app_profile import profile_bp
-
-from routes.app_print_settings import print_settings_bp
-from routes.app_log_management import log_management_bp
-from routes.app_currency_management import currency_management_bp
-from routes.app_standards_management import standards_management_bp
-from routes.app_purpose_limits import purpose_limits_bp
-from routes.app_income_query import income_query_bp
-from routes.app_foreign_stock_query import foreign_stock_query_bp
-from routes.app_local_stock_query import local_stock_bp
-from routes.app_transaction_alerts import transaction_alerts_bp
-from routes.app_operating_status import operating_status_bp
-from routes.app_reports import reports_bp
-from routes.app_eod_step import eod_step_bp
-from routes.app_eod_migration import eod_migration_bp
-from routes.app_dual_direction_migration import dual_direction_migration_bp
-from routes.app_receipt_migration import receipt_migration_bp
-from routes.app_feature_flags import app_feature_flags
-from routes.app_denominations import denomination_bp
-from routes.app_denominations_api import denominations_api_bp
-from routes.batch_publish_api import batch_publish_bp
-from routes.batch_display_api import batch_display_bp
-from routes.app_repform import app_repform
-from routes.app_amlo import app_amlo
-from routes.app_bot import app_bot
-from routes.app_report_numbers import report_number_bp
-from routes.app_compliance import app_compliance
+# 蓝图在 create_app() 中按注册表导入（routes/registry.py）
+from routes.registry import register_blueprints
 
 # Import services and models
 from services.db_service import DatabaseService, shutdown_session
 from services.auth_service import token_required, has_permission
+from services.compliance_outbox_service import ComplianceOutboxWorker
+from services.request_tracing import RequestTracer
+from services.index_advisor import IndexAdvisor
+from services.query_budget import QueryBudget
 from models.exchange_models import Currency
 # 导入所有模型以确保SQLAlchemy可以找到它们
 from models import denomination_models, report_models
@@ -626,17 +613,27 @@ def create_app():
          expose_headers=["Content-Type", "Authorization", "Access-Control-Allow-Origin"]
     )
     
+    # 请求追踪：请求ID、片段耗时、接口延迟直方图（/metrics）
+    RequestTracer.init_app(app)
+    # 设置 INDEX_ADVISOR_OUTPUT 时收集查询条件（scripts/index_advisor.py）
+    IndexAdvisor.init_from_env()
+    # 设置 QUERY_BUDGET_ENABLED 时按接口统计SQL语句数并检查预算
+    QueryBudget.init_from_env(app)
+
     # 添加全局OPTIONS处理
     @app.before_request
     def handle_preflight():
-        # 添加请求日志
-        print(f"\n========== [Flask] 收到请求 ==========", flush=True)
-        print(f"[Flask] {request.method} {request.path}", flush=True)
-        print(f"[Flask] Remote: {request.remote_addr}", flush=True)
-        print(f"[Flask] Headers: {dict(request.headers)}", flush=True)
+        # 逐请求日志只在 VERBOSE_REQUEST_LOG=true 时输出，避免高负载下控制台I/O拖慢请求
+        verbose = RequestTracer.verbose()
+        if verbose:
+            print(f"\n========== [Flask] 收到请求 {RequestTracer.current_request_id()} ==========", flush=True)
+            print(f"[Flask] {request.method} {request.path}", flush=True)
+            print(f"[Flask] Remote: {request.remote_addr}", flush=True)
+            print(f"[Flask] Headers: {dict(request.headers)}", flush=True)
 
         if request.method == "OPTIONS":
-            print(f"[Flask] OPTIONS预检请求，返回CORS头", flush=True)
+            if verbose:
+                print(f"[Flask] OPTIONS预检请求，返回CORS头", flush=True)
             response = make_response()
             origin = request.headers.get('Origin')
 
@@ -660,51 +657,13 @@ def create_app():
         return response
     
     # Register blueprints with /api prefix
-    app.register_blueprint(rates_bp)  # 已经包含 /api 前缀
-    app.register_blueprint(end_of_day_bp)  # 已经包含 /api 前缀
-    app.register_blueprint(transactions_bp)  # Already has /api prefix
-    app.register_blueprint(balances_bp)  # 保留blueprint注册
-    # operators_bp 已删除，功能合并到 user_bp
-    app.register_blueprint(roles_bp)  # Already has /api prefix
-    app.register_blueprint(auth_bp)  # 已经包含 /api 前缀
-    app.register_blueprint(dashboard_bp)  # 已经包含 /api 前缀
-    app.register_blueprint(system_bp)  # 已经包含 /api 前缀
-    app.register_blueprint(exchange_bp)  # 已经包含 /api 前缀
-    app.register_blueprint(currencies_bp)  # 已经包含 /api 前缀
-    app.register_blueprint(balance_bp)  # 已经包含 /api 前缀
-    app.register_blueprint(reversal_query_bp)  # 已经包含 /api 前缀
-    app.register_blueprint(balance_adjust_query_bp)  # 已经包含 /api 前缀
-    app.register_blueprint(user_bp)  # 用户管理蓝图，已经包含 /api 前缀
-    app.register_blueprint(perm_bp)  # 权限管理蓝图，已经包含 /api 前缀
-    app.register_blueprint(profile_bp)  # 个人信息蓝图，已经包含 /api 前缀
-    app.register_blueprint(print_settings_bp)  # 新增：打印设置蓝图
-    app.register_blueprint(log_management_bp)  # 新增：日志管理蓝图
-    app.register_blueprint(currency_management_bp)  # 币种管理蓝图
-    app.register_blueprint(standards_management_bp)  # 规范管理蓝图
-    app.register_blueprint(purpose_limits_bp)  # 交易用途限额蓝图
-    app.register_blueprint(income_query_bp)  # 动态收入查询蓝图
-    app.register_blueprint(foreign_stock_query_bp)  # 库存外币查询蓝图
-    app.register_blueprint(local_stock_bp)  # 本币库存查询蓝图
-    app.register_blueprint(transaction_alerts_bp)  # 交易报警事件蓝图
-    app.register_blueprint(operating_status_bp)  # 营业状态管理蓝图
-    app.register_blueprint(reports_bp)  # 报表查询蓝图
-    app.register_blueprint(eod_step_bp)  # 日结步骤管理蓝图
-    app.register_blueprint(eod_migration_bp)  # EOD迁移管理蓝图
-    app.register_blueprint(dual_direction_migration_bp)  # 双向交易迁移管理蓝图
-    app.register_blueprint(receipt_migration_bp)  # 收据增强迁移管理蓝图
-    app.register_blueprint(app_feature_flags, url_prefix='/api')  # 特性开关管理蓝图
-    app.register_blueprint(denomination_bp)  # 面值管理蓝图
-    app.register_blueprint(denominations_api_bp)  # 面值汇率API蓝图
-    app.register_blueprint(batch_publish_bp)  # 批次发布API蓝图
-    app.register_blueprint(batch_display_bp)  # 批次显示API蓝图
-    app.register_blueprint(app_repform)  # RepForm核心API蓝图
-    app.register_blueprint(app_amlo)  # AMLO审核API蓝图
-    app.register_blueprint(app_bot)  # BOT报告API蓝图
-    app.register_blueprint(report_number_bp)  # 报告编号管理API蓝图
-    app.register_blueprint(app_compliance)  # 合规配置API蓝图
+    register_blueprints(app)
 
     # Register teardown function to cleanup database sessions
     app.teardown_appcontext(shutdown_session)
+
+    # 合规发件箱线程池和巡检线程随应用启动，上次退出前未处理完的任务不必等到下一笔交易才补处理
+    ComplianceOutboxWorker.start()
     
     @app.route('/health', methods=['GET'])
     def health_check():
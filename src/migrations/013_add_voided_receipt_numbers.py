@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+数据库迁移: 创建作废票据编号表
+
+迁移版本: 013
+功能: 票据编号改为独立短事务分配后，外层交易事务回滚时写入作废记录，
+      交易记录编号 ∪ 作废编号 保持每日严格连续
+"""
+
+import os
+import sys
+
+# Ensure project root is on sys.path to reuse existing services
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from services.db_service import engine  # noqa: E402
+from models.exchange_models import Base, VoidedReceiptNumber  # noqa: E402
+
+
+def upgrade():
+    """执行迁移：创建 voided_receipt_numbers 表"""
+    Base.metadata.create_all(engine, tables=[VoidedReceiptNumber.__table__])
+    print("✅ 已创建 voided_receipt_numbers 表")
+    return True
+
+
+def downgrade():
+    """回滚迁移：删除 voided_receipt_numbers 表"""
+    VoidedReceiptNumber.__table__.drop(engine, checkfirst=True)
+    print("✅ 已删除 voided_receipt_numbers 表")
+    return True
+
+
+if __name__ == "__main__":
+    upgrade()
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+数据库迁移: 创建合规检查发件箱表
+
+迁移版本: 014
+功能: 交易与合规检查任务在同一事务中写入，AMLO/BOT 记录改由后台工作线程异步生成，
+      前端通过 /api/exchange/compliance/<transaction_id> 查询处理结果
+"""
+
+import os
+import sys
+
+# Ensure project root is on sys.path to reuse existing services
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from services.db_service import engine  # noqa: E402
+from models.exchange_models import Base, ComplianceOutbox  # noqa: E402
+
+
+def upgrade():
+    """执行迁移：创建 compliance_outbox 表"""
+    Base.metadata.create_all(engine, tables=[ComplianceOutbox.__table__])
+    print("✅ 已创建 compliance_outbox 表")
+    return True
+
+
+def downgrade():
+    """回滚迁移：删除 compliance_outbox 表"""
+    ComplianceOutbox.__table__.drop(engine, checkfirst=True)
+    print("✅ 已删除 compliance_outbox 表")
+    return True
+
+
+if __name__ == "__main__":
+    upgrade()
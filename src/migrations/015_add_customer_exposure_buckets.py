@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+数据库迁移: 创建客户累计额度桶表
+
+迁移版本: 015
+功能: 按 客户+网点+交易日期+小时 汇总已完成交易，AMLO/BOT 累计检查不再对
+      exchange_transactions 做全表聚合；同时为 exchange_transactions 增加
+      (customer_id, created_at) 索引，并从历史交易重建额度桶
+"""
+
+import os
+import sys
+
+# Ensure project root is on sys.path to reuse existing services
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import inspect  # noqa: E402
+
+from services.db_service import engine, SessionLocal  # noqa: E402
+from models.exchange_models import Base, CustomerExposureBucket, ExchangeTransaction  # noqa: E402
+from services.customer_exposure_service import CustomerExposureService  # noqa: E402
+
+CUSTOMER_INDEX = 'idx_exchange_tx_customer_created'
+
+
+def _customer_index():
+    return next(index for index in ExchangeTransaction.__table__.indexes if index.name == CUSTOMER_INDEX)
+
+
+def upgrade():
+    """执行迁移：创建 customer_exposure_buckets 表、交易表客户索引，并重建额度桶"""
+    Base.metadata.create_all(engine, tables=[CustomerExposureBucket.__table__])
+    print("✅ 已创建 customer_exposure_buckets 表")
+
+    existing = {index['name'] for index in inspect(engine).get_indexes('exchange_transactions')}
+    if CUSTOMER_INDEX not in existing:
+        _customer_index().create(engine)
+        print(f"✅ 已创建索引 {CUSTOMER_INDEX}")
+
+    session = SessionLocal()
+    try:
+        count = CustomerExposureService.rebuild(session)
+        session.commit()
+        print(f"✅ 已从历史交易重建 {count} 个额度桶")
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    return True
+
+
+def downgrade():
+    """回滚迁移：删除 customer_exposure_buckets 表和交易表客户索引"""
+    CustomerExposureBucket.__table__.drop(engine, checkfirst=True)
+    existing = {index['name'] for index in inspect(engine).get_indexes('exchange_transactions')}
+    if CUSTOMER_INDEX in existing:
+        _customer_index().drop(engine)
+    print("✅ 已删除 customer_exposure_buckets 表")
+    return True
+
+
+if __name__ == "__main__":
+    upgrade()
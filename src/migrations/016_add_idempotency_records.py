@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+数据库迁移: 创建幂等请求记录表
+
+迁移版本: 016
+功能: 交易类接口按 Idempotency-Key 保存执行结果，重复提交/网络重试直接返回首次结果，
+      并发的重复请求等待首个请求完成，不再重复过账
+"""
+
+import os
+import sys
+
+# Ensure project root is on sys.path to reuse existing services
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from services.db_service import engine  # noqa: E402
+from models.exchange_models import Base, IdempotencyRecord  # noqa: E402
+
+
+def upgrade():
+    """执行迁移：创建 idempotency_records 表"""
+    Base.metadata.create_all(engine, tables=[IdempotencyRecord.__table__])
+    print("✅ 已创建 idempotency_records 表")
+    return True
+
+
+def downgrade():
+    """回滚迁移：删除 idempotency_records 表"""
+    IdempotencyRecord.__table__.drop(engine, checkfirst=True)
+    print("✅ 已删除 idempotency_records 表")
+    return True
+
+
+if __name__ == "__main__":
+    upgrade()
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+数据库迁移: 创建认证主体版本表
+
+迁移版本: 017
+功能: 用户、角色或权限变更时递增版本号，各工作进程的登录用户信息缓存（PrincipalCache）
+      定期读取该表，使其他进程中缓存的旧权限失效
+"""
+
+import os
+import sys
+
+# Ensure project root is on sys.path to reuse existing services
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from services.db_service import engine  # noqa: E402
+from models.exchange_models import Base, AuthPrincipalVersion  # noqa: E402
+
+
+def upgrade():
+    """执行迁移：创建 auth_principal_versions 表"""
+    Base.metadata.create_all(engine, tables=[AuthPrincipalVersion.__table__])
+    print("✅ 已创建 auth_principal_versions 表")
+    return True
+
+
+def downgrade():
+    """回滚迁移：删除 auth_principal_versions 表"""
+    AuthPrincipalVersion.__table__.drop(engine, checkfirst=True)
+    print("✅ 已删除 auth_principal_versions 表")
+    return True
+
+
+if __name__ == "__main__":
+    upgrade()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+数据库迁移: 为交易表增加热点查询索引
+
+迁移版本: 018
+功能: 为 exchange_transactions 增加热点查询条件的复合索引（由 scripts/index_advisor.py 根据实际执行的查询生成，
+      业务组索引为补充：双向交易按 网点+业务组 查询、打印和反结算）；
+      已存在的同名索引跳过（已执行过本迁移的数据库重新执行即补建新增的索引），回滚时只删除本迁移创建的索引
+"""
+
+import os
+import sys
+
+# Ensure project root is on sys.path to reuse existing services
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import Index, inspect  # noqa: E402
+
+from services.db_service import engine  # noqa: E402
+from models.exchange_models import Base  # noqa: E402
+
+# (表名, 索引名, 列)
+INDEXES = [
+    ('exchange_transactions', 'idx_exchange_transactions_branch_id_created_at', ('branch_id', 'created_at')),
+    ('exchange_transactions', 'idx_exchange_transactions_branch_id_currency_id_created_at', ('branch_id', 'currency_id', 'created_at')),
+    ('exchange_transactions', 'idx_exchange_transactions_branch_id_transaction_date', ('branch_id', 'transaction_date')),
+    ('exchange_transactions', 'idx_exchange_transactions_receipt_filename', ('receipt_filename',)),
+    ('exchange_transactions', 'idx_exchange_transactions_customer_id_transaction_date', ('customer_id', 'transaction_date')),
+    ('exchange_transactions', 'idx_exchange_transactions_branch_id_business_group_id', ('branch_id', 'business_group_id')),
+]
+
+
+def _index(table_name, name, columns):
+    table = Base.metadata.tables[table_name]
+    declared = next((index for index in table.indexes if index.name == name), None)
+    return declared if declared is not None else Index(name, *(table.c[column] for column in columns))
+
+
+def _existing(table_name):
+    return {index['name'] for index in inspect(engine).get_indexes(table_name)}
+
+
+def upgrade():
+    """执行迁移：创建索引"""
+    for table_name, name, columns in INDEXES:
+        if name in _existing(table_name):
+            print(f"⏭️  索引 {name} 已存在")
+            continue
+        _index(table_name, name, columns).create(engine)
+        print(f"✅ 已创建索引 {name} ({', '.join(columns)})")
+    return True
+
+
+def downgrade():
+    """回滚迁移：删除索引"""
+    for table_name, name, columns in INDEXES:
+        if name in _existing(table_name):
+            _index(table_name, name, columns).drop(engine)
+            print(f"✅ 已删除索引 {name}")
+    return True
+
+
+if __name__ == "__main__":
+    upgrade()
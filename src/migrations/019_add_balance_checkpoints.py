@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+数据库迁移: 创建余额检查点表
+
+迁移版本: 019
+功能: 按 网点+币种 只追加记录日结完成、日间定时和首笔交易时点的账面余额，
+      日结期初余额、期间变动和库存报表从最近的检查点加其后的交易增量计算；
+      同时为已有的已完成日结和各币种首笔交易补写检查点
+"""
+
+import os
+import sys
+
+# Ensure project root is on sys.path to reuse existing services
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from services.db_service import engine, SessionLocal  # noqa: E402
+from models.exchange_models import Base, BalanceCheckpoint  # noqa: E402
+from services.balance_checkpoint_service import BalanceCheckpointService  # noqa: E402
+
+
+def upgrade():
+    """执行迁移：创建 balance_checkpoints 表并补写历史检查点"""
+    Base.metadata.create_all(engine, tables=[BalanceCheckpoint.__table__])
+    print("✅ 已创建 balance_checkpoints 表")
+
+    session = SessionLocal()
+    try:
+        counts = BalanceCheckpointService.backfill(session)
+        session.commit()
+        print(f"✅ 已补写日结检查点 {counts['eod']} 条，首笔交易检查点 {counts['opening']} 条")
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    return True
+
+
+def downgrade():
+    """回滚迁移：删除 balance_checkpoints 表"""
+    BalanceCheckpoint.__table__.drop(engine, checkfirst=True)
+    print("✅ 已删除 balance_checkpoints 表")
+    return True
+
+
+if __name__ == "__main__":
+    upgrade()
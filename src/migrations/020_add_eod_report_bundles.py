@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+数据库迁移: 创建日结报表数据包表
+
+迁移版本: 020
+功能: 每个日结保存一份收入统计数据模型（CalGain/CalBalance/CalBaseCurrency 结果）、
+      已生成的各语言报表文件和各阶段耗时，收入统计和打印步骤重复调用时不再重新计算，
+      报表内容未变化时重印直接使用已生成的文件
+"""
+
+import os
+import sys
+
+# Ensure project root is on sys.path to reuse existing services
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from services.db_service import engine  # noqa: E402
+from models.exchange_models import Base, EODReportBundle  # noqa: E402
+
+
+def upgrade():
+    """执行迁移：创建 eod_report_bundles 表"""
+    Base.metadata.create_all(engine, tables=[EODReportBundle.__table__])
+    print("✅ 已创建 eod_report_bundles 表")
+    return True
+
+
+def downgrade():
+    """回滚迁移：删除 eod_report_bundles 表"""
+    EODReportBundle.__table__.drop(engine, checkfirst=True)
+    print("✅ 已删除 eod_report_bundles 表")
+    return True
+
+
+if __name__ == "__main__":
+    upgrade()
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+数据库迁移: 创建批量日结任务表
+
+迁移版本: 021
+功能: 总部按网点列表批量执行日结，eod_batch_runs 记录任务参数、执行进程心跳和汇总结果，
+      eod_batch_items 记录每个网点对应的日结和已完成的步骤，进程中断后可从该步骤继续
+"""
+
+import os
+import sys
+
+# Ensure project root is on sys.path to reuse existing services
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from services.db_service import engine  # noqa: E402
+from models.exchange_models import Base, EODBatchItem, EODBatchRun  # noqa: E402
+
+
+def upgrade():
+    """执行迁移：创建 eod_batch_runs、eod_batch_items 表"""
+    Base.metadata.create_all(engine, tables=[EODBatchRun.__table__, EODBatchItem.__table__])
+    print("✅ 已创建 eod_batch_runs、eod_batch_items 表")
+    return True
+
+
+def downgrade():
+    """回滚迁移：删除 eod_batch_items、eod_batch_runs 表"""
+    EODBatchItem.__table__.drop(engine, checkfirst=True)
+    EODBatchRun.__table__.drop(engine, checkfirst=True)
+    print("✅ 已删除 eod_batch_items、eod_batch_runs 表")
+    return True
+
+
+if __name__ == "__main__":
+    upgrade()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+数据库迁移: 日结会话锁定改为租约
+
+迁移版本: 022
+功能: eod_session_locks 增加 fencing_token（租约令牌）和 expires_at（租约到期时间），
+      新建 eod_lease_sequences 表按网点分配单调递增的令牌；
+      已有的锁定没有到期时间，仍按空闲时间由 cleanup_expired_eod_sessions 清理
+"""
+
+import os
+import sys
+
+# Ensure project root is on sys.path to reuse existing services
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import inspect, text  # noqa: E402
+
+from services.db_service import engine  # noqa: E402
+from models.exchange_models import Base, EODLeaseSequence  # noqa: E402
+
+COLUMNS = [
+    ('fencing_token', 'BIGINT NULL'),
+    ('expires_at', 'DATETIME NULL'),
+]
+
+
+def _existing_columns():
+    return {column['name'] for column in inspect(engine).get_columns('eod_session_locks')}
+
+
+def upgrade():
+    """执行迁移：增加租约字段，创建 eod_lease_sequences 表"""
+    existing = _existing_columns()
+    with engine.begin() as conn:
+        for name, ddl in COLUMNS:
+            if name in existing:
+                print(f"⏭️  字段 eod_session_locks.{name} 已存在")
+                continue
+            conn.execute(text(f"ALTER TABLE eod_session_locks ADD COLUMN {name} {ddl}"))
+            print(f"✅ 已增加字段 eod_session_locks.{name}")
+    Base.metadata.create_all(engine, tables=[EODLeaseSequence.__table__])
+    print("✅ 已创建 eod_lease_sequences 表")
+    return True
+
+
+def downgrade():
+    """回滚迁移：删除 eod_lease_sequences 表和租约字段"""
+    EODLeaseSequence.__table__.drop(engine, checkfirst=True)
+    existing = _existing_columns()
+    with engine.begin() as conn:
+        for name, _ in reversed(COLUMNS):
+            if name in existing:
+                conn.execute(text(f"ALTER TABLE eod_session_locks DROP COLUMN {name}"))
+                print(f"✅ 已删除字段 eod_session_locks.{name}")
+    print("✅ 已删除 eod_lease_sequences 表")
+    return True
+
+
+if __name__ == "__main__":
+    upgrade()
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+数据库迁移: 日间余额检查点记录写入时的最大交易ID
+
+迁移版本: 023
+功能: balance_checkpoints 增加 last_transaction_id（日间检查点写入时网点已提交的最大交易ID），
+      对账时据此找出时点之前、检查点写入后才提交而未计入期间变动的交易；
+      已有的检查点该字段为空，仍按重新计算的期间变动对账
+"""
+
+import os
+import sys
+
+# Ensure project root is on sys.path to reuse existing services
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import inspect, text  # noqa: E402
+
+from services.db_service import engine  # noqa: E402
+
+TABLE = 'balance_checkpoints'
+COLUMN = 'last_transaction_id'
+
+
+def _has_column():
+    return COLUMN in {column['name'] for column in inspect(engine).get_columns(TABLE)}
+
+
+def upgrade():
+    """执行迁移：增加 last_transaction_id 字段"""
+    if _has_column():
+        print(f"⏭️  字段 {TABLE}.{COLUMN} 已存在")
+        return True
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {TABLE} ADD COLUMN {COLUMN} INTEGER NULL"))
+    print(f"✅ 已增加字段 {TABLE}.{COLUMN}")
+    return True
+
+
+def downgrade():
+    """回滚迁移：删除 last_transaction_id 字段"""
+    if _has_column():
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {TABLE} DROP COLUMN {COLUMN}"))
+        print(f"✅ 已删除字段 {TABLE}.{COLUMN}")
+    return True
+
+
+if __name__ == "__main__":
+    upgrade()
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text, Date, Numeric, UniqueConstraint
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, ForeignKey, Boolean, Text, Date, Numeric, UniqueConstraint, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -243,6 +243,20 @@ class ExchangeTransaction(Base):
     currency = relationship("Currency", back_populates="transactions")
     operator = relationship("Operator", back_populates="transactions")
 
+    __table_args__ = (
+        # 24小时窗口边界修正和一致性检查按客户+时间范围读取原始交易
+        Index('idx_exchange_tx_customer_created', 'customer_id', 'created_at'),
+        # 热点查询索引（迁移018，scripts/index_advisor.py 生成）：日终按网点/币种+时间，报表按网点+交易日期，
+        # 规则引擎按客户+交易日期，票据文件按文件名反查交易
+        Index('idx_exchange_transactions_branch_id_created_at', 'branch_id', 'created_at'),
+        Index('idx_exchange_transactions_branch_id_currency_id_created_at', 'branch_id', 'currency_id', 'created_at'),
+        Index('idx_exchange_transactions_branch_id_transaction_date', 'branch_id', 'transaction_date'),
+        Index('idx_exchange_transactions_receipt_filename', 'receipt_filename'),
+        Index('idx_exchange_transactions_customer_id_transaction_date', 'customer_id', 'transaction_date'),
+        # 双向交易按业务组查询、打印和反结算（请求内由 BranchScope 追加 branch_id 条件）
+        Index('idx_exchange_transactions_branch_id_business_group_id', 'branch_id', 'business_group_id'),
+    )
+
 class SystemLog(Base):
     __tablename__ = 'system_logs'
 
@@ -427,6 +441,62 @@ class EODCashOut(Base):
     currency = relationship('Currency', backref='cash_outs')
     transaction = relationship('ExchangeTransaction', backref='cash_out_records')
 
+class EODReportBundle(Base):
+    """日结报表数据包 - 每个日结一行，保存收入统计数据模型（CalGain/CalBalance/CalBaseCurrency）、已生成的报表文件和各阶段耗时"""
+    __tablename__ = 'eod_report_bundles'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    eod_status_id = Column(Integer, ForeignKey('eod_status.id'), nullable=False, unique=True)
+    branch_id = Column(Integer, nullable=False)
+    start_time = Column(DateTime, nullable=True)  # 数据模型的统计时间范围
+    end_time = Column(DateTime, nullable=True)
+    source_marker = Column(Integer, nullable=True)  # 计算时网点的最大交易ID，之后有新交易则数据模型失效
+    data = Column(Text, nullable=True)  # JSON: income_data / stock_data / base_currency_data
+    data_hash = Column(String(64), nullable=True)
+    artifacts = Column(Text, nullable=True)  # JSON: {报表组: {'hash': 内容摘要, 'files': {文件键: 生成结果}}}
+    timings = Column(Text, nullable=True)  # JSON: 最近一次各阶段耗时（毫秒）
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+class EODBatchRun(Base):
+    """批量日结任务 - 总部按网点列表批量执行日结，记录执行参数和汇总结果，进程中断后可继续执行"""
+    __tablename__ = 'eod_batch_runs'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    target_date = Column(Date, nullable=False)
+    operator_id = Column(Integer, ForeignKey('operators.id'), nullable=False)  # 以该操作员身份执行各网点日结
+    status = Column(String(20), nullable=False, default='pending')  # pending, running, completed, partial, failed
+    options = Column(Text, nullable=True)  # JSON: workers, force_differences, language
+    owner = Column(String(100), nullable=True)  # 正在执行的进程（主机:进程号）
+    heartbeat_at = Column(DateTime, nullable=True)  # 执行中每完成一个步骤更新，用于判断进程是否已中断
+    summary = Column(Text, nullable=True)  # JSON: 最近一次执行结束时的汇总
+    created_at = Column(DateTime, default=datetime.now)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    items = relationship('EODBatchItem', backref='run', order_by='EODBatchItem.branch_id')
+
+class EODBatchItem(Base):
+    """批量日结网点明细 - 每个网点一行，记录对应的日结、已完成的步骤和结果"""
+    __tablename__ = 'eod_batch_items'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    run_id = Column(Integer, ForeignKey('eod_batch_runs.id'), nullable=False)
+    branch_id = Column(Integer, ForeignKey('branches.id'), nullable=False)
+    eod_status_id = Column(Integer, ForeignKey('eod_status.id'), nullable=True)
+    session_id = Column(String(100), nullable=False)  # 该网点日结使用的会话锁定ID
+    status = Column(String(20), nullable=False, default='pending')  # pending, running, completed, failed, attention
+    stage = Column(String(20), nullable=True)  # 最后完成的步骤
+    message = Column(String(500), nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    durations = Column(Text, nullable=True)  # JSON: 各步骤耗时（毫秒）
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint('run_id', 'branch_id', name='uq_eod_batch_item_branch'),
+    )
+
 # 新增操作员活跃状态记录模型
 class OperatorActivityLog(Base):
     __tablename__ = 'operator_activity_logs'
@@ -510,6 +580,177 @@ class ReceiptSequence(Base):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+class VoidedReceiptNumber(Base):
+    """作废票据编号表 - 外层事务回滚后记录已分配但未使用的票据编号，保证编号连续可追溯"""
+    __tablename__ = 'voided_receipt_numbers'
+
+    id = Column(Integer, primary_key=True)
+    branch_id = Column(Integer, ForeignKey('branches.id'), nullable=False)
+    receipt_number = Column(String(30), nullable=False, unique=True)
+    sequence_date = Column(Date, nullable=False)
+    sequence_no = Column(Integer, nullable=False)
+    reason = Column(String(100), default='transaction_rollback')
+    created_at = Column(DateTime, default=datetime.now)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'branch_id': self.branch_id,
+            'receipt_number': self.receipt_number,
+            'sequence_date': self.sequence_date.isoformat() if self.sequence_date else None,
+            'sequence_no': self.sequence_no,
+            'reason': self.reason,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+class ComplianceOutbox(Base):
+    """合规检查发件箱 - 与交易同一事务写入，由后台工作线程生成AMLO/BOT记录"""
+    __tablename__ = 'compliance_outbox'
+
+    id = Column(Integer, primary_key=True)
+    transaction_id = Column(Integer, ForeignKey('exchange_transactions.id'), nullable=False, unique=True)
+    branch_id = Column(Integer, ForeignKey('branches.id'), nullable=False)
+    currency_id = Column(Integer, ForeignKey('currencies.id'), nullable=False)
+    operator_id = Column(Integer, ForeignKey('operators.id'), nullable=False)
+    status = Column(String(20), nullable=False, default='pending', index=True)  # pending, processing, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    locked_by = Column(String(64), nullable=True)  # 领取该任务的工作线程标识
+    locked_at = Column(DateTime, nullable=True)
+    result = Column(Text, nullable=True)  # JSON: 与接口返回的 compliance 结构一致
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    processed_at = Column(DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'transaction_id': self.transaction_id,
+            'branch_id': self.branch_id,
+            'currency_id': self.currency_id,
+            'operator_id': self.operator_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'processed_at': self.processed_at.isoformat() if self.processed_at else None
+        }
+
+class CustomerExposureBucket(Base):
+    """客户累计交易额度桶 - 按 客户+网点+交易日期+小时 汇总已完成交易，供AMLO/BOT累计检查使用"""
+    __tablename__ = 'customer_exposure_buckets'
+
+    id = Column(Integer, primary_key=True)
+    customer_id = Column(String(50), nullable=False)
+    branch_id = Column(Integer, nullable=False)
+    bucket_date = Column(Date, nullable=False)  # 交易日期（transaction_date），用于30天窗口
+    bucket_hour = Column(DateTime, nullable=False)  # created_at 取整到小时，用于24小时窗口
+    transaction_count = Column(Integer, nullable=False, default=0)
+    amount = Column(Numeric(18, 2), nullable=False, default=0)  # SUM(ABS(local_amount))
+    first_created_at = Column(DateTime, nullable=True)
+    last_created_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        UniqueConstraint('customer_id', 'branch_id', 'bucket_date', 'bucket_hour', name='uq_customer_exposure_bucket'),
+        Index('idx_customer_exposure_hour', 'customer_id', 'bucket_hour'),
+    )
+
+    def to_dict(self):
+        return {
+            'customer_id': self.customer_id,
+            'branch_id': self.branch_id,
+            'bucket_date': self.bucket_date.isoformat() if self.bucket_date else None,
+            'bucket_hour': self.bucket_hour.isoformat() if self.bucket_hour else None,
+            'transaction_count': self.transaction_count,
+            'amount': float(self.amount or 0),
+            'first_created_at': self.first_created_at.isoformat() if self.first_created_at else None,
+            'last_created_at': self.last_created_at.isoformat() if self.last_created_at else None
+        }
+
+class AuthPrincipalVersion(Base):
+    """认证主体版本号 - 用户或角色（含权限）变更时递增，各工作进程据此使缓存的登录用户信息失效"""
+    __tablename__ = 'auth_principal_versions'
+
+    id = Column(Integer, primary_key=True)
+    scope = Column(String(20), nullable=False)  # user, role, all
+    ref_id = Column(Integer, nullable=False, default=0)  # 用户ID/角色ID，scope=all 时为0
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        UniqueConstraint('scope', 'ref_id', name='uq_auth_principal_version'),
+    )
+
+class IdempotencyRecord(Base):
+    """幂等请求记录 - 按 Idempotency-Key 保存交易类接口的执行结果，重试请求直接返回已保存的响应"""
+    __tablename__ = 'idempotency_records'
+
+    id = Column(Integer, primary_key=True)
+    scope = Column(String(100), nullable=False)  # 接口标识，如 exchange.perform
+    operator_id = Column(Integer, nullable=False)
+    idempotency_key = Column(String(100), nullable=False)
+    request_hash = Column(String(64), nullable=False)  # 请求方法+路径+请求体的 SHA-256
+    status = Column(String(20), nullable=False, default='processing')  # processing, completed
+    owner = Column(String(64), nullable=True)  # 正在执行该请求的进程/线程标识
+    response_status = Column(Integer, nullable=True)
+    response_body = Column(Text, nullable=True)
+    response_mimetype = Column(String(100), nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    completed_at = Column(DateTime, nullable=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    __table_args__ = (
+        UniqueConstraint('scope', 'operator_id', 'idempotency_key', name='uq_idempotency_record'),
+    )
+
+    def to_dict(self):
+        return {
+            'scope': self.scope,
+            'operator_id': self.operator_id,
+            'idempotency_key': self.idempotency_key,
+            'status': self.status,
+            'response_status': self.response_status,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
+        }
+
+class BalanceCheckpoint(Base):
+    """余额检查点 - 按 网点+币种 只追加记录某一时点的账面余额，期初余额和期间变动从最近的检查点加其后的交易增量计算"""
+    __tablename__ = 'balance_checkpoints'
+
+    id = Column(Integer, primary_key=True)
+    branch_id = Column(Integer, nullable=False)
+    currency_id = Column(Integer, nullable=False)
+    kind = Column(String(20), nullable=False)  # eod=日结完成, intraday=日间定时, opening=无日结时的第一笔交易
+    checkpoint_at = Column(DateTime, nullable=False)  # 余额对应的时点，此前（不含）的交易已计入
+    balance = Column(Numeric(20, 2), nullable=False, default=0)
+    period_start = Column(DateTime, nullable=False)  # 所属期间的起点（日结/首笔交易检查点的 checkpoint_at）
+    period_change = Column(Numeric(20, 2), nullable=False, default=0)  # period_start 到 checkpoint_at 的变动
+    eod_status_id = Column(Integer, nullable=True)  # kind=eod 时对应的日结
+    source_transaction_id = Column(Integer, nullable=True)  # kind=opening 时对应的交易
+    last_transaction_id = Column(Integer, nullable=True)  # kind=intraday 时写入时网点已提交的最大交易ID
+    created_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        Index('idx_balance_checkpoint_lookup', 'branch_id', 'currency_id', 'kind', 'checkpoint_at'),
+        Index('idx_balance_checkpoint_eod', 'eod_status_id'),
+    )
+
+    def to_dict(self):
+        return {
+            'branch_id': self.branch_id,
+            'currency_id': self.currency_id,
+            'kind': self.kind,
+            'checkpoint_at': self.checkpoint_at.isoformat() if self.checkpoint_at else None,
+            'balance': float(self.balance or 0),
+            'period_start': self.period_start.isoformat() if self.period_start else None,
+            'period_change': float(self.period_change or 0),
+            'eod_status_id': self.eod_status_id,
+            'source_transaction_id': self.source_transaction_id,
+            'last_transaction_id': self.last_transaction_id
+        }
+
 class PrintSettings(Base):
     """打印设置表"""
     __tablename__ = 'print_settings'
@@ -863,6 +1104,8 @@ class EODSessionLock(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     last_activity = Column(DateTime, default=datetime.utcnow)
     is_active = Column(Boolean, default=True)
+    fencing_token = Column(BigInteger, nullable=True)  # 租约令牌，同一网点单调递增（eod_lease_sequences）
+    expires_at = Column(DateTime, nullable=True)  # 租约到期时间，续期时顺延
 
     # 外键关系
     branch = relationship("Branch", backref="eod_session_locks")
@@ -885,9 +1128,19 @@ class EODSessionLock(Base):
             'user_agent': self.user_agent,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'last_activity': self.last_activity.isoformat() if self.last_activity else None,
-            'is_active': self.is_active
+            'is_active': self.is_active,
+            'fencing_token': self.fencing_token,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
         }
 
+class EODLeaseSequence(Base):
+    """日结租约令牌序列 - 每个网点一行，每次授予日结会话租约递增，旧持有者的令牌因此失效"""
+    __tablename__ = 'eod_lease_sequences'
+
+    branch_id = Column(Integer, ForeignKey('branches.id'), primary_key=True)
+    last_token = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
 class Country(Base):
     """国家信息表 - 支持多语言国家名称"""
     __tablename__ = 'countries'
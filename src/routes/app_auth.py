@@ -7,6 +7,7 @@ from services.auth_service import (
 )
 from models.exchange_models import Branch, Role, Permission, RolePermission, Operator
 from services.db_service import DatabaseService
+from services.principal_cache import PrincipalCache
 from datetime import datetime
 from utils.multilingual_log_service import multilingual_logger
 from services.unified_log_service import log_user_login, log_user_logout
@@ -128,9 +129,10 @@ def login():
             # 更新用户的 branch_id
             user.branch_id = branch_id
             DatabaseService.commit_session(session)
+            PrincipalCache.bump_user(user.id)
 
         # 生成token
-        token = generate_token(user.id)
+        token = generate_token(user.id, claims=PrincipalCache.token_claims(user.id))
         
         # 获取用户角色和权限
         role = user.role
@@ -245,7 +247,7 @@ def refresh_token(current_user):
     """刷新token"""
     try:
         # 生成新的token
-        new_token = generate_token(current_user['id'])
+        new_token = generate_token(current_user['id'], claims=PrincipalCache.token_claims(current_user['id']))
         
         return jsonify({
             'success': True,
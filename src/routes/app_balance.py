@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime, date
 from services.auth_service import token_required, has_permission, check_business_lock_for_balance
+from services.read_replica import read_replica
 from services.db_service import DatabaseService
 from models.exchange_models import Currency, CurrencyBalance, ExchangeRate, SystemLog, Branch, Operator, ExchangeTransaction, EODStatus, BranchOperatingStatus, CurrencyTemplate
 from sqlalchemy.exc import SQLAlchemyError
@@ -610,6 +611,7 @@ def get_query_currencies(*args):
 @balance_bp.route('/query', methods=['GET'])
 @token_required
 @has_permission('view_balances')
+@read_replica()
 def query_balances(*args):
     """查询余额 - 显示所有在汇率表中出现过的币种"""
     current_user = args[0] if args else None
@@ -766,6 +768,7 @@ def query_balances(*args):
 @balance_bp.route('/export', methods=['GET'])
 @token_required
 @has_permission('view_balances')
+@read_replica()
 def export_balances(*args):
     """导出余额查询结果"""
     current_user = args[0] if args else None
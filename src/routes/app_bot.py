@@ -8,15 +8,15 @@ BOT报告API路由
 
 from flask import Blueprint, request, jsonify, g, send_file
 from functools import wraps
-from services.db_service import SessionLocal
+from services.db_service import SessionLocal, DatabaseService
 from services.auth_service import token_required, permission_required
+from services.read_replica import read_replica
+from services.branch_scope import scoped_text
 from sqlalchemy import text
 import traceback
 import json
 from datetime import datetime, timedelta
 import io
-import openpyxl
-from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
 import logging
 
 # Get logger instance - DO NOT call basicConfig() here as it will override
@@ -212,6 +212,7 @@ def check_bot_trigger(current_user):
 @app_bot.route('/t1-buy-fx', methods=['GET'])
 @token_required
 @bot_permission_required('bot_report_view')
+@read_replica()
 def get_t1_buy_fx(current_user):
     """
     查询买入外币报表数据（支持年月查询）
@@ -240,7 +241,7 @@ def get_t1_buy_fx(current_user):
         ]
     }
     """
-    session = SessionLocal()
+    session = DatabaseService.get_session()
 
     try:
         # 获取当前用户的branch_id
@@ -330,6 +331,7 @@ def get_t1_buy_fx(current_user):
 @app_bot.route('/t1-sell-fx', methods=['GET'])
 @token_required
 @bot_permission_required('bot_report_view')
+@read_replica()
 def get_t1_sell_fx(current_user):
     """
     查询卖出外币报表数据（支持年月查询）
@@ -358,7 +360,7 @@ def get_t1_sell_fx(current_user):
         ]
     }
     """
-    session = SessionLocal()
+    session = DatabaseService.get_session()
 
     try:
         # 获取当前用户的branch_id
@@ -590,19 +592,20 @@ def mark_bot_reported(current_user):
         # 获取当前用户ID
         user_id = g.current_user.get('id', 1)
         
-        # 更新记录
-        sql = text(f"""
+        # 更新记录（只能标记本网点的记录）
+        params = {
+            'user_id': user_id,
+            'ids': tuple(ids)
+        }
+        sql = scoped_text(f"""
             UPDATE {table_name}
             SET is_reported = TRUE,
                 report_time = NOW(),
                 reported_by = :user_id
-            WHERE id IN :ids
-        """)
+            WHERE id IN :ids{{branch_scope}}
+        """, params)
         
-        result = session.execute(sql, {
-            'user_id': user_id,
-            'ids': tuple(ids)
-        })
+        result = session.execute(sql, params)
         
         session.commit()
         
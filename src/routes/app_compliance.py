@@ -10,6 +10,7 @@ from flask import Blueprint, request, jsonify, g
 from functools import wraps
 from services.db_service import SessionLocal
 from services.auth_service import token_required, permission_required
+from services.repform.rule_engine import RuleEngine
 from sqlalchemy import text
 import traceback
 import json
@@ -477,6 +478,7 @@ def create_trigger_rule(current_user):
 
         result = session.execute(sql, params)
         session.commit()
+        RuleEngine.invalidate_rule_cache()
 
         return jsonify({
             'success': True,
@@ -568,6 +570,7 @@ def update_trigger_rule(current_user, rule_id):
 
         session.execute(sql, params)
         session.commit()
+        RuleEngine.invalidate_rule_cache()
 
         return jsonify({
             'success': True,
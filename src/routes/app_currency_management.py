@@ -6,6 +6,7 @@ from datetime import datetime
 from flask import Blueprint, request, jsonify, current_app
 from services.auth_service import token_required, has_permission
 from services.db_service import DatabaseService
+from services.reference_data_cache import ReferenceDataCache
 from services.unified_log_service import UnifiedLogService
 from sqlalchemy.exc import IntegrityError
 import logging
@@ -369,6 +370,7 @@ def update_currency_template(*args, **kwargs):
             current_app.logger.warning(f"Currency表中不存在币种 {template.currency_code}，无法同步")
         
         DatabaseService.commit_session(session)
+        ReferenceDataCache.invalidate_currencies()
         
         current_app.logger.info(f"更新币种模板: {template_id}")
         
@@ -6,6 +6,8 @@ from models.denomination_models import CurrencyDenomination, DenominationRate
 from models.exchange_models import DenominationPublishDetail
 from services.db_service import DatabaseService
 from services.auth_service import token_required, has_permission
+from services.read_replica import read_replica
+from services.shared_cache import SharedCache
 import secrets
 import hashlib
 import json
@@ -17,8 +19,8 @@ import os
 
 dashboard_bp = Blueprint('dashboard', __name__, url_prefix='/api/dashboard')
 
-# 存储发布的汇率数据（内存中，用于机顶盒访问）
-published_rates_cache = {}
+# 存储发布的汇率数据（用于机顶盒访问，CACHE_BACKEND 为 file/redis 时各工作进程共享）
+published_rates_cache = SharedCache.namespace('published_rates')
 
 def update_show_html_branch_code(branch_code):
     """更新Show.html文件中的网点代码"""
@@ -312,11 +314,11 @@ def publish_rates_for_display(*args, **kwargs):
         
         # 删除旧的缓存
         for old_token in branch_tokens_to_remove:
-            del published_rates_cache[old_token]
+            published_rates_cache.delete(old_token)
             logger.info(f"[缓存清理] 删除旧缓存: {old_token}")
         
         # 存储到缓存中
-        published_rates_cache[token] = published_data
+        published_rates_cache.set(token, published_data)
         logger.info(f"[缓存更新] 新缓存已存储: {token}, 货币数量: {len(rates_data)}")
         
         # 提交数据库事务
@@ -609,9 +611,9 @@ def get_display_rates(token):
     # 检查URL参数是否要求强制刷新
     force_refresh = request.args.get('force_refresh', 'false').lower() == 'true'
     
-    # 首先检查内存缓存
-    if token in published_rates_cache and not force_refresh:
-        data = published_rates_cache[token]
+    # 首先检查缓存
+    data = None if force_refresh else published_rates_cache.get(token)
+    if data is not None:
         
         # 检查是否是面值汇率数据
         if data.get('has_denominations', False):
@@ -768,7 +770,7 @@ def get_display_rates(token):
             }
             
             # 更新缓存
-            published_rates_cache[token] = data
+            published_rates_cache.set(token, data)
             
             return jsonify({
                 'success': True,
@@ -818,11 +820,30 @@ def get_display_rates(token):
             'IDR': {'zh': '印尼盾', 'en': 'Indonesian Rupiah', 'th': 'รูเปียห์อินโดนีเซีย'}
         }
         
+        # 查找该分支的其他发布记录及其详情（一次查询取回全部详情，按记录分组）
+        other_records = session.query(RatePublishRecord).filter(
+            RatePublishRecord.branch_id == publish_record.branch_id,
+            RatePublishRecord.id != publish_record.id
+        ).order_by(desc(RatePublishRecord.publish_time)).all()
+        other_details_map = {record.id: [] for record in other_records}
+        if other_records:
+            for detail in session.query(RatePublishDetail).filter(
+                RatePublishDetail.publish_record_id.in_(list(other_details_map))
+            ).order_by(RatePublishDetail.sort_order).all():
+                other_details_map[detail.publish_record_id].append(detail)
+        
+        # 从数据库获取正确的 flag_code 和 custom_flag_filename（所有涉及的币种一次查询）
+        currency_ids = {detail.currency_id for detail in publish_details}
+        for details in other_details_map.values():
+            currency_ids.update(detail.currency_id for detail in details)
+        currency_map = {}
+        if currency_ids:
+            currency_map = {c.id: c for c in session.query(Currency).filter(Currency.id.in_(currency_ids)).all()}
+        
         # 重建汇率数据
         rates_data = []
         for detail in publish_details:
-            # 从数据库获取正确的 flag_code 和 custom_flag_filename
-            currency = session.query(Currency).filter_by(id=detail.currency_id).first()
+            currency = currency_map.get(detail.currency_id)
             flag_code = currency.flag_code if currency and currency.flag_code else detail.currency_code.lower()
             custom_flag_filename = currency.custom_flag_filename if currency else None
             
@@ -872,24 +893,14 @@ def get_display_rates(token):
         # 获取该分支的所有发布记录，合并汇率数据
         all_rates_data = rates_data.copy()  # 先包含当前记录的汇率
         
-        # 查找该分支的其他发布记录
-        other_records = session.query(RatePublishRecord).filter(
-            RatePublishRecord.branch_id == publish_record.branch_id,
-            RatePublishRecord.id != publish_record.id
-        ).order_by(desc(RatePublishRecord.publish_time)).all()
-        
         # 从其他发布记录中获取汇率数据
         for other_record in other_records:
-            other_details = session.query(RatePublishDetail).filter_by(
-                publish_record_id=other_record.id
-            ).order_by(RatePublishDetail.sort_order).all()
-            
-            for detail in other_details:
+            for detail in other_details_map[other_record.id]:
                 # 检查是否已经存在该币种的汇率
                 existing_rate = next((rate for rate in all_rates_data if rate['currency_code'] == detail.currency_code), None)
                 if not existing_rate:
                     # 如果不存在，则添加
-                    currency = session.query(Currency).filter_by(id=detail.currency_id).first()
+                    currency = currency_map.get(detail.currency_id)
                     flag_code = currency.flag_code if currency and currency.flag_code else detail.currency_code.lower()
                     
                     rate_data = {
@@ -929,8 +940,8 @@ def get_display_rates(token):
             'publish_record_id': publish_record.id
         }
         
-        # 重新加载到内存缓存中
-        published_rates_cache[token] = data
+        # 重新加载到缓存中
+        published_rates_cache.set(token, data)
         
         return jsonify({
             'success': True,
@@ -948,6 +959,7 @@ def get_display_rates(token):
 
 @dashboard_bp.route('/transaction_stats', methods=['GET'])
 @token_required
+@read_replica()
 def get_transaction_stats(current_user):
     """获取交易统计数据"""
     session = DatabaseService.get_session()
@@ -1062,6 +1074,7 @@ def get_recent_transactions(current_user):
 
 @dashboard_bp.route('/transaction_trends', methods=['GET'])
 @token_required
+@read_replica()
 def get_transaction_trends(current_user):
     """获取交易趋势数据"""
     days = request.args.get('days', 7, type=int)
@@ -1102,6 +1115,7 @@ def get_transaction_trends(current_user):
 
 @dashboard_bp.route('/business-stats', methods=['GET'])
 @token_required
+@read_replica()
 def get_business_stats(current_user):
     """获取业务统计数据"""
     session = DatabaseService.get_session()
@@ -1187,18 +1201,27 @@ def get_business_stats(current_user):
                 )
             ).all()
             
+            # 预警涉及的余额和币种各一次查询
+            alert_currency_ids = {alert.currency_id for alert in branch_alerts}
+            balance_map = {}
+            currency_map = {}
+            if alert_currency_ids:
+                for balance in session.query(CurrencyBalance).filter(
+                    CurrencyBalance.branch_id == branch_id,
+                    CurrencyBalance.currency_id.in_(alert_currency_ids)
+                ).order_by(CurrencyBalance.id).all():
+                    balance_map.setdefault(balance.currency_id, balance)
+                currency_map = {
+                    c.id: c for c in session.query(Currency).filter(Currency.id.in_(alert_currency_ids)).all()
+                }
+            
             # 对每个预警设置，检查对应的余额
             for alert in branch_alerts:
-                balance_record = session.query(CurrencyBalance).filter(
-                    and_(
-                        CurrencyBalance.branch_id == branch_id,
-                        CurrencyBalance.currency_id == alert.currency_id
-                    )
-                ).first()
+                balance_record = balance_map.get(alert.currency_id)
                 
                 if balance_record:
                     # 获取币种信息
-                    currency = session.query(Currency).filter_by(id=alert.currency_id).first()
+                    currency = currency_map.get(alert.currency_id)
                     
                     current_balance = float(balance_record.balance)
                     min_threshold = float(alert.min_threshold)
@@ -1312,7 +1335,6 @@ def get_business_stats(current_user):
 def clear_publish_cache(*args, **kwargs):
     """清除发布缓存（用于调试）"""
     current_user = kwargs.get('current_user') or args[0]
-    global published_rates_cache
     session = None
     
     try:
@@ -1341,7 +1363,7 @@ def clear_publish_cache(*args, **kwargs):
         
         removed_count = len(branch_tokens_to_remove)
         for old_token in branch_tokens_to_remove:
-            del published_rates_cache[old_token]
+            published_rates_cache.delete(old_token)
             logger.info(f"[清除缓存] 删除缓存: {old_token[:8]}...")
         
         cache_count_after = len(published_rates_cache)
@@ -1633,7 +1655,7 @@ def publish_denomination_rates(current_user):
             session.commit()
             
             # 数据库操作成功后，更新内存缓存和文件
-            published_rates_cache[token] = publish_data
+            published_rates_cache.set(token, publish_data)
             update_show_html_branch_code(branch.branch_code)
             
             logger.info(f"面值汇率发布成功: 币种={currency.currency_code}, 面值数量={len(valid_denominations)}, 令牌={token}")
@@ -1916,7 +1938,7 @@ def publish_denomination_rates(current_user):
             session.commit()
             
             # 数据库操作成功后，更新内存缓存和文件
-            published_rates_cache[token] = publish_data
+            published_rates_cache.set(token, publish_data)
             update_show_html_branch_code(branch.branch_code)
             
             logger.info(f"多币种面值汇率发布成功: 总面值数量={total_denominations}, 令牌={token}")
@@ -1950,7 +1972,7 @@ def publish_denomination_rates(current_user):
 def clear_cache(current_user):
     """清理发布缓存"""
     try:
-        # 清理所有缓存
+        # 清理所有缓存（所有工作进程）
         published_rates_cache.clear()
         logger.info(f"用户 {current_user.get('name', '未知用户')} 清理了所有发布缓存")
         
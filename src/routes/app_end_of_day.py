@@ -53,8 +53,9 @@ def start_eod(current_user):
         )
         
         if result['success']:
-            # 保存会话ID到session中
+            # 保存会话ID和租约令牌到session中
             session['eod_session_id'] = session_id
+            session['eod_fencing_token'] = result.get('fencing_token')
             return jsonify(result), 200
         else:
             return jsonify(result), 400
@@ -98,6 +99,7 @@ def continue_eod(current_user, eod_id):
             )
             
             if result['success']:
+                session['eod_fencing_token'] = result.get('fencing_token')
                 return jsonify({
                     'success': True,
                     'message': '成功继续现有流程',
@@ -391,7 +393,11 @@ def complete_eod(current_user, eod_id):
         # 【修复】获取会话ID用于权限验证
         session_id = request.headers.get('X-Session-ID') or request.args.get('session_id')
         
-        result = EODService.complete_eod(eod_id, operator_id, session_id)
+        # 同一会话开始或继续日结时取得的租约令牌，被其他终端接管后不能再完成日结
+        from flask import session
+        fencing_token = session.get('eod_fencing_token') if session_id and session_id == session.get('eod_session_id') else None
+        
+        result = EODService.complete_eod(eod_id, operator_id, session_id, fencing_token)
         
         if result['success']:
             return jsonify(result), 200
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+批量日结管理API路由
+包含：
+- 创建批量日结任务并在后台执行
+- 查询任务汇总
+- 继续执行中断或未全部完成的任务
+"""
+
+from datetime import datetime, date
+
+from flask import Blueprint, request, jsonify
+
+from models.exchange_models import EODBatchRun
+from services.auth_service import token_required, has_permission
+from services.db_service import DatabaseService
+from services.eod_batch_service import EODBatchService
+import logging
+
+logger = logging.getLogger('app_eod_batch')
+
+eod_batch_bp = Blueprint('eod_batch', __name__, url_prefix='/api/eod-batch')
+
+
+@eod_batch_bp.route('/runs', methods=['POST'])
+@token_required
+@has_permission('system_manage')
+def create_batch_run(current_user):
+    """创建批量日结任务并在后台执行，立即返回任务ID"""
+    data = request.get_json() or {}
+    branch_ids = data.get('branch_ids') or []
+    # 各网点日结以发起人的身份执行（审计记录归属当前登录用户）
+    operator_id = current_user['id']
+    workers = data.get('workers')
+    if not branch_ids:
+        return jsonify({'success': False, 'message': '缺少必要的参数: branch_ids'}), 400
+
+    session = DatabaseService.get_session()
+    try:
+        target_date = datetime.strptime(data['date'], '%Y-%m-%d').date() if data.get('date') else date.today()
+        run = EODBatchService.create_run(
+            session, branch_ids, operator_id, target_date,
+            workers=int(workers) if workers else None,
+            force_differences=bool(data.get('force_differences')),
+            language=data.get('language') or 'zh'
+        )
+        session.commit()
+        run_id = run.id
+    except ValueError as e:
+        session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        session.rollback()
+        logger.error(f"创建批量日结任务失败: {e}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+    finally:
+        DatabaseService.close_session(session)
+
+    try:
+        EODBatchService.start_background(run_id)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e), 'run_id': run_id}), 409
+    return jsonify({'success': True, 'message': '批量日结任务已开始执行', 'run_id': run_id}), 202
+
+
+@eod_batch_bp.route('/runs/<int:run_id>', methods=['GET'])
+@token_required
+@has_permission('system_manage')
+def get_batch_run(current_user, run_id):
+    """查询任务汇总"""
+    session = DatabaseService.get_session()
+    try:
+        run = session.get(EODBatchRun, run_id)
+        if not run:
+            return jsonify({'success': False, 'message': '批量日结任务不存在'}), 404
+        return jsonify({'success': True, 'data': EODBatchService.summary(session, run)})
+    finally:
+        DatabaseService.close_session(session)
+
+
+@eod_batch_bp.route('/runs/<int:run_id>/resume', methods=['POST'])
+@token_required
+@has_permission('system_manage')
+def resume_batch_run(current_user, run_id):
+    """继续执行任务（已完成的网点和步骤跳过）"""
+    session = DatabaseService.get_session()
+    try:
+        if not session.get(EODBatchRun, run_id):
+            return jsonify({'success': False, 'message': '批量日结任务不存在'}), 404
+    finally:
+        DatabaseService.close_session(session)
+
+    try:
+        started = EODBatchService.start_background(run_id)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 409
+    if not started:
+        return jsonify({'success': False, 'message': '批量日结任务正在执行'}), 409
+    return jsonify({'success': True, 'message': '批量日结任务已继续执行', 'run_id': run_id}), 202
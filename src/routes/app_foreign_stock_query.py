@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from services.db_service import DatabaseService
 from services.auth_service import token_required, has_permission
+from services.read_replica import read_replica
 from models.exchange_models import ExchangeTransaction, Branch, Currency, EODBalanceVerification, EODStatus  # EODBalanceSnapshot, EODHistory 已废弃
 from sqlalchemy import and_, or_, func, desc
 from datetime import datetime, timedelta
@@ -153,6 +154,7 @@ def query_stock_summary(current_user):
 
 @foreign_stock_query_bp.route('/foreign-stock', methods=['GET'])
 @token_required
+@read_replica()
 def get_foreign_stock_query(current_user):
     """
     库存外币查询API
@@ -208,6 +210,7 @@ def get_foreign_stock_query(current_user):
 
 @foreign_stock_query_bp.route('/foreign-stock/currency/<currency_code>', methods=['GET'])
 @token_required
+@read_replica()
 def get_foreign_stock_detail(current_user, currency_code):
     """
     获取指定外币的详细库存信息
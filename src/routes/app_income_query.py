@@ -3,6 +3,7 @@ from datetime import datetime, date, timedelta
 from models.exchange_models import ExchangeTransaction, Currency, Branch, Operator
 from services.db_service import DatabaseService
 from services.auth_service import token_required, has_permission
+from services.read_replica import read_replica
 from utils.multilingual_log_service import multilingual_logger
 from sqlalchemy import func, and_
 import logging
@@ -14,6 +15,7 @@ income_query_bp = Blueprint('income_query', __name__, url_prefix='/api/income_qu
 @income_query_bp.route('/daily', methods=['GET'])
 @token_required
 @has_permission('view_transactions')
+@read_replica()
 def query_daily_income(current_user):
     """查询日收入统计"""
     try:
@@ -49,6 +51,7 @@ def query_daily_income(current_user):
 @income_query_bp.route('/monthly', methods=['GET'])
 @token_required
 @has_permission('view_transactions')
+@read_replica()
 def query_monthly_income(current_user):
     """查询月收入统计"""
     try:
@@ -84,6 +87,7 @@ def query_monthly_income(current_user):
 @income_query_bp.route('/profit', methods=['GET'])
 @token_required
 @has_permission('view_transactions')
+@read_replica()
 def query_exchange_profit(current_user):
     """查询兑换利润"""
     try:
@@ -9,6 +9,7 @@ from models.exchange_models import (
 )
 from services.db_service import DatabaseService
 from services.auth_service import token_required, has_permission
+from services.read_replica import read_replica
 from config.features import FeatureFlags
 import logging
 
@@ -21,6 +22,7 @@ local_stock_bp = Blueprint('local_stock', __name__, url_prefix='/api/reports')
 @local_stock_bp.route('/local-stock', methods=['GET'])
 @token_required
 @has_permission('view_balances')
+@read_replica()
 def get_local_stock_query(current_user):
     """获取本币库存查询数据"""
     try:
@@ -168,6 +170,7 @@ def get_local_stock_query(current_user):
 @local_stock_bp.route('/local-stock/export', methods=['GET'])
 @token_required
 @has_permission('view_balances')
+@read_replica()
 def export_local_stock_query(current_user):
     """导出本币库存查询报表"""
     try:
@@ -0,0 +1,71 @@
+"""
+运行指标API
+输出各接口延迟直方图、请求片段（认证、数据库、规则评估、PDF生成）直方图和缓存命中统计
+默认为 Prometheus 文本格式，?format=json 返回JSON
+访问需在 Authorization: Bearer <token> 或 ?token= 中提供以下之一：
+- METRICS_TOKEN 配置的令牌（供 Prometheus 抓取）
+- 拥有 system_manage 权限或管理员角色的用户登录令牌
+设置 METRICS_PUBLIC=true 时不做校验（仅用于内网抓取等明确允许公开的部署）
+"""
+
+import hmac
+import logging
+import os
+
+from flask import Blueprint, Response, jsonify, request
+
+from services.request_tracing import RequestTracer
+
+logger = logging.getLogger(__name__)
+
+metrics_bp = Blueprint('metrics', __name__)
+
+METRICS_PERMISSION = 'system_manage'
+
+
+def _supplied_token():
+    auth_header = request.headers.get('Authorization', '')
+    if auth_header.startswith('Bearer '):
+        return auth_header[len('Bearer '):]
+    return request.args.get('token', '')
+
+
+def _is_admin_token(token):
+    """登录令牌对应的用户是否有权查看运行指标"""
+    from services.auth_service import decode_token_claims
+    from services.principal_cache import PrincipalCache
+
+    claims = decode_token_claims(token)
+    if claims is None:
+        return False
+    try:
+        current_user = PrincipalCache.get_principal(claims['sub'], claims)
+    except Exception as e:
+        logger.warning(f"运行指标访问用户校验失败: {str(e)}")
+        return False
+    if current_user is None:
+        return False
+    return current_user.get('is_admin', False) or METRICS_PERMISSION in current_user.get('permissions', [])
+
+
+def _authorized():
+    if os.environ.get('METRICS_PUBLIC', '').lower() in ('1', 'true', 'yes'):
+        return True
+    supplied = _supplied_token()
+    if not supplied:
+        return False
+    expected = os.environ.get('METRICS_TOKEN')
+    if expected and hmac.compare_digest(supplied.encode('utf-8'), expected.encode('utf-8')):
+        return True
+    return _is_admin_token(supplied)
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """获取运行指标"""
+    if not _authorized():
+        return jsonify({'success': False, 'message': '无权访问运行指标'}), 401
+
+    if request.args.get('format') == 'json':
+        return jsonify({'success': True, 'metrics': RequestTracer.snapshot()})
+    return Response(RequestTracer.render_prometheus(), mimetype='text/plain; version=0.0.4; charset=utf-8')
@@ -11,6 +11,7 @@ from flask import Blueprint, request, jsonify
 from datetime import datetime, date
 from services.auth_service import token_required, has_permission
 from services.db_service import DatabaseService
+from services.principal_cache import PrincipalCache
 from services.unified_log_service import UnifiedLogService
 from models.exchange_models import (
     BranchOperatingStatus, Branch, Operator, ExchangeTransaction,
@@ -95,6 +96,7 @@ def clear_test_users_and_roles(session, current_user):
         
         # 提交事务
         session.commit()
+        PrincipalCache.bump_all()
         
         # 记录清理日志
         log = SystemLog(
@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from werkzeug.security import check_password_hash, generate_password_hash
 from services.db_service import DatabaseService
 from services.auth_service import token_required
+from services.principal_cache import PrincipalCache
 from services.log_service import record_system_log
 from services.activity_service import ActivityService
 from models.exchange_models import Operator, Branch, Role
@@ -149,6 +150,7 @@ def update_profile(current_user):
         if updated_fields:
             # 提交更改
             session.commit()
+            PrincipalCache.bump_user(user_id)
             
             # 记录系统日志
             try:
@@ -255,6 +257,7 @@ def change_password(current_user):
         # 更新密码
         user.password_hash = new_password_hash
         session.commit()
+        PrincipalCache.bump_user(user_id)
         
         # 记录系统日志
         try:
@@ -4,7 +4,9 @@ from datetime import datetime, date
 from decimal import Decimal
 from models.exchange_models import ExchangeTransaction, Currency, Branch, Operator, CurrencyBalance, SystemLog
 from services.db_service import DatabaseService
+from services.eod_lease_service import BusinessLockedError, EODLeaseService
 from services.auth_service import token_required, has_permission, check_business_lock_for_transactions
+from services.read_replica import read_replica
 import logging
 from utils.transaction_utils import generate_transaction_no
 from services.log_service import LogService
@@ -30,6 +32,7 @@ transactions_bp = Blueprint('transactions', __name__, url_prefix='/api/transacti
 @transactions_bp.route('/query', methods=['GET'])
 @token_required
 @has_permission('view_transactions')
+@read_replica()
 def query_transactions(current_user, *args):
     logger.info(f"Query parameters: {request.args}")
     
@@ -375,6 +378,8 @@ def reverse_transaction(current_user, *args):
             logger.info(f"✅ 原交易 {transaction_no} 已标记为已冲正状态")
             
             session.add(reversal_tx)
+            # 入口只按缓存快速拒绝，提交前在本事务中查询网点是否进入日结（本次请求唯一的锁定状态读取）
+            EODLeaseService.ensure_business_unlocked(session, transaction.branch_id)
             session.commit()
             
             # 记录冲正交易日志
@@ -402,6 +407,15 @@ def reverse_transaction(current_user, *args):
                 'reversal_transaction_id': reversal_tx.id
             })
             
+        except BusinessLockedError as e:
+            session.rollback()
+            return jsonify({
+                'success': False,
+                'message': str(e),
+                'lock_reason': 'eod_in_progress',
+                'eod_id': e.lock.get('eod_id'),
+                'lock_date': e.lock.get('lock_date')
+            }), 423
         except Exception as e:
             session.rollback()
             logger.error(f"Error in reverse_transaction: {str(e)}")
@@ -748,6 +762,7 @@ def reprint_receipt(current_user, transaction_id):
 @transactions_bp.route('/export-csv', methods=['GET'])
 @token_required
 @has_permission('view_transactions')
+@read_replica()
 def export_transactions_csv(current_user, *args):
     """导出交易记录为CSV文件"""
     logger.info(f"Export CSV parameters: {request.args}")
@@ -4,6 +4,7 @@ from flask import Blueprint, request, jsonify, current_app
 from sqlalchemy import func, and_, or_
 from models.exchange_models import ExchangeRate, Currency, SystemLog, CurrencyTemplate, Branch, RatePublishRecord, RatePublishDetail, ExchangeTransaction, BranchCurrency, BranchBalanceAlert, DenominationPublishDetail
 from services.db_service import DatabaseService
+from services.reference_data_cache import ReferenceDataCache
 from services.auth_service import token_required, has_permission
 from utils.multilingual_log_service import multilingual_logger
 import logging
@@ -22,12 +23,7 @@ def auto_init_daily_rates(session, branch_id, today):
         base_currency_id = branch.base_currency_id
         
         # 获取被禁用的币种ID列表
-        disabled_currency_ids = session.query(BranchCurrency.currency_id).filter(
-            BranchCurrency.branch_id == branch_id,
-            BranchCurrency.is_enabled == False
-        ).all()
-        
-        disabled_currency_id_list = [row[0] for row in disabled_currency_ids]
+        disabled_currency_id_list = sorted(ReferenceDataCache.get_disabled_currency_ids(session, branch_id))
         
         # 删除被禁用币种的今日汇率记录
         current_app.logger.info(f"[DEBUG] 自动初始化 - 被禁用的币种ID列表: {disabled_currency_id_list}")
@@ -134,10 +130,7 @@ def auto_init_daily_rates(session, branch_id, today):
         ).all()
         
         # 添加调试信息
-        disabled_count = session.query(BranchCurrency).filter(
-            BranchCurrency.branch_id == branch_id,
-            BranchCurrency.is_enabled == False
-        ).count()
+        disabled_count = len(disabled_currency_id_list)
         logger.debug(f"自动初始化 - 网点{branch_id}, 禁用的币种数量: {disabled_count}")
         logger.debug(f"自动初始化 - 将创建 {len(all_currencies)} 个币种的汇率记录")
         for currency in all_currencies:
@@ -259,11 +252,7 @@ def get_all_exchange_rates(current_user):
                 current_app.logger.info(f"[API] /rates/all - 宽松模式，今日无发布记录")
 
         # 获取被禁用的币种ID列表（用于过滤今日汇率记录）
-        disabled_currency_ids = session.query(BranchCurrency.currency_id).filter(
-            BranchCurrency.branch_id == branch_id,
-            BranchCurrency.is_enabled == False
-        ).all()
-        disabled_currency_id_list = [row[0] for row in disabled_currency_ids]
+        disabled_currency_id_list = sorted(ReferenceDataCache.get_disabled_currency_ids(session, branch_id))
         
         # 获取今日汇率记录（排除本币和被禁用的币种）
         today_rates_query = session.query(ExchangeRate).join(Currency).filter(
@@ -1192,6 +1181,8 @@ def add_currency(*args, **kwargs):
         session.add(log)
         
         DatabaseService.commit_session(session)
+        ReferenceDataCache.invalidate_currencies()
+        ReferenceDataCache.invalidate_branch_currencies()
         logger.info(f"Successfully added new currency: {new_currency.currency_code}")
         
         return jsonify({
@@ -1340,12 +1331,7 @@ def get_available_currencies(current_user):
         else:
             # 查询所有非本币的币种（排除被禁用的币种）
             # 使用新的BranchCurrency表来检查币种是否在当前网点被禁用
-            disabled_currency_ids = session.query(BranchCurrency.currency_id).filter(
-                BranchCurrency.branch_id == branch_id,
-                BranchCurrency.is_enabled == False
-            ).all()
-            
-            disabled_currency_id_list = [row[0] for row in disabled_currency_ids]
+            disabled_currency_id_list = sorted(ReferenceDataCache.get_disabled_currency_ids(session, branch_id))
             
             currencies = session.query(Currency).filter(
                 Currency.id != branch.base_currency_id,  # 排除本币
@@ -1530,6 +1516,7 @@ def delete_currency(current_user, currency_code):
         session.add(log)
         
         DatabaseService.commit_session(session)
+        ReferenceDataCache.invalidate_branch_currencies()
         
         message = f'币种 {currency_code} 已从当前网点移除（删除了 {deleted_rates_count} 条汇率记录，{deleted_publish_details_count} 条发布详情记录，{deleted_alerts_count} 条报警设置'
         if deleted_currency:
@@ -10,6 +10,7 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime, date, timedelta
 from services.auth_service import token_required, has_permission
+from services.read_replica import read_replica
 from services.db_service import DatabaseService
 from models.exchange_models import ExchangeTransaction, Currency, Branch, Operator, EODStatus, CurrencyBalance
 from sqlalchemy.exc import SQLAlchemyError
@@ -21,6 +22,7 @@ from utils.multilingual_log_service import multilingual_logger
 from utils.currency_utils import get_base_currency_id_from_branch, is_base_currency
 from models.exchange_models import EODBalanceVerification  # EODBalanceSnapshot, EODHistory 已废弃
 from config.features import FeatureFlags
+from services.balance_checkpoint_service import BalanceCheckpointService
 
 # Get logger instance - DO NOT call basicConfig() here
 logger = logging.getLogger(__name__)
@@ -395,6 +397,13 @@ def _calculate_opening_balance_from_transactions(session, branch_id, currency_id
     """
     is_base_currency = (currency_id == base_currency_id)
     
+    # 已有首笔交易检查点时直接读取，不再扫描交易表
+    checkpoint_opening = BalanceCheckpointService.opening_from_checkpoint(
+        session, branch_id, currency_id, eod_start_time
+    )
+    if checkpoint_opening is not None:
+        return checkpoint_opening
+    
     # 查询该币种在日结开始时间前的第一笔交易（按时间正序）
     first_transaction = session.query(ExchangeTransaction).filter(
         and_(
@@ -507,43 +516,23 @@ def CalBalance(branch_id, start_time, end_time):
         opening_balances = {}
         currency_change_periods = {}  # 存储每个币种的变化统计时间范围
         
-        # 【简化】统一使用新方式：从EODBalanceVerification表获取上次日结的actual_balance
-        logging.info("🔧 统一使用新方式：从EODBalanceVerification表获取期初余额")
-        
+        # 从余额检查点读取期初（最近一次日结，没有日结时为第一笔交易），按币种分组查询
+        currency_openings = BalanceCheckpointService.openings(
+            session, branch_id, base_currency_id, [c.id for c in active_currencies], eod_start_time,
+            undated_eod=True
+        )
         for currency in active_currencies:
-            # 查找上次已完成日结的余额验证记录
-            prev_eod_verification = session.query(EODBalanceVerification).join(EODStatus).filter(
-                EODStatus.branch_id == branch_id,
-                EODStatus.status == 'completed',
-                EODBalanceVerification.currency_id == currency.id
-            ).order_by(desc(EODStatus.completed_at)).first()
-            
-            if prev_eod_verification:
-                # 有上次日结记录：使用上次日结验证后的实际余额作为期初
-                opening_balances[currency.id] = float(prev_eod_verification.actual_balance)
-                # 变化统计从上次日结结束时间+1秒开始
-                prev_eod_status = session.query(EODStatus).filter_by(
-                    id=prev_eod_verification.eod_status_id
-                ).first()
-                if prev_eod_status and prev_eod_status.completed_at:
-                    change_start = prev_eod_status.completed_at + timedelta(seconds=1)
-                    change_end = end_time
-                    currency_change_periods[currency.id] = (change_start, change_end)
-                    logging.info(f"📊 {currency.currency_code} 期初余额: {opening_balances[currency.id]} (来自EODBalanceVerification)")
-                    logging.info(f"📅 {currency.currency_code} 变化统计时间: {change_start} 到 {change_end}")
-                else:
-                    # 如果没有完成时间，使用默认时间范围
-                    currency_change_periods[currency.id] = (start_time, end_time)
-            else:
-                # 没有上次日结记录：从第一笔交易计算期初余额
-                opening_balance, change_start = _calculate_opening_balance_from_transactions(
-                    session, branch_id, currency.id, eod_start_time, base_currency_id
-                )
-                opening_balances[currency.id] = opening_balance
-                change_end = end_time
-                currency_change_periods[currency.id] = (change_start, change_end)
-                logging.info(f"📊 {currency.currency_code} 期初余额: {opening_balances[currency.id]} (第一笔交易值)")
-                logging.info(f"📅 {currency.currency_code} 变化统计时间: {change_start} 到 {change_end}")
+            opening_balance, change_start, source = currency_openings[currency.id]
+            opening_balances[currency.id] = float(opening_balance)
+            if source == 'eod' and change_start is None:
+                # 上次日结没有完成时间：使用默认时间范围
+                change_start = start_time
+            elif source == 'eod':
+                # 有上次日结记录：变化统计从上次日结结束时间+1秒开始
+                change_start = change_start + timedelta(seconds=1)
+            currency_change_periods[currency.id] = (change_start, end_time)
+            logging.info(f"📊 {currency.currency_code} 期初余额: {opening_balances[currency.id]} ({source})，"
+                         f"变化统计时间: {change_start} 到 {end_time}")
 
         # 【修复】计算全局的变化统计时间范围
         # 从所有币种的时间范围中计算最早开始时间和最晚结束时间
@@ -834,6 +823,7 @@ def get_daily_time_range(branch_id):
 
 @reports_bp.route('/income', methods=['GET'])
 @token_required
+@read_replica()
 def get_income_report(current_user):
     """获取动态收入统计报表"""
     try:
@@ -886,6 +876,7 @@ def get_income_report(current_user):
 
 @reports_bp.route('/stock', methods=['GET'])
 @token_required
+@read_replica()
 def get_stock_report(current_user):
     """获取库存外币统计报表"""
     try:
@@ -4,6 +4,7 @@ from services.db_service import DatabaseService
 from models.exchange_models import Permission, PermissionTranslation, Role, RolePermission
 from flask import g
 from services.auth_service import token_required, has_permission
+from services.principal_cache import PrincipalCache
 from sqlalchemy.orm import joinedload
 
 roles_bp = Blueprint('roles', __name__, url_prefix='/api')
@@ -214,6 +215,7 @@ def update_role(current_user, role_id):
                 session.add(role_permission)
         
         session.commit()
+        PrincipalCache.bump_role(role_id)
         
         return jsonify({
             'success': True,
@@ -263,6 +265,7 @@ def delete_role(current_user, role_id):
         # 删除角色
         session.delete(role)
         session.commit()
+        PrincipalCache.bump_role(role_id)
         
         return jsonify({
             'success': True,
@@ -5,6 +5,8 @@ import logging
 from models.exchange_models import Branch, Currency, Permission, RolePermission, SystemLog, ExchangeTransaction, Operator, CurrencyBalance, OperatorActivityLog, Country
 from services.db_service import DatabaseService
 from services.auth_service import token_required, has_permission, has_any_permission
+from services.read_replica import read_replica
+from services.reference_data_cache import ReferenceDataCache
 import traceback
 from sqlalchemy import desc
 from sqlalchemy.orm import joinedload
@@ -132,6 +134,7 @@ def add_branch(*args, **kwargs):
         )
         session.add(branch)
         session.commit()
+        ReferenceDataCache.invalidate_branches()
         
         # 记录网点新增日志
         log = SystemLog(
@@ -243,6 +246,7 @@ def update_branch(*args, **kwargs):
         # 提交事务
         session.commit()
         current_app.logger.info(f"[API] 数据库提交成功")
+        ReferenceDataCache.invalidate_branches()
         
         # 记录网点修改日志
         log = SystemLog(
@@ -405,6 +409,7 @@ def delete_branch(*args, **kwargs):
         # 执行删除
         session.delete(branch)
         session.commit()
+        ReferenceDataCache.invalidate_branches()
         
         return jsonify({
             'success': True,
@@ -681,6 +686,7 @@ def get_daily_statistics(*args, **kwargs):
 @system_bp.route('/statistics/monthly', methods=['GET'])
 @token_required
 @has_permission('system_statistics_view')
+@read_replica()
 def get_monthly_statistics(*args, **kwargs):
     """获取月度统计数据"""
     # 从装饰器传递的参数中获取current_user
@@ -4,6 +4,7 @@ from flask import Blueprint, request, jsonify
 from werkzeug.security import generate_password_hash
 from services.db_service import DatabaseService
 from services.auth_service import token_required, has_permission
+from services.principal_cache import PrincipalCache
 from services.log_service import record_system_log
 from services.activity_service import ActivityService
 from services.unified_log_service import log_user_management
@@ -365,6 +366,7 @@ def update_user(current_user, user_id):
             user.email = data['email']
         
         DatabaseService.commit_session(session)
+        PrincipalCache.bump_user(user_id)
         
         # 安全地获取current_user的属性并记录活动和系统日志
         try:
@@ -488,6 +490,7 @@ def delete_user(current_user, user_id):
         user.is_active = False
         user.status = 'inactive'  # 同时更新状态字段
         DatabaseService.commit_session(session)
+        PrincipalCache.bump_user(user_id)
         
         # 记录系统日志
         try:
@@ -801,6 +804,7 @@ def activate_user(current_user, user_id):
         user.is_active = True
         user.status = 'active'
         DatabaseService.commit_session(session)
+        PrincipalCache.bump_user(user_id)
         
         # 记录活动日志
         try:
@@ -844,6 +848,7 @@ def deactivate_user(current_user, user_id):
         user.is_active = False
         user.status = 'inactive'
         DatabaseService.commit_session(session)
+        PrincipalCache.bump_user(user_id)
         
         # 记录活动日志
         try:
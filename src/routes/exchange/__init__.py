@@ -25,5 +25,6 @@ from . import perform  # noqa: E402,F401
 from . import validation  # noqa: E402,F401
 from . import transactions  # noqa: E402,F401
 from . import dual_direction  # noqa: E402,F401
+from . import precheck  # noqa: E402,F401
 
 __all__ = ['exchange_bp', 'logger', 'RATE_PRECISION']
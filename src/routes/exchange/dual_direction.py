@@ -7,6 +7,7 @@ from services.auth_service import (
     token_required,
 )
 from services.db_service import DatabaseService
+from services.idempotency_service import idempotent
 from services.transaction_split_service import TransactionSplitService
 from utils.backend_i18n import get_request_language, t
 from utils.multilingual_log_service import multilingual_logger
@@ -194,6 +195,7 @@ def validate_dual_direction_exchange(*args):
 @exchange_bp.route('/perform-dual-direction', methods=['POST'])
 @token_required
 @has_permission('transaction_execute')
+@idempotent('exchange.perform_dual_direction')
 @check_business_lock_for_transactions
 def perform_dual_direction_exchange(*args):
     """执行双向交易（支持面值组合的不同买卖方向）"""
@@ -243,6 +245,15 @@ def perform_dual_direction_exchange(*args):
                     'data': result['data']
                 })
 
+            if result.get('lock_reason'):
+                return jsonify({
+                    'success': False,
+                    'message': result['message'],
+                    'lock_reason': result['lock_reason'],
+                    'eod_id': result['data'].get('eod_id'),
+                    'lock_date': result['data'].get('lock_date')
+                }), 423
+
             return jsonify({
                 'success': False,
                 'message': result['message']
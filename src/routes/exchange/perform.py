@@ -1,15 +1,20 @@
+import os
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from decimal import Decimal
 
 from flask import jsonify, request
 
-from models.exchange_models import Branch, Currency
 from services.auth_service import (
     check_business_lock_for_transactions,
     has_permission,
     token_required,
 )
 from services.balance_service import BalanceService
+from services.compliance_outbox_service import ComplianceOutboxService, ComplianceOutboxWorker
 from services.db_service import DatabaseService
+from services.eod_lease_service import BusinessLockedError, EODLeaseService
+from services.idempotency_service import idempotent
+from services.reference_data_cache import ReferenceDataCache
 from services.unified_log_service import log_exchange_transaction
 from utils.language_utils import get_current_language
 from utils.multilingual_log_service import multilingual_logger
@@ -17,9 +22,39 @@ from utils.multilingual_log_service import multilingual_logger
 from . import exchange_bp, logger
 
 
+def _dispatch_compliance(outbox_id):
+    """
+    投递合规检查任务并返回 compliance 结构
+    默认不等待（status=pending，前端可通过 /compliance/<transaction_id> 查询结果）；
+    设置 COMPLIANCE_INLINE_WAIT_SECONDS 后在该时间内完成的结果直接随响应返回
+    """
+    compliance_results = ComplianceOutboxService.empty_result()
+    compliance_results['status'] = 'pending'
+    compliance_results['outbox_id'] = outbox_id
+
+    future = ComplianceOutboxWorker.submit(outbox_id)
+    wait_seconds = float(os.environ.get('COMPLIANCE_INLINE_WAIT_SECONDS', '0'))
+    if future is None or wait_seconds <= 0:
+        return compliance_results
+
+    try:
+        result = future.result(timeout=wait_seconds)
+    except FutureTimeoutError:
+        return compliance_results
+    except Exception as e:
+        logger.error(f"合规检查任务执行失败: {str(e)}")
+        return compliance_results
+
+    if result is not None:
+        compliance_results.update(result)
+        compliance_results['status'] = 'done'
+    return compliance_results
+
+
 @exchange_bp.route('/perform', methods=['POST'])
 @token_required
 @has_permission('transaction_execute')
+@idempotent('exchange.perform')
 @check_business_lock_for_transactions
 def perform_exchange(*args):
     """执行货币兑换操作"""
@@ -39,12 +74,12 @@ def perform_exchange(*args):
                 raise ValueError(f'缺少必要字段: {field}')
 
         # 获取当前汇率
-        currency = session.query(Currency).filter_by(id=data['currency_id']).first()
+        currency = ReferenceDataCache.get_currency(session, data['currency_id'])
         if not currency:
             raise ValueError('币种不存在')
 
         # 获取网点信息和本币ID
-        branch = session.query(Branch).filter_by(id=current_user['branch_id']).first()
+        branch = ReferenceDataCache.get_branch(session, current_user['branch_id'])
         if not branch or not branch.base_currency_id:
             raise ValueError('网点信息不完整或未设置本币')
 
@@ -112,23 +147,17 @@ def perform_exchange(*args):
                 import traceback
                 traceback.print_exc()
 
-        # 更新外币余额（加行锁）
-        foreign_balance_before, foreign_balance_after = BalanceService.update_currency_balance(
-            session=session,
-            currency_id=data['currency_id'],
-            branch_id=current_user['branch_id'],
-            amount=foreign_amount_change,
-            lock_for_update=True
-        )
-
-        # 更新本币余额（加行锁）
-        base_balance_before, base_balance_after = BalanceService.update_currency_balance(
-            session=session,
-            currency_id=base_currency_id,
-            branch_id=current_user['branch_id'],
-            amount=base_amount_change,
+        # 外币和本币两条腿一次过账（按固定顺序加行锁，避免死锁）
+        foreign_leg, base_leg = BalanceService.post_balance_legs(
+            session,
+            [
+                (current_user['branch_id'], data['currency_id'], foreign_amount_change),
+                (current_user['branch_id'], base_currency_id, base_amount_change),
+            ],
             lock_for_update=True
         )
+        foreign_balance_before, foreign_balance_after = foreign_leg['balance_before'], foreign_leg['balance_after']
+        base_balance_before, base_balance_after = base_leg['balance_before'], base_leg['balance_after']
 
         # 创建交易记录（保持原来的设计：一笔交易一条记录）
         transaction = BalanceService.create_exchange_transaction(
@@ -160,82 +189,22 @@ def perform_exchange(*args):
             language='zh-CN'
         )
 
-        # 提交事务
-        session.commit()
-
-        # ⭐ 合规检查: 检查AMLO和BOT报告触发条件（使用统一的RuleEngine）
-        compliance_results = {
-            'amlo': {'triggered': False, 'reports': []},
-            'bot': {'triggered': False, 'reports': []}
-        }
-
-        # 1️⃣ 检查AMLO报告触发条件
-        try:
-            from services.amlo_trigger_service import AMLOTriggerService
-
-            amlo_results = AMLOTriggerService.check_and_create_amlo_records(
-                session=session,
-                transaction=transaction,
-                currency=currency,
-                branch_id=current_user['branch_id'],
-                operator_id=current_user['id']
-            )
+        # ⭐ 合规检查任务写入发件箱，与交易在同一事务中提交，由后台工作线程生成AMLO/BOT记录
+        outbox = ComplianceOutboxService.enqueue(
+            session,
+            transaction,
+            currency_id=data['currency_id'],
+            branch_id=current_user['branch_id'],
+            operator_id=current_user['id']
+        )
 
-            # 如果创建了AMLO记录，记录结果并提交
-            if any(amlo_results.values()):
-                session.commit()
-                logger.info(
-                    "AMLO记录创建结果: CTR(101)=%s, ATR(102)=%s, STR(103)=%s",
-                    amlo_results['amlo_101_created'],
-                    amlo_results['amlo_102_created'],
-                    amlo_results['amlo_103_created'],
-                )
-                compliance_results['amlo']['triggered'] = True
-                if amlo_results['amlo_101_created']:
-                    compliance_results['amlo']['reports'].append('AMLO-1-01')
-                if amlo_results['amlo_102_created']:
-                    compliance_results['amlo']['reports'].append('AMLO-1-02')
-                if amlo_results['amlo_103_created']:
-                    compliance_results['amlo']['reports'].append('AMLO-1-03')
-        except Exception as amlo_error:
-            # AMLO触发失败不应影响主交易流程，只记录错误
-            logger.error(f"AMLO触发检查失败: {str(amlo_error)}")
-            import traceback
-            traceback.print_exc()
-
-        # 2️⃣ 检查BOT报告触发条件
-        try:
-            from services.bot_trigger_service import BOTTriggerService
+        # 入口只按缓存快速拒绝，提交前在本事务中查询网点是否进入日结（本次请求唯一的锁定状态读取）
+        EODLeaseService.ensure_business_unlocked(session, current_user['branch_id'])
 
-            bot_results = BOTTriggerService.check_and_create_bot_records(
-                session=session,
-                transaction=transaction,
-                currency=currency,
-                branch_id=current_user['branch_id'],
-                operator_id=current_user['id']
-            )
+        # 提交事务
+        session.commit()
 
-            # 如果创建了BOT记录，记录结果并提交
-            if any(bot_results.values()):
-                session.commit()
-                logger.info(
-                    "BOT记录创建结果: BuyFX=%s, SellFX=%s, FCD=%s",
-                    bot_results['bot_buyfx_created'],
-                    bot_results['bot_sellfx_created'],
-                    bot_results['bot_fcd_created'],
-                )
-                compliance_results['bot']['triggered'] = True
-                if bot_results['bot_buyfx_created']:
-                    compliance_results['bot']['reports'].append('BOT_BuyFX')
-                if bot_results['bot_sellfx_created']:
-                    compliance_results['bot']['reports'].append('BOT_SellFX')
-                if bot_results['bot_fcd_created']:
-                    compliance_results['bot']['reports'].append('BOT_FCD')
-        except Exception as bot_error:
-            # BOT触发失败不应影响主交易流程，只记录错误
-            logger.error(f"BOT触发检查失败: {str(bot_error)}")
-            import traceback
-            traceback.print_exc()
+        compliance_results = _dispatch_compliance(outbox.id)
 
         # 记录兑换交易日志
         try:
@@ -317,11 +286,44 @@ def perform_exchange(*args):
                 'type': transaction.type,
                 'rate': float(transaction.rate)
             },
-            'compliance': compliance_results  # 新增：返回合规检查结果
+            'compliance': compliance_results  # 合规检查结果（异步处理时 status=pending）
         })
+    except BusinessLockedError as exc:
+        session.rollback()
+        return jsonify({
+            'success': False,
+            'message': str(exc),
+            'lock_reason': 'eod_in_progress',
+            'eod_id': exc.lock.get('eod_id'),
+            'lock_date': exc.lock.get('lock_date')
+        }), 423
     except Exception as exc:
         logger.error(f"Exchange transaction failed: {str(exc)}")
         session.rollback()
         return jsonify({'success': False, 'message': str(exc)}), 500
     finally:
         DatabaseService.close_session(session)
+
+
+@exchange_bp.route('/compliance/<int:transaction_id>', methods=['GET'])
+@token_required
+@has_permission('transaction_execute')
+def get_compliance_status(*args, transaction_id):
+    """查询交易的异步合规检查结果（AMLO/BOT报告生成情况）"""
+    current_user = args[0] if args else None
+    if not current_user:
+        return jsonify({'success': False, 'message': '用户信息获取失败'}), 401
+
+    session = DatabaseService.get_session()
+    try:
+        compliance = ComplianceOutboxService.get_status(
+            session, transaction_id, branch_id=current_user['branch_id']
+        )
+        if compliance is None:
+            return jsonify({'success': False, 'message': '未找到该交易的合规检查任务'}), 404
+        return jsonify({'success': True, 'compliance': compliance})
+    except Exception as exc:
+        logger.error(f"查询合规检查结果失败: {str(exc)}")
+        return jsonify({'success': False, 'message': str(exc)}), 500
+    finally:
+        DatabaseService.close_session(session)
@@ -0,0 +1,50 @@
+from flask import jsonify, request
+
+from services.auth_service import has_permission, token_required
+from services.db_service import DatabaseService
+from services.exchange_precheck_service import ExchangePrecheckService
+
+from . import exchange_bp, logger
+
+
+@exchange_bp.route('/precheck', methods=['POST'])
+@token_required
+@has_permission('transaction_execute')
+def precheck_exchange(*args):
+    """
+    交易预检：一次检查整篮交易的余额、报警阈值、用途限额、预约审核金额和AMLO/BOT触发条件
+
+    请求体:
+    {
+        "legs": [
+            {"currency_id": 2, "type": "sell", "amount": 1000, "rate": 35.2, "purpose": "旅游"},
+            {"currency_id": 3, "type": "buy", "denominations": [{"denomination": 50, "quantity": 4}], "rate": 38.1}
+        ],
+        "customer_id": "1234567890123",   # 可选
+        "purpose": "旅游",                 # 可选，各笔未指定用途时使用
+        "use_fcd": false                   # 可选
+    }
+    """
+    current_user = args[0] if args else None
+    if not current_user:
+        return jsonify({'success': False, 'message': '用户信息获取失败'}), 401
+
+    data = request.get_json(silent=True) or {}
+    session = DatabaseService.get_session()
+    try:
+        result = ExchangePrecheckService.precheck(
+            session,
+            branch_id=current_user['branch_id'],
+            legs=data.get('legs'),
+            customer_id=data.get('customer_id') or None,
+            purpose=data.get('purpose') or None,
+            use_fcd=bool(data.get('use_fcd', False))
+        )
+        return jsonify({'success': True, 'data': result})
+    except ValueError as exc:
+        return jsonify({'success': False, 'message': str(exc)}), 400
+    except Exception as exc:
+        logger.error("交易预检失败: %s", str(exc))
+        return jsonify({'success': False, 'message': f'交易预检失败: {str(exc)}'}), 500
+    finally:
+        DatabaseService.close_session(session)
@@ -14,6 +14,7 @@ from models.exchange_models import (
 )
 from services.auth_service import has_permission, token_required
 from services.db_service import DatabaseService
+from services.idempotency_service import idempotent
 
 from . import exchange_bp, logger
 
@@ -324,6 +325,7 @@ def download_receipt(*args, transaction_no):
 @exchange_bp.route('/business-group/<business_group_id>/print-receipt', methods=['POST'])
 @token_required
 @has_permission('transaction_execute')
+@idempotent('exchange.business_group_print_receipt')
 def print_dual_direction_receipt(*args, **kwargs):
     """生成并打印双向交易业务组PDF票据"""
     # 修复参数顺序问题：从装饰器获取current_user，从路径获取business_group_id
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+蓝图注册表
+create_app() 按此表导入并注册蓝图，同时记录每个蓝图模块的导入耗时（见 scripts/startup_benchmark.py）
+蓝图模块只在顶层导入轻量依赖；PDF（ReportLab/PyPDF2/PyMuPDF）、Excel（openpyxl）和 AMLO 表单填充等
+较重的库在接口首次调用时才导入，新增蓝图时请保持这一约定
+"""
+
+import importlib
+import logging
+import time
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# (模块, 蓝图变量名[, register_blueprint 参数])
+BLUEPRINTS = [
+    ('routes.app_rates', 'rates_bp'),  # 已经包含 /api 前缀
+    ('routes.app_end_of_day', 'end_of_day_bp'),  # 已经包含 /api 前缀
+    ('routes.app_query_transactions', 'transactions_bp'),  # Already has /api prefix
+    ('routes.app_query_balances', 'balances_bp'),  # 保留blueprint注册
+    ('routes.app_roles', 'roles_bp'),  # Already has /api prefix
+    ('routes.app_auth', 'auth_bp'),  # 已经包含 /api 前缀
+    ('routes.app_dashboard', 'dashboard_bp'),  # 已经包含 /api 前缀
+    ('routes.app_system', 'system_bp'),  # 已经包含 /api 前缀
+    ('routes.app_exchange', 'exchange_bp'),  # 已经包含 /api 前缀
+    ('routes.app_currencies', 'currencies_bp'),  # 已经包含 /api 前缀
+    ('routes.app_balance', 'balance_bp'),  # 已经包含 /api 前缀
+    ('routes.app_reversal_query', 'reversal_query_bp'),  # 已经包含 /api 前缀
+    ('routes.app_balance_adjust_query', 'balance_adjust_query_bp'),  # 已经包含 /api 前缀
+    ('routes.app_user_management', 'user_bp'),  # 用户管理蓝图，已经包含 /api 前缀
+    ('routes.app_user_management', 'perm_bp'),  # 权限管理蓝图，已经包含 /api 前缀
+    ('routes.app_profile', 'profile_bp'),  # 个人信息蓝图，已经包含 /api 前缀
+    ('routes.app_print_settings', 'print_settings_bp'),  # 新增：打印设置蓝图
+    ('routes.app_log_management', 'log_management_bp'),  # 新增：日志管理蓝图
+    ('routes.app_currency_management', 'currency_management_bp'),  # 币种管理蓝图
+    ('routes.app_standards_management', 'standards_management_bp'),  # 规范管理蓝图
+    ('routes.app_purpose_limits', 'purpose_limits_bp'),  # 交易用途限额蓝图
+    ('routes.app_income_query', 'income_query_bp'),  # 动态收入查询蓝图
+    ('routes.app_foreign_stock_query', 'foreign_stock_query_bp'),  # 库存外币查询蓝图
+    ('routes.app_local_stock_query', 'local_stock_bp'),  # 本币库存查询蓝图
+    ('routes.app_transaction_alerts', 'transaction_alerts_bp'),  # 交易报警事件蓝图
+    ('routes.app_operating_status', 'operating_status_bp'),  # 营业状态管理蓝图
+    ('routes.app_reports', 'reports_bp'),  # 报表查询蓝图
+    ('routes.app_eod_step', 'eod_step_bp'),  # 日结步骤管理蓝图
+    ('routes.app_eod_batch', 'eod_batch_bp'),  # 批量日结管理蓝图
+    ('routes.app_eod_migration', 'eod_migration_bp'),  # EOD迁移管理蓝图
+    ('routes.app_dual_direction_migration', 'dual_direction_migration_bp'),  # 双向交易迁移管理蓝图
+    ('routes.app_receipt_migration', 'receipt_migration_bp'),  # 收据增强迁移管理蓝图
+    ('routes.app_feature_flags', 'app_feature_flags', {'url_prefix': '/api'}),  # 特性开关管理蓝图
+    ('routes.app_denominations', 'denomination_bp'),  # 面值管理蓝图
+    ('routes.app_denominations_api', 'denominations_api_bp'),  # 面值汇率API蓝图
+    ('routes.batch_publish_api', 'batch_publish_bp'),  # 批次发布API蓝图
+    ('routes.batch_display_api', 'batch_display_bp'),  # 批次显示API蓝图
+    ('routes.app_repform', 'app_repform'),  # RepForm核心API蓝图
+    ('routes.app_amlo', 'app_amlo'),  # AMLO审核API蓝图
+    ('routes.app_bot', 'app_bot'),  # BOT报告API蓝图
+    ('routes.app_report_numbers', 'report_number_bp'),  # 报告编号管理API蓝图
+    ('routes.app_compliance', 'app_compliance'),  # 合规配置API蓝图
+    ('routes.app_metrics', 'metrics_bp'),  # 运行指标（/metrics）
+]
+
+
+def register_blueprints(app) -> Dict[str, float]:
+    """
+    导入并注册全部蓝图
+
+    Returns:
+        {模块名: 导入耗时毫秒}，已被其他模块导入过的记为 0
+    """
+    import_ms = {}
+    for entry in BLUEPRINTS:
+        module_name, attribute = entry[0], entry[1]
+        options = entry[2] if len(entry) > 2 else {}
+        started = time.perf_counter()
+        module = importlib.import_module(module_name)
+        import_ms[module_name] = import_ms.get(module_name, 0.0) + (time.perf_counter() - started) * 1000
+        app.register_blueprint(getattr(module, attribute), **options)
+
+    slowest = sorted(import_ms.items(), key=lambda item: item[1], reverse=True)[:5]
+    logger.debug("蓝图导入耗时(ms): " + ', '.join(f'{name}={ms:.1f}' for name, ms in slowest))
+    app.extensions['blueprint_import_ms'] = import_ms
+    return import_ms
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+余额检查点维护工具
+- backfill: 为已完成的日结和各币种首笔交易补写检查点（可重复执行，已有的跳过）
+- verify:   从原始交易和日结验证记录重新计算，列出不一致的检查点
+- intraday: 立即写入一次日间检查点（也可由定时任务按 BALANCE_CHECKPOINT_INTERVAL_MINUTES 执行）
+
+用法:
+    python scripts/balance_checkpoints.py backfill
+    python scripts/balance_checkpoints.py verify --branch-id 3
+    python scripts/balance_checkpoints.py intraday --branch-id 3
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.exchange_models import Branch
+from services.db_service import DatabaseService
+from services.balance_checkpoint_service import BalanceCheckpointService
+
+
+def main():
+    parser = argparse.ArgumentParser(description='余额检查点维护工具')
+    parser.add_argument('command', choices=['backfill', 'verify', 'intraday'],
+                        help='backfill=补写, verify=对账, intraday=写入日间检查点')
+    parser.add_argument('--branch-id', type=int, help='只处理指定网点')
+    args = parser.parse_args()
+
+    session = DatabaseService.get_session()
+    try:
+        if args.command == 'backfill':
+            counts = BalanceCheckpointService.backfill(session, args.branch_id)
+            session.commit()
+            print(f"✅ 已补写日结检查点 {counts['eod']} 条，首笔交易检查点 {counts['opening']} 条")
+            return 0
+
+        if args.command == 'intraday':
+            if args.branch_id:
+                branch_ids = [args.branch_id]
+            else:
+                branch_ids = [branch_id for (branch_id,) in session.query(Branch.id).filter(
+                    Branch.is_active == True).all()]  # noqa: E712
+            count = sum(BalanceCheckpointService.record_intraday(session, branch_id) for branch_id in branch_ids)
+            session.commit()
+            print(f"✅ 已写入日间检查点 {count} 条")
+            return 0
+
+        mismatches = BalanceCheckpointService.verify(session, args.branch_id)
+        if not mismatches:
+            print("✅ 余额检查点与原始数据一致")
+            return 0
+
+        print(f"❌ 发现 {len(mismatches)} 处不一致:")
+        for item in mismatches:
+            print(f"  - 检查点ID: {item['id']}, 网点: {item['branch_id']}, 币种: {item['currency_id']}, "
+                  f"类型: {item['kind']}, 时点: {item['checkpoint_at']}, "
+                  f"余额: {item['actual_balance']}/{item['expected_balance']}, 原因: {item['reason']}")
+        return 1
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        DatabaseService.close_session(session)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
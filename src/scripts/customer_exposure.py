@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+客户累计额度桶维护工具
+- rebuild: 从 exchange_transactions 重建额度桶（直接用 SQL 导入/修改交易后执行）
+- check:   对账，列出额度桶与原始交易表不一致的 客户+网点+日期
+
+用法:
+    python scripts/customer_exposure.py check
+    python scripts/customer_exposure.py rebuild --customer-id P123456
+    python scripts/customer_exposure.py rebuild --since 2025-01-01
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.db_service import DatabaseService
+from services.customer_exposure_service import CustomerExposureService
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='客户累计额度桶维护工具')
+    parser.add_argument('command', choices=['rebuild', 'check'], help='rebuild=重建, check=对账')
+    parser.add_argument('--customer-id', help='只处理指定客户证件号')
+    parser.add_argument('--since', type=_parse_date, help='只处理该日期（YYYY-MM-DD）及之后的交易')
+    args = parser.parse_args()
+
+    session = DatabaseService.get_session()
+    try:
+        if args.command == 'rebuild':
+            count = CustomerExposureService.rebuild(session, args.customer_id, args.since)
+            session.commit()
+            print(f"✅ 已重建 {count} 个额度桶")
+            return 0
+
+        mismatches = CustomerExposureService.check_consistency(session, args.customer_id, args.since)
+        if not mismatches:
+            print("✅ 额度桶与交易表一致")
+            return 0
+
+        print(f"❌ 发现 {len(mismatches)} 处不一致:")
+        for item in mismatches:
+            print(f"  - 客户: {item['customer_id']}, 网点: {item['branch_id']}, 日期: {item['date']}, "
+                  f"次数: {item['actual_count']}/{item['expected_count']}, "
+                  f"金额: {item['actual_amount']}/{item['expected_amount']}")
+        return 1
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        DatabaseService.close_session(session)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+批量日结工具
+- run:    为指定网点创建批量日结任务并执行（并行数 --workers，默认 EOD_BATCH_WORKERS）
+- resume: 继续执行中断或未全部完成的任务（已完成的步骤跳过）
+- status: 查看任务汇总
+
+用法:
+    python scripts/eod_batch.py run --branch-ids 1,2,3 --operator-id 1 --date 2024-03-01
+    python scripts/eod_batch.py resume --run-id 12
+    python scripts/eod_batch.py status --run-id 12
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import date, datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.exchange_models import Branch, EODBatchRun
+from services.db_service import DatabaseService
+from services.eod_batch_service import EODBatchService
+
+
+def print_summary(summary):
+    print(f"任务 {summary['run_id']}  日期: {summary['target_date']}  状态: {summary['status']}  "
+          f"网点: {summary['total']}  {json.dumps(summary['counts'], ensure_ascii=False)}")
+    for branch in summary['branches']:
+        total_ms = sum(branch['durations'].values())
+        print(f"  - 网点 {branch['branch_id']} {branch['branch_name'] or ''}: {branch['status']}, "
+              f"日结ID: {branch['eod_id']}, 已完成步骤: {branch['stage']}, 耗时: {total_ms:.0f}ms"
+              + (f", 原因: {branch['message']}" if branch['message'] else ''))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量日结工具')
+    parser.add_argument('command', choices=['run', 'resume', 'status'],
+                        help='run=创建并执行, resume=继续执行, status=查看汇总')
+    parser.add_argument('--branch-ids', help='网点ID，逗号分隔；不指定时为全部启用的网点（run）')
+    parser.add_argument('--operator-id', type=int, help='执行日结的操作员ID（run）')
+    parser.add_argument('--date', help='日结日期 YYYY-MM-DD，默认今天（run）')
+    parser.add_argument('--workers', type=int, help='并行网点数')
+    parser.add_argument('--force-differences', action='store_true', help='余额核对不一致时强制继续（run）')
+    parser.add_argument('--language', default='zh', help='报表语言（run）')
+    parser.add_argument('--run-id', type=int, help='任务ID（resume/status）')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        if not args.operator_id:
+            parser.error('run 需要 --operator-id')
+        target_date = datetime.strptime(args.date, '%Y-%m-%d').date() if args.date else date.today()
+        session = DatabaseService.get_session()
+        try:
+            if args.branch_ids:
+                branch_ids = [int(value) for value in args.branch_ids.split(',') if value.strip()]
+            else:
+                branch_ids = [branch_id for (branch_id,) in session.query(Branch.id).filter(
+                    Branch.is_active == True).order_by(Branch.id).all()]  # noqa: E712
+            run = EODBatchService.create_run(session, branch_ids, args.operator_id, target_date,
+                                             args.workers, args.force_differences, args.language)
+            session.commit()
+            run_id = run.id
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            DatabaseService.close_session(session)
+        print(f"已创建批量日结任务 {run_id}，网点 {len(branch_ids)} 个")
+        summary = EODBatchService.run(run_id, args.workers)
+    else:
+        if not args.run_id:
+            parser.error(f'{args.command} 需要 --run-id')
+        if args.command == 'resume':
+            summary = EODBatchService.run(args.run_id, args.workers)
+        else:
+            session = DatabaseService.get_session()
+            try:
+                run = session.get(EODBatchRun, args.run_id)
+                if not run:
+                    print(f"❌ 批量日结任务不存在: {args.run_id}")
+                    return 1
+                summary = EODBatchService.summary(session, run)
+            finally:
+                DatabaseService.close_session(session)
+
+    print_summary(summary)
+    if summary['status'] == 'completed':
+        print("✅ 全部网点日结已完成")
+        return 0
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+索引建议工具
+1. 收集：在测试套件或压测过程中记录实际执行的查询条件（见 services/index_advisor.py）
+2. 建议：合并收集结果，对照模型声明的索引（--live 时同时对照线上库）给出复合索引建议
+3. 生成迁移：按 src/migrations 的编号格式写出迁移脚本
+
+用法：
+    # 运行测试套件并收集（pytest 参数放在 -- 之后）
+    python scripts/index_advisor.py collect --output shapes_tests.json --pytest -- tests/backend -q
+    # 运行柜台压测并收集（压测参数放在 -- 之后）
+    python scripts/index_advisor.py collect --output shapes_load.json --load-test -- --tellers 4 --trades 30
+    # 查看建议
+    python scripts/index_advisor.py propose shapes_tests.json shapes_load.json --tables exchange_transactions
+    # 生成迁移
+    python scripts/index_advisor.py propose shapes_load.json --migration 018 --name add_hot_query_indexes
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(SRC_DIR)
+
+PYTEST_CODE = '''
+import sys
+from services.index_advisor import IndexAdvisor
+IndexAdvisor.init_from_env()
+import pytest
+sys.exit(pytest.main(sys.argv[1:]))
+'''
+
+
+def collect(args):
+    output = os.path.abspath(args.output)
+    env = dict(os.environ, INDEX_ADVISOR_OUTPUT=output, PYTHONIOENCODING='utf-8')
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [SRC_DIR, env.get('PYTHONPATH')]))
+    extra = [a for a in args.extra if a != '--']
+    if args.load_test:
+        command = [sys.executable, os.path.join(SRC_DIR, 'scripts', 'load_test_counter.py'), *extra]
+        cwd = SRC_DIR
+    else:
+        command = [sys.executable, '-c', PYTEST_CODE, *extra]
+        cwd = os.path.dirname(SRC_DIR)
+    code = subprocess.call(command, cwd=cwd, env=env)
+    if not os.path.exists(output):
+        print(f'未生成收集结果（退出码 {code}）')
+        sys.exit(2)
+    # 测试失败不影响收集结果
+    print(f'查询形态已写入: {output}（退出码 {code}）')
+
+
+def propose(args):
+    from services.index_advisor import IndexAdvisor, LOW_CARDINALITY_COLUMNS
+    import models.denomination_models  # noqa: F401  加载全部模型以取得已声明的索引
+    import models.report_models  # noqa: F401
+    import models.report_number_models  # noqa: F401
+    from models.exchange_models import Base
+
+    engine = None
+    if args.live:
+        from services.db_service import engine
+    existing = IndexAdvisor.existing_indexes(Base.metadata, engine)
+    low_cardinality = LOW_CARDINALITY_COLUMNS if args.low_cardinality is None else args.low_cardinality
+    proposals = IndexAdvisor.propose(
+        IndexAdvisor.load(args.inputs), existing,
+        min_count=args.min_count, tables=args.tables, low_cardinality=low_cardinality
+    )
+    if args.top:
+        proposals = proposals[:args.top]
+
+    if not proposals:
+        print('没有需要新增的索引')
+        return
+    print(f"{'索引':<60}{'次数':>8}{'累计耗时(ms)':>14}{'形态数':>8}")
+    for p in proposals:
+        print(f"{p['name']:<60}{p['count']:>8}{p['total_ms']:>14.1f}{p['shapes']:>8}")
+        print(f"    {p['table']}({', '.join(p['columns'])})")
+
+    if args.migration:
+        name = args.name or 'add_query_indexes'
+        path = os.path.join(SRC_DIR, 'migrations', f'{args.migration}_{name}.py')
+        if os.path.exists(path):
+            print(f'迁移文件已存在: {path}')
+            sys.exit(2)
+        description = args.description or '新增热点查询索引'
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(IndexAdvisor.render_migration(proposals, args.migration, description))
+        print(f'\n迁移已写入: {path}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='索引建议工具')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    collect_parser = sub.add_parser('collect', help='运行测试套件或压测并收集查询形态')
+    collect_parser.add_argument('--output', default='index_advisor_shapes.json', help='收集结果JSON文件')
+    source = collect_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--pytest', action='store_true', help='运行 pytest（在仓库根目录执行）')
+    source.add_argument('--load-test', action='store_true', help='运行 scripts/load_test_counter.py')
+    collect_parser.add_argument('extra', nargs=argparse.REMAINDER, help='传给 pytest 或压测工具的参数')
+
+    propose_parser = sub.add_parser('propose', help='根据收集结果给出索引建议')
+    propose_parser.add_argument('inputs', nargs='+', help='一个或多个收集结果JSON文件')
+    propose_parser.add_argument('--tables', nargs='+', help='只对这些表给出建议')
+    propose_parser.add_argument('--min-count', type=int, default=1, help='形态出现次数下限')
+    propose_parser.add_argument('--top', type=int, help='只保留前N条建议')
+    propose_parser.add_argument('--low-cardinality', nargs='*', help='不作为索引列的低区分度列（默认状态/类型/标记列）')
+    propose_parser.add_argument('--live', action='store_true', help='同时对照当前配置数据库中已有的索引')
+    propose_parser.add_argument('--migration', help='写出迁移脚本，值为迁移版本号（如 018）')
+    propose_parser.add_argument('--name', help='迁移文件名（不含版本号），默认 add_query_indexes')
+    propose_parser.add_argument('--description', help='迁移说明')
+
+    args = parser.parse_args()
+    if args.command == 'collect':
+        collect(args)
+    else:
+        propose(args)
+
+
+if __name__ == '__main__':
+    main()
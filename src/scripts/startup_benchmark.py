@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后端冷启动基准
+在子进程中以 python -X importtime 导入 main 并调用 create_app()，报告：
+- import main 与 create_app() 的耗时（毫秒，多次运行取中位数）
+- 每个蓝图模块的导入耗时（由 routes.registry 计时）
+- 按顶层包汇总的自身导入耗时（找出拖慢启动的依赖）
+- 启动阶段是否加载了应当延迟导入的重型库（ReportLab、PyMuPDF、openpyxl 等）
+
+用法：
+    python scripts/startup_benchmark.py
+    python scripts/startup_benchmark.py --runs 5 --top 15
+    python scripts/startup_benchmark.py --output startup.json --budget-ms 1500
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MARKER = '__STARTUP_BENCHMARK__'
+
+# 启动时不应加载的重型库（应在接口首次调用时导入）
+HEAVY_PACKAGES = ('reportlab', 'fitz', 'pymupdf', 'openpyxl', 'pandas', 'numpy', 'PyPDF2', 'pypdf', 'PIL', 'matplotlib')
+
+CHILD_CODE = f'''
+import json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+app = main.create_app()
+created = time.perf_counter()
+print({MARKER!r} + json.dumps({{
+    'import_main_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'routes': len(list(app.url_map.iter_rules())),
+    'heavy_loaded': sorted(name for name in {HEAVY_PACKAGES!r} if name in sys.modules),
+    'blueprints_ms': app.extensions.get('blueprint_import_ms', {{}}),
+}}))
+'''
+
+
+def parse_importtime(stderr):
+    """解析 -X importtime 输出，返回 [(模块名, 自身微秒, 累计微秒)]"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = [part.strip() for part in line.split(':', 1)[1].split('|')]
+            rows.append((name, int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+    return rows
+
+
+def run_once():
+    env = dict(os.environ, PYTHONIOENCODING='utf-8')
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD_CODE],
+        cwd=SRC_DIR, env=env, capture_output=True, text=True, encoding='utf-8', errors='replace'
+    )
+    result = None
+    for line in proc.stdout.splitlines():
+        if line.startswith(MARKER):
+            result = json.loads(line[len(MARKER):])
+    if proc.returncode != 0 or result is None:
+        tail = '\n'.join(proc.stderr.splitlines()[-15:])
+        raise RuntimeError(f'子进程启动失败（退出码 {proc.returncode}）:\n{tail}')
+
+    modules = parse_importtime(proc.stderr)
+    by_package = defaultdict(int)
+    for name, self_us, _ in modules:
+        by_package[name.split('.')[0]] += self_us
+    # 蓝图导入耗时由 routes.registry 在 create_app() 中计时（已在 main 中导入的模块记为首次导入者的耗时）
+    result['packages_self_ms'] = {name: us / 1000 for name, us in by_package.items()}
+    return result
+
+
+def median_of(runs, key):
+    return round(statistics.median(run[key] for run in runs), 1)
+
+
+def median_map(runs, key):
+    names = set()
+    for run in runs:
+        names.update(run[key])
+    return {name: round(statistics.median(run[key].get(name, 0.0) for run in runs), 1) for name in names}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='后端冷启动基准')
+    parser.add_argument('--runs', type=int, default=3, help='运行次数，结果取中位数')
+    parser.add_argument('--top', type=int, default=10, help='显示耗时最多的前N项')
+    parser.add_argument('--output', help='写出JSON结果文件')
+    parser.add_argument('--budget-ms', type=float, help='import main + create_app 的耗时上限，超出时以状态码1退出')
+    args = parser.parse_args()
+
+    runs = []
+    for index in range(args.runs):
+        try:
+            runs.append(run_once())
+        except RuntimeError as e:
+            print(str(e))
+            sys.exit(2)
+        print(f'第 {index + 1}/{args.runs} 次: import main {runs[-1]["import_main_ms"]:.1f}ms, '
+              f'create_app {runs[-1]["create_app_ms"]:.1f}ms')
+
+    summary = {
+        'runs': args.runs,
+        'import_main_ms': median_of(runs, 'import_main_ms'),
+        'create_app_ms': median_of(runs, 'create_app_ms'),
+        'routes': runs[-1]['routes'],
+        'heavy_loaded': runs[-1]['heavy_loaded'],
+        'blueprints_ms': median_map(runs, 'blueprints_ms'),
+        'packages_self_ms': median_map(runs, 'packages_self_ms'),
+    }
+    summary['total_ms'] = round(summary['import_main_ms'] + summary['create_app_ms'], 1)
+
+    print()
+    print(f"启动总耗时: {summary['total_ms']}ms（import main {summary['import_main_ms']}ms + "
+          f"create_app {summary['create_app_ms']}ms），路由数: {summary['routes']}")
+    print(f'\n蓝图模块导入耗时（前{args.top}）:')
+    for name, ms in sorted(summary['blueprints_ms'].items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f'  {name:<45}{ms:>10.1f}ms')
+    print(f'\n按顶层包汇总的自身导入耗时（前{args.top}）:')
+    for name, ms in sorted(summary['packages_self_ms'].items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f'  {name:<45}{ms:>10.1f}ms')
+    if summary['heavy_loaded']:
+        print(f"\n警告: 启动阶段加载了重型库 {', '.join(summary['heavy_loaded'])}，应改为在接口内按需导入")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        print(f'\n结果已写入: {args.output}')
+
+    if args.budget_ms is not None and summary['total_ms'] > args.budget_ms:
+        print(f"\n启动耗时 {summary['total_ms']}ms 超出上限 {args.budget_ms}ms")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
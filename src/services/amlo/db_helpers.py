@@ -12,6 +12,8 @@ from typing import Dict, Any, List, Optional, Tuple
 from sqlalchemy import text
 from datetime import datetime
 
+from ..branch_scope import scoped_text
+
 logger = logging.getLogger(__name__)
 
 
@@ -32,7 +34,8 @@ class AMLODatabaseHelper:
             Reservation row or None if not found
         """
         try:
-            sql = text("""
+            params = {'reservation_id': reservation_id}
+            sql = scoped_text("""
                 SELECT
                     id, reservation_no, report_type, direction, status,
                     customer_name, customer_id, customer_country_code,
@@ -40,10 +43,8 @@ class AMLODatabaseHelper:
                     form_data, created_at, audit_time,
                     operator_id, auditor_id, rejection_reason
                 FROM Reserved_Transaction
-                WHERE id = :reservation_id
-            """)
-
-            params = {'reservation_id': reservation_id}
+                WHERE id = :reservation_id{branch_scope}
+            """, params)
 
             if branch_id is not None:
                 sql = text("""
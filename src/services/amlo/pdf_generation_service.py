@@ -20,6 +20,7 @@ from sqlalchemy import text
 from datetime import datetime
 
 from .db_helpers import AMLODatabaseHelper
+from services.request_tracing import traced
 
 logger = logging.getLogger(__name__)
 
@@ -276,6 +277,7 @@ class PDFGenerationService:
         return institution_code, branch_code
 
     @staticmethod
+    @traced('pdf.amlo_report')
     def generate_single_pdf(
         session,
         reservation_id: int,
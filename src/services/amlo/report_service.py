@@ -13,6 +13,7 @@ from typing import Dict, Any, List, Optional, Tuple
 from sqlalchemy import text
 from datetime import datetime
 
+from ..branch_scope import scoped_text
 from .db_helpers import AMLODatabaseHelper
 from .validators import ReservationValidator
 
@@ -235,7 +236,8 @@ class ReportService:
             Tuple of (success, report_data, error_message)
         """
         try:
-            sql = text("""
+            params = {'report_id': report_id}
+            sql = scoped_text("""
                 SELECT
                     r.id, r.reserved_id, r.report_no, r.report_type,
                     r.customer_name, r.customer_id,
@@ -245,10 +247,10 @@ class ReportService:
                     res.status as reservation_status, res.form_data
                 FROM AMLOReport r
                 LEFT JOIN Reserved_Transaction res ON r.reserved_id = res.id
-                WHERE r.id = :report_id
-            """)
+                WHERE r.id = :report_id{branch_scope}
+            """, params, column='r.branch_id')
 
-            result = session.execute(sql, {'report_id': report_id}).fetchone()
+            result = session.execute(sql, params).fetchone()
 
             if not result:
                 return False, None, "Report not found"
@@ -15,6 +15,7 @@ from typing import Dict, Any, Optional, Tuple, List
 from sqlalchemy import text
 from datetime import datetime
 
+from ..branch_scope import scoped_text
 from .db_helpers import AMLODatabaseHelper
 from .validators import ReservationValidator
 
@@ -169,8 +170,9 @@ class SignatureService:
             Dict of timestamps
         """
         # Get existing timestamps
-        sql = text("SELECT signature_timestamps FROM Reserved_Transaction WHERE id = :reservation_id")
-        result = session.execute(sql, {'reservation_id': reservation_id}).fetchone()
+        params = {'reservation_id': reservation_id}
+        sql = scoped_text("SELECT signature_timestamps FROM Reserved_Transaction WHERE id = :reservation_id{branch_scope}", params)
+        result = session.execute(sql, params).fetchone()
 
         existing_timestamps = {}
         if result and result[0]:
@@ -202,7 +204,8 @@ class SignatureService:
             Tuple of (success, signatures_data, error_message)
         """
         try:
-            sql = text("""
+            params = {'reservation_id': reservation_id}
+            sql = scoped_text("""
                 SELECT
                     reporter_signature,
                     customer_signature,
@@ -210,10 +213,10 @@ class SignatureService:
                     signature_storage_type,
                     signature_timestamps
                 FROM Reserved_Transaction
-                WHERE id = :reservation_id
-            """)
+                WHERE id = :reservation_id{branch_scope}
+            """, params)
 
-            result = session.execute(sql, {'reservation_id': reservation_id}).fetchone()
+            result = session.execute(sql, params).fetchone()
 
             if not result:
                 return False, None, "Reservation not found"
@@ -271,8 +274,9 @@ class SignatureService:
                 return False, "Reservation not found"
 
             # Get existing timestamps
-            sql = text("SELECT signature_timestamps FROM Reserved_Transaction WHERE id = :reservation_id")
-            result = session.execute(sql, {'reservation_id': reservation_id}).fetchone()
+            params = {'reservation_id': reservation_id}
+            sql = scoped_text("SELECT signature_timestamps FROM Reserved_Transaction WHERE id = :reservation_id{branch_scope}", params)
+            result = session.execute(sql, params).fetchone()
 
             timestamps = {}
             if result and result[0]:
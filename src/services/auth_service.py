@@ -6,9 +6,8 @@ import logging
 import traceback
 from functools import wraps
 from flask import request, jsonify, current_app, g
-from services.db_service import DatabaseService
-from models.exchange_models import Operator, Role, Permission, RolePermission
-from sqlalchemy import text
+from services.principal_cache import PrincipalCache
+from services.request_tracing import span
 
 # 设置日志记录器
 logger = logging.getLogger(__name__)
@@ -16,53 +15,40 @@ logger = logging.getLogger(__name__)
 # JWT密钥 - 优先使用JWT_SECRET_KEY，否则使用SECRET_KEY
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or os.environ.get('SECRET_KEY', 'ExchangeOK-JWT-Secret-Key-2025-Fixed')
 
-def generate_token(user_id, expires_in_hours=24):
-    """生成JWT令牌"""
+def generate_token(user_id, expires_in_hours=24, claims=None):
+    """生成JWT令牌；claims 为附加内容（如 PrincipalCache.token_claims 返回的用户信息）"""
     payload = {
         'sub': user_id,
         'iat': datetime.utcnow(),
         'exp': datetime.utcnow() + timedelta(hours=expires_in_hours)
     }
+    if claims:
+        payload.update(claims)
     return jwt.encode(payload, SECRET_KEY, algorithm='HS256')
 
-def decode_token(token):
-    """解码JWT令牌"""
+def decode_token_claims(token):
+    """解码JWT令牌，返回完整内容；无效或过期时返回 None"""
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-        return payload['sub']
+        return jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
     except jwt.ExpiredSignatureError as e:
-        print(f"[decode_token] ❌ Token已过期: {e}", flush=True)
-        try:
-            logger.error(f"Token已过期: {e}")
-        except:
-            pass
+        logger.error(f"Token已过期: {e}")
         return None
     except jwt.InvalidTokenError as e:
-        print(f"[decode_token] ❌ Token无效: {e}", flush=True)
-        try:
-            logger.error(f"Token无效: {e}")
-        except:
-            pass
-        print(f"[decode_token] 使用的SECRET_KEY: {SECRET_KEY[:20]}...", flush=True)
+        logger.error(f"Token无效: {e}")
         return None
     except Exception as e:
-        print(f"[decode_token] ❌ 未知错误: {e}", flush=True)
-        try:
-            logger.error(f"Token解码未知错误: {e}")
-        except:
-            pass
+        logger.error(f"Token解码未知错误: {e}")
         return None
 
+def decode_token(token):
+    """解码JWT令牌"""
+    payload = decode_token_claims(token)
+    return payload['sub'] if payload else None
+
 def token_required(f):
-    """JWT令牌验证装饰器"""
+    """JWT令牌验证装饰器（用户信息由 PrincipalCache 缓存，稳定状态下不访问数据库）"""
     @wraps(f)
     def decorated(*args, **kwargs):
-        # 添加请求日志
-        print(f"\n========== [token_required] 收到请求 ==========", flush=True)
-        print(f"[token_required] 请求路径: {request.path}", flush=True)
-        print(f"[token_required] 请求方法: {request.method}", flush=True)
-        print(f"[token_required] 请求头: Authorization = {request.headers.get('Authorization', '未提供')}", flush=True)
-
         token = None
 
         # 先从Authorization头获取token
@@ -70,136 +56,38 @@ def token_required(f):
             auth_header = request.headers['Authorization']
             try:
                 token = auth_header.split(" ")[1]  # Bearer <token>
-                print(f"[token_required] 从Authorization头提取token", flush=True)
             except IndexError:
-                print(f"[token_required] ❌ Token格式错误", flush=True)
-                try:
-                    logger.error("Token格式错误")
-                except:
-                    pass
+                logger.error("Token格式错误")
                 return jsonify({'message': 'Token格式错误'}), 401
 
         # 如果头部没有token，尝试从URL参数获取
         if not token and 'token' in request.args:
             token = request.args.get('token')
-            print(f"[token_required] 从URL参数提取token", flush=True)
 
         if not token:
-            print(f"[token_required] ❌ 缺少访问令牌，返回401", flush=True)
-            try:
-                logger.error("缺少访问令牌")
-            except:
-                pass
+            logger.error(f"缺少访问令牌: {request.method} {request.path}")
             return jsonify({'message': '缺少访问令牌'}), 401
-        
-        try:
-            print(f"[token_required] 开始解码token...", flush=True)
-            user_id = decode_token(token)
 
-            if user_id is None:
-                print(f"[token_required] ❌ Token解码失败或已过期", flush=True)
-                try:
-                    logger.error("Token解码失败或已过期")
-                except:
-                    pass
+        try:
+            with span('auth'):
+                claims = decode_token_claims(token)
+                current_user = PrincipalCache.get_principal(claims['sub'], claims) if claims is not None else None
+            if claims is None:
                 return jsonify({'message': '无效或过期的令牌'}), 401
 
-            print(f"[token_required] Token解码成功, user_id={user_id}", flush=True)
+            if current_user is None:
+                logger.error(f"用户不存在或已禁用: user_id={claims['sub']}")
+                return jsonify({'message': '用户不存在或已禁用'}), 401
 
-            # 获取用户信息
-            print(f"[token_required] 正在获取数据库会话...", flush=True)
-            try:
-                session = DatabaseService.get_session()
-                print(f"[token_required] 数据库会话获取成功", flush=True)
-            except Exception as db_err:
-                print(f"[token_required] 数据库会话获取失败: {db_err}", flush=True)
-                traceback.print_exc()
-                return jsonify({'message': '数据库连接失败'}), 500
-
-            try:
-                print(f"[token_required] 正在查询用户: user_id={user_id}", flush=True)
-                user = session.query(Operator).filter_by(id=user_id).first()
-                print(f"[token_required] 用户查询完成: user={'存在' if user else '不存在'}", flush=True)
-
-                if not user:
-                    print(f"[token_required] 用户不存在: user_id={user_id}", flush=True)
-                    try:
-                        logger.error(f"用户不存在: user_id={user_id}")
-                    except:
-                        pass
-                    return jsonify({'message': '用户不存在或已禁用'}), 401
-
-                if not user.is_active:
-                    print(f"[token_required] 用户已禁用: user_id={user_id}", flush=True)
-                    try:
-                        logger.error(f"用户已禁用: user_id={user_id}")
-                    except:
-                        pass
-                    return jsonify({'message': '用户不存在或已禁用'}), 401
-                
-                # 获取用户角色信息
-                print(f"[token_required] 正在查询角色: role_id={user.role_id}", flush=True)
-                role_query = session.execute(
-                    text('SELECT role_name FROM roles WHERE id = :role_id'),
-                    {'role_id': user.role_id}
-                ).fetchone()
-
-                role_name = role_query[0] if role_query else ''
-                print(f"[token_required] 角色查询完成: role_name={role_name}", flush=True)
-
-                # 获取用户权限 - 使用直接SQL查询确保与登录一致
-                print(f"[token_required] 正在查询权限...", flush=True)
-                permission_query = session.execute(
-                    text('''SELECT p.permission_name 
-                       FROM permissions p
-                       JOIN role_permissions rp ON p.id = rp.permission_id
-                       WHERE rp.role_id = :role_id
-                       ORDER BY p.permission_name'''),
-                    {'role_id': user.role_id}
-                ).fetchall()
-
-                permission_list = [row[0] for row in permission_query]
-                print(f"[token_required] 权限查询完成: 共{len(permission_list)}个权限", flush=True)
-
-                # 判断是否为管理员或App角色
-                is_admin = role_name in ['系统管理员', 'System Administrator', 'admin', 'administrator']
-                is_app_role = role_name == 'App' or role_name == 'APP'
-                
-                # 构建用户信息
-                current_user = {
-                    'id': user.id,
-                    'login_code': user.login_code,
-                    'name': user.name,
-                    'branch_id': user.branch_id,
-                    'role_id': user.role_id,
-                    'role_name': role_name,
-                    'permissions': permission_list,
-                    'is_admin': is_admin,
-                    'is_app_role': is_app_role
-                }
-                
-                # 将用户信息存储到g对象中
-                g.current_user = current_user
-                print(f"[token_required] 用户信息构建完成，准备调用目标函数", flush=True)
-
-            finally:
-                DatabaseService.close_session(session)
-                print(f"[token_required] 数据库会话已关闭", flush=True)
-
-            print(f"[token_required] 正在调用目标函数: {f.__name__}", flush=True)
-            result = f(current_user, *args, **kwargs)
-            print(f"[token_required] 目标函数调用成功", flush=True)
-            return result
+            # 将用户信息存储到g对象中
+            g.current_user = current_user
+            return f(current_user, *args, **kwargs)
 
         except Exception as e:
-            print(f"[token_required] 异常: {type(e).__name__}: {str(e)}", flush=True)
             traceback.print_exc()
-            try:
-                logger.error(f"Token验证失败: {str(e)}")
-            except:
-                print(f"[token_required] ⚠️ logger.error也失败了", flush=True)
+            logger.error(f"Token验证失败: {str(e)}")
             return jsonify({'message': '令牌验证失败'}), 401
-    
+
     return decorated
 
 def has_permission(required_permission):
@@ -321,7 +209,11 @@ def check_eod_session_permission(f):
     return decorated
 
 def check_business_lock_for_transactions(f):
-    """交易相关的营业锁定检查装饰器 - 支持多网点隔离"""
+    """
+    交易相关的营业锁定检查装饰器 - 支持多网点隔离
+    只按缓存快速拒绝，不查询数据库；被装饰的接口在提交前用
+    EODLeaseService.ensure_business_unlocked 在交易事务中查询营业锁定状态
+    """
     @wraps(f)
     def decorated(*args, **kwargs):
         # 获取当前用户
@@ -330,9 +222,9 @@ def check_business_lock_for_transactions(f):
         else:
             return jsonify({'message': '用户信息获取失败'}), 401
         
-        # 检查当前网点的营业锁定状态
-        from services.eod_service import EODService
-        lock_status = EODService.check_business_lock(current_user['branch_id'])
+        # 检查当前网点缓存的营业锁定状态
+        from services.eod_lease_service import EODLeaseService
+        lock_status = EODLeaseService.cached_business_lock(current_user['branch_id']) or {}
         
         if lock_status.get('is_locked', False):
             return jsonify({
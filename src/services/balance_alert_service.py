@@ -10,6 +10,7 @@ from typing import Dict, Any, Optional, List
 from enum import Enum
 
 from services.db_service import DatabaseService
+from services.reference_data_cache import ReferenceDataCache
 from models.exchange_models import (
     BranchBalanceAlert, CurrencyBalance, Currency, 
     Branch, SystemLog, Operator
@@ -64,7 +65,7 @@ class BalanceAlertService:
                     }
                 
                 # 获取币种信息
-                currency = session.query(Currency).filter(Currency.id == currency_id).first()
+                currency = ReferenceDataCache.get_currency(session, currency_id)
                 currency_code = currency.currency_code if currency else 'UNKNOWN'
                 
                 # 检查余额状态
@@ -213,7 +214,7 @@ class BalanceAlertService:
                 ).first()
                 
                 # 获取币种信息
-                currency = session.query(Currency).filter(Currency.id == currency_id).first()
+                currency = ReferenceDataCache.get_currency(session, currency_id)
                 
                 # 检查余额状态
                 alert_status = BalanceAlertService.check_balance_status(currency_id, current_balance, branch_id)
@@ -0,0 +1,624 @@
+# -*- coding: utf-8 -*-
+"""
+余额检查点服务
+按 网点+币种 只追加记录账面余额检查点（balance_checkpoints），期初余额和期间变动从最近的检查点
+加其后的交易增量计算，不再为没有上次日结的币种扫描第一笔交易，也不再从期间起点累加全部交易：
+- eod：日结完成时按 EODBalanceVerification 的实际余额写入（complete_eod，同一事务）
+- opening：没有日结记录时的第一笔交易（期初 = 该笔金额，期间从其后1秒开始），首次计算时写入
+- intraday：设置 BALANCE_CHECKPOINT_INTERVAL_MINUTES 后由定时任务按间隔写入，记录期间起点到该时点的变动；
+  时点不晚于当前时间减 BALANCE_CHECKPOINT_SETTLE_SECONDS（默认300秒），交易的 created_at 在事务开始时取得、
+  提交前不可见，留出这段时间让时点之前开始的交易提交；同时记录写入时已提交的最大交易ID
+
+账面变动口径与日结理论余额一致：状态 completed/reversed、剔除 Eod_diff；外币累加 amount，
+本币累加所有币种交易的 local_amount。已有历史通过 backfill() 补写，verify() 从原始交易重新计算对账。
+检查点写入后补录或迟于结算延迟才提交的、时点之前的交易会使其失效，verify() 可发现这种情况：
+ID 大于检查点记录的最大交易ID的单独列出，其余体现为期间变动不一致。
+"""
+
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, case, func, insert
+from sqlalchemy.orm import Session
+
+from models.exchange_models import (
+    BalanceCheckpoint, Branch, CurrencyBalance, EODBalanceVerification, EODStatus, ExchangeTransaction
+)
+
+logger = logging.getLogger(__name__)
+
+# 计入账面变动的交易状态
+LEDGER_STATUSES = ('completed', 'reversed')
+# 日结盘点差额调节已体现在实际余额中，不计入变动
+EXCLUDED_TYPE = 'Eod_diff'
+# 没有日结记录时，可作为期初余额的第一笔交易类型（与 _calculate_opening_balance_from_transactions 一致）
+OPENING_TRANSACTION_TYPES = ('initial_balance', 'adjust_balance', 'buy', 'sell', 'reversal', 'cash_out')
+# 首笔交易检查点的期间从交易后1秒开始（该笔金额即期初余额）
+OPENING_OFFSET = timedelta(seconds=1)
+
+# (期初余额, 期间起点, 来源 eod/opening/none)
+Opening = Tuple[Decimal, Optional[datetime], str]
+
+
+class BalanceCheckpointService:
+    """余额检查点的写入、读取、补写和对账"""
+
+    @staticmethod
+    def interval_minutes() -> int:
+        """日间检查点间隔（分钟），0 表示不写日间检查点"""
+        try:
+            return max(int(os.environ.get('BALANCE_CHECKPOINT_INTERVAL_MINUTES', '0')), 0)
+        except ValueError:
+            return 0
+
+    @staticmethod
+    def settle_seconds() -> int:
+        """日间检查点时点距当前时间的最小间隔（秒）"""
+        try:
+            return max(int(os.environ.get('BALANCE_CHECKPOINT_SETTLE_SECONDS', '300')), 0)
+        except ValueError:
+            return 300
+
+    # ------------------------------------------------------------------
+    # 交易增量
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _ledger_filter(branch_id: int, start_time, end_time):
+        return (
+            ExchangeTransaction.branch_id == branch_id,
+            ExchangeTransaction.created_at >= start_time,
+            ExchangeTransaction.created_at < end_time,
+            ExchangeTransaction.status.in_(LEDGER_STATUSES),
+            ExchangeTransaction.type != EXCLUDED_TYPE
+        )
+
+    @staticmethod
+    def deltas(session: Session, branch_id: int, base_currency_id: Optional[int],
+               starts: Dict[int, Any], end_time) -> Dict[int, Any]:
+        """
+        各币种从各自起点到 end_time（不含）的账面变动
+
+        外币按起点分组，每组一次按币种分组的 SUM(amount)；本币一次查询合计本币直接交易和
+        外币交易对本币的影响（均为 local_amount）。没有交易的外币不在结果中
+        """
+        windows = defaultdict(list)
+        for currency_id, start_time in starts.items():
+            if currency_id != base_currency_id:
+                windows[start_time].append(currency_id)
+
+        changes = {}
+        for start_time, currency_ids in windows.items():
+            rows = session.query(
+                ExchangeTransaction.currency_id,
+                func.coalesce(func.sum(ExchangeTransaction.amount), 0)
+            ).filter(
+                *BalanceCheckpointService._ledger_filter(branch_id, start_time, end_time),
+                ExchangeTransaction.currency_id.in_(currency_ids)
+            ).group_by(ExchangeTransaction.currency_id).all()
+            changes.update(dict(rows))
+
+        if base_currency_id in starts:
+            direct, impact = session.query(
+                func.coalesce(func.sum(case(
+                    (ExchangeTransaction.currency_id == base_currency_id, ExchangeTransaction.local_amount)
+                )), 0),
+                func.coalesce(func.sum(case(
+                    (ExchangeTransaction.currency_id != base_currency_id, ExchangeTransaction.local_amount)
+                )), 0)
+            ).filter(
+                *BalanceCheckpointService._ledger_filter(branch_id, starts[base_currency_id], end_time)
+            ).one()
+            changes[base_currency_id] = (direct or 0) + (impact or 0)
+        return changes
+
+    # ------------------------------------------------------------------
+    # 期初余额
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _latest_eod_checkpoints(session: Session, branch_id: int, currency_ids: List[int],
+                                exclude_eod_id: Optional[int]) -> Dict[int, BalanceCheckpoint]:
+        """每个币种最近一次日结检查点"""
+        conditions = [
+            BalanceCheckpoint.branch_id == branch_id,
+            BalanceCheckpoint.kind == 'eod',
+            BalanceCheckpoint.currency_id.in_(currency_ids)
+        ]
+        if exclude_eod_id is not None:
+            conditions.append(BalanceCheckpoint.eod_status_id != exclude_eod_id)
+        latest = session.query(
+            BalanceCheckpoint.currency_id.label('currency_id'),
+            func.max(BalanceCheckpoint.checkpoint_at).label('checkpoint_at')
+        ).filter(*conditions).group_by(BalanceCheckpoint.currency_id).subquery()
+
+        checkpoints = {}
+        for checkpoint in session.query(BalanceCheckpoint).join(
+            latest, and_(latest.c.currency_id == BalanceCheckpoint.currency_id,
+                         latest.c.checkpoint_at == BalanceCheckpoint.checkpoint_at)
+        ).filter(*conditions).order_by(BalanceCheckpoint.id).all():
+            checkpoints.setdefault(checkpoint.currency_id, checkpoint)
+        return checkpoints
+
+    @staticmethod
+    def _previous_verifications(session: Session, branch_id: int, currency_ids: List[int],
+                                exclude_eod_id: Optional[int]) -> Dict[int, Tuple]:
+        """尚未补写检查点的历史：每个币种最近一次已完成日结的 (实际余额, 完成时间)"""
+        conditions = [
+            EODStatus.branch_id == branch_id,
+            EODStatus.status == 'completed'
+        ]
+        if exclude_eod_id is not None:
+            conditions.append(EODStatus.id != exclude_eod_id)
+        latest = session.query(
+            EODBalanceVerification.currency_id.label('currency_id'),
+            func.max(EODStatus.completed_at).label('completed_at')
+        ).join(EODStatus, EODStatus.id == EODBalanceVerification.eod_status_id).filter(
+            *conditions, EODBalanceVerification.currency_id.in_(currency_ids)
+        ).group_by(EODBalanceVerification.currency_id).subquery()
+
+        rows = session.query(
+            EODBalanceVerification.currency_id,
+            EODBalanceVerification.actual_balance,
+            EODStatus.completed_at
+        ).join(EODStatus, EODStatus.id == EODBalanceVerification.eod_status_id).join(
+            latest, and_(latest.c.currency_id == EODBalanceVerification.currency_id,
+                         latest.c.completed_at == EODStatus.completed_at)
+        ).filter(*conditions).order_by(EODBalanceVerification.id).all()
+
+        previous = {}
+        for currency_id, actual_balance, completed_at in rows:
+            previous.setdefault(currency_id, (actual_balance, completed_at))
+        return previous
+
+    @staticmethod
+    def _undated_verifications(session: Session, branch_id: int, currency_ids: List[int],
+                               exclude_eod_id: Optional[int]) -> Dict[int, Any]:
+        """只有完成时间为空的已完成日结的币种：最近一次（日结ID最大）的实际余额"""
+        conditions = [
+            EODStatus.branch_id == branch_id,
+            EODStatus.status == 'completed',
+            EODStatus.completed_at.is_(None),
+            EODBalanceVerification.currency_id.in_(currency_ids)
+        ]
+        if exclude_eod_id is not None:
+            conditions.append(EODStatus.id != exclude_eod_id)
+        undated = {}
+        for currency_id, actual_balance in session.query(
+            EODBalanceVerification.currency_id, EODBalanceVerification.actual_balance
+        ).join(EODStatus, EODStatus.id == EODBalanceVerification.eod_status_id).filter(*conditions).order_by(
+            EODStatus.id.desc(), EODBalanceVerification.id
+        ).all():
+            undated.setdefault(currency_id, actual_balance)
+        return undated
+
+    @staticmethod
+    def _first_transactions(session: Session, branch_id: int, currency_ids: Optional[List[int]],
+                            before=None) -> Dict[Tuple[int, int], ExchangeTransaction]:
+        """各 网点+币种 的第一笔可作为期初的交易（branch_id/currency_ids 为空表示全部）"""
+        conditions = [ExchangeTransaction.type.in_(OPENING_TRANSACTION_TYPES)]
+        if branch_id is not None:
+            conditions.append(ExchangeTransaction.branch_id == branch_id)
+        if currency_ids is not None:
+            conditions.append(ExchangeTransaction.currency_id.in_(currency_ids))
+        if before is not None:
+            conditions.append(ExchangeTransaction.created_at < before)
+        first = session.query(
+            ExchangeTransaction.branch_id.label('branch_id'),
+            ExchangeTransaction.currency_id.label('currency_id'),
+            func.min(ExchangeTransaction.created_at).label('created_at')
+        ).filter(*conditions).group_by(ExchangeTransaction.branch_id, ExchangeTransaction.currency_id).subquery()
+
+        transactions = {}
+        for transaction in session.query(ExchangeTransaction).join(
+            first, and_(first.c.branch_id == ExchangeTransaction.branch_id,
+                        first.c.currency_id == ExchangeTransaction.currency_id,
+                        first.c.created_at == ExchangeTransaction.created_at)
+        ).filter(*conditions).order_by(ExchangeTransaction.id).all():
+            transactions.setdefault((transaction.branch_id, transaction.currency_id), transaction)
+        return transactions
+
+    @staticmethod
+    def _opening_checkpoint(transaction: ExchangeTransaction, base_currency_id: Optional[int]) -> Dict[str, Any]:
+        value = transaction.local_amount if transaction.currency_id == base_currency_id else transaction.amount
+        checkpoint_at = transaction.created_at + OPENING_OFFSET
+        return {
+            'branch_id': transaction.branch_id, 'currency_id': transaction.currency_id, 'kind': 'opening',
+            'checkpoint_at': checkpoint_at, 'balance': value, 'period_start': checkpoint_at,
+            'period_change': 0, 'source_transaction_id': transaction.id, 'created_at': datetime.now()
+        }
+
+    @staticmethod
+    def openings(session: Session, branch_id: int, base_currency_id: Optional[int], currency_ids: Iterable[int],
+                 before, exclude_eod_id: Optional[int] = None, persist: bool = False,
+                 undated_eod: bool = False) -> Dict[int, Opening]:
+        """
+        各币种的期初余额和期间起点
+
+        依次取：最近一次日结检查点（尚未补写时取 EODBalanceVerification）、首笔交易检查点、
+        before 之前的第一笔交易（persist=True 时写入首笔交易检查点，由调用方提交），都没有时期初为0、
+        期间从 before 开始
+
+        Args:
+            before: 日结开始时间，第一笔交易需早于该时间
+            exclude_eod_id: 排除的日结（当前正在进行的日结）
+            undated_eod: 没有带完成时间的日结时，使用完成时间为空的已完成日结的实际余额
+                         （期间起点为 None，由调用方决定统计范围；库存报表沿用原有行为）
+        """
+        currency_ids = list(currency_ids)
+        openings: Dict[int, Opening] = {}
+        for currency_id, checkpoint in BalanceCheckpointService._latest_eod_checkpoints(
+                session, branch_id, currency_ids, exclude_eod_id).items():
+            openings[currency_id] = (Decimal(str(checkpoint.balance)), checkpoint.checkpoint_at, 'eod')
+
+        missing = [cid for cid in currency_ids if cid not in openings]
+        if missing:
+            for currency_id, (actual_balance, completed_at) in BalanceCheckpointService._previous_verifications(
+                    session, branch_id, missing, exclude_eod_id).items():
+                openings[currency_id] = (Decimal(str(actual_balance)), completed_at, 'eod')
+
+        missing = [cid for cid in currency_ids if cid not in openings]
+        if missing and undated_eod:
+            for currency_id, actual_balance in BalanceCheckpointService._undated_verifications(
+                    session, branch_id, missing, exclude_eod_id).items():
+                openings[currency_id] = (Decimal(str(actual_balance)), None, 'eod')
+
+        missing = [cid for cid in currency_ids if cid not in openings]
+        if missing:
+            for checkpoint in session.query(BalanceCheckpoint).filter(
+                BalanceCheckpoint.branch_id == branch_id,
+                BalanceCheckpoint.kind == 'opening',
+                BalanceCheckpoint.currency_id.in_(missing)
+            ).order_by(BalanceCheckpoint.checkpoint_at, BalanceCheckpoint.id).all():
+                if checkpoint.currency_id in openings:
+                    continue
+                # 首笔交易晚于 before 时，before 之前没有交易（期初为0）
+                if before is not None and checkpoint.checkpoint_at - OPENING_OFFSET < before:
+                    openings[checkpoint.currency_id] = (
+                        Decimal(str(float(checkpoint.balance))), checkpoint.checkpoint_at, 'opening')
+                else:
+                    openings[checkpoint.currency_id] = (Decimal(str(0.0)), before, 'none')
+
+        missing = [cid for cid in currency_ids if cid not in openings]
+        if missing:
+            first = BalanceCheckpointService._first_transactions(session, branch_id, missing, before)
+            rows = []
+            for (_, currency_id), transaction in first.items():
+                row = BalanceCheckpointService._opening_checkpoint(transaction, base_currency_id)
+                openings[currency_id] = (Decimal(str(float(row['balance']))), row['checkpoint_at'], 'opening')
+                rows.append(row)
+            if persist and rows:
+                session.execute(insert(BalanceCheckpoint), rows)
+
+        for currency_id in currency_ids:
+            openings.setdefault(currency_id, (Decimal(str(0.0)), before, 'none'))
+        return openings
+
+    @staticmethod
+    def opening_from_checkpoint(session: Session, branch_id: int, currency_id: int,
+                                before) -> Optional[Tuple[float, Any]]:
+        """
+        按首笔交易检查点返回 (期初余额, 变化统计开始时间)，与 _calculate_opening_balance_from_transactions
+        的返回值相同；没有检查点时返回 None（由调用方扫描交易表）
+        """
+        checkpoint = session.query(BalanceCheckpoint).filter(
+            BalanceCheckpoint.branch_id == branch_id,
+            BalanceCheckpoint.currency_id == currency_id,
+            BalanceCheckpoint.kind == 'opening'
+        ).order_by(BalanceCheckpoint.checkpoint_at, BalanceCheckpoint.id).first()
+        if checkpoint is None:
+            return None
+        if checkpoint.checkpoint_at - OPENING_OFFSET < before:
+            return float(checkpoint.balance), checkpoint.checkpoint_at
+        return 0.0, before
+
+    @staticmethod
+    def first_activity_at(session: Session, branch_id: int, any_type: bool = False) -> Optional[datetime]:
+        """
+        网点第一笔交易时间，没有时返回 None
+
+        默认取首笔交易检查点（只含可作为期初的交易类型）；any_type=True 时取任意类型交易的最早创建时间
+        （branch_id, created_at 索引上的 MIN，不扫描交易表）
+        """
+        if any_type:
+            return session.query(func.min(ExchangeTransaction.created_at)).filter(
+                ExchangeTransaction.branch_id == branch_id
+            ).scalar()
+        first = session.query(func.min(BalanceCheckpoint.checkpoint_at)).filter(
+            BalanceCheckpoint.branch_id == branch_id,
+            BalanceCheckpoint.kind == 'opening'
+        ).scalar()
+        return first - OPENING_OFFSET if first else None
+
+    # ------------------------------------------------------------------
+    # 期间变动
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def period_changes(session: Session, branch_id: int, base_currency_id: Optional[int],
+                       starts: Dict[int, Any], end_time) -> Dict[int, Any]:
+        """
+        各币种从期间起点到 end_time（不含）的账面变动：同一期间内不晚于 end_time 的最近日间检查点
+        的 period_change 加其后的交易增量（没有日间检查点时从期间起点累加）
+        """
+        effective = dict(starts)
+        carried = {}
+        period_starts = {start for start in starts.values() if start is not None}
+        if period_starts and end_time is not None:
+            for checkpoint in session.query(BalanceCheckpoint).filter(
+                BalanceCheckpoint.branch_id == branch_id,
+                BalanceCheckpoint.kind == 'intraday',
+                BalanceCheckpoint.currency_id.in_(list(starts)),
+                BalanceCheckpoint.period_start.in_(period_starts),
+                BalanceCheckpoint.checkpoint_at <= end_time
+            ).order_by(BalanceCheckpoint.checkpoint_at, BalanceCheckpoint.id).all():
+                currency_id = checkpoint.currency_id
+                if checkpoint.period_start != starts[currency_id] or checkpoint.checkpoint_at < starts[currency_id]:
+                    continue
+                effective[currency_id] = checkpoint.checkpoint_at
+                carried[currency_id] = Decimal(str(checkpoint.period_change))
+
+        changes = BalanceCheckpointService.deltas(session, branch_id, base_currency_id, effective, end_time)
+        for currency_id, change in carried.items():
+            changes[currency_id] = change + Decimal(str(changes.get(currency_id) or 0))
+        return changes
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def record_eod(session: Session, eod_status: EODStatus) -> int:
+        """日结完成时按余额验证记录写入日结检查点（不提交，已写入的币种跳过）"""
+        if not eod_status.completed_at:
+            return 0
+        existing = {currency_id for (currency_id,) in session.query(BalanceCheckpoint.currency_id).filter(
+            BalanceCheckpoint.kind == 'eod',
+            BalanceCheckpoint.eod_status_id == eod_status.id
+        )}
+        rows = []
+        for verification in session.query(EODBalanceVerification).filter_by(
+                eod_status_id=eod_status.id).order_by(EODBalanceVerification.id).all():
+            if verification.currency_id in existing:
+                continue
+            existing.add(verification.currency_id)
+            rows.append({
+                'branch_id': eod_status.branch_id, 'currency_id': verification.currency_id, 'kind': 'eod',
+                'checkpoint_at': eod_status.completed_at, 'balance': verification.actual_balance,
+                'period_start': eod_status.completed_at, 'period_change': 0, 'eod_status_id': eod_status.id,
+                'created_at': datetime.now()
+            })
+        if rows:
+            session.execute(insert(BalanceCheckpoint), rows)
+        return len(rows)
+
+    @staticmethod
+    def record_intraday(session: Session, branch_id: int, at: Optional[datetime] = None) -> int:
+        """写入网点各币种在 at（默认且最晚为当前时间减结算延迟）的日间检查点（不提交）"""
+        latest = datetime.now() - timedelta(seconds=BalanceCheckpointService.settle_seconds())
+        at = min(at, latest) if at else latest
+        branch = session.query(Branch).filter_by(id=branch_id).first()
+        if not branch:
+            return 0
+        base_currency_id = branch.base_currency_id
+        currency_ids = {cid for (cid,) in session.query(CurrencyBalance.currency_id).filter(
+            CurrencyBalance.branch_id == branch_id).distinct()}
+        if base_currency_id:
+            currency_ids.add(base_currency_id)
+        if not currency_ids:
+            return 0
+
+        openings = BalanceCheckpointService.openings(
+            session, branch_id, base_currency_id, sorted(currency_ids), at, persist=True)
+        starts = {cid: start for cid, (_, start, kind) in openings.items() if kind != 'none' and start <= at}
+        changes = BalanceCheckpointService.period_changes(session, branch_id, base_currency_id, starts, at)
+        # 在读取变动之后取：计入变动的交易ID都不大于它，大于它且时点之前的交易即为写入后才提交的
+        last_transaction_id = session.query(func.max(ExchangeTransaction.id)).filter(
+            ExchangeTransaction.branch_id == branch_id).scalar()
+        now = datetime.now()
+        rows = []
+        for currency_id, start in starts.items():
+            change = Decimal(str(changes.get(currency_id) or 0))
+            rows.append({
+                'branch_id': branch_id, 'currency_id': currency_id, 'kind': 'intraday', 'checkpoint_at': at,
+                'balance': openings[currency_id][0] + change, 'period_start': start, 'period_change': change,
+                'last_transaction_id': last_transaction_id, 'created_at': now
+            })
+        if rows:
+            session.execute(insert(BalanceCheckpoint), rows)
+        return len(rows)
+
+    @staticmethod
+    def record_intraday_all(at: Optional[datetime] = None) -> int:
+        """定时任务：为所有启用的网点写入日间检查点（未设置间隔时不执行）"""
+        if not BalanceCheckpointService.interval_minutes():
+            return 0
+        from services.db_service import DatabaseService
+
+        session = DatabaseService.get_session()
+        try:
+            latest = datetime.now() - timedelta(seconds=BalanceCheckpointService.settle_seconds())
+            at = min(at, latest) if at else latest
+            count = 0
+            for (branch_id,) in session.query(Branch.id).filter(Branch.is_active == True).all():  # noqa: E712
+                count += BalanceCheckpointService.record_intraday(session, branch_id, at)
+            session.commit()
+            logger.info(f"日间余额检查点写入完成: {count} 条，时点 {at}")
+            return count
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            DatabaseService.close_session(session)
+
+    # ------------------------------------------------------------------
+    # 补写与对账
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def backfill(session: Session, branch_id: Optional[int] = None, batch_size: int = 5000) -> Dict[str, int]:
+        """
+        为已有历史补写检查点（不提交，可重复执行）：已完成日结的日结检查点、各 网点+币种 的首笔交易检查点
+
+        Returns:
+            {'eod': 写入的日结检查点数, 'opening': 写入的首笔交易检查点数}
+        """
+        eod_query = session.query(EODStatus.id, EODStatus.branch_id, EODStatus.completed_at).filter(
+            EODStatus.status == 'completed', EODStatus.completed_at.isnot(None))
+        checkpoint_query = session.query(BalanceCheckpoint.eod_status_id, BalanceCheckpoint.currency_id).filter(
+            BalanceCheckpoint.kind == 'eod')
+        opening_query = session.query(BalanceCheckpoint.branch_id, BalanceCheckpoint.currency_id).filter(
+            BalanceCheckpoint.kind == 'opening')
+        if branch_id is not None:
+            eod_query = eod_query.filter(EODStatus.branch_id == branch_id)
+            checkpoint_query = checkpoint_query.filter(BalanceCheckpoint.branch_id == branch_id)
+            opening_query = opening_query.filter(BalanceCheckpoint.branch_id == branch_id)
+
+        eods = {eod_id: (eod_branch_id, completed_at) for eod_id, eod_branch_id, completed_at in eod_query}
+        existing = set(checkpoint_query.all())
+        now = datetime.now()
+        rows = []
+        verification_query = session.query(
+            EODBalanceVerification.eod_status_id, EODBalanceVerification.currency_id,
+            EODBalanceVerification.actual_balance
+        ).join(EODStatus, EODStatus.id == EODBalanceVerification.eod_status_id).filter(
+            EODStatus.status == 'completed', EODStatus.completed_at.isnot(None))
+        if branch_id is not None:
+            verification_query = verification_query.filter(EODStatus.branch_id == branch_id)
+        for eod_id, currency_id, actual_balance in verification_query.order_by(EODBalanceVerification.id):
+            if (eod_id, currency_id) in existing:
+                continue
+            existing.add((eod_id, currency_id))
+            eod_branch_id, completed_at = eods[eod_id]
+            rows.append({
+                'branch_id': eod_branch_id, 'currency_id': currency_id, 'kind': 'eod',
+                'checkpoint_at': completed_at, 'balance': actual_balance, 'period_start': completed_at,
+                'period_change': 0, 'eod_status_id': eod_id, 'created_at': now
+            })
+
+        eod_count = len(rows)
+        openings = set(opening_query.all())
+        base_currencies = dict(session.query(Branch.id, Branch.base_currency_id).all())
+        for key, transaction in BalanceCheckpointService._first_transactions(session, branch_id, None).items():
+            if key not in openings:
+                rows.append(BalanceCheckpointService._opening_checkpoint(
+                    transaction, base_currencies.get(transaction.branch_id)))
+
+        for offset in range(0, len(rows), batch_size):
+            session.execute(insert(BalanceCheckpoint), rows[offset:offset + batch_size])
+        logger.info(f"余额检查点补写完成: 日结 {eod_count} 条，首笔交易 {len(rows) - eod_count} 条")
+        return {'eod': eod_count, 'opening': len(rows) - eod_count}
+
+    @staticmethod
+    def _late_transactions(session: Session, branch_id: int, base_currency_id: Optional[int],
+                           checkpoints: List[BalanceCheckpoint], period_start, checkpoint_at) -> Dict[int, List[int]]:
+        """同一批写入的日间检查点中，时点之前、ID 大于其最大交易ID的交易 {检查点ID: [交易ID]}"""
+        bounds = {c.last_transaction_id for c in checkpoints if c.last_transaction_id is not None}
+        if not bounds:
+            return {}
+        rows = session.query(ExchangeTransaction.id, ExchangeTransaction.currency_id).filter(
+            *BalanceCheckpointService._ledger_filter(branch_id, period_start, checkpoint_at),
+            ExchangeTransaction.id > min(bounds)
+        ).order_by(ExchangeTransaction.id).all()
+
+        late = defaultdict(list)
+        for checkpoint in checkpoints:
+            if checkpoint.last_transaction_id is None:
+                continue
+            for transaction_id, currency_id in rows:
+                # 本币检查点包含所有币种交易的本币金额
+                if transaction_id > checkpoint.last_transaction_id and \
+                        checkpoint.currency_id in (currency_id, base_currency_id):
+                    late[checkpoint.id].append(transaction_id)
+        return late
+
+    @staticmethod
+    def verify(session: Session, branch_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        对账：从原始数据重新计算每个检查点
+        - eod：等于对应日结的余额验证实际余额
+        - opening：等于该 网点+币种 第一笔交易的金额，时点为其后1秒
+        - intraday：期间起点检查点的余额 + 原始交易从期间起点累加的变动；
+          时点之前、ID 大于写入时最大交易ID的交易（写入后才提交，未计入）单独报告
+
+        Returns:
+            不一致的检查点列表（为空表示一致）
+        """
+        query = session.query(BalanceCheckpoint)
+        if branch_id is not None:
+            query = query.filter(BalanceCheckpoint.branch_id == branch_id)
+        checkpoints = query.order_by(BalanceCheckpoint.id).all()
+        if not checkpoints:
+            return []
+
+        verifications = {
+            (eod_id, currency_id): actual_balance
+            for eod_id, currency_id, actual_balance in session.query(
+                EODBalanceVerification.eod_status_id, EODBalanceVerification.currency_id,
+                EODBalanceVerification.actual_balance
+            ).filter(EODBalanceVerification.eod_status_id.in_(
+                {c.eod_status_id for c in checkpoints if c.kind == 'eod'} or {0}))
+        }
+        first = BalanceCheckpointService._first_transactions(session, branch_id, None)
+        base_currencies = dict(session.query(Branch.id, Branch.base_currency_id).all())
+        anchors = {
+            (c.branch_id, c.currency_id, c.checkpoint_at): c for c in checkpoints if c.kind in ('eod', 'opening')
+        }
+
+        mismatches = []
+
+        def mismatch(checkpoint, expected, reason):
+            mismatches.append({
+                'id': checkpoint.id, 'branch_id': checkpoint.branch_id, 'currency_id': checkpoint.currency_id,
+                'kind': checkpoint.kind,
+                'checkpoint_at': checkpoint.checkpoint_at.isoformat() if checkpoint.checkpoint_at else None,
+                'expected_balance': float(expected) if expected is not None else None,
+                'actual_balance': float(checkpoint.balance), 'reason': reason
+            })
+
+        # 日间检查点按 网点+期间起点+时点 分组，每组一次增量查询
+        intraday = defaultdict(list)
+        for checkpoint in checkpoints:
+            balance = Decimal(str(checkpoint.balance))
+            if checkpoint.kind == 'eod':
+                expected = verifications.get((checkpoint.eod_status_id, checkpoint.currency_id))
+                if expected is None:
+                    mismatch(checkpoint, None, '日结余额验证记录不存在')
+                elif Decimal(str(expected)) != balance:
+                    mismatch(checkpoint, expected, '与日结实际余额不一致')
+            elif checkpoint.kind == 'opening':
+                transaction = first.get((checkpoint.branch_id, checkpoint.currency_id))
+                if transaction is None or transaction.id != checkpoint.source_transaction_id:
+                    mismatch(checkpoint, None, '不是该币种的第一笔交易')
+                    continue
+                expected_row = BalanceCheckpointService._opening_checkpoint(
+                    transaction, base_currencies.get(checkpoint.branch_id))
+                if Decimal(str(expected_row['balance'])) != balance or \
+                        expected_row['checkpoint_at'] != checkpoint.checkpoint_at:
+                    mismatch(checkpoint, expected_row['balance'], '与第一笔交易不一致')
+            else:
+                intraday[(checkpoint.branch_id, checkpoint.period_start, checkpoint.checkpoint_at)].append(checkpoint)
+
+        for (checkpoint_branch_id, period_start, checkpoint_at), group in intraday.items():
+            base_currency_id = base_currencies.get(checkpoint_branch_id)
+            changes = BalanceCheckpointService.deltas(
+                session, checkpoint_branch_id, base_currency_id, {c.currency_id: period_start for c in group},
+                checkpoint_at)
+            late = BalanceCheckpointService._late_transactions(
+                session, checkpoint_branch_id, base_currency_id, group, period_start, checkpoint_at)
+            for checkpoint in group:
+                anchor = anchors.get((checkpoint_branch_id, checkpoint.currency_id, period_start))
+                change = Decimal(str(changes.get(checkpoint.currency_id) or 0))
+                late_ids = late.get(checkpoint.id)
+                if late_ids:
+                    mismatch(checkpoint, None, f'写入后提交了时点之前的交易 {len(late_ids)} 笔（ID: '
+                                               f'{", ".join(str(i) for i in late_ids[:10])}），未计入期间变动')
+                elif Decimal(str(checkpoint.period_change)) != change:
+                    mismatch(checkpoint, None, f'期间变动应为 {change}，记录为 {checkpoint.period_change}')
+                elif anchor is not None and Decimal(str(anchor.balance)) + change != Decimal(str(checkpoint.balance)):
+                    mismatch(checkpoint, Decimal(str(anchor.balance)) + change, '与期间起点余额加变动不一致')
+        return mismatches
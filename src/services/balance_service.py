@@ -1,8 +1,9 @@
 from decimal import Decimal
 from datetime import datetime
+from sqlalchemy import select, update, insert, case, tuple_
 from sqlalchemy.orm import Session
 from models.exchange_models import CurrencyBalance, ExchangeTransaction, Currency, Operator, Branch
-from typing import Tuple
+from typing import Any, Dict, Iterable, List, Tuple
 from utils.transaction_utils import generate_unified_transaction_no
 import logging
 
@@ -12,6 +13,111 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 class BalanceService:
+    @staticmethod
+    def post_balance_legs(
+        session: Session,
+        legs: Iterable[Tuple[int, int, Decimal]],
+        lock_for_update: bool = True,
+        allow_negative: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        多腿余额过账引擎：一次锁定、一次更新所有涉及的余额行
+        
+        按 (branch_id, currency_id) 排序后一次性 SELECT ... FOR UPDATE，
+        保证所有交易以相同顺序加锁，避免死锁；缺失的余额行批量插入，
+        已存在的余额行用一条 UPDATE ... CASE 语句完成更新。
+        
+        :param session: 数据库会话
+        :param legs: [(branch_id, currency_id, 变动金额), ...]
+        :param lock_for_update: 是否使用行锁
+        :param allow_negative: 是否允许余额为负数（用于冲正等特殊操作）
+        :return: 与legs顺序一致的结果列表，每项包含
+                 branch_id, currency_id, amount, balance_before, balance_after
+        """
+        legs = [
+            (int(branch_id), int(currency_id), Decimal(str(amount)))
+            for branch_id, currency_id, amount in legs
+        ]
+        if not legs:
+            return []
+
+        try:
+            # 先刷新会话中的待插入对象，保证后续查询能看到它们
+            session.flush()
+
+            keys = sorted({(branch_id, currency_id) for branch_id, currency_id, _ in legs})
+            table = CurrencyBalance.__table__
+
+            # 按固定顺序一次性锁定所有余额行
+            query = select(
+                table.c.id, table.c.branch_id, table.c.currency_id, table.c.balance
+            ).where(
+                tuple_(table.c.branch_id, table.c.currency_id).in_(keys)
+            ).order_by(table.c.branch_id, table.c.currency_id, table.c.id)
+            if lock_for_update:
+                query = query.with_for_update()
+
+            existing = {}
+            for row in session.execute(query):
+                key = (row.branch_id, row.currency_id)
+                if key not in existing:  # 如有重复行，沿用原逻辑只取第一条
+                    existing[key] = (row.id, Decimal(str(row.balance or 0)))
+
+            # 依次计算每条腿的前后余额，保持与逐笔调用相同的结果
+            running = {key: existing[key][1] if key in existing else Decimal('0') for key in keys}
+            results = []
+            for branch_id, currency_id, amount in legs:
+                key = (branch_id, currency_id)
+                balance_before = running[key]
+                new_balance = balance_before + amount
+
+                if not allow_negative and amount < 0 and new_balance < 0:
+                    logger.error(f"余额不足 - 网点ID: {branch_id}, 币种ID: {currency_id}, 当前余额: {balance_before}, 需要: {abs(amount)}")
+                    raise ValueError(f"余额不足。当前余额: {balance_before}, 需要: {abs(amount)}")
+                elif amount < 0 and new_balance < 0:
+                    logger.warning(f"余额将为负数 - 当前余额: {balance_before}, 变动: {amount}, 结果: {new_balance}")
+
+                running[key] = new_balance
+                results.append({
+                    'branch_id': branch_id,
+                    'currency_id': currency_id,
+                    'amount': amount,
+                    'balance_before': balance_before,
+                    'balance_after': new_balance
+                })
+
+            now = datetime.now()
+            updates = {existing[key][0]: running[key] for key in keys if key in existing}
+            inserts = [
+                {'branch_id': key[0], 'currency_id': key[1], 'balance': running[key], 'updated_at': now}
+                for key in keys if key not in existing
+            ]
+
+            if updates:
+                session.execute(
+                    update(table)
+                    .where(table.c.id.in_(list(updates)))
+                    .values(balance=case(updates, value=table.c.id), updated_at=now)
+                )
+            if inserts:
+                logger.info(f"未找到余额记录，批量创建 {len(inserts)} 条新记录: {[(r['branch_id'], r['currency_id']) for r in inserts]}")
+                session.execute(insert(table), inserts)
+
+            logger.info(
+                "余额过账完成: "
+                + ", ".join(
+                    f"[网点{r['branch_id']}/币种{r['currency_id']}] {r['balance_before']} -> {r['balance_after']}"
+                    for r in results
+                )
+            )
+            return results
+
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"余额过账出现异常: {str(e)}", exc_info=True)
+            raise ValueError(f"更新余额失败: {str(e)}")
+
     @staticmethod
     def update_currency_balance(
         session: Session,
@@ -22,7 +128,7 @@ class BalanceService:
         allow_negative: bool = False
     ) -> Tuple[Decimal, Decimal]:
         """
-        更新货币余额，带并发控制
+        更新货币余额，带并发控制（单腿版本，内部使用post_balance_legs）
         :param session: 数据库会话
         :param currency_id: 货币ID
         :param branch_id: 分行ID
@@ -31,121 +137,13 @@ class BalanceService:
         :param allow_negative: 是否允许余额为负数（用于冲正等特殊操作）
         :return: (调节前余额, 调节后余额)
         """
-        try:
-            logger.info(f"开始更新余额 - 币种ID: {currency_id}, 分行ID: {branch_id}, 变动金额: {amount}")
-            
-            # 查询余额记录并加行锁
-            query = session.query(CurrencyBalance).filter(
-                CurrencyBalance.currency_id == currency_id,
-                CurrencyBalance.branch_id == branch_id
-            )
-            
-            if lock_for_update:
-                query = query.with_for_update()
-                logger.info("已添加行锁")
-                
-            balance_record = query.first()
-            logger.info(f"【调试】查询到的余额记录: ID={balance_record.id if balance_record else 'None'}, 余额={balance_record.balance if balance_record else 'None'}")
-            logger.info(f"【调试】查询条件: currency_id={currency_id}, branch_id={branch_id}")
-            
-            # 检查所有THB余额记录
-            all_thb_records = session.query(CurrencyBalance).filter(
-                CurrencyBalance.currency_id == currency_id
-            ).all()
-            logger.info(f"【调试】所有THB余额记录数量: {len(all_thb_records)}")
-            for record in all_thb_records:
-                logger.info(f"【调试】THB记录: ID={record.id}, branch_id={record.branch_id}, balance={record.balance}")
-            
-            if not balance_record:
-                logger.info(f"未找到余额记录，创建新记录 - 币种ID: {currency_id}, 分行ID: {branch_id}")
-                # 自动创建余额记录，初始余额为0
-                balance_record = CurrencyBalance(
-                    currency_id=currency_id,
-                    branch_id=branch_id,
-                    balance=0,
-                    updated_at=datetime.now()
-                )
-                session.add(balance_record)
-                session.flush()  # 确保记录被保存并获得ID
-                logger.info(f"已创建新余额记录 - 币种ID: {currency_id}, 分行ID: {branch_id}, 初始余额: 0")
-            
-            # 记录调节前余额
-            balance_before = Decimal(str(balance_record.balance))
-            logger.info(f"当前余额: {balance_before}")
-            
-            # 计算新余额
-            new_balance = balance_before + amount
-            logger.info(f"计算得到新余额: {new_balance}")
-            
-            # 检查余额是否会变成负数（如果是支出且不允许负余额）
-            if not allow_negative and amount < 0 and new_balance < 0:
-                logger.error(f"余额不足 - 当前余额: {balance_before}, 需要: {abs(amount)}")
-                raise ValueError(f"余额不足。当前余额: {balance_before}, 需要: {abs(amount)}")
-            elif amount < 0 and new_balance < 0:
-                logger.warning(f"余额将为负数 - 当前余额: {balance_before}, 变动: {amount}, 结果: {new_balance}")
-            
-            # 更新余额 - 使用直接SQL更新，避免ORM缓存问题
-            from sqlalchemy import text
-            
-            # 【调试】检查数据类型
-            logger.info(f"【调试】SQL更新参数:")
-            logger.info(f"  - new_balance: {new_balance} (类型: {type(new_balance)})")
-            logger.info(f"  - currency_id: {currency_id} (类型: {type(currency_id)})")
-            logger.info(f"  - branch_id: {branch_id} (类型: {type(branch_id)})")
-            
-            # 先查询当前余额
-            select_sql = text("""
-                SELECT balance FROM currency_balances 
-                WHERE currency_id = :currency_id AND branch_id = :branch_id
-            """)
-            
-            current_result = session.execute(select_sql, {
-                'currency_id': currency_id,
-                'branch_id': branch_id
-            }).fetchone()
-            
-            if current_result:
-                logger.info(f"【调试】SQL查询当前余额: {current_result[0]}")
-            
-            # 执行更新
-            update_sql = text("""
-                UPDATE currency_balances 
-                SET balance = :new_balance, updated_at = :updated_at 
-                WHERE currency_id = :currency_id AND branch_id = :branch_id
-            """)
-            
-            result = session.execute(update_sql, {
-                'new_balance': str(new_balance),  # 【修复】使用字符串格式，避免精度问题
-                'updated_at': datetime.now(),
-                'currency_id': currency_id,
-                'branch_id': branch_id
-            })
-            
-            # 强制刷新会话
-            session.flush()
-            
-            logger.info(f"已更新余额记录 - 调节前: {balance_before}, 调节后: {new_balance}")
-            logger.info(f"【调试】SQL更新结果: 影响行数={result.rowcount}")
-            
-            # 重新查询余额记录以验证更新
-            updated_result = session.execute(select_sql, {
-                'currency_id': currency_id,
-                'branch_id': branch_id
-            }).fetchone()
-            
-            if updated_result:
-                logger.info(f"【调试】SQL查询更新后余额: {updated_result[0]}")
-            else:
-                logger.error(f"【调试】SQL查询更新后找不到余额记录")
-            
-            return balance_before, new_balance
-            
-        except ValueError as e:
-            logger.error(f"余额更新出现ValueError: {str(e)}")
-            raise ValueError(str(e))
-        except Exception as e:
-            logger.error(f"余额更新出现异常: {str(e)}", exc_info=True)
-            raise ValueError(f"更新余额失败: {str(e)}")
+        result = BalanceService.post_balance_legs(
+            session,
+            [(branch_id, currency_id, amount)],
+            lock_for_update=lock_for_update,
+            allow_negative=allow_negative
+        )[0]
+        return result['balance_before'], result['balance_after']
 
     @staticmethod
     def create_exchange_transaction(
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+网点数据隔离
+在 ORM 查询上按当前网点追加 branch_id 条件，取代逐次 inspect 实体的 branch_filter_middleware：
+- BranchScope.install() 注册 do_orm_execute 监听；带 branch_id 列的映射类在首次出现时登记一次
+  （Currency 等全局表除外），之后每次查询只做一次字典查找
+- 条件通过 with_loader_criteria 附加，别名实体和关系懒加载同样生效；同一网点的条件对象会被复用，
+  SQL 编译缓存不受网点取值影响
+- 当前网点取自 BranchScope.restrict() 范围，否则取自请求内的 g.current_user；
+  BranchScope.unrestricted()（或 DatabaseService.skip_branch_filter）内不追加条件
+- 服务层的原生 text() 查询用 scoped_text() 在 {branch_scope} 占位处注入相同的网点条件
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, Tuple
+
+from flask import g, has_app_context
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session, with_loader_criteria
+
+logger = logging.getLogger(__name__)
+
+# 不按网点隔离的全局表
+GLOBAL_MODELS = ('Currency',)
+
+BRANCH_SCOPE_PLACEHOLDER = '{branch_scope}'
+BRANCH_SCOPE_PARAM = 'scope_branch_id'
+
+_UNSET = object()
+_unrestricted = ContextVar('branch_scope_unrestricted', default=False)
+_explicit_branch = ContextVar('branch_scope_branch_id', default=_UNSET)
+
+
+def _branch_criteria(model, branch_id):
+    return with_loader_criteria(model, lambda cls: cls.branch_id == branch_id, include_aliases=True)
+
+
+class BranchScope:
+    """网点条件登记表与作用域"""
+
+    _lock = threading.Lock()
+    _installed = False
+    _global_models = frozenset(GLOBAL_MODELS)
+    # mapper -> 是否按网点隔离
+    _scoped_mappers: Dict[Any, bool] = {}
+    # (mapper, branch_id) -> with_loader_criteria 选项
+    _criteria: Dict[Tuple[Any, Any], Any] = {}
+
+    @classmethod
+    def install(cls, base=None, global_models=GLOBAL_MODELS):
+        """
+        注册网点过滤并预先登记 base 下已映射的类（可重复调用）
+
+        Args:
+            base: 声明式基类，用于启动时预先登记映射类
+            global_models: 不做网点隔离的类名
+        """
+        with cls._lock:
+            cls._global_models = frozenset(global_models)
+            cls._scoped_mappers = {}
+            cls._criteria = {}
+            if base is not None:
+                for mapper in base.registry.mappers:
+                    cls._classify(mapper)
+            if not event.contains(Session, 'do_orm_execute', cls._on_orm_execute):
+                event.listen(Session, 'do_orm_execute', cls._on_orm_execute)
+            cls._installed = True
+        logger.info(f"网点过滤已启用，隔离映射类 {sum(cls._scoped_mappers.values())} 个")
+
+    @classmethod
+    def uninstall(cls):
+        with cls._lock:
+            if event.contains(Session, 'do_orm_execute', cls._on_orm_execute):
+                event.remove(Session, 'do_orm_execute', cls._on_orm_execute)
+            cls._installed = False
+            cls._scoped_mappers = {}
+            cls._criteria = {}
+
+    @classmethod
+    def is_installed(cls) -> bool:
+        return cls._installed
+
+    @classmethod
+    def _classify(cls, mapper) -> bool:
+        scoped = (
+            'branch_id' in mapper.columns
+            and mapper.class_.__name__ not in cls._global_models
+        )
+        cls._scoped_mappers[mapper] = scoped
+        return scoped
+
+    @classmethod
+    def scoped_models(cls):
+        return sorted(mapper.class_.__name__ for mapper, scoped in cls._scoped_mappers.items() if scoped)
+
+    @staticmethod
+    def current_branch_id():
+        """
+        当前需要隔离的网点；返回 _UNSET 表示不追加条件
+        （未安装、处于 unrestricted() 范围、或既无 restrict() 范围也无登录用户）
+        """
+        if not BranchScope._installed or _unrestricted.get():
+            return _UNSET
+        branch_id = _explicit_branch.get()
+        if branch_id is not _UNSET:
+            return branch_id
+        if not has_app_context() or getattr(g, 'skip_branch_filter', False):
+            return _UNSET
+        current_user = getattr(g, 'current_user', None)
+        if not isinstance(current_user, dict):
+            return _UNSET
+        return current_user.get('branch_id')
+
+    @staticmethod
+    @contextmanager
+    def unrestricted():
+        """范围内的查询不追加网点条件（跨网点汇总、管理员操作等）"""
+        token = _unrestricted.set(True)
+        try:
+            yield
+        finally:
+            _unrestricted.reset(token)
+
+    @staticmethod
+    @contextmanager
+    def restrict(branch_id):
+        """范围内的查询按指定网点隔离（无请求上下文的批处理任务等）"""
+        token = _explicit_branch.set(branch_id)
+        try:
+            yield
+        finally:
+            _explicit_branch.reset(token)
+
+    @classmethod
+    def _on_orm_execute(cls, orm_execute_state):
+        if not orm_execute_state.is_select:
+            return
+        mapper = orm_execute_state.bind_mapper
+        if mapper is None:
+            return
+        scoped = cls._scoped_mappers.get(mapper)
+        if scoped is None:
+            scoped = cls._classify(mapper)
+        if not scoped:
+            return
+        branch_id = cls.current_branch_id()
+        if branch_id is _UNSET:
+            return
+
+        key = (mapper, branch_id)
+        criteria = cls._criteria.get(key)
+        if criteria is None:
+            criteria = cls._criteria[key] = _branch_criteria(mapper.class_, branch_id)
+        orm_execute_state.statement = orm_execute_state.statement.options(criteria)
+
+
+def branch_predicate(column: str = 'branch_id', params: Optional[Dict[str, Any]] = None) -> str:
+    """
+    原生 SQL 的网点条件片段（以 " AND " 开头）；不需要隔离时返回空字符串
+
+    Args:
+        column: 网点列（可带表别名，如 r.branch_id）
+        params: 查询参数字典，需要隔离时写入 scope_branch_id
+    """
+    branch_id = BranchScope.current_branch_id()
+    if branch_id is _UNSET:
+        return ''
+    if params is not None:
+        params[BRANCH_SCOPE_PARAM] = branch_id
+    return f' AND {column} = :{BRANCH_SCOPE_PARAM}'
+
+
+def scoped_text(sql: str, params: Dict[str, Any], column: str = 'branch_id'):
+    """
+    将 SQL 中的 {branch_scope} 占位替换为当前网点条件并返回 text()
+
+    用法：
+        params = {'reservation_id': reservation_id}
+        sql = scoped_text("SELECT ... FROM Reserved_Transaction WHERE id = :reservation_id{branch_scope}", params)
+        session.execute(sql, params)
+    """
+    return text(sql.replace(BRANCH_SCOPE_PLACEHOLDER, branch_predicate(column, params)))
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+"""
+合规检查发件箱服务
+交易提交时在同一事务中写入 compliance_outbox 记录，由后台工作线程池异步
+执行 AMLO/BOT 触发检查并生成报告记录，柜台响应时间不再受规则数量影响
+"""
+
+import json
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.orm import Session
+
+from models.exchange_models import ComplianceOutbox, Currency, ExchangeTransaction
+from services.db_service import DatabaseService
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = 'pending'
+STATUS_PROCESSING = 'processing'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+# 单条任务最多尝试次数，超过后标记为 failed 等待人工处理
+MAX_ATTEMPTS = 3
+# processing 状态超过该时间视为工作线程已中断，可被重新领取
+STALE_SECONDS = 300
+
+
+class ComplianceOutboxService:
+    """合规检查发件箱服务"""
+
+    @staticmethod
+    def empty_result() -> Dict[str, Dict[str, Any]]:
+        """与 perform_exchange 返回的 compliance 结构保持一致"""
+        return {
+            'amlo': {'triggered': False, 'reports': []},
+            'bot': {'triggered': False, 'reports': []}
+        }
+
+    @staticmethod
+    def enqueue(session: Session, transaction: ExchangeTransaction, currency_id: int,
+                branch_id: int, operator_id: int) -> ComplianceOutbox:
+        """
+        在交易所在的事务中写入发件箱记录（不提交）
+        交易回滚时发件箱记录随之回滚，不会出现无交易的合规任务
+        """
+        if transaction.id is None:
+            session.flush()
+
+        outbox = ComplianceOutbox(
+            transaction_id=transaction.id,
+            branch_id=branch_id,
+            currency_id=currency_id,
+            operator_id=operator_id,
+            status=STATUS_PENDING,
+            attempts=0,
+            created_at=datetime.now()
+        )
+        session.add(outbox)
+        session.flush()
+        return outbox
+
+    @staticmethod
+    def run_checks(session: Session, transaction: Any, currency: Any,
+                   branch_id: int, operator_id: int) -> Dict[str, Dict[str, Any]]:
+        """执行AMLO和BOT触发检查并创建报告记录（不提交），返回 compliance 结构"""
+        from services.amlo_trigger_service import AMLOTriggerService
+        from services.bot_trigger_service import BOTTriggerService
+
+        compliance_results = ComplianceOutboxService.empty_result()
+
+        # 1️⃣ 检查AMLO报告触发条件
+        amlo_results = AMLOTriggerService.check_and_create_amlo_records(
+            session=session,
+            transaction=transaction,
+            currency=currency,
+            branch_id=branch_id,
+            operator_id=operator_id
+        )
+        if any(amlo_results.values()):
+            logger.info(
+                "AMLO记录创建结果: CTR(101)=%s, ATR(102)=%s, STR(103)=%s",
+                amlo_results['amlo_101_created'],
+                amlo_results['amlo_102_created'],
+                amlo_results['amlo_103_created'],
+            )
+            compliance_results['amlo']['triggered'] = True
+            if amlo_results['amlo_101_created']:
+                compliance_results['amlo']['reports'].append('AMLO-1-01')
+            if amlo_results['amlo_102_created']:
+                compliance_results['amlo']['reports'].append('AMLO-1-02')
+            if amlo_results['amlo_103_created']:
+                compliance_results['amlo']['reports'].append('AMLO-1-03')
+
+        # 2️⃣ 检查BOT报告触发条件
+        bot_results = BOTTriggerService.check_and_create_bot_records(
+            session=session,
+            transaction=transaction,
+            currency=currency,
+            branch_id=branch_id,
+            operator_id=operator_id
+        )
+        if any(bot_results.values()):
+            logger.info(
+                "BOT记录创建结果: BuyFX=%s, SellFX=%s, FCD=%s",
+                bot_results['bot_buyfx_created'],
+                bot_results['bot_sellfx_created'],
+                bot_results['bot_fcd_created'],
+            )
+            compliance_results['bot']['triggered'] = True
+            if bot_results['bot_buyfx_created']:
+                compliance_results['bot']['reports'].append('BOT_BuyFX')
+            if bot_results['bot_sellfx_created']:
+                compliance_results['bot']['reports'].append('BOT_SellFX')
+            if bot_results['bot_fcd_created']:
+                compliance_results['bot']['reports'].append('BOT_FCD')
+
+        return compliance_results
+
+    @staticmethod
+    def claim(session: Session, outbox_id: int, worker_id: str) -> bool:
+        """
+        领取一条发件箱任务并提交
+        条件更新保证同一任务同一时间只会被一个工作线程领取
+        """
+        table = ComplianceOutbox.__table__
+        now = datetime.now()
+        stale_before = now - timedelta(seconds=STALE_SECONDS)
+
+        result = session.execute(
+            update(table)
+            .where(
+                table.c.id == outbox_id,
+                table.c.attempts < MAX_ATTEMPTS,
+                or_(
+                    table.c.status == STATUS_PENDING,
+                    and_(table.c.status == STATUS_PROCESSING, table.c.locked_at < stale_before)
+                )
+            )
+            .values(
+                status=STATUS_PROCESSING,
+                locked_by=worker_id,
+                locked_at=now,
+                attempts=table.c.attempts + 1
+            )
+        )
+        session.commit()
+        return result.rowcount == 1
+
+    @staticmethod
+    def process(outbox_id: int, worker_id: Optional[str] = None) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        处理一条发件箱任务
+        报告记录和任务完成状态在同一事务中提交；完成状态的更新以 locked_by 为条件，
+        被其他线程重新领取的任务不会重复写入报告记录
+
+        Returns:
+            dict: compliance 结构；未领取到任务或处理失败时返回 None
+        """
+        worker_id = worker_id or f"{os.getpid()}-{threading.get_ident()}-{uuid.uuid4().hex[:8]}"
+        session = DatabaseService.get_session()
+        try:
+            if not ComplianceOutboxService.claim(session, outbox_id, worker_id):
+                return None
+
+            outbox = session.get(ComplianceOutbox, outbox_id)
+            transaction = session.get(ExchangeTransaction, outbox.transaction_id)
+            currency = session.get(Currency, outbox.currency_id)
+            if transaction is None or currency is None:
+                raise ValueError(f"交易或币种不存在: transaction_id={outbox.transaction_id}")
+
+            compliance_results = ComplianceOutboxService.run_checks(
+                session, transaction, currency, outbox.branch_id, outbox.operator_id
+            )
+
+            table = ComplianceOutbox.__table__
+            finished = session.execute(
+                update(table)
+                .where(table.c.id == outbox_id, table.c.locked_by == worker_id)
+                .values(
+                    status=STATUS_DONE,
+                    result=json.dumps(compliance_results),
+                    error=None,
+                    processed_at=datetime.now()
+                )
+            )
+            if finished.rowcount != 1:
+                # 任务已被其他线程接管，放弃本次写入
+                session.rollback()
+                logger.warning(f"合规任务 {outbox_id} 已被其他工作线程接管，放弃本次结果")
+                return None
+
+            session.commit()
+            return compliance_results
+
+        except Exception as e:
+            session.rollback()
+            logger.error(f"合规任务 {outbox_id} 处理失败: {str(e)}")
+            ComplianceOutboxService._release(session, outbox_id, worker_id, str(e))
+            return None
+        finally:
+            DatabaseService.close_session(session)
+
+    @staticmethod
+    def _release(session: Session, outbox_id: int, worker_id: str, error: str):
+        """处理失败后释放任务：未达到最大次数则回到 pending，否则标记 failed"""
+        table = ComplianceOutbox.__table__
+        try:
+            attempts = session.execute(
+                select(table.c.attempts).where(table.c.id == outbox_id)
+            ).scalar() or 0
+            session.execute(
+                update(table)
+                .where(table.c.id == outbox_id, table.c.locked_by == worker_id)
+                .values(
+                    status=STATUS_FAILED if attempts >= MAX_ATTEMPTS else STATUS_PENDING,
+                    locked_by=None,
+                    locked_at=None,
+                    error=error[:2000]
+                )
+            )
+            session.commit()
+        except Exception as release_error:
+            session.rollback()
+            logger.error(f"释放合规任务 {outbox_id} 失败: {str(release_error)}")
+
+    @staticmethod
+    def find_runnable_ids(session: Session, limit: int = 100) -> List[int]:
+        """查询待处理的任务（pending 或中断超时的 processing）"""
+        stale_before = datetime.now() - timedelta(seconds=STALE_SECONDS)
+        rows = session.query(ComplianceOutbox.id).filter(
+            ComplianceOutbox.attempts < MAX_ATTEMPTS,
+            or_(
+                ComplianceOutbox.status == STATUS_PENDING,
+                and_(ComplianceOutbox.status == STATUS_PROCESSING, ComplianceOutbox.locked_at < stale_before)
+            )
+        ).order_by(ComplianceOutbox.id).limit(limit).all()
+        return [row[0] for row in rows]
+
+    @staticmethod
+    def get_status(session: Session, transaction_id: int,
+                   branch_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        查询交易的合规检查结果
+
+        Args:
+            transaction_id: 交易ID
+            branch_id: 网点ID（可选，限定只能查询本网点的交易）
+
+        Returns:
+            dict: compliance 结构附加 status / outbox_id；交易没有发件箱记录时返回 None
+        """
+        query = session.query(ComplianceOutbox).filter_by(transaction_id=transaction_id)
+        if branch_id is not None:
+            query = query.filter_by(branch_id=branch_id)
+        outbox = query.first()
+        if outbox is None:
+            return None
+
+        compliance = json.loads(outbox.result) if outbox.result else ComplianceOutboxService.empty_result()
+        compliance['status'] = outbox.status
+        compliance['outbox_id'] = outbox.id
+        if outbox.status == STATUS_FAILED:
+            compliance['error'] = outbox.error
+        return compliance
+
+
+class ComplianceOutboxWorker:
+    """
+    合规发件箱后台工作线程池
+    应用启动时（create_app）启动；交易提交后立即投递任务，另有一个巡检线程定期补处理遗漏或中断的任务
+    """
+
+    _executor: Optional[ThreadPoolExecutor] = None
+    _sweeper: Optional[threading.Thread] = None
+    _stop_event = threading.Event()
+    _lock = threading.Lock()
+
+    @classmethod
+    def _max_workers(cls) -> int:
+        return int(os.environ.get('COMPLIANCE_WORKERS', '2'))
+
+    @classmethod
+    def _sweep_interval(cls) -> float:
+        return float(os.environ.get('COMPLIANCE_SWEEP_INTERVAL', '30'))
+
+    @classmethod
+    def start(cls):
+        """启动线程池和巡检线程（重复调用无副作用）"""
+        with cls._lock:
+            if cls._executor is not None:
+                return
+            cls._stop_event.clear()
+            cls._executor = ThreadPoolExecutor(
+                max_workers=cls._max_workers(), thread_name_prefix='compliance-outbox'
+            )
+            cls._sweeper = threading.Thread(
+                target=cls._sweep_loop, name='compliance-outbox-sweeper', daemon=True
+            )
+            cls._sweeper.start()
+            logger.info(f"[OK] 合规发件箱工作线程池已启动（{cls._max_workers()}个线程）")
+
+    @classmethod
+    def stop(cls, wait: bool = True):
+        """停止线程池和巡检线程"""
+        with cls._lock:
+            cls._stop_event.set()
+            executor, cls._executor = cls._executor, None
+            sweeper, cls._sweeper = cls._sweeper, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+        if sweeper is not None and wait:
+            sweeper.join(timeout=5)
+
+    @classmethod
+    def submit(cls, outbox_id: int) -> Optional[Future]:
+        """投递一条任务（交易提交之后调用）；线程池不可用时由巡检线程兜底"""
+        cls.start()
+        try:
+            return cls._executor.submit(ComplianceOutboxService.process, outbox_id)
+        except Exception as e:
+            logger.warning(f"投递合规任务 {outbox_id} 失败，等待巡检线程处理: {str(e)}")
+            return None
+
+    @classmethod
+    def drain(cls, limit: int = 100) -> int:
+        """同步处理一批待处理任务，返回成功处理的数量"""
+        session = DatabaseService.get_session()
+        try:
+            outbox_ids = ComplianceOutboxService.find_runnable_ids(session, limit)
+        finally:
+            DatabaseService.close_session(session)
+
+        processed = 0
+        for outbox_id in outbox_ids:
+            if ComplianceOutboxService.process(outbox_id) is not None:
+                processed += 1
+        return processed
+
+    @classmethod
+    def _sweep_loop(cls):
+        while not cls._stop_event.wait(cls._sweep_interval()):
+            try:
+                processed = cls.drain()
+                if processed:
+                    logger.info(f"合规发件箱巡检补处理 {processed} 条任务")
+            except Exception as e:
+                logger.error(f"合规发件箱巡检失败: {str(e)}")
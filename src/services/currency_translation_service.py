@@ -11,6 +11,7 @@ import logging
 import json
 import os
 from .db_service import DatabaseService
+from .shared_cache import SharedCache
 from models.exchange_models import Currency
 
 logger = logging.getLogger(__name__)
@@ -21,9 +22,8 @@ class CurrencyTranslationService:
     # 配置文件路径
     CONFIG_FILE_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'config', 'currency_translations.json')
     
-    # 内存缓存
-    _translations_cache = None
-    _cache_loaded = False
+    # 配置在各进程本地加载，修改后通过共享缓存通知所有工作进程重新读取配置文件
+    _cache = SharedCache.namespace('currency_translations', local=True)
     
     @staticmethod
     def get_currency_name(currency_code, language='zh'):
@@ -102,20 +102,20 @@ class CurrencyTranslationService:
     @staticmethod
     def _load_config():
         """加载配置文件"""
-        if CurrencyTranslationService._cache_loaded:
-            return CurrencyTranslationService._translations_cache
+        cached = CurrencyTranslationService._cache.get('config')
+        if cached is not None:
+            return cached
         
         try:
             if os.path.exists(CurrencyTranslationService.CONFIG_FILE_PATH):
                 with open(CurrencyTranslationService.CONFIG_FILE_PATH, 'r', encoding='utf-8') as f:
-                    CurrencyTranslationService._translations_cache = json.load(f)
-                    CurrencyTranslationService._cache_loaded = True
+                    translations = json.load(f)
+                    CurrencyTranslationService._cache.set('config', translations)
                     logger.info(f"✅ 成功加载币种翻译配置文件: {CurrencyTranslationService.CONFIG_FILE_PATH}")
-                    return CurrencyTranslationService._translations_cache
+                    return translations
             else:
                 logger.info(f"📝 币种翻译配置文件不存在，将创建: {CurrencyTranslationService.CONFIG_FILE_PATH}")
-                CurrencyTranslationService._create_default_config()
-                return CurrencyTranslationService._translations_cache
+                return CurrencyTranslationService._create_default_config()
         except Exception as e:
             logger.error(f"加载币种翻译配置文件失败: {e}")
             return None
@@ -165,12 +165,13 @@ class CurrencyTranslationService:
             with open(CurrencyTranslationService.CONFIG_FILE_PATH, 'w', encoding='utf-8') as f:
                 json.dump(default_translations, f, ensure_ascii=False, indent=2)
             
-            CurrencyTranslationService._translations_cache = default_translations
-            CurrencyTranslationService._cache_loaded = True
+            CurrencyTranslationService._cache.set('config', default_translations)
             logger.info(f"✅ 成功创建默认币种翻译配置文件")
+            return default_translations
             
         except Exception as e:
             logger.error(f"创建默认配置文件失败: {e}")
+            return None
     
     @staticmethod
     def add_translation(currency_code, translations):
@@ -191,8 +192,8 @@ class CurrencyTranslationService:
             with open(CurrencyTranslationService.CONFIG_FILE_PATH, 'w', encoding='utf-8') as f:
                 json.dump(current_translations, f, ensure_ascii=False, indent=2)
             
-            # 更新缓存
-            CurrencyTranslationService._translations_cache = current_translations
+            # 使所有工作进程的缓存失效，下次使用时重新读取配置文件
+            CurrencyTranslationService._cache.clear()
             
             logger.info(f"✅ 成功添加币种翻译: {currency_code}")
             return True
@@ -204,6 +205,5 @@ class CurrencyTranslationService:
     @staticmethod
     def reload_config():
         """重新加载配置文件"""
-        CurrencyTranslationService._cache_loaded = False
-        CurrencyTranslationService._translations_cache = None
+        CurrencyTranslationService._cache.clear()
         return CurrencyTranslationService._load_config() 
\ No newline at end of file
@@ -1,9 +1,16 @@
 import os
 import logging
-from flask import g, current_app
-from sqlalchemy import create_engine, event, inspect
+import time
+import threading
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import g, current_app, has_app_context, has_request_context
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, scoped_session, Session
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError as PoolTimeoutError
 try:
     from src.models.exchange_models import Base
 except ImportError:
@@ -132,32 +139,93 @@ def get_db_url():
             logger.info(f"Created data directory at {DATA_DIR}")
         return f'sqlite:///{DATABASE_PATH}'
 
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class MeteredQueuePool(QueuePool):
+    """
+    记录连接获取耗时的连接池
+    获取耗时包括排队等待空闲连接、新建溢出连接和 pre_ping 检测
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._metrics_lock = threading.Lock()
+        self.wait_metrics = {'checkouts': 0, 'wait_ms_total': 0.0, 'wait_ms_max': 0.0, 'slow_waits': 0, 'timeouts': 0}
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            with self._metrics_lock:
+                self.wait_metrics['timeouts'] += 1
+            logger.error(f"数据库连接池耗尽: {self.status()}")
+            raise
+        waited_ms = (time.perf_counter() - started) * 1000
+        with self._metrics_lock:
+            metrics = self.wait_metrics
+            metrics['checkouts'] += 1
+            metrics['wait_ms_total'] += waited_ms
+            if waited_ms > metrics['wait_ms_max']:
+                metrics['wait_ms_max'] = waited_ms
+            if waited_ms >= _env_int('DB_POOL_WAIT_WARN_MS', 100):
+                metrics['slow_waits'] += 1
+        return connection
+
+    def recreate(self):
+        # engine.dispose() 会重建连接池，保留累计指标
+        pool = super().recreate()
+        pool.wait_metrics = self.wait_metrics
+        return pool
+
+
+def get_pool_config():
+    """
+    连接池配置（环境变量）
+    DB_POOL_SIZE / DB_MAX_OVERFLOW / DB_POOL_TIMEOUT / DB_POOL_RECYCLE / DB_POOL_PRE_PING
+    MySQL 默认 10 + 20 溢出，SQLite 默认 5 + 10 溢出
+    """
+    if DB_TYPE == 'mysql':
+        pool_size, max_overflow = 10, 20
+    else:
+        pool_size, max_overflow = 5, 10
+    return {
+        'poolclass': MeteredQueuePool,
+        'pool_size': _env_int('DB_POOL_SIZE', pool_size),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', max_overflow),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', 3600),
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    }
+
 # Create global engine instance
 def create_db_engine():
     """创建数据库引擎"""
     db_url = get_db_url()
+    pool_config = get_pool_config()
     
     if DB_TYPE == 'mysql':
         # MySQL引擎配置
         engine = create_engine(
             db_url,
             echo=os.getenv('EXCHANGEOK_DB_ECHO', 'false').lower() == 'true',
-            pool_pre_ping=True,
-            pool_recycle=3600,
-            pool_size=10,
-            max_overflow=20,
             # 设置事务隔离级别为READ_COMMITTED，确保事务提交后立即可见
-            isolation_level='READ_COMMITTED'
+            isolation_level='READ_COMMITTED',
+            **pool_config
         )
         return engine
     else:
-        # SQLite引擎配置
+        # SQLite配置
         return create_engine(
             db_url,
             echo=os.getenv('EXCHANGEOK_DB_ECHO', 'false').lower() == 'true',
-            pool_pre_ping=True,
-            pool_recycle=3600,
-            connect_args={"check_same_thread": False}
+            connect_args={"check_same_thread": False},
+            **pool_config
         )
 
 engine = create_db_engine()
@@ -165,6 +233,205 @@ engine = create_db_engine()
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 交易写入/冲正时同步维护客户累计额度桶（AMLO/BOT累计检查使用）
+from services.customer_exposure_service import CustomerExposureService  # noqa: E402
+
+# 日结状态变更提交后清除营业锁定状态缓存
+from services.eod_lease_service import EODLeaseService  # noqa: E402
+
+# 查询按当前网点隔离（init_db 中启用）
+from services.branch_scope import BranchScope  # noqa: E402
+
+
+# ----------------------------------------------------------------------
+# 请求级会话
+# 同一请求内 DatabaseService.get_session() 返回的会话共享同一个 Session，同一时刻最多占用一个连接：
+# - 第一个打开的会话是外层会话，commit/rollback/close 与独立会话相同
+# - 外层会话未关闭时再打开的会话是内层会话，使用 SAVEPOINT：
+#   外层事务已有未提交的写入（包括 Session 中尚未 flush 的新增、修改和删除）时，
+#   内层 commit 只释放保存点，随外层事务一起提交或回滚；
+#   外层没有未提交的写入时，内层 commit 直接提交事务（与原来的独立会话一致）
+#   内层 rollback 只回滚到自己的保存点
+# - 需要不受外层事务影响的独立事务（如编号分配）时使用 DatabaseService.autonomous_transaction()
+# - 请求结束时（teardown）关闭共享 Session
+# DB_SESSION_SCOPE=independent 时恢复为每次调用创建独立会话
+# ----------------------------------------------------------------------
+
+_autonomous_transaction = ContextVar('db_autonomous_transaction', default=False)
+
+# 只读副本路由范围（值为可接受的副本延迟秒数，见 services/read_replica.py）
+_read_replica_scope = ContextVar('db_read_replica_scope', default=None)
+
+_WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE', 'REPLAC', 'MERGE')
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _mark_pending_writes(conn, cursor, statement, parameters, context, executemany):
+    if statement.lstrip()[:6].upper() in _WRITE_PREFIXES:
+        conn.info['_pending_writes'] = True
+
+
+@event.listens_for(Engine, 'commit')
+@event.listens_for(Engine, 'rollback')
+def _clear_pending_writes(conn):
+    conn.info.pop('_pending_writes', None)
+
+
+def _remember_connection(session, transaction, connection):
+    session.info['_connection'] = connection
+
+
+def register_session_listeners(session_factory):
+    """在会话工厂上注册会话事件（重复调用无副作用）"""
+    CustomerExposureService.register_listeners(session_factory)
+    EODLeaseService.register_listeners(session_factory)
+    if not event.contains(session_factory, 'after_begin', _remember_connection):
+        event.listen(session_factory, 'after_begin', _remember_connection)
+
+
+register_session_listeners(SessionLocal)
+
+
+class _RequestSessionState:
+    """一个请求内共享的 Session 及当前打开的会话数"""
+
+    def __init__(self, session):
+        self.session = session
+        self.open_count = 0
+
+    def has_pending_writes(self):
+        """共享 Session 的当前事务中是否有未提交的写入（包括尚未 flush 的新增、修改和删除）"""
+        if self.session.new or self.session.dirty or self.session.deleted:
+            return True
+        if not self.session.in_transaction():
+            return False
+        connection = self.session.info.get('_connection')
+        if connection is None or connection.closed:
+            return False
+        return bool(connection.info.get('_pending_writes'))
+
+    def release(self):
+        self.open_count -= 1
+
+    def release_leaked(self, nested):
+        """句柄未关闭即被回收：外层会话的未提交事务回滚（与独立会话被回收时一致）"""
+        self.open_count -= 1
+        if not nested:
+            try:
+                self.session.rollback()
+            except Exception as e:
+                logger.error(f"Error rolling back leaked request session: {str(e)}")
+
+    def close(self):
+        try:
+            if self.session.in_transaction():
+                self.session.rollback()
+            self.session.close()
+        except Exception as e:
+            logger.error(f"Error closing request session: {str(e)}")
+
+
+class RequestScopedSession:
+    """
+    请求级共享 Session 的会话句柄
+    commit/rollback/close 按外层/内层语义处理，其余属性和方法直接转发给共享的 Session
+    未关闭的句柄被回收时自动释放
+    """
+
+    def __init__(self, state, nested):
+        self._state = state
+        self._session = state.session
+        self._nested = nested
+        self._joined = False
+        self._savepoint = None
+        if nested:
+            self._begin_savepoint()
+        state.open_count += 1
+        self._finalizer = weakref.finalize(self, state.release_leaked, nested)
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _begin_savepoint(self):
+        self._joined = self._state.has_pending_writes()
+        self._savepoint = self._session.begin_nested()
+
+    def commit(self):
+        if not self._nested:
+            self._session.commit()
+            return
+        if self._savepoint is not None and self._savepoint.is_active:
+            self._savepoint.commit()
+        self._savepoint = None
+        if self._joined:
+            # 并入外层写事务：由外层提交
+            self._begin_savepoint()
+        else:
+            self._session.commit()
+
+    def rollback(self):
+        if not self._nested:
+            self._session.rollback()
+            return
+        if self._savepoint is not None and self._savepoint.is_active:
+            self._savepoint.rollback()
+            self._begin_savepoint()
+        elif not self._state.has_pending_writes():
+            self._session.rollback()
+
+    def close(self):
+        if not self._finalizer.alive:
+            return
+        try:
+            if self._nested:
+                if self._savepoint is not None and self._savepoint.is_active:
+                    self._savepoint.rollback()
+                self._savepoint = None
+            else:
+                # 外层会话关闭：回滚未提交的事务、归还连接并清空标识映射
+                self._session.close()
+        finally:
+            self._finalizer.detach()
+            self._state.release()
+
+
+class RequestSessionManager:
+    """请求级会话管理（主库和读副本各一个共享 Session）"""
+
+    G_KEY = '_db_request_sessions'
+
+    @staticmethod
+    def is_enabled():
+        return (
+            os.getenv('DB_SESSION_SCOPE', 'request').lower() == 'request'
+            and not _autonomous_transaction.get()
+            and has_request_context()
+        )
+
+    @classmethod
+    def open_session(cls, session_factory=None):
+        session_factory = session_factory or SessionLocal
+        states = g.get(cls.G_KEY)
+        if states is None:
+            states = {}
+            setattr(g, cls.G_KEY, states)
+        state = states.get(session_factory)
+        if state is None:
+            state = states[session_factory] = _RequestSessionState(session_factory())
+        return RequestScopedSession(state, nested=state.open_count > 0)
+
+    @classmethod
+    def close_request_session(cls):
+        states = g.pop(cls.G_KEY, None)
+        for state in (states or {}).values():
+            state.close()
+
 # 测试数据库连接
 def test_database_connection():
     """测试数据库连接"""
@@ -202,18 +469,74 @@ class DatabaseService:
     
     @staticmethod
     def get_session():
-        """获取新的数据库会话"""
+        """
+        获取数据库会话
+        请求内返回共享同一 Session 的会话句柄（见 RequestSessionManager），请求外创建新的会话；
+        在 @read_replica 标记的接口内优先使用读副本（见 services/read_replica.py）
+        """
         try:
-            session = SessionLocal()
+            session_factory = SessionLocal
+            max_lag = _read_replica_scope.get()
+            if max_lag is not None and not _autonomous_transaction.get():
+                from services.read_replica import ReadReplica
+                session_factory = ReadReplica.session_factory(max_lag)
+            if RequestSessionManager.is_enabled():
+                return RequestSessionManager.open_session(session_factory)
+            session = session_factory()
             return session
         except Exception as e:
             logger.error(f"Error creating database session: {str(e)}")
             raise
 
+    @staticmethod
+    def primary_engine():
+        """主库 engine（不经过读副本的会话绑定的 engine）"""
+        return SessionLocal.kw['bind']
+
+    @staticmethod
+    def get_read_session(max_lag_seconds=None):
+        """
+        获取只读查询会话：读副本可用且延迟在容忍范围内时使用副本，否则使用主库
+        调用方负责 close_session
+        """
+        from services.read_replica import replica_scope
+        with replica_scope(max_lag_seconds):
+            return DatabaseService.get_session()
+
+    @staticmethod
+    @contextmanager
+    def autonomous_transaction():
+        """在此范围内 get_session() 返回独立会话（独立连接和事务，不受请求内外层事务影响）"""
+        token = _autonomous_transaction.set(True)
+        try:
+            yield
+        finally:
+            _autonomous_transaction.reset(token)
+
+    @staticmethod
+    def pool_stats():
+        """连接池使用情况：容量、已借出、溢出数及连接获取耗时"""
+        pool = engine.pool
+        stats = {
+            'size': pool.size() if hasattr(pool, 'size') else 0,
+            'checked_out': pool.checkedout() if hasattr(pool, 'checkedout') else 0,
+            'overflow': pool.overflow() if hasattr(pool, 'overflow') else 0,
+            'max_overflow': getattr(pool, '_max_overflow', 0)
+        }
+        metrics = getattr(pool, 'wait_metrics', None)
+        if metrics is not None:
+            stats.update(metrics)
+            stats['wait_ms_total'] = round(stats['wait_ms_total'], 3)
+            stats['wait_ms_max'] = round(stats['wait_ms_max'], 3)
+        return stats
+
     @staticmethod
     def close_session(session):
         """关闭数据库会话"""
         try:
+            if isinstance(session, RequestScopedSession):
+                session.close()
+                return
             if session:
                 # Ensure any pending transactions are handled
                 if session.in_transaction():
@@ -267,10 +590,8 @@ class DatabaseService:
                 Base.metadata.create_all(bind=engine)
                 logger.info(f"SQLite database initialized successfully at {DATABASE_PATH}")
             
-            # 注册branch_id过滤中间件
-            if not event.contains(Session, 'do_orm_execute', DatabaseService.branch_filter_middleware):
-                event.listen(Session, 'do_orm_execute', DatabaseService.branch_filter_middleware)
-                logger.info("Branch filter middleware registered successfully")
+            # 注册branch_id过滤（按映射类预先登记的网点条件）
+            BranchScope.install(Base)
             
         except Exception as e:
             logger.error(f"Failed to initialize database: {str(e)}")
@@ -301,68 +622,19 @@ class DatabaseService:
         
         session.commit()
 
-    @staticmethod
-    def branch_filter_middleware(orm_execute_state):
-        """Middleware to automatically add branch_id filter to queries"""
-        
-        # Skip if not in request context or if explicitly disabled
-        if not hasattr(g, 'current_user') or getattr(g, 'skip_branch_filter', False):
-            return
-            
-        # Skip for system tables or tables without branch_id
-        if not orm_execute_state.is_select:
-            return
-            
-        # Get the primary entity being queried
-        entities = orm_execute_state.statement.column_descriptions
-        if not entities:
-            return
-            
-        primary_entity = entities[0].get('entity')
-        if not primary_entity:
-            return
-            
-        # Check if the entity has branch_id column
-        mapper = inspect(primary_entity)
-        if not hasattr(mapper.class_, 'branch_id'):
-            return
-            
-        # Skip for Currency table - currencies should be global
-        if mapper.class_.__name__ == 'Currency':
-            return
-            
-        # Skip if user has all-branch permission and skip_branch_filter is True
-        current_user = getattr(g, 'current_user', None)
-        if (current_user and 
-            isinstance(current_user, dict) and 
-            'manage_all_branches' in current_user.get('permissions', []) and 
-            getattr(g, 'skip_branch_filter', False)):
-            return
-            
-        # Add branch_id condition
-        if current_user and isinstance(current_user, dict):
-            orm_execute_state.statement = orm_execute_state.statement.where(
-                primary_entity.branch_id == current_user.get('branch_id')
-            )
-
     @staticmethod
     def skip_branch_filter(func):
         """Decorator to skip branch filter for specific queries"""
         @wraps(func)
         def wrapper(*args, **kwargs):
-            g.skip_branch_filter = True
-            try:
+            with BranchScope.unrestricted():
                 return func(*args, **kwargs)
-            finally:
-                g.skip_branch_filter = False
         return wrapper
 
-# 创建全局数据库实例
-db = SessionLocal()
-
 def shutdown_session(exception=None):
-    """在应用关闭时清理数据库会话"""
-    db.close()
+    """请求结束时关闭请求级共享会话"""
+    if has_app_context():
+        RequestSessionManager.close_request_session()
 
 def get_branch_list():
     """Get list of all branches"""
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+日结理论余额批量计算
+EOD 步骤3原来逐币种查询：上次日结验证记录、上次日结状态、第一笔交易、1~3次 SUM、当前余额，
+25个币种的网点一次日结要执行100多条SQL。这里对全部币种按集合计算，查询数与币种数无关：
+- 期初余额：BalanceCheckpointService.openings()，最近一次日结检查点（尚未补写时取上次日结验证记录），
+  没有日结记录的币种取首笔交易检查点或日结开始前的第一笔交易，均为按币种分组的查询
+- 当日变动：BalanceCheckpointService.period_changes()，同一期间的日间检查点加其后的增量；
+  外币按统计开始时间分组（通常只有一组）SUM(amount)，本币合计所有交易的 local_amount，均剔除 Eod_diff
+- 实际余额：一次查询
+口径与 EODService._calculate_balances_legacy（原逐币种实现）完全一致，由一致性测试保证
+"""
+
+import logging
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+from models.exchange_models import Branch, Currency, CurrencyBalance, EODStatus
+from services.balance_checkpoint_service import BalanceCheckpointService
+
+logger = logging.getLogger(__name__)
+
+
+class TheoreticalBalanceEngine:
+    """按集合计算日结理论余额"""
+
+    @classmethod
+    def calculate(cls, session, eod_status: EODStatus, branch: Optional[Branch],
+                  currencies: Iterable[Currency]) -> List[Dict[str, Any]]:
+        """
+        计算各币种的期初余额、当日变动、理论余额和实际余额
+
+        Args:
+            session: 数据库会话
+            eod_status: 当前日结记录
+            branch: 日结网点
+            currencies: 参与计算的币种（结果按此顺序返回，无效币种跳过）
+
+        Returns:
+            与 calculate_theoretical_balance 返回的 calculations 相同结构的列表
+        """
+        currencies = [c for c in currencies if c and c.currency_code]
+        if not currencies:
+            return []
+        branch_id = eod_status.branch_id
+        end_time = eod_status.started_at
+        base_currency_id = branch.base_currency_id if branch else None
+        currency_ids = [c.id for c in currencies]
+
+        # 1. 期初余额与变动统计开始时间（首次计算的币种写入首笔交易检查点，随步骤状态一起提交）
+        openings = BalanceCheckpointService.openings(
+            session, branch_id, base_currency_id, currency_ids, end_time,
+            exclude_eod_id=eod_status.id, persist=True)
+
+        # 2. 当日变动
+        starts = {currency_id: openings[currency_id][1] for currency_id in currency_ids}
+        changes = BalanceCheckpointService.period_changes(session, branch_id, base_currency_id, starts, end_time)
+
+        # 3. 实际余额（同一币种有多条余额记录时取最早的一条）
+        actual_balances = {}
+        for balance in session.query(CurrencyBalance).filter(
+            CurrencyBalance.branch_id == branch_id,
+            CurrencyBalance.currency_id.in_(currency_ids)
+        ).order_by(CurrencyBalance.id).all():
+            actual_balances.setdefault(balance.currency_id, balance.balance)
+
+        calculations = []
+        for currency in currencies:
+            opening_balance, change_start_time, _ = openings[currency.id]
+            daily_change = Decimal(str(changes.get(currency.id) or 0))
+            theoretical_balance = opening_balance + daily_change
+            actual = actual_balances.get(currency.id)
+            actual_balance = Decimal(str(actual)) if actual is not None else Decimal('0')
+            calculations.append({
+                'currency_id': currency.id,
+                'currency_code': currency.currency_code,
+                'currency_name': currency.currency_name,
+                'custom_flag_filename': currency.custom_flag_filename,
+                'flag_code': currency.flag_code,
+                'opening_balance': float(opening_balance),
+                'daily_change': float(daily_change),
+                'theoretical_balance': float(theoretical_balance),
+                'actual_balance': float(actual_balance),
+                'difference': float(theoretical_balance - actual_balance),
+                'change_start_time': change_start_time.isoformat() if change_start_time else None,
+                'change_end_time': end_time.isoformat() if end_time else None
+            })
+
+        logger.info(f"理论余额计算完成 - EOD ID: {eod_status.id}, 币种数: {len(calculations)}, "
+                    f"统计时间段数: {len(set(starts.values()))}")
+        return calculations
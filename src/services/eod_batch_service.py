@@ -0,0 +1,438 @@
+# -*- coding: utf-8 -*-
+"""
+批量日结服务
+总部夜间按网点列表批量执行日结：每个网点依次调用 EODService 的原有步骤函数
+（开始 → 提取余额 → 理论余额 → 核对 → 收入统计 → 打印 → 完成），审计记录与在前台逐步操作一致。
+
+- 并行：网点之间用有上限的线程池并行（EOD_BATCH_WORKERS，默认4），同一网点的步骤顺序执行
+- 隔离：每个网点使用独立的数据库会话和会话租约（session_id = eod-batch-<任务ID>-<网点ID>），
+  某个网点失败或需要人工处理不影响其他网点；每次执行持有自己的租约令牌，
+  任务被其他进程接管后旧进程续期失败即停止
+- 可恢复：每完成一个步骤即提交 eod_batch_items.stage，进程中断后对同一任务再次执行
+  从下一个步骤继续；执行期间后台线程每隔 EOD_BATCH_HEARTBEAT_SECONDS（默认为超时时间的1/4，最长60秒）
+  更新心跳（单个步骤耗时很长时也不中断），超过 EOD_BATCH_STALE_SECONDS（默认600）未更新的任务可由其他进程接管
+- 汇总：任务结束时写入各网点状态、日结ID、失败原因和各步骤耗时
+
+余额核对不一致时默认标记为 attention（日结保持进行中，网点可在前台继续处理），
+任务参数 force_differences 为真时按"强制继续"处理。交款步骤不在批量流程中执行。
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy.orm import Session
+
+from models.exchange_models import Branch, EODBatchItem, EODBatchRun, EODSessionLock, EODStatus
+from services.db_service import DatabaseService
+from services.eod_lease_service import EODLeaseService
+from services.eod_service import EODService
+from services.log_service import LogService
+
+logger = logging.getLogger(__name__)
+
+# 会话锁定中记录的来源（ip_address / user_agent）
+BATCH_IP_ADDRESS = 'eod-batch'
+BATCH_USER_AGENT = 'EODBatchService'
+
+
+class EODBatchService:
+    """批量日结服务"""
+
+    # 按顺序执行的步骤；complete_eod 要求已打印，因此包含打印步骤
+    STAGES = ('start', 'extract', 'calculate', 'verify', 'income', 'print', 'complete')
+
+    # 通过 API 在后台执行的任务 {run_id: Thread}
+    _threads: Dict[int, threading.Thread] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def max_workers() -> int:
+        return max(1, int(os.getenv('EOD_BATCH_WORKERS', '4')))
+
+    @staticmethod
+    def stale_seconds() -> int:
+        return int(os.getenv('EOD_BATCH_STALE_SECONDS', '600'))
+
+    @staticmethod
+    def heartbeat_seconds() -> float:
+        default = min(60.0, EODBatchService.stale_seconds() / 4)
+        try:
+            return max(0.1, float(os.getenv('EOD_BATCH_HEARTBEAT_SECONDS', default)))
+        except ValueError:
+            return max(0.1, default)
+
+    @staticmethod
+    def owner() -> str:
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    @staticmethod
+    def session_id(run_id: int, branch_id: int) -> str:
+        return f"eod-batch-{run_id}-{branch_id}"
+
+    @staticmethod
+    def create_run(session: Session, branch_ids: Iterable[int], operator_id: int, target_date,
+                   workers: Optional[int] = None, force_differences: bool = False,
+                   language: str = 'zh') -> EODBatchRun:
+        """创建批量日结任务（不提交）"""
+        branch_ids = list(dict.fromkeys(int(branch_id) for branch_id in branch_ids))
+        if not branch_ids:
+            raise ValueError("网点列表不能为空")
+        found = {branch_id for (branch_id,) in session.query(Branch.id).filter(Branch.id.in_(branch_ids)).all()}
+        missing = [branch_id for branch_id in branch_ids if branch_id not in found]
+        if missing:
+            raise ValueError(f"网点不存在: {missing}")
+
+        run = EODBatchRun(
+            target_date=target_date,
+            operator_id=operator_id,
+            status='pending',
+            options=json.dumps({'workers': workers, 'force_differences': bool(force_differences),
+                                'language': language}),
+        )
+        session.add(run)
+        session.flush()
+        for branch_id in branch_ids:
+            session.add(EODBatchItem(run_id=run.id, branch_id=branch_id,
+                                     session_id=EODBatchService.session_id(run.id, branch_id)))
+        session.flush()
+        return run
+
+    @staticmethod
+    def claim(run_id: int) -> EODBatchRun:
+        """
+        由当前进程接管任务：任务正由其他进程执行且心跳未超时时拒绝；
+        上次中断时停在 running 的网点恢复为 pending
+        """
+        session = DatabaseService.get_session()
+        try:
+            run = session.query(EODBatchRun).filter_by(id=run_id).with_for_update().first()
+            if not run:
+                raise ValueError(f"批量日结任务不存在: {run_id}")
+            now = datetime.now()
+            owner = EODBatchService.owner()
+            if (run.status == 'running' and run.owner != owner and run.heartbeat_at
+                    and (now - run.heartbeat_at).total_seconds() < EODBatchService.stale_seconds()):
+                raise ValueError(f"批量日结任务 {run_id} 正由 {run.owner} 执行")
+
+            session.query(EODBatchItem).filter(
+                EODBatchItem.run_id == run_id,
+                EODBatchItem.status == 'running'
+            ).update({'status': 'pending'}, synchronize_session=False)
+            run.status = 'running'
+            run.owner = owner
+            run.heartbeat_at = now
+            run.started_at = run.started_at or now
+            run.finished_at = None
+            session.commit()
+            return run
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            DatabaseService.close_session(session)
+
+    @classmethod
+    def run(cls, run_id: int, workers: Optional[int] = None) -> Dict[str, Any]:
+        """接管并执行任务（未完成的网点全部重新执行，已完成的步骤跳过），返回汇总"""
+        cls.claim(run_id)
+        return cls.execute(run_id, workers)
+
+    @classmethod
+    def execute(cls, run_id: int, workers: Optional[int] = None) -> Dict[str, Any]:
+        """执行已接管的任务"""
+        session = DatabaseService.get_session()
+        try:
+            run = session.get(EODBatchRun, run_id)
+            options = json.loads(run.options or '{}')
+            item_ids = [item_id for (item_id,) in session.query(EODBatchItem.id).filter(
+                EODBatchItem.run_id == run_id,
+                EODBatchItem.status != 'completed'
+            ).order_by(EODBatchItem.branch_id).all()]
+            context = {
+                'run_id': run_id,
+                'operator_id': run.operator_id,
+                'target_date': run.target_date,
+                'force_differences': options.get('force_differences', False),
+                'language': options.get('language') or 'zh',
+            }
+        finally:
+            DatabaseService.close_session(session)
+
+        workers = workers or options.get('workers') or cls.max_workers()
+        started = time.perf_counter()
+        logger.info(f"批量日结任务 {run_id} 开始: {len(item_ids)} 个网点, 并行数 {workers}")
+        if item_ids:
+            stop = threading.Event()
+            ticker = threading.Thread(target=cls._heartbeat, args=(run_id, stop),
+                                      name=f'eod-batch-{run_id}-heartbeat', daemon=True)
+            ticker.start()
+            try:
+                with ThreadPoolExecutor(max_workers=min(workers, len(item_ids)),
+                                        thread_name_prefix=f'eod-batch-{run_id}') as executor:
+                    list(executor.map(lambda item_id: cls._process_item(item_id, context), item_ids))
+            finally:
+                stop.set()
+                ticker.join()
+
+        session = DatabaseService.get_session()
+        try:
+            run = session.get(EODBatchRun, run_id)
+            statuses = [status for (status,) in session.query(EODBatchItem.status).filter_by(run_id=run_id).all()]
+            completed = statuses.count('completed')
+            run.status = 'completed' if completed == len(statuses) else ('partial' if completed else 'failed')
+            run.finished_at = datetime.now()
+            run.heartbeat_at = run.finished_at
+            run.owner = None
+            summary = cls.summary(session, run)
+            summary['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            run.summary = json.dumps(summary, ensure_ascii=False, default=str)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            DatabaseService.close_session(session)
+
+        LogService.log_system_event(
+            f"批量日结任务 {run_id} 结束: {summary['status']}, {summary['counts']}",
+            operator_id=context['operator_id']
+        )
+        return summary
+
+    @classmethod
+    def _heartbeat(cls, run_id: int, stop: threading.Event) -> None:
+        """执行期间定时更新心跳（只更新本进程仍持有的任务）"""
+        owner = cls.owner()
+        while not stop.wait(cls.heartbeat_seconds()):
+            session = DatabaseService.get_session()
+            try:
+                updated = session.query(EODBatchRun).filter(
+                    EODBatchRun.id == run_id,
+                    EODBatchRun.owner == owner
+                ).update({'heartbeat_at': datetime.now()}, synchronize_session=False)
+                session.commit()
+                if not updated:
+                    logger.warning(f"批量日结任务 {run_id} 已由其他进程接管，停止更新心跳")
+                    return
+            except Exception as e:
+                session.rollback()
+                logger.warning(f"批量日结任务 {run_id} 更新心跳失败: {str(e)}")
+            finally:
+                DatabaseService.close_session(session)
+
+    @classmethod
+    def start_background(cls, run_id: int, workers: Optional[int] = None) -> bool:
+        """接管任务并在后台线程中执行（管理API使用），同一任务已在本进程执行时返回 False"""
+        with cls._lock:
+            thread = cls._threads.get(run_id)
+            if thread and thread.is_alive():
+                return False
+            cls.claim(run_id)
+
+            def target():
+                try:
+                    cls.execute(run_id, workers)
+                except Exception as e:
+                    logger.exception(f"批量日结任务 {run_id} 执行失败: {e}")
+                finally:
+                    with cls._lock:
+                        cls._threads.pop(run_id, None)
+
+            thread = threading.Thread(target=target, name=f'eod-batch-{run_id}', daemon=True)
+            cls._threads[run_id] = thread
+            thread.start()
+            return True
+
+    @classmethod
+    def _process_item(cls, item_id: int, context: Dict[str, Any]) -> None:
+        """执行一个网点的剩余步骤，异常只影响本网点"""
+        # 本次执行持有的租约令牌（开始日结或接管会话时取得）
+        context = dict(context, fencing_token=None)
+        session = DatabaseService.get_session()
+        try:
+            item = session.get(EODBatchItem, item_id)
+            item.status = 'running'
+            item.message = None
+            item.attempts = (item.attempts or 0) + 1
+            item.started_at = datetime.now()
+            item.finished_at = None
+            session.commit()
+
+            durations = json.loads(item.durations or '{}')
+            remaining = cls.STAGES[cls.STAGES.index(item.stage) + 1:] if item.stage else cls.STAGES
+            for stage in remaining:
+                started = time.perf_counter()
+                if stage != 'start':
+                    problem = cls._ensure_session_lock(session, item, context)
+                    if problem:
+                        cls._finish(session, item, 'attention', problem)
+                        return
+                result = getattr(cls, f'_stage_{stage}')(session, item, context)
+                if not result['success']:
+                    cls._finish(session, item, result.get('status', 'failed'), result['message'], stage)
+                    return
+
+                durations[stage] = round((time.perf_counter() - started) * 1000, 1)
+                item.stage = stage
+                item.durations = json.dumps(durations)
+                session.query(EODBatchRun).filter_by(id=item.run_id).update(
+                    {'heartbeat_at': datetime.now()}, synchronize_session=False)
+                session.commit()
+
+            cls._finish(session, item, 'completed', None)
+        except Exception as e:
+            session.rollback()
+            logger.exception(f"批量日结网点处理失败: item={item_id}")
+            item = session.get(EODBatchItem, item_id)
+            cls._finish(session, item, 'failed', f"{type(e).__name__}: {e}")
+        finally:
+            DatabaseService.close_session(session)
+
+    @staticmethod
+    def _finish(session: Session, item: EODBatchItem, status: str, message: Optional[str],
+                stage: Optional[str] = None) -> None:
+        item.status = status
+        if message:
+            item.message = (f"[{stage}] {message}" if stage else message)[:500]
+        item.finished_at = datetime.now()
+        session.commit()
+        if status != 'completed':
+            LogService.log_error(f"批量日结网点 {item.branch_id} 未完成({status}): {item.message}")
+
+    @staticmethod
+    def _ensure_session_lock(session: Session, item: EODBatchItem, context: Dict[str, Any]) -> Optional[str]:
+        """
+        续期本网点的日结会话租约；本次执行尚未持有租约（进程中断后继续）或租约已到期时重新取得。
+        日结已不在进行中、已由其他终端或其他进程接管时返回原因，不再继续执行
+        """
+        token = context['fencing_token']
+        if token is not None and EODService.update_eod_session_activity(
+                item.session_id, item.branch_id, token)['success']:
+            return None
+        eod_status = session.get(EODStatus, item.eod_status_id)
+        session.refresh(eod_status)
+        if eod_status.status != 'processing':
+            return f"日结 {eod_status.id} 状态为 {eod_status.status}，批量日结已停止"
+        holder = EODLeaseService.holder(session, eod_status_id=eod_status.id)
+        if holder and holder.session_id != item.session_id:
+            return f"日结 {eod_status.id} 已由其他终端接管（会话 {holder.session_id}）"
+        if holder and token is not None and holder.fencing_token != token:
+            return f"日结 {eod_status.id} 已由其他批量日结进程接管"
+        result = EODService.continue_eod_session(eod_status.id, item.session_id, BATCH_IP_ADDRESS, BATCH_USER_AGENT)
+        if not result['success']:
+            return result['message']
+        context['fencing_token'] = result['fencing_token']
+        return None
+
+    @staticmethod
+    def _stage_start(session: Session, item: EODBatchItem, context: Dict[str, Any]) -> Dict[str, Any]:
+        # 上次执行在开始日结后、记录日结ID前中断：沿用本任务会话锁定下进行中的日结
+        adopted = session.query(EODStatus).join(
+            EODSessionLock, EODSessionLock.eod_status_id == EODStatus.id
+        ).filter(
+            EODStatus.branch_id == item.branch_id,
+            EODStatus.status == 'processing',
+            EODSessionLock.session_id == item.session_id
+        ).first()
+        if adopted:
+            # 令牌属于中断前的进程，下一步骤前重新取得
+            item.eod_status_id = adopted.id
+            return {'success': True}
+
+        result = EODService.start_eod(
+            branch_id=item.branch_id,
+            operator_id=context['operator_id'],
+            target_date=context['target_date'],
+            session_id=item.session_id,
+            ip_address=BATCH_IP_ADDRESS,
+            user_agent=BATCH_USER_AGENT
+        )
+        if result['success']:
+            item.eod_status_id = result['eod_id']
+            context['fencing_token'] = result['fencing_token']
+        return result
+
+    @staticmethod
+    def _stage_extract(session: Session, item: EODBatchItem, context: Dict[str, Any]) -> Dict[str, Any]:
+        return EODService.extract_balance(item.eod_status_id)
+
+    @staticmethod
+    def _stage_calculate(session: Session, item: EODBatchItem, context: Dict[str, Any]) -> Dict[str, Any]:
+        return EODService.calculate_theoretical_balance(item.eod_status_id)
+
+    @staticmethod
+    def _stage_verify(session: Session, item: EODBatchItem, context: Dict[str, Any]) -> Dict[str, Any]:
+        result = EODService.verify_balance(item.eod_status_id)
+        if not result['success']:
+            return result
+        if result['all_match']:
+            return EODService.handle_verification_result(item.eod_status_id, 'continue')
+
+        differences = ', '.join(
+            f"{r['currency_code']} {r['difference']}" for r in result['verification_results'] if not r['is_match'])
+        if not context['force_differences']:
+            return {'success': False, 'status': 'attention', 'message': f"余额核对不一致，需人工处理: {differences}"}
+        return EODService.handle_verification_result(
+            item.eod_status_id, 'force', f"批量日结任务 {item.run_id} 强制继续: {differences}")
+
+    @staticmethod
+    def _stage_income(session: Session, item: EODBatchItem, context: Dict[str, Any]) -> Dict[str, Any]:
+        return EODService.generate_income_statistics(item.eod_status_id, context['operator_id'], context['language'])
+
+    @staticmethod
+    def _stage_print(session: Session, item: EODBatchItem, context: Dict[str, Any]) -> Dict[str, Any]:
+        return EODService.print_report(item.eod_status_id, context['operator_id'], 'simple', context['language'])
+
+    @staticmethod
+    def _stage_complete(session: Session, item: EODBatchItem, context: Dict[str, Any]) -> Dict[str, Any]:
+        # 上次执行在完成日结后、记录步骤前中断
+        eod_status = session.get(EODStatus, item.eod_status_id)
+        session.refresh(eod_status)
+        if eod_status.status == 'completed':
+            return {'success': True}
+        return EODService.complete_eod(item.eod_status_id, context['operator_id'], item.session_id,
+                                       context['fencing_token'])
+
+    @staticmethod
+    def summary(session: Session, run: EODBatchRun) -> Dict[str, Any]:
+        """任务汇总：各状态网点数和每个网点的日结ID、步骤、原因与耗时"""
+        items = session.query(EODBatchItem).filter_by(run_id=run.id).order_by(EODBatchItem.branch_id).all()
+        names = dict(session.query(Branch.id, Branch.branch_name).filter(
+            Branch.id.in_([item.branch_id for item in items])).all()) if items else {}
+        counts: Dict[str, int] = {}
+        branches: List[Dict[str, Any]] = []
+        for item in items:
+            counts[item.status] = counts.get(item.status, 0) + 1
+            branches.append({
+                'branch_id': item.branch_id,
+                'branch_name': names.get(item.branch_id),
+                'eod_id': item.eod_status_id,
+                'status': item.status,
+                'stage': item.stage,
+                'message': item.message,
+                'attempts': item.attempts,
+                'durations': json.loads(item.durations or '{}'),
+                'started_at': item.started_at.isoformat() if item.started_at else None,
+                'finished_at': item.finished_at.isoformat() if item.finished_at else None,
+            })
+        return {
+            'run_id': run.id,
+            'target_date': run.target_date.isoformat() if run.target_date else None,
+            'operator_id': run.operator_id,
+            'status': run.status,
+            'owner': run.owner,
+            'heartbeat_at': run.heartbeat_at.isoformat() if run.heartbeat_at else None,
+            'started_at': run.started_at.isoformat() if run.started_at else None,
+            'finished_at': run.finished_at.isoformat() if run.finished_at else None,
+            'options': json.loads(run.options or '{}'),
+            'total': len(items),
+            'counts': counts,
+            'branches': branches,
+        }
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+日结会话租约服务
+eod_session_locks 每行即一个网点的日结会话租约：
+- 授予（acquire）：一条语句删除该网点原有的锁定，从 eod_lease_sequences 取下一个令牌，写入新租约，
+  到期时间 = 当前时间 + EOD_LEASE_SECONDS（默认7200，与原2小时过期清理一致）
+- 续期（renew）：一条带条件的 UPDATE（会话ID、未到期、可选令牌一致），不再先查询再更新
+- 令牌（fencing token）：同一网点单调递增，被接管的旧持有者带旧令牌续期或完成日结时失败，
+  即使会话ID相同（例如批量日结进程中断后由其他进程继续）也不会误用新持有者的租约
+- 过期（expire）：到期或空闲超时的租约一条 DELETE 批量删除
+
+营业锁定状态（网点是否有进行中且锁定的日结）是每笔交易的前置检查：
+- 只在跨进程共享的缓存后端（file、redis）上缓存到命名空间 eod_business_lock，
+  默认的进程内后端无法通知其他工作进程，每次直接查询
+- EODStatus 新增、删除或 status/is_locked/branch_id 变更（含批量 update/delete）的事务提交后
+  递增命名空间代数，与之并发的 get_or_load 读到新代数后不会写回旧值；
+  原生 SQL 修改由 EOD_BUSINESS_LOCK_CACHE_TTL（默认30秒，0 表示不缓存）兜底
+- 交易路径（兑换、双向交易、冲正）的入口只用 cached_business_lock 读缓存快速拒绝，不查询数据库；
+  唯一的数据库读取是提交前在同一事务中调用的 ensure_business_unlocked，日结已锁定时抛出
+  BusinessLockedError，读到的状态写回缓存供后续请求的入口检查使用
+"""
+
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import and_, delete, event, insert, inspect, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models.exchange_models import EODLeaseSequence, EODSessionLock, EODStatus
+from services.shared_cache import SharedCache
+
+logger = logging.getLogger(__name__)
+
+# 会话 info 中记录待失效的网点（'*' 表示全部）
+PENDING_KEY = 'eod_business_lock_pending'
+# 影响营业锁定状态的 EODStatus 字段
+TRACKED_FIELDS = ('status', 'is_locked', 'branch_id')
+ALL_BRANCHES = '*'
+
+
+class BusinessLockedError(ValueError):
+    """网点营业已锁定（日结进行中），不能过账"""
+
+    def __init__(self, lock: Dict[str, Any]):
+        super().__init__('当前网点营业已锁定（日结进行中），无法进行交易操作')
+        self.lock = lock
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class EODLeaseService:
+    """日结会话租约与营业锁定状态缓存"""
+
+    _business_locks = SharedCache.namespace('eod_business_lock')
+
+    @staticmethod
+    def lease_seconds() -> float:
+        return _env_number('EOD_LEASE_SECONDS', 7200)
+
+    @staticmethod
+    def business_lock_ttl() -> float:
+        return _env_number('EOD_BUSINESS_LOCK_CACHE_TTL', 30)
+
+    # ------------------------------------------------------------------
+    # 租约
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def next_token(session: Session, branch_id: int) -> int:
+        """递增并返回网点的下一个租约令牌（在调用方事务中，语句本身持有行锁）"""
+        table = EODLeaseSequence.__table__
+        values = {'last_token': table.c.last_token + 1, 'updated_at': datetime.now()}
+        if session.execute(update(table).where(table.c.branch_id == branch_id).values(**values)).rowcount == 0:
+            try:
+                with session.begin_nested():
+                    session.execute(insert(table).values(branch_id=branch_id, last_token=1, updated_at=datetime.now()))
+                return 1
+            except IntegrityError:
+                # 并发首次插入，改为递增
+                session.execute(update(table).where(table.c.branch_id == branch_id).values(**values))
+        return session.execute(select(table.c.last_token).where(table.c.branch_id == branch_id)).scalar()
+
+    @classmethod
+    def acquire(cls, session: Session, branch_id: int, eod_status_id: int, operator_id: int,
+                session_id: str, ip_address: str, user_agent: Optional[str] = None) -> EODSessionLock:
+        """授予网点日结会话租约（接管原有持有者，不提交）"""
+        now = datetime.now()
+        session.execute(delete(EODSessionLock).where(EODSessionLock.branch_id == branch_id))
+        lock = EODSessionLock(
+            branch_id=branch_id,
+            eod_status_id=eod_status_id,
+            session_id=session_id,
+            operator_id=operator_id,
+            ip_address=ip_address,
+            user_agent=user_agent or '',
+            created_at=now,
+            last_activity=now,
+            is_active=True,
+            fencing_token=cls.next_token(session, branch_id),
+            expires_at=now + timedelta(seconds=cls.lease_seconds())
+        )
+        session.add(lock)
+        session.flush()
+        return lock
+
+    @staticmethod
+    def _unexpired(now: datetime):
+        # 迁移前创建的锁定没有到期时间，按空闲时间由 expire() 清理
+        return or_(EODSessionLock.expires_at.is_(None), EODSessionLock.expires_at > now)
+
+    @classmethod
+    def renew(cls, session: Session, session_id: str, branch_id: int,
+              fencing_token: Optional[int] = None) -> bool:
+        """续期租约（一条 UPDATE，不提交）；租约不存在、已到期或令牌不一致时返回 False"""
+        now = datetime.now()
+        conditions = [
+            EODSessionLock.session_id == session_id,
+            EODSessionLock.branch_id == branch_id,
+            EODSessionLock.is_active == True,  # noqa: E712
+            cls._unexpired(now),
+        ]
+        if fencing_token is not None:
+            conditions.append(EODSessionLock.fencing_token == fencing_token)
+        result = session.execute(
+            update(EODSessionLock).where(and_(*conditions)).values(
+                last_activity=now, expires_at=now + timedelta(seconds=cls.lease_seconds())
+            ).execution_options(synchronize_session=False)
+        )
+        return result.rowcount > 0
+
+    @classmethod
+    def holder(cls, session: Session, branch_id: Optional[int] = None,
+               eod_status_id: Optional[int] = None) -> Optional[EODSessionLock]:
+        """网点或日结当前未到期的租约"""
+        query = session.query(EODSessionLock).filter(
+            EODSessionLock.is_active == True,  # noqa: E712
+            cls._unexpired(datetime.now())
+        )
+        if branch_id is not None:
+            query = query.filter(EODSessionLock.branch_id == branch_id)
+        if eod_status_id is not None:
+            query = query.filter(EODSessionLock.eod_status_id == eod_status_id)
+        return query.first()
+
+    @classmethod
+    def validate(cls, session: Session, eod_status_id: int, session_id: str,
+                 fencing_token: Optional[int] = None) -> Optional[EODSessionLock]:
+        """日结的未到期租约属于 session_id（且令牌一致）时返回该租约"""
+        lock = cls.holder(session, eod_status_id=eod_status_id)
+        if lock is None or lock.session_id != session_id:
+            return None
+        if fencing_token is not None and lock.fencing_token != fencing_token:
+            return None
+        return lock
+
+    @staticmethod
+    def release(session: Session, branch_id: int, session_id: Optional[str] = None) -> int:
+        """释放网点的租约（指定 session_id 时只释放该会话的，不提交）"""
+        statement = delete(EODSessionLock).where(EODSessionLock.branch_id == branch_id)
+        if session_id is not None:
+            statement = statement.where(EODSessionLock.session_id == session_id)
+        return session.execute(statement).rowcount
+
+    @staticmethod
+    def release_eod(session: Session, eod_status_id: int) -> int:
+        """释放日结的全部租约（不提交）"""
+        return session.execute(
+            delete(EODSessionLock).where(EODSessionLock.eod_status_id == eod_status_id)
+        ).rowcount
+
+    @staticmethod
+    def expire(session: Session, idle: Optional[timedelta] = None) -> int:
+        """批量删除已到期（或空闲超过 idle）的租约（不提交），返回删除数量"""
+        now = datetime.now()
+        expired = [and_(EODSessionLock.expires_at.isnot(None), EODSessionLock.expires_at <= now)]
+        if idle is not None:
+            expired.append(EODSessionLock.last_activity < now - idle)
+        return session.execute(delete(EODSessionLock).where(or_(*expired))).rowcount
+
+    # ------------------------------------------------------------------
+    # 营业锁定状态缓存
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def load_business_lock(session: Session, branch_id: int) -> Dict[str, Any]:
+        locked_eod = session.query(EODStatus.id, EODStatus.date).filter(
+            EODStatus.branch_id == branch_id,
+            EODStatus.is_locked == True,  # noqa: E712
+            EODStatus.status == 'processing'
+        ).first()
+        return {
+            'is_locked': locked_eod is not None,
+            'eod_id': locked_eod.id if locked_eod else None,
+            'lock_date': locked_eod.date.isoformat() if locked_eod else None,
+        }
+
+    @classmethod
+    def business_lock(cls, branch_id: int) -> Dict[str, Any]:
+        """网点营业锁定状态 {is_locked, eod_id, lock_date}（缓存未命中时另开会话读取）"""
+        from services.db_service import DatabaseService
+
+        def load():
+            session = DatabaseService.get_session()
+            try:
+                return cls.load_business_lock(session, branch_id)
+            finally:
+                DatabaseService.close_session(session)
+
+        if not cls._cache_enabled():
+            return load()
+        return dict(cls._business_locks.get_or_load(branch_id, load, ttl=cls.business_lock_ttl()))
+
+    @classmethod
+    def _cache_enabled(cls) -> bool:
+        return cls.business_lock_ttl() > 0 and SharedCache.backend().shared
+
+    @classmethod
+    def cached_business_lock(cls, branch_id: int) -> Optional[Dict[str, Any]]:
+        """只读缓存的营业锁定状态，未缓存（或后端不共享）时返回 None，从不查询数据库"""
+        if not cls._cache_enabled():
+            return None
+        lock = cls._business_locks.get(branch_id)
+        return dict(lock) if lock is not None else None
+
+    @classmethod
+    def ensure_business_unlocked(cls, session: Session, branch_id: int):
+        """在过账事务中查询营业锁定状态（不经缓存），已锁定时抛出 BusinessLockedError"""
+        generation = SharedCache.generation(cls._business_locks.name)
+        lock = cls.load_business_lock(session, branch_id)
+        # 读取期间命名空间被清除（日结状态已变更）时不写回
+        if cls._cache_enabled() and SharedCache.generation(cls._business_locks.name) == generation:
+            cls._business_locks.set(branch_id, lock, ttl=cls.business_lock_ttl())
+        if lock['is_locked']:
+            logger.warning(f"网点 {branch_id} 营业已锁定（日结ID: {lock['eod_id']}），拒绝过账")
+            raise BusinessLockedError(lock)
+
+    @classmethod
+    def invalidate_business_lock(cls):
+        """
+        清除营业锁定状态缓存
+        只变更一个网点时也递增整个命名空间的代数：只删除该网点条目时，提交前开始的 get_or_load 仍可能写回旧值
+        """
+        cls._business_locks.clear()
+
+    @classmethod
+    def register_listeners(cls, session_factory):
+        """在会话工厂上注册 EODStatus 变更后的缓存失效事件（重复调用无副作用）"""
+        for name, listener in (('after_flush', cls._after_flush), ('do_orm_execute', cls._on_orm_execute),
+                               ('after_commit', cls._after_commit),
+                               ('after_transaction_end', cls._after_transaction_end)):
+            if not event.contains(session_factory, name, listener):
+                event.listen(session_factory, name, listener)
+
+    @staticmethod
+    def _mark(session: Session, branch_id):
+        session.info.setdefault(PENDING_KEY, set()).add(branch_id)
+
+    @classmethod
+    def _after_flush(cls, session: Session, flush_context):
+        for obj in list(session.new) + list(session.deleted):
+            if isinstance(obj, EODStatus):
+                cls._mark(session, obj.branch_id)
+        for obj in session.dirty:
+            if not isinstance(obj, EODStatus):
+                continue
+            state = inspect(obj)
+            histories = {field: state.attrs[field].history for field in TRACKED_FIELDS}
+            if any(history.has_changes() for history in histories.values()):
+                cls._mark(session, obj.branch_id)
+                # 日结改到其他网点时原网点也失效
+                for branch_id in histories['branch_id'].deleted or ():
+                    cls._mark(session, branch_id)
+
+    @classmethod
+    def _on_orm_execute(cls, orm_execute_state):
+        if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+            return
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ is EODStatus:
+            cls._mark(orm_execute_state.session, ALL_BRANCHES)
+
+    @classmethod
+    def _after_commit(cls, session: Session):
+        pending = session.info.pop(PENDING_KEY, None)
+        if not pending:
+            return
+        try:
+            cls.invalidate_business_lock()
+        except Exception as e:
+            logger.warning(f"营业锁定状态缓存失效失败: {str(e)}")
+
+    @staticmethod
+    def _after_transaction_end(session: Session, transaction):
+        # 只处理最外层事务；提交时 _after_commit 已处理，这里丢弃回滚事务中的记录
+        if transaction.parent is None:
+            session.info.pop(PENDING_KEY, None)
@@ -0,0 +1,399 @@
+# -*- coding: utf-8 -*-
+"""
+日结报表数据包服务
+日结收入统计和打印步骤原来每次调用都重新执行 CalGain/CalBalance/CalBaseCurrency，再逐个语言串行生成PDF。
+这里按日结ID只计算一次数据模型并保存在 eod_report_bundles（跟随日结记录），各语言版本和差额报表在进程池中
+并行生成，生成结果同样记在数据包中，内容不变时重印直接使用已生成的文件：
+- 数据模型：按 (网点, 统计开始时间, 网点最大交易ID) 判断能否直接读取；传统时间范围以当前时间为结束时间，
+  每次调用都不同，结束时间不早于已保存的结束时间且没有新交易时统计结果不变，同样直接读取
+- 报表组：income（收入报表）、print（交款汇总和差额调节/差额报告），按内容摘要判断能否复用已生成的文件；
+  生成参数中不放每次请求不同的操作员和打印时间，文件中的生成时间是文件实际生成的时间
+- 各阶段耗时（毫秒）随结果返回，并保存在 timings 中
+
+EOD_REPORT_RENDER_WORKERS 设置进程池大小（默认3，0/1 表示在当前进程内依次生成）。
+进程池子进程不复用父进程的数据库连接，并使用独立会话。
+应用服务器是多线程的，直接 fork 可能复制其他线程持有的锁，子进程默认由 forkserver（不支持时 spawn）启动，
+EOD_REPORT_RENDER_START_METHOD 可改为其他启动方式；一批任务超过 EOD_REPORT_RENDER_TIMEOUT_SECONDS
+（默认120秒）未完成时终止进程池，未完成的任务改在当前进程内生成。
+"""
+
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models.exchange_models import EODReportBundle, EODStatus, ExchangeTransaction
+
+logger = logging.getLogger(__name__)
+
+LANGUAGES = ('zh', 'en', 'th')
+
+# (文件键, 生成器名称, 参数)
+RenderTask = Tuple[str, str, tuple]
+
+
+# ----------------------------------------------------------------------
+# 报表生成器（模块级函数，供进程池子进程调用）
+# ----------------------------------------------------------------------
+
+def _render_income(print_data, filename, target_date, eod_id, language):
+    from services.simple_pdf_service import SimplePDFService
+    return SimplePDFService.generate_eod_income_report_pdf_to_manager(print_data, filename, target_date, eod_id, language)
+
+
+def _render_cashout(print_data, filename, target_date, language):
+    from services.simple_pdf_service import SimplePDFService
+    return SimplePDFService.generate_simple_eod_report_pdf(print_data, filename, target_date, language=language)
+
+
+def _render_difference_adjustment(eod_id, summary, language):
+    from services.difference_report_service import DifferenceReportService
+    return DifferenceReportService.generate_difference_adjustment_report(eod_id, summary, language)
+
+
+def _render_difference(eod_id, summary, language):
+    from services.difference_report_service import DifferenceReportService
+    return DifferenceReportService.generate_difference_report(eod_id, summary, language)
+
+
+RENDERERS = {
+    'income': _render_income,
+    'cashout': _render_cashout,
+    'difference_adjustment': _render_difference_adjustment,
+    'difference': _render_difference,
+}
+
+
+def _init_render_worker():
+    """子进程初始化：丢弃从父进程继承的连接池（不关闭父进程的连接），数据库访问使用独立会话"""
+    os.environ['DB_SESSION_SCOPE'] = 'independent'
+    from services import db_service
+    db_service.engine.dispose(close=False)
+
+
+def _run_render(renderer: str, args: tuple) -> Tuple[Dict[str, Any], float]:
+    """执行一个生成任务，返回 (生成结果, 耗时毫秒)；生成器异常记为失败结果"""
+    started = time.perf_counter()
+    try:
+        result = RENDERERS[renderer](*args)
+    except Exception as e:
+        result = {'success': False, 'message': str(e)}
+    if not result:
+        result = {'success': False, 'message': '生成器返回空结果'}
+    return result, round((time.perf_counter() - started) * 1000, 1)
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'无法序列化的类型: {type(value).__name__}')
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+class EODReportBundleService:
+    """日结报表数据模型的计算缓存、并行生成和已生成文件的复用"""
+
+    _executor: Optional[ProcessPoolExecutor] = None
+    _lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # 进程池
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def max_workers() -> int:
+        try:
+            return max(int(os.environ.get('EOD_REPORT_RENDER_WORKERS', '3')), 0)
+        except ValueError:
+            return 3
+
+    @staticmethod
+    def render_timeout() -> float:
+        """一批生成任务在进程池中的最长等待时间（秒）"""
+        try:
+            return max(float(os.environ.get('EOD_REPORT_RENDER_TIMEOUT_SECONDS', '120')), 0.1)
+        except ValueError:
+            return 120.0
+
+    @staticmethod
+    def start_method() -> Optional[str]:
+        """进程池子进程的启动方式：EOD_REPORT_RENDER_START_METHOD，默认 forkserver，不支持时 spawn"""
+        available = multiprocessing.get_all_start_methods()
+        configured = os.environ.get('EOD_REPORT_RENDER_START_METHOD', '').strip().lower()
+        if configured:
+            if configured in available:
+                return configured
+            logger.warning(f"不支持的报表进程启动方式 {configured}，使用默认方式")
+        for method in ('forkserver', 'spawn'):
+            if method in available:
+                return method
+        return None
+
+    @classmethod
+    def _get_executor(cls) -> ProcessPoolExecutor:
+        with cls._lock:
+            if cls._executor is None:
+                method = cls.start_method()
+                context = multiprocessing.get_context(method) if method else None
+                cls._executor = ProcessPoolExecutor(
+                    max_workers=cls.max_workers(), mp_context=context, initializer=_init_render_worker
+                )
+            return cls._executor
+
+    @classmethod
+    def shutdown(cls, wait: bool = True, terminate: bool = False):
+        """关闭进程池（下次生成时重新创建）；terminate=True 时先终止仍在运行的子进程"""
+        with cls._lock:
+            executor, cls._executor = cls._executor, None
+        if executor is None:
+            return
+        if terminate:
+            # ProcessPoolExecutor 没有公开的终止接口，卡住的子进程只能直接终止
+            for process in list((getattr(executor, '_processes', None) or {}).values()):
+                try:
+                    process.terminate()
+                except Exception as e:
+                    logger.warning(f"终止报表子进程失败: {str(e)}")
+        executor.shutdown(wait=wait, cancel_futures=True)
+
+    @classmethod
+    def render(cls, tasks: List[RenderTask], label: str) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, float]]:
+        """
+        并行执行生成任务（进程池不可用或超时时，未完成的任务在当前进程内生成）
+
+        Returns:
+            ({文件键: 生成结果}, {'render.<label>.<文件键>': 毫秒, 'render.<label>.wall': 总耗时})
+        """
+        started = time.perf_counter()
+        results, durations = {}, {}
+        if cls.max_workers() > 1 and len(tasks) > 1:
+            try:
+                executor = cls._get_executor()
+                futures = {key: executor.submit(_run_render, renderer, args) for key, renderer, args in tasks}
+                deadline = time.monotonic() + cls.render_timeout()
+                for key, future in futures.items():
+                    results[key], durations[key] = future.result(timeout=max(deadline - time.monotonic(), 0))
+            except FutureTimeoutError:
+                logger.warning(f"报表进程池超过 {cls.render_timeout()} 秒未完成，终止进程池，"
+                               f"剩余 {len(tasks) - len(results)} 个任务在当前进程内生成")
+                cls.shutdown(wait=False, terminate=True)
+            except Exception as e:
+                # 生成器异常已在 _run_render 中转为失败结果，这里只会是进程池本身的问题
+                logger.warning(f"报表进程池不可用，改为在当前进程内生成: {str(e)}")
+                cls.shutdown(wait=False)
+        for key, renderer, args in tasks:
+            if key not in results:
+                results[key], durations[key] = _run_render(renderer, args)
+
+        timings = {f'render.{label}.{key}': ms for key, ms in durations.items()}
+        timings[f'render.{label}.wall'] = _elapsed_ms(started)
+        return results, timings
+
+    # ------------------------------------------------------------------
+    # 数据包
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def dumps(value: Any) -> str:
+        return json.dumps(value, ensure_ascii=False, sort_keys=True, default=_json_default)
+
+    @staticmethod
+    def _loads(text: Optional[str], default):
+        return json.loads(text) if text else default
+
+    @staticmethod
+    def fingerprint(value: Any) -> str:
+        """报表内容摘要（SHA-256），内容相同时可复用已生成的文件"""
+        return hashlib.sha256(EODReportBundleService.dumps(value).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def get(session: Session, eod_id: int) -> Optional[EODReportBundle]:
+        return session.query(EODReportBundle).filter_by(eod_status_id=eod_id).first()
+
+    @staticmethod
+    def _get_or_create(session: Session, eod_status: EODStatus) -> EODReportBundle:
+        bundle = EODReportBundleService.get(session, eod_status.id)
+        if bundle is None:
+            bundle = EODReportBundle(eod_status_id=eod_status.id, branch_id=eod_status.branch_id)
+            session.add(bundle)
+        return bundle
+
+    @staticmethod
+    def source_marker(session: Session, branch_id: int) -> int:
+        """网点当前的最大交易ID（新交易、冲正、调节都会新增交易记录）"""
+        return session.query(func.max(ExchangeTransaction.id)).filter(
+            ExchangeTransaction.branch_id == branch_id
+        ).scalar() or 0
+
+    @staticmethod
+    def _record_timings(bundle: EODReportBundle, timings: Dict[str, float]):
+        recorded = EODReportBundleService._loads(bundle.timings, {})
+        recorded.update(timings)
+        bundle.timings = EODReportBundleService.dumps(recorded)
+
+    @staticmethod
+    def compute(session: Session, eod_status: EODStatus, start_time: datetime,
+                end_time: datetime) -> Tuple[Dict[str, Any], Dict[str, float]]:
+        """
+        取日结的收入统计数据模型（不提交）
+        开始时间和网点最大交易ID未变化、结束时间不早于已保存的结束时间时直接读取数据包，否则重新计算并保存
+
+        Returns:
+            ({'income_data', 'stock_data', 'base_currency_data'}, 各阶段耗时)
+        """
+        started = time.perf_counter()
+        branch_id = eod_status.branch_id
+        marker = EODReportBundleService.source_marker(session, branch_id)
+        bundle = EODReportBundleService._get_or_create(session, eod_status)
+        if (bundle.data and bundle.start_time == start_time and bundle.source_marker == marker
+                and bundle.end_time is not None and end_time >= bundle.end_time):
+            timings = {'compute.cached': _elapsed_ms(started)}
+            EODReportBundleService._record_timings(bundle, timings)
+            return json.loads(bundle.data), timings
+
+        from routes.app_reports import CalGain, CalBalance, CalBaseCurrency
+
+        timings = {}
+        stage = time.perf_counter()
+        income_data = CalGain(branch_id, start_time, end_time)
+        timings['compute.income'] = _elapsed_ms(stage)
+        stage = time.perf_counter()
+        stock_data = CalBalance(branch_id, start_time, end_time)
+        timings['compute.stock'] = _elapsed_ms(stage)
+        stage = time.perf_counter()
+        base_currency_data = CalBaseCurrency(branch_id, start_time, end_time)
+        timings['compute.base_currency'] = _elapsed_ms(stage)
+
+        data = EODReportBundleService.dumps({
+            'income_data': income_data,
+            'stock_data': stock_data,
+            'base_currency_data': base_currency_data
+        })
+        bundle.start_time = start_time
+        bundle.end_time = end_time
+        bundle.source_marker = marker
+        bundle.data = data
+        bundle.data_hash = hashlib.sha256(data.encode('utf-8')).hexdigest()
+        timings['compute'] = _elapsed_ms(started)
+        EODReportBundleService._record_timings(bundle, timings)
+        return json.loads(data), timings
+
+    # ------------------------------------------------------------------
+    # 报表文件
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def file_path(result: Optional[Dict[str, Any]]) -> Optional[str]:
+        """生成结果中的文件路径（差额报表使用 filepath 字段）"""
+        if not result:
+            return None
+        return result.get('file_path') or result.get('filepath')
+
+    @staticmethod
+    def _file_exists(result: Optional[Dict[str, Any]]) -> bool:
+        path = EODReportBundleService.file_path(result)
+        return bool(path) and os.path.exists(path)
+
+    @classmethod
+    def render_group(cls, session: Session, eod_status: EODStatus, group: str, content_hash: str,
+                     tasks: List[RenderTask], force: bool = False) -> Dict[str, Any]:
+        """
+        生成一组报表文件并记入数据包（不提交）；内容摘要相同且文件都还在时直接返回已生成的文件
+
+        Returns:
+            {'results': {文件键: 生成结果}, 'reused': 是否复用已生成文件, 'timings': 各阶段耗时}
+        """
+        started = time.perf_counter()
+        bundle = cls._get_or_create(session, eod_status)
+        artifacts = cls._loads(bundle.artifacts, {})
+        stored = artifacts.get(group) or {}
+        stored_files = stored.get('files', {}) if stored.get('hash') == content_hash else {}
+        keys = [key for key, _, _ in tasks]
+
+        if not force and keys and all(cls._file_exists(stored_files.get(key)) for key in keys):
+            results = {key: stored_files[key] for key in keys}
+            timings = {f'reuse.{group}': _elapsed_ms(started)}
+            reused = True
+        else:
+            results, timings = cls.render(tasks, group)
+            files = dict(stored_files)
+            files.update({key: result for key, result in results.items() if result.get('success')})
+            artifacts[group] = {'hash': content_hash, 'files': files, 'rendered_at': datetime.now().isoformat()}
+            bundle.artifacts = cls.dumps(artifacts)
+            reused = False
+
+        cls._record_timings(bundle, timings)
+        logger.info(f"日结报表 {group} - 日结ID: {eod_status.id}, 复用: {reused}, 耗时(ms): {timings}")
+        return {'results': results, 'reused': reused, 'timings': timings}
+
+    @staticmethod
+    def income_filename(eod_status: EODStatus, language: str) -> str:
+        """收入报表文件名：YYYYMMDDEOD{id}income.pdf，非中文加语言后缀"""
+        prefix = f"{eod_status.date.strftime('%Y%m%d')}EOD{eod_status.id}income"
+        return f"{prefix}.pdf" if language == 'zh' else f"{prefix}_{language}.pdf"
+
+    @staticmethod
+    def income_print_data(eod_status: EODStatus, bundle: EODReportBundle) -> Dict[str, Any]:
+        """收入报表PDF数据（与界面显示的收入统计数据一致）"""
+        model = json.loads(bundle.data)
+        income_data, stock_data = model['income_data'], model['stock_data']
+        return {
+            'eod_id': eod_status.id,
+            'eod_date': eod_status.date,
+            'time_range': {  # CalGain 查询使用的实际时间范围
+                'start_time': bundle.start_time,
+                'end_time': bundle.end_time
+            },
+            'branch_id': eod_status.branch_id,
+            'date': eod_status.date.isoformat(),
+            'income_reports': income_data.get('currencies', []) if isinstance(income_data, dict) else [],
+            'stock_reports': stock_data.get('currencies', []) if isinstance(stock_data, dict) else [],
+            'base_currency_data': model['base_currency_data']
+        }
+
+    @classmethod
+    def render_income(cls, session: Session, eod_status: EODStatus, languages: Iterable[str] = LANGUAGES,
+                      force: bool = False) -> Dict[str, Any]:
+        """按数据包中的数据模型生成各语言收入报表（需先调用 compute）"""
+        bundle = cls.get(session, eod_status.id)
+        if bundle is None or not bundle.data:
+            raise ValueError(f'日结 {eod_status.id} 尚未计算收入统计数据')
+        print_data = cls.income_print_data(eod_status, bundle)
+        tasks = [
+            (lang, 'income', (print_data, cls.income_filename(eod_status, lang), eod_status.date, eod_status.id, lang))
+            for lang in languages
+        ]
+        return cls.render_group(session, eod_status, 'income', bundle.data_hash, tasks, force=force)
+
+    @classmethod
+    def stored_file(cls, session: Session, eod_id: int, group: str, key: str) -> Optional[Dict[str, Any]]:
+        """数据包中当前内容已生成且文件仍存在的报表，没有时返回 None"""
+        bundle = cls.get(session, eod_id)
+        if bundle is None:
+            return None
+        stored = cls._loads(bundle.artifacts, {}).get(group) or {}
+        if group == 'income' and stored.get('hash') != bundle.data_hash:
+            return None
+        result = stored.get('files', {}).get(key)
+        return result if cls._file_exists(result) else None
+
+    @classmethod
+    def timings(cls, session: Session, eod_id: int) -> Dict[str, float]:
+        """数据包中记录的各阶段耗时"""
+        bundle = cls.get(session, eod_id)
+        return cls._loads(bundle.timings, {}) if bundle else {}
@@ -8,10 +8,14 @@ from models.exchange_models import (
     EODStatus, 
     # EODHistory, EODBalanceSnapshot,  # 已废弃 - 2025-10-10
     EODBalanceVerification, EODPrintLog, EODCashOut,
-    ExchangeTransaction, Currency, CurrencyBalance, Branch, Operator, EODSessionLock
+    ExchangeTransaction, Currency, CurrencyBalance, Branch, Operator
 )
 from utils.transaction_utils import generate_transaction_no
 from config.features import FeatureFlags
+from services.balance_checkpoint_service import BalanceCheckpointService
+from services.eod_balance_engine import TheoreticalBalanceEngine
+from services.eod_report_bundle_service import EODReportBundleService
+from services.eod_lease_service import EODLeaseService
 import logging
 import os
 
@@ -42,11 +46,8 @@ class EODService:
             ).first()
             
             if existing_eod:
-                # 检查是否有对应的活跃会话锁定
-                session_lock = session.query(EODSessionLock).filter(
-                    EODSessionLock.eod_status_id == existing_eod.id,
-                    EODSessionLock.is_active == True
-                ).first()
+                # 检查是否有对应的未到期会话租约
+                session_lock = EODLeaseService.holder(session, eod_status_id=existing_eod.id)
                 
                 if not session_lock:
                     # 【自动清理】孤立的EOD记录，自动取消
@@ -99,12 +100,11 @@ class EODService:
                         business_start_time = prev_eod.completed_at
                     else:
                         # 【修复】如果没有上次日结记录，从第一笔交易时间开始（符合用户要求）
-                        first_transaction = session.query(ExchangeTransaction).filter(
-                            ExchangeTransaction.branch_id == branch_id
-                        ).order_by(ExchangeTransaction.created_at.asc()).first()
+                        # 任意类型的第一笔交易，与首笔交易检查点（只含期初类型）不同
+                        first_created_at = BalanceCheckpointService.first_activity_at(session, branch_id, any_type=True)
                         
-                        if first_transaction and first_transaction.created_at:
-                            business_start_time = first_transaction.created_at
+                        if first_created_at:
+                            business_start_time = first_created_at
                         else:
                             # 如果没有任何交易记录，使用当天0点
                             business_start_time = datetime.combine(target_date, datetime.min.time())
@@ -218,6 +218,8 @@ class EODService:
                 'message': '日结流程已开始',
                 'eod_id': eod_status.id
             }
+            if session_id and ip_address:
+                result['fencing_token'] = session_lock_result['fencing_token']
             
             # 只有启用特性时才返回业务时间范围信息
             if FeatureFlags.FEATURE_NEW_BUSINESS_TIME_RANGE and business_start_time:
@@ -293,6 +295,7 @@ class EODService:
         步骤3: 计算理论余额 - 期初 + 当日变动 = 理论余额
         """
         logging.info(f"开始计算理论余额 - EOD ID: {eod_id}")
+        set_based = FeatureFlags.is_enabled('ENABLE_SET_BASED_THEORETICAL_BALANCE')
         session = DatabaseService.get_session()
         try:
             eod_status = session.query(EODStatus).filter_by(id=eod_id).first()
@@ -351,63 +354,83 @@ class EODService:
                 Currency.id.in_(currency_ids)
             ).all() if currency_ids else []
             
-            balance_calculations = []
+            if set_based:
+                balance_calculations = TheoreticalBalanceEngine.calculate(session, eod_status, branch, currencies)
+            else:
+                balance_calculations = EODService._calculate_balances_legacy(session, eod_status, branch, currencies)
             
-            for currency in currencies:
-                # 安全检查：确保currency对象和currency_code字段存在
-                if not currency or not currency.currency_code:
-                    logging.warning(f"⚠️ 跳过无效币种: currency={currency}")
-                    continue
+            # 更新步骤状态 - 完成第3步并推进到第4步
+            eod_status.step = 4
+            eod_status.step_status = 'processing'
+            session.commit()
+            
+            # 使用I18n工具类获取消息
+            from utils.i18n_utils import I18nUtils
+            
+            return {
+                'success': True,
+                'message': I18nUtils.get_message('eod.theoretical_balance_calculated'),
+                'calculations': balance_calculations
+            }
+            
+        except Exception as e:
+            session.rollback()
+            from utils.i18n_utils import I18nUtils
+            return {'success': False, 'message': f'{I18nUtils.get_message("eod.calculation_failed")}: {str(e)}'}
+        finally:
+            DatabaseService.close_session(session)
+    
+    @staticmethod
+    def _calculate_balances_legacy(session, eod_status, branch, currencies):
+        """
+        逐币种计算理论余额（原实现，每个币种5~7条SQL）
+        保留作为 TheoreticalBalanceEngine 的一致性基准；关闭特性开关
+        ENABLE_SET_BASED_THEORETICAL_BALANCE 时回退使用
+        """
+        eod_id = eod_status.id
+        branch_id = eod_status.branch_id
+        balance_calculations = []
+        
+        for currency in currencies:
+            # 安全检查：确保currency对象和currency_code字段存在
+            if not currency or not currency.currency_code:
+                logging.warning(f"⚠️ 跳过无效币种: currency={currency}")
+                continue
+            
+            # 【关键修改】为每个币种分别计算时间范围和期初余额
+            
+            # 【简化】统一从 EODBalanceVerification 表查找该币种的上一次日结记录
+            prev_eod_verification = session.query(EODBalanceVerification).join(EODStatus).filter(
+                EODStatus.branch_id == branch_id,
+                EODStatus.id != eod_id,  # 排除当前日结
+                EODStatus.status == 'completed',
+                EODBalanceVerification.currency_id == currency.id
+            ).order_by(desc(EODStatus.completed_at)).first()
+            
+            if prev_eod_verification:
+                # 该币种有上一次日结记录
+                # 期初余额：使用上次日结验证后的余额
+                opening_balance = Decimal(str(prev_eod_verification.actual_balance))
                 
-                # 【关键修改】为每个币种分别计算时间范围和期初余额
+                # 时间范围：从上一次日结结束时间到本次日结开始时间
+                prev_eod_status = session.query(EODStatus).filter_by(id=prev_eod_verification.eod_status_id).first()
                 
-                # 【简化】统一从 EODBalanceVerification 表查找该币种的上一次日结记录
-                prev_eod_verification = session.query(EODBalanceVerification).join(EODStatus).filter(
-                    EODStatus.branch_id == branch_id,
-                    EODStatus.id != eod_id,  # 排除当前日结
-                    EODStatus.status == 'completed',
-                    EODBalanceVerification.currency_id == currency.id
-                ).order_by(desc(EODStatus.completed_at)).first()
+                logging.info(f"📋 币种{currency.currency_code}找到上次日结记录:")
+                logging.info(f"  - 上次日结ID: {prev_eod_verification.eod_status_id}")
+                logging.info(f"  - 期初余额: {opening_balance}")
+                logging.info(f"  - completed_at: {prev_eod_status.completed_at if prev_eod_status else 'None'}")
                 
-                if prev_eod_verification:
-                    # 该币种有上一次日结记录
-                    # 期初余额：使用上次日结验证后的余额
-                    opening_balance = Decimal(str(prev_eod_verification.actual_balance))
-                    
-                    # 时间范围：从上一次日结结束时间到本次日结开始时间
-                    prev_eod_status = session.query(EODStatus).filter_by(id=prev_eod_verification.eod_status_id).first()
-                    
-                    logging.info(f"📋 币种{currency.currency_code}找到上次日结记录:")
-                    logging.info(f"  - 上次日结ID: {prev_eod_verification.eod_status_id}")
-                    logging.info(f"  - 期初余额: {opening_balance}")
-                    logging.info(f"  - completed_at: {prev_eod_status.completed_at if prev_eod_status else 'None'}")
+                if prev_eod_status and prev_eod_status.completed_at:
+                    currency_change_start_time = prev_eod_status.completed_at
+                    currency_change_end_time = eod_status.started_at
                     
-                    if prev_eod_status and prev_eod_status.completed_at:
-                        currency_change_start_time = prev_eod_status.completed_at
-                        currency_change_end_time = eod_status.started_at
-                        
-                        logging.info(f"✅ 币种{currency.currency_code}使用上次日结时间:")
-                        logging.info(f"  - 变化开始时间: {currency_change_start_time}")
-                        logging.info(f"  - 变化结束时间: {currency_change_end_time}")
-                    else:
-                        # 如果找不到完成时间，fallback到第一笔交易逻辑
-                        logging.warning(f"⚠️ 币种{currency.currency_code}上次日结记录存在但completed_at为空，fallback到第一笔交易逻辑")
-                        
-                        from routes.app_reports import _calculate_opening_balance_from_transactions
-                        
-                        opening_balance_float, currency_change_start_time = _calculate_opening_balance_from_transactions(
-                            session, branch_id, currency.id, eod_status.started_at, branch.base_currency_id if branch else None
-                        )
-                        
-                        opening_balance = Decimal(str(opening_balance_float))
-                        currency_change_end_time = eod_status.started_at
-                        
-                        logging.info(f"📊 币种{currency.currency_code}期初余额(fallback): {opening_balance}")
-                        logging.info(f"📅 币种{currency.currency_code}变化统计时间(fallback): {currency_change_start_time} 到 {currency_change_end_time}")
-                
+                    logging.info(f"✅ 币种{currency.currency_code}使用上次日结时间:")
+                    logging.info(f"  - 变化开始时间: {currency_change_start_time}")
+                    logging.info(f"  - 变化结束时间: {currency_change_end_time}")
                 else:
-                    # 该币种没有上一次日结记录
-                    # 从第一笔交易的值作为期初余额
+                    # 如果找不到完成时间，fallback到第一笔交易逻辑
+                    logging.warning(f"⚠️ 币种{currency.currency_code}上次日结记录存在但completed_at为空，fallback到第一笔交易逻辑")
+                    
                     from routes.app_reports import _calculate_opening_balance_from_transactions
                     
                     opening_balance_float, currency_change_start_time = _calculate_opening_balance_from_transactions(
@@ -417,128 +440,124 @@ class EODService:
                     opening_balance = Decimal(str(opening_balance_float))
                     currency_change_end_time = eod_status.started_at
                     
-                    logging.info(f"📊 币种{currency.currency_code}期初余额(第一笔交易): {opening_balance}")
-                    logging.info(f"📅 币种{currency.currency_code}变化统计时间: {currency_change_start_time} 到 {currency_change_end_time}")
-                
-                # 2. 计算该币种的当日交易变动（使用该币种的时间范围）
-                is_base_currency = (branch and branch.base_currency_id == currency.id)
+                    logging.info(f"📊 币种{currency.currency_code}期初余额(fallback): {opening_balance}")
+                    logging.info(f"📅 币种{currency.currency_code}变化统计时间(fallback): {currency_change_start_time} 到 {currency_change_end_time}")
+            
+            else:
+                # 该币种没有上一次日结记录
+                # 从第一笔交易的值作为期初余额
+                from routes.app_reports import _calculate_opening_balance_from_transactions
                 
-                if is_base_currency:
-                    # 本币：需要计算所有交易对本币的影响
-                    # 1. 直接对本币的交易（如余额调整、本币交款等）- 使用local_amount字段保持一致性
-                    direct_transactions = session.query(
-                        func.coalesce(func.sum(ExchangeTransaction.local_amount), 0)
-                    ).filter(
-                        ExchangeTransaction.branch_id == branch_id,
-                        ExchangeTransaction.currency_id == currency.id,
-                        ExchangeTransaction.created_at >= currency_change_start_time,
-                        ExchangeTransaction.created_at < currency_change_end_time,
-                        ExchangeTransaction.status.in_(['completed', 'reversed']),
-                        # 【修复】剔除Eod_diff类型的业务
-                        ExchangeTransaction.type != 'Eod_diff'
-                    ).scalar()
-                    
-                    # 2. 所有外币交易对本币的影响（通过local_amount字段）
-                    foreign_exchange_impact = session.query(
-                        func.coalesce(func.sum(ExchangeTransaction.local_amount), 0)
-                    ).filter(
-                        ExchangeTransaction.branch_id == branch_id,
-                        ExchangeTransaction.currency_id != currency.id,  # 排除本币直接交易
-                        ExchangeTransaction.created_at >= currency_change_start_time,
-                        ExchangeTransaction.created_at < currency_change_end_time,
-                        ExchangeTransaction.status.in_(['completed', 'reversed']),
-                        # 【修复】剔除Eod_diff类型的业务
-                        ExchangeTransaction.type != 'Eod_diff'
-                    ).scalar()
-                    
-                    # 合并两部分变动
-                    daily_transactions = (direct_transactions or 0) + (foreign_exchange_impact or 0)
-                    
-                    # 【调试日志】记录本币计算详情
-                    logging.info(f"🔍 {currency.currency_code} 本币计算详情:")
-                    logging.info(f"  - 直接交易变动: {direct_transactions or 0}")
-                    logging.info(f"  - 外币交易影响: {foreign_exchange_impact or 0}")
-                    logging.info(f"  - 合并后变动: {daily_transactions}")
-                else:
-                    # 外币：累加 amount 字段（外币变动金额）
-                    daily_transactions = session.query(
-                        func.coalesce(func.sum(ExchangeTransaction.amount), 0)
-                    ).filter(
-                        ExchangeTransaction.branch_id == branch_id,
-                        ExchangeTransaction.currency_id == currency.id,
-                        ExchangeTransaction.created_at >= currency_change_start_time,
-                        ExchangeTransaction.created_at < currency_change_end_time,
-                        ExchangeTransaction.status.in_(['completed', 'reversed']),
-                        # 【修复】剔除Eod_diff类型的业务
-                        ExchangeTransaction.type != 'Eod_diff'
-                    ).scalar()
-                    
-                    # 【调试日志】记录外币计算详情
-                    logging.info(f"🔍 {currency.currency_code} 外币计算详情:")
-                    logging.info(f"  - amount字段变动: {daily_transactions or 0}")
+                opening_balance_float, currency_change_start_time = _calculate_opening_balance_from_transactions(
+                    session, branch_id, currency.id, eod_status.started_at, branch.base_currency_id if branch else None
+                )
                 
-                daily_change = Decimal(str(daily_transactions or 0))
-                theoretical_balance = opening_balance + daily_change
+                opening_balance = Decimal(str(opening_balance_float))
+                currency_change_end_time = eod_status.started_at
                 
-                # 【调试日志】记录计算过程
-                logging.info(f"🔍 {currency.currency_code} 计算过程:")
-                logging.info(f"  - 期初余额: {opening_balance}")
-                logging.info(f"  - 当日变动: {daily_change}")
-                logging.info(f"  - 理论余额: {theoretical_balance}")
+                logging.info(f"📊 币种{currency.currency_code}期初余额(第一笔交易): {opening_balance}")
+                logging.info(f"📅 币种{currency.currency_code}变化统计时间: {currency_change_start_time} 到 {currency_change_end_time}")
+            
+            # 2. 计算该币种的当日交易变动（使用该币种的时间范围）
+            is_base_currency = (branch and branch.base_currency_id == currency.id)
+            
+            if is_base_currency:
+                # 本币：需要计算所有交易对本币的影响
+                # 1. 直接对本币的交易（如余额调整、本币交款等）- 使用local_amount字段保持一致性
+                direct_transactions = session.query(
+                    func.coalesce(func.sum(ExchangeTransaction.local_amount), 0)
+                ).filter(
+                    ExchangeTransaction.branch_id == branch_id,
+                    ExchangeTransaction.currency_id == currency.id,
+                    ExchangeTransaction.created_at >= currency_change_start_time,
+                    ExchangeTransaction.created_at < currency_change_end_time,
+                    ExchangeTransaction.status.in_(['completed', 'reversed']),
+                    # 【修复】剔除Eod_diff类型的业务
+                    ExchangeTransaction.type != 'Eod_diff'
+                ).scalar()
                 
-                # 获取实际余额
-                actual_balance_record = session.query(CurrencyBalance).filter_by(
-                    branch_id=branch_id,
-                    currency_id=currency.id
-                ).first()
+                # 2. 所有外币交易对本币的影响（通过local_amount字段）
+                foreign_exchange_impact = session.query(
+                    func.coalesce(func.sum(ExchangeTransaction.local_amount), 0)
+                ).filter(
+                    ExchangeTransaction.branch_id == branch_id,
+                    ExchangeTransaction.currency_id != currency.id,  # 排除本币直接交易
+                    ExchangeTransaction.created_at >= currency_change_start_time,
+                    ExchangeTransaction.created_at < currency_change_end_time,
+                    ExchangeTransaction.status.in_(['completed', 'reversed']),
+                    # 【修复】剔除Eod_diff类型的业务
+                    ExchangeTransaction.type != 'Eod_diff'
+                ).scalar()
                 
-                actual_balance = Decimal(str(actual_balance_record.balance)) if actual_balance_record else Decimal('0')
+                # 合并两部分变动
+                daily_transactions = (direct_transactions or 0) + (foreign_exchange_impact or 0)
                 
-                balance_calculations.append({
-                    'currency_id': currency.id,
-                    'currency_code': currency.currency_code,
-                    'currency_name': currency.currency_name,
-                    'custom_flag_filename': currency.custom_flag_filename,
-                    'flag_code': currency.flag_code,
-                    'opening_balance': float(opening_balance),
-                    'daily_change': float(daily_change),
-                    'theoretical_balance': float(theoretical_balance),
-                    'actual_balance': float(actual_balance),
-                    'difference': float(theoretical_balance - actual_balance),
-                    'change_start_time': currency_change_start_time.isoformat() if currency_change_start_time else None,
-                    'change_end_time': currency_change_end_time.isoformat() if currency_change_end_time else None
-                })
+                # 【调试日志】记录本币计算详情
+                logging.info(f"🔍 {currency.currency_code} 本币计算详情:")
+                logging.info(f"  - 直接交易变动: {direct_transactions or 0}")
+                logging.info(f"  - 外币交易影响: {foreign_exchange_impact or 0}")
+                logging.info(f"  - 合并后变动: {daily_transactions}")
+            else:
+                # 外币：累加 amount 字段（外币变动金额）
+                daily_transactions = session.query(
+                    func.coalesce(func.sum(ExchangeTransaction.amount), 0)
+                ).filter(
+                    ExchangeTransaction.branch_id == branch_id,
+                    ExchangeTransaction.currency_id == currency.id,
+                    ExchangeTransaction.created_at >= currency_change_start_time,
+                    ExchangeTransaction.created_at < currency_change_end_time,
+                    ExchangeTransaction.status.in_(['completed', 'reversed']),
+                    # 【修复】剔除Eod_diff类型的业务
+                    ExchangeTransaction.type != 'Eod_diff'
+                ).scalar()
                 
-                # 【调试日志】记录返回的数据
-                logging.info(f"🔍 {currency.currency_code} 返回数据:")
-                logging.info(f"  - currency_id: {currency.id}")
-                logging.info(f"  - currency_code: {currency.currency_code}")
-                logging.info(f"  - currency_name: {currency.currency_name}")
-                logging.info(f"  - opening_balance: {float(opening_balance)}")
-                logging.info(f"  - daily_change: {float(daily_change)}")
-                logging.info(f"  - theoretical_balance: {float(theoretical_balance)}")
-                logging.info(f"  - actual_balance: {float(actual_balance)}")
+                # 【调试日志】记录外币计算详情
+                logging.info(f"🔍 {currency.currency_code} 外币计算详情:")
+                logging.info(f"  - amount字段变动: {daily_transactions or 0}")
             
-            # 更新步骤状态 - 完成第3步并推进到第4步
-            eod_status.step = 4
-            eod_status.step_status = 'processing'
-            session.commit()
+            daily_change = Decimal(str(daily_transactions or 0))
+            theoretical_balance = opening_balance + daily_change
             
-            # 使用I18n工具类获取消息
-            from utils.i18n_utils import I18nUtils
+            # 【调试日志】记录计算过程
+            logging.info(f"🔍 {currency.currency_code} 计算过程:")
+            logging.info(f"  - 期初余额: {opening_balance}")
+            logging.info(f"  - 当日变动: {daily_change}")
+            logging.info(f"  - 理论余额: {theoretical_balance}")
             
-            return {
-                'success': True,
-                'message': I18nUtils.get_message('eod.theoretical_balance_calculated'),
-                'calculations': balance_calculations
-            }
+            # 获取实际余额
+            actual_balance_record = session.query(CurrencyBalance).filter_by(
+                branch_id=branch_id,
+                currency_id=currency.id
+            ).first()
             
-        except Exception as e:
-            session.rollback()
-            from utils.i18n_utils import I18nUtils
-            return {'success': False, 'message': f'{I18nUtils.get_message("eod.calculation_failed")}: {str(e)}'}
-        finally:
-            DatabaseService.close_session(session)
+            actual_balance = Decimal(str(actual_balance_record.balance)) if actual_balance_record else Decimal('0')
+            
+            balance_calculations.append({
+                'currency_id': currency.id,
+                'currency_code': currency.currency_code,
+                'currency_name': currency.currency_name,
+                'custom_flag_filename': currency.custom_flag_filename,
+                'flag_code': currency.flag_code,
+                'opening_balance': float(opening_balance),
+                'daily_change': float(daily_change),
+                'theoretical_balance': float(theoretical_balance),
+                'actual_balance': float(actual_balance),
+                'difference': float(theoretical_balance - actual_balance),
+                'change_start_time': currency_change_start_time.isoformat() if currency_change_start_time else None,
+                'change_end_time': currency_change_end_time.isoformat() if currency_change_end_time else None
+            })
+            
+            # 【调试日志】记录返回的数据
+            logging.info(f"🔍 {currency.currency_code} 返回数据:")
+            logging.info(f"  - currency_id: {currency.id}")
+            logging.info(f"  - currency_code: {currency.currency_code}")
+            logging.info(f"  - currency_name: {currency.currency_name}")
+            logging.info(f"  - opening_balance: {float(opening_balance)}")
+            logging.info(f"  - daily_change: {float(daily_change)}")
+            logging.info(f"  - theoretical_balance: {float(theoretical_balance)}")
+            logging.info(f"  - actual_balance: {float(actual_balance)}")
+        
+        return balance_calculations
     
     @staticmethod
     def verify_balance(eod_id):
@@ -2169,19 +2188,6 @@ class EODService:
                         'difference_adjustment_summary': report_data['difference_adjustment_summary']
                     }
                 })
-                
-                # 生成三种语言版本的差额调节报告
-                from services.difference_report_service import DifferenceReportService
-                for lang in ['zh', 'en', 'th']:
-                    report_result = DifferenceReportService.generate_difference_adjustment_report(
-                        eod_id, 
-                        difference_adjustment_summary, 
-                        lang
-                    )
-                    if not report_result['success']:
-                        logging.warning(f"生成{lang}语言差额调节报告失败: {report_result['message']}")
-                    else:
-                        logging.info(f"生成{lang}语言差额调节报告成功: {report_result['filename']}")
             
             # 如果有差额但未调节，生成差额报告表
             if has_difference_without_adjustment:
@@ -2192,19 +2198,6 @@ class EODService:
                         'difference_report_summary': report_data['difference_report_summary']
                     }
                 })
-                
-                # 生成三种语言版本的差额报告
-                from services.difference_report_service import DifferenceReportService
-                for lang in ['zh', 'en', 'th']:
-                    report_result = DifferenceReportService.generate_difference_report(
-                        eod_id, 
-                        difference_report_summary, 
-                        lang
-                    )
-                    if not report_result['success']:
-                        logging.warning(f"生成{lang}语言差额报告失败: {report_result['message']}")
-                    else:
-                        logging.info(f"生成{lang}语言差额报告成功: {report_result['filename']}")
             
             # 如果是详细模式，添加收入汇总
             if mode == 'detailed':
@@ -2258,11 +2251,9 @@ class EODService:
                     'branch_id': branch_id,
                     'branch_name': branch.branch_name if branch else f'网点{branch_id}',
                     'eod_id': eod_id,
-                    'generated_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
                     'mode': mode,
                     'business_start_time': str(business_start_time) if business_start_time else None,
-                    'business_end_time': str(business_end_time) if business_end_time else None,
-                    'operator_name': operator_name
+                    'business_end_time': str(business_end_time) if business_end_time else None
                 },
                 'sections': sections
             }
@@ -2271,47 +2262,61 @@ class EODService:
             for i, section in enumerate(sections):
                 logger.info(f"🌍 Section {i+1}: type={section.get('type')}, title={section.get('title')}")
             
-            # 生成三种语言的PDF文件
-            generated_files = []
-            languages = [
-                ('zh', ''),  # 中文不加语言类型
-                ('en', '_en'),  # 英文加_en
-                ('th', '_th')   # 泰文加_th
-            ]
-            
-            for lang_code, lang_suffix in languages:
-                # 构建正确的文件名格式：yyyymmddEODxxxcashout_lang.pdf
-                date_str = target_date.strftime('%Y%m%d')
+            # 三种语言的交款汇总表和差额调节表/差额报告表在进程池中并行生成
+            # 报表内容未变化且文件仍在时，重印直接使用已生成的文件；生成参数中不放本次的操作员和打印时间，
+            # 文件中的生成时间由生成器在实际生成时填写，本次打印的操作员和时间记在打印日志并随结果返回
+            date_str = target_date.strftime('%Y%m%d')
+            render_tasks = []
+            for lang_code in ('zh', 'en', 'th'):
+                # 文件名格式：yyyymmddEODxxxcashout_lang.pdf，中文不加语言后缀
                 if lang_code == 'zh':
                     filename = f"{date_str}EOD{eod_id:03d}cashout.pdf"
                 else:
                     filename = f"{date_str}EOD{eod_id:03d}cashout_{lang_code}.pdf"
-                output_file = os.path.join(manager_dir, filename)
-                
-                # 生成PDF
-                logger.info(f"🌍 开始生成{lang_code}语言PDF - 文件: {filename}")
-                pdf_result = SimplePDFService.generate_simple_eod_report_pdf(
-                    print_data, 
-                    filename,
-                    target_date,
-                    language=lang_code
+                render_tasks.append((lang_code, 'cashout', (print_data, filename, target_date, lang_code)))
+            if has_adjustment:
+                render_tasks.extend(
+                    (f"difference_adjustment.{lang_code}", 'difference_adjustment', (eod_id, difference_adjustment_summary, lang_code))
+                    for lang_code in ('zh', 'en', 'th')
                 )
+            if has_difference_without_adjustment:
+                render_tasks.extend(
+                    (f"difference.{lang_code}", 'difference', (eod_id, difference_report_summary, lang_code))
+                    for lang_code in ('zh', 'en', 'th')
+                )
+            
+            content_hash = EODReportBundleService.fingerprint({
+                'mode': mode,
+                'business_start_time': print_data['header']['business_start_time'],
+                'business_end_time': print_data['header']['business_end_time'],
+                'sections': sections
+            })
+            rendered = EODReportBundleService.render_group(session, eod_status, 'print', content_hash, render_tasks)
+            
+            generated_files = []
+            for key, renderer, args in render_tasks:
+                pdf_result = rendered['results'][key]
+                if renderer != 'cashout':
+                    if not pdf_result.get('success'):
+                        logging.warning(f"生成{key}差额报表失败: {pdf_result.get('message')}")
+                    else:
+                        logging.info(f"生成{key}差额报表成功: {pdf_result.get('filename')}")
+                    continue
                 
-                logger.info(f"🌍 {lang_code}语言PDF生成结果: {pdf_result}")
-                
-                if pdf_result['success']:
+                filename = args[1]
+                if pdf_result.get('success'):
                     generated_files.append({
-                        'language': lang_code,
+                        'language': key,
                         'filename': filename,
                         'file_path': pdf_result['file_path']
                     })
                     LogService.log_system_event(
-                        f"生成{lang_code}语言PDF成功 - 文件: {filename}",
+                        f"生成{key}语言PDF成功 - 文件: {filename}, 复用已生成文件: {rendered['reused']}",
                         operator_id=operator_id,
                         branch_id=branch_id
                     )
                 else:
-                    LogService.log_error(f"生成{lang_code}语言PDF失败: {pdf_result.get('message', '未知错误')}")
+                    LogService.log_error(f"生成{key}语言PDF失败: {pdf_result.get('message', '未知错误')}")
             
             if not generated_files:
                 return {'success': False, 'message': '所有语言版本的PDF生成都失败了'}
@@ -2350,10 +2355,12 @@ class EODService:
                 'message': '日结报表生成成功',
                 'print_count': print_count,
                 'printed_at': printed_at,
+                'printed_by': operator_name,
                 'generated_files': generated_files,
                 'eod_no': f"EOD{eod_id:08d}",
                 'eod_id': eod_id,  # 添加原始EOD ID
-                'report_data': report_data
+                'report_data': report_data,
+                'timings': rendered['timings']  # 报表生成耗时（毫秒）
             }
             
         except Exception as e:
@@ -2368,12 +2375,12 @@ class EODService:
             DatabaseService.close_session(session)
     
     @staticmethod
-    def complete_eod(eod_id, operator_id, session_id=None):
+    def complete_eod(eod_id, operator_id, session_id=None, fencing_token=None):
         """
         步骤9: 完成日结 - 生成历史记录和余额快照，标记报表为最终版本
         """
         # 【修复】先进行统一的权限验证
-        permission_result = EODService.validate_eod_permission(eod_id, operator_id, session_id)
+        permission_result = EODService.validate_eod_permission(eod_id, operator_id, session_id, fencing_token)
         if not permission_result['has_permission']:
             return {
                 'success': False, 
@@ -2423,6 +2430,9 @@ class EODService:
             eod_status.is_locked = False  # 解除营业锁定
             eod_status.business_end_time = completion_time
             
+            # 写入日结余额检查点（下次日结和库存报表的期初余额）
+            BalanceCheckpointService.record_eod(session, eod_status)
+            
             # 3. 提交事务
             session.commit()
             
@@ -2604,103 +2614,36 @@ class EODService:
     @staticmethod
     def check_business_lock(branch_id):
         """
-        检查营业锁定状态
+        检查营业锁定状态（每笔交易前置检查，读取 EODLeaseService 的营业锁定状态缓存）
         """
-        session = DatabaseService.get_session()
         try:
-            locked_eod = session.query(EODStatus).filter(
-                EODStatus.branch_id == branch_id,
-                EODStatus.is_locked == True,
-                EODStatus.status == 'processing'
-            ).first()
-            
-            # 在会话关闭前提取所有需要的数据
-            is_locked = locked_eod is not None
-            eod_id = locked_eod.id if locked_eod else None
-            lock_date = locked_eod.date.isoformat() if locked_eod else None
-            
-            return {
-                'success': True,
-                'is_locked': is_locked,
-                'eod_id': eod_id,
-                'lock_date': lock_date
-            }
-            
+            return {'success': True, **EODLeaseService.business_lock(branch_id)}
         except Exception as e:
             return {
                 'success': False,
                 'is_locked': False, 
                 'error': str(e)
             }
-        finally:
-            DatabaseService.close_session(session)
 
     @staticmethod
     def create_eod_session_lock(branch_id, eod_status_id, operator_id, session_id, ip_address, user_agent):
         """
         创建日结会话锁定 - 确保只有单一终端可以进行日结
+        授予新的会话租约，该网点原有的锁定被接管（旧令牌失效）
         """
         session = DatabaseService.get_session()
         
         try:
-            # 【修复】先清理该网点的所有旧会话锁定记录，避免唯一约束冲突
-            session.query(EODSessionLock).filter(
-                EODSessionLock.branch_id == branch_id
-            ).delete(synchronize_session=False)
-            
-            # 检查是否已存在该网点的活跃日结会话（清理后应该没有）
-            existing_session = session.query(EODSessionLock).filter(
-                EODSessionLock.branch_id == branch_id,
-                EODSessionLock.is_active == True
-            ).first()
-            
-            if existing_session:
-                # 检查是否是同一个会话
-                if existing_session.session_id == session_id:
-                    # 更新活跃时间
-                    existing_session.last_activity = datetime.now()
-                    session.commit()
-                    return {
-                        'success': True,
-                        'message': '日结会话已存在，更新活跃时间',
-                        'session_lock_id': existing_session.id
-                    }
-                else:
-                    # 获取会话信息
-                    operator = session.query(Operator).filter_by(id=existing_session.operator_id).first()
-                    operator_name = operator.name if operator else '未知操作员'
-                    
-                    return {
-                        'success': False,
-                        'message': f'该网点已有活跃的日结会话',
-                        'existing_session': {
-                            'operator_name': operator_name,
-                            'ip_address': existing_session.ip_address,
-                            'created_at': existing_session.created_at.isoformat() if existing_session.created_at else None,
-                            'last_activity': existing_session.last_activity.isoformat() if existing_session.last_activity else None
-                        }
-                    }
-            
-            # 创建新的会话锁定
-            session_lock = EODSessionLock(
-                branch_id=branch_id,
-                eod_status_id=eod_status_id,
-                session_id=session_id,
-                operator_id=operator_id,
-                ip_address=ip_address,
-                user_agent=user_agent,
-                created_at=datetime.now(),
-                last_activity=datetime.now(),
-                is_active=True
+            session_lock = EODLeaseService.acquire(
+                session, branch_id, eod_status_id, operator_id, session_id, ip_address, user_agent
             )
-            
-            session.add(session_lock)
             session.commit()
             
             return {
                 'success': True,
                 'message': '日结会话锁定创建成功',
-                'session_lock_id': session_lock.id
+                'session_lock_id': session_lock.id,
+                'fencing_token': session_lock.fencing_token
             }
             
         except Exception as e:
@@ -2713,24 +2656,18 @@ class EODService:
             DatabaseService.close_session(session)
 
     @staticmethod
-    def update_eod_session_activity(session_id, branch_id):
+    def update_eod_session_activity(session_id, branch_id, fencing_token=None):
         """
-        更新日结会话活跃时间
+        更新日结会话活跃时间 - 续期租约（提供 fencing_token 时令牌必须一致）
         """
         session = DatabaseService.get_session()
         
         try:
-            session_lock = session.query(EODSessionLock).filter(
-                EODSessionLock.session_id == session_id,
-                EODSessionLock.branch_id == branch_id,
-                EODSessionLock.is_active == True
-            ).first()
-            
-            if session_lock:
-                session_lock.last_activity = datetime.now()
+            if EODLeaseService.renew(session, session_id, branch_id, fencing_token):
                 session.commit()
                 return {'success': True}
             else:
+                session.rollback()
                 return {'success': False, 'message': '会话锁定不存在'}
                 
         except Exception as e:
@@ -2747,17 +2684,11 @@ class EODService:
         session = DatabaseService.get_session()
         
         try:
-            session_lock = session.query(EODSessionLock).filter(
-                EODSessionLock.session_id == session_id,
-                EODSessionLock.branch_id == branch_id,
-                EODSessionLock.is_active == True
-            ).first()
-            
-            if session_lock:
-                session.delete(session_lock)
+            if EODLeaseService.release(session, branch_id, session_id):
                 session.commit()
                 return {'success': True, 'message': '日结会话锁定已释放'}
             else:
+                session.rollback()
                 return {'success': False, 'message': '会话锁定不存在'}
                 
         except Exception as e:
@@ -2774,19 +2705,8 @@ class EODService:
         session = DatabaseService.get_session()
         
         try:
-            # 首先检查是否存在有效的会话锁定
-            session_lock = session.query(EODSessionLock).filter(
-                EODSessionLock.session_id == session_id,
-                EODSessionLock.branch_id == branch_id,
-                EODSessionLock.is_active == True
-            ).first()
-            
-            if session_lock:
-                # 会话存在，更新活跃时间
-                session_lock.last_activity = datetime.now()
-                session.commit()
-                has_permission = True
-            else:
+            # 首先续期该会话的租约
+            if not EODLeaseService.renew(session, session_id, branch_id):
                 # 会话不存在，检查是否有进行中的日结
                 active_eod = session.query(EODStatus).filter(
                     EODStatus.branch_id == branch_id,
@@ -2794,24 +2714,14 @@ class EODService:
                 ).first()
                 
                 if active_eod:
-                    # 有进行中的日结，创建新的会话锁定
-                    new_session_lock = EODSessionLock(
-                        session_id=session_id,
-                        branch_id=branch_id,
-                        eod_status_id=active_eod.id,
-                        operator_id=active_eod.started_by,
-                        ip_address='auto_created',
-                        user_agent='auto_created',
-                        is_active=True,
-                        created_at=datetime.now(),
-                        last_activity=datetime.now()
+                    # 有进行中的日结，为该会话授予租约
+                    EODLeaseService.acquire(
+                        session, branch_id, active_eod.id, active_eod.started_by,
+                        session_id, 'auto_created', 'auto_created'
                     )
-                    session.add(new_session_lock)
-                    session.commit()
-                    has_permission = True
-                else:
-                    # 没有进行中的日结，允许操作（可能是开始新的日结）
-                    has_permission = True
+                # 没有进行中的日结，允许操作（可能是开始新的日结）
+            session.commit()
+            has_permission = True
             
             from utils.i18n_utils import I18nUtils
             
@@ -2822,6 +2732,7 @@ class EODService:
             }
             
         except Exception as e:
+            session.rollback()
             return {
                 'success': False,
                 'has_permission': False,
@@ -2833,23 +2744,12 @@ class EODService:
     @staticmethod
     def cleanup_expired_eod_sessions(expire_hours=2):
         """
-        清理过期的日结会话锁定
+        清理过期的日结会话锁定 - 已到期或空闲超过 expire_hours 的租约一次批量删除
         """
         session = DatabaseService.get_session()
         
         try:
-            expire_time = datetime.now() - timedelta(hours=expire_hours)
-            
-            expired_sessions = session.query(EODSessionLock).filter(
-                EODSessionLock.is_active == True,
-                EODSessionLock.last_activity < expire_time
-            ).all()
-            
-            count = 0
-            for session_lock in expired_sessions:
-                session.delete(session_lock)
-                count += 1
-            
+            count = EODLeaseService.expire(session, idle=timedelta(hours=expire_hours))
             session.commit()
             
             return {
@@ -2870,7 +2770,7 @@ class EODService:
     @staticmethod
     def continue_eod_session(eod_id, session_id, ip_address, user_agent):
         """
-        继续现有日结流程 - 为现有EOD设置会话ID
+        继续现有日结流程 - 为现有EOD设置会话ID（授予新租约，原持有者的令牌失效）
         """
         session = DatabaseService.get_session()
         try:
@@ -2882,25 +2782,10 @@ class EODService:
             if eod_status.status != 'processing':
                 return {'success': False, 'message': '只能继续处理中的日结流程'}
             
-            # 【增强】先清理该EOD的所有会话锁定记录，避免冲突
-            session.query(EODSessionLock).filter(
-                EODSessionLock.eod_status_id == eod_id
-            ).delete(synchronize_session=False)
-            
-            # 创建新的会话锁定
-            session_lock = EODSessionLock(
-                eod_status_id=eod_id,
-                branch_id=eod_status.branch_id,
-                operator_id=eod_status.started_by,
-                session_id=session_id,
-                ip_address=ip_address,
-                user_agent=user_agent,
-                is_active=True,
-                created_at=datetime.now(),
-                last_activity=datetime.now()
+            session_lock = EODLeaseService.acquire(
+                session, eod_status.branch_id, eod_id, eod_status.started_by, session_id, ip_address, user_agent
             )
-            
-            session.add(session_lock)
+            fencing_token = session_lock.fencing_token
             session.commit()
             
             LogService.log_system_event(
@@ -2912,35 +2797,8 @@ class EODService:
             return {
                 'success': True,
                 'message': '成功继续现有日结流程',
-                'session_id': session_id
-            }
-            
-            # 创建新的会话锁定
-            session_lock = EODSessionLock(
-                eod_status_id=eod_id,
-                branch_id=eod_status.branch_id,
-                operator_id=eod_status.started_by,
-                session_id=session_id,
-                ip_address=ip_address,
-                user_agent=user_agent,
-                is_active=True,
-                created_at=datetime.now(),
-                last_activity=datetime.now()
-            )
-            
-            session.add(session_lock)
-            session.commit()
-            
-            LogService.log_system_event(
-                f"为现有日结设置会话 - EOD ID: {eod_id}, 会话ID: {session_id}",
-                operator_id=eod_status.started_by,
-                branch_id=eod_status.branch_id
-            )
-            
-            return {
-                'success': True,
-                'message': '成功为现有日结设置会话',
-                'session_id': session_id
+                'session_id': session_id,
+                'fencing_token': fencing_token
             }
             
         except Exception as e:
@@ -3296,24 +3154,21 @@ class EODService:
                 branch_id=branch_id
             )
             
-            # 调用CalGain函数生成收入报表
+            # 收入统计数据模型（CalGain/CalBalance/CalBaseCurrency）按日结ID只计算一次，保存在报表数据包中
             try:
-                from routes.app_reports import CalGain, CalBalance, CalBaseCurrency
-                
-                # 【修复】使用独立的数据库会话避免锁定
                 LogService.log_system_event(
-                    f"开始调用CalGain、CalBalance和CalBaseCurrency函数",
+                    f"开始获取收入统计数据模型（CalGain、CalBalance和CalBaseCurrency）",
                     operator_id=operator_id,
                     branch_id=branch_id
                 )
                 
-                # 【修复】使用按币种分别计算模式
-                income_data = CalGain(branch_id, start_time, end_time)
-                stock_data = CalBalance(branch_id, start_time, end_time)
-                base_currency_data = CalBaseCurrency(branch_id, start_time, end_time)
+                report_model, report_timings = EODReportBundleService.compute(session, eod_status, start_time, end_time)
+                income_data = report_model['income_data']
+                stock_data = report_model['stock_data']
+                base_currency_data = report_model['base_currency_data']
                 
                 LogService.log_system_event(
-                    f"函数调用完成 - 收入币种数: {len(income_data.get('currencies', []))}, 外币库存币种数: {len(stock_data.get('currencies', []))}, 本币数据: {'有' if base_currency_data else '无'}",
+                    f"函数调用完成 - 收入币种数: {len(income_data.get('currencies', []))}, 外币库存币种数: {len(stock_data.get('currencies', []))}, 本币数据: {'有' if base_currency_data else '无'}, 使用已保存的数据模型: {'compute.cached' in report_timings}",
                     operator_id=operator_id,
                     branch_id=branch_id
                 )
@@ -3408,175 +3263,7 @@ class EODService:
                     branch_id=branch_id
                 )
             
-                # 生成本币库存数据
-                # base_currency_data已经在第3442行通过CalBaseCurrency函数计算完成
-                # 不需要重新设置为None，避免覆盖正确的结果
-                
-                # 获取分支的基准货币
-                branch = session.query(Branch).filter_by(id=branch_id).first()
-                if branch:
-                    base_currency = session.query(Currency).filter_by(id=branch.base_currency_id).first()
-                    if base_currency:
-                        base_currency_code = base_currency.currency_code
-                        
-                        # 【重构】按照统一的期初余额获取逻辑实现本币计算
-                        # 1. 计算本币的期初余额和时间范围
-                        base_currency_change_start_time = None
-                        base_currency_change_end_time = None
-                        opening_balance = 0
-                        
-                        # 【简化】统一从 EODBalanceVerification 表获取期初余额
-                        latest_eod_record = session.query(EODBalanceVerification).join(
-                            EODStatus, EODBalanceVerification.eod_status_id == EODStatus.id
-                        ).filter(
-                            EODBalanceVerification.currency_id == base_currency.id,
-                            EODStatus.branch_id == branch_id,
-                            EODStatus.date < target_date,
-                            EODStatus.status == 'completed'
-                        ).order_by(EODStatus.date.desc()).first()
-                            
-                        LogService.log_system_event(
-                            f"本币期初余额查询 - 使用统一新表方式：EODBalanceVerification",
-                            operator_id=operator_id,
-                            branch_id=branch_id
-                        )
-                        
-                        if latest_eod_record:
-                            # 有上一次日结记录的情况
-                            # 【简化】统一从 EODBalanceVerification 表获取
-                            latest_eod_status = session.query(EODStatus).filter_by(
-                                id=latest_eod_record.eod_status_id
-                            ).first()
-                            
-                            if latest_eod_status and latest_eod_status.completed_at:
-                                base_currency_change_start_time = latest_eod_status.completed_at
-                                base_currency_change_end_time = eod_status.started_at
-                                
-                                # 期初余额：直接使用 actual_balance（已在步骤7扣减交款金额）
-                                opening_balance = float(latest_eod_record.actual_balance)
-                                LogService.log_system_event(
-                                    f"本币期初余额 - 使用EODBalanceVerification.actual_balance: {opening_balance}",
-                                    operator_id=operator_id,
-                                    branch_id=branch_id
-                                )
-                            
-                            LogService.log_system_event(
-                                f"本币使用历史日结期初余额: {opening_balance}, 时间范围: {base_currency_change_start_time} ~ {base_currency_change_end_time}",
-                                operator_id=operator_id,
-                                branch_id=branch_id
-                            )
-                        else:
-                            # 1.2 该本币没有上一次日结记录的情况
-                            # 【修复】使用与日结第3步相同的逻辑
-                            LogService.log_system_event(
-                                f"本币没有历史日结记录，使用与日结第3步相同的_calculate_opening_balance_from_transactions函数",
-                                operator_id=operator_id,
-                                branch_id=branch_id
-                            )
-                            
-                            # 使用与日结第3步相同的期初余额计算函数
-                            from routes.app_reports import _calculate_opening_balance_from_transactions
-                            opening_balance_float, base_currency_change_start_time = _calculate_opening_balance_from_transactions(
-                                session, branch_id, base_currency.id, eod_status.started_at, base_currency.id
-                            )
-                            opening_balance = opening_balance_float
-                            base_currency_change_end_time = eod_status.started_at
-                            
-                            LogService.log_system_event(
-                                f"本币期初余额(与日结第3步一致): {opening_balance}, 时间范围: {base_currency_change_start_time} ~ {base_currency_change_end_time}",
-                                operator_id=operator_id,
-                                branch_id=branch_id
-                            )
-                        
-                        # 2. 计算本币的当日交易变动（使用本币的个别化时间范围）
-                        # 2.1 直接对本币的交易（如余额调整、本币交款等）- 使用local_amount字段保持一致性
-                        direct_transactions = session.query(
-                            func.coalesce(func.sum(ExchangeTransaction.local_amount), 0)
-                        ).filter(
-                            ExchangeTransaction.branch_id == branch_id,
-                            ExchangeTransaction.currency_id == base_currency.id,
-                            ExchangeTransaction.created_at >= base_currency_change_start_time,
-                            ExchangeTransaction.created_at < base_currency_change_end_time,
-                            ExchangeTransaction.status.in_(['completed', 'reversed'])
-                        ).scalar() or 0
-                        
-                        # 2.2 所有外币交易对本币的影响（通过local_amount字段）
-                        foreign_exchange_impact = session.query(
-                            func.coalesce(func.sum(ExchangeTransaction.local_amount), 0)
-                        ).filter(
-                            ExchangeTransaction.branch_id == branch_id,
-                            ExchangeTransaction.currency_id != base_currency.id,  # 排除本币直接交易
-                            ExchangeTransaction.created_at >= base_currency_change_start_time,
-                            ExchangeTransaction.created_at < base_currency_change_end_time,
-                            ExchangeTransaction.status.in_(['completed', 'reversed'])
-                        ).scalar() or 0
-                        
-                        # 合并两部分变动
-                        daily_transactions = (direct_transactions or 0) + (foreign_exchange_impact or 0)
-                        
-                        # 计算当前余额
-                        current_balance = opening_balance + float(daily_transactions)
-                        
-                        # 分类统计（用于显示详细信息）
-                        income_amount = 0
-                        expense_amount = 0
-                        reversal_amount = 0  # 【新增】冲正金额
-                        
-                        # 详细统计（用local_amount保持一致）
-                        foreign_transactions = session.query(ExchangeTransaction).filter(
-                            and_(
-                                ExchangeTransaction.branch_id == branch_id,
-                                ExchangeTransaction.currency_id != base_currency.id,
-                                ExchangeTransaction.created_at >= base_currency_change_start_time,
-                                ExchangeTransaction.created_at < base_currency_change_end_time,
-                                ExchangeTransaction.status.in_(['completed', 'reversed']),
-                                ExchangeTransaction.type.in_(['buy', 'sell', 'initial_balance', 'adjust_balance', 'cash_out', 'reversal'])  # 排除Eod_diff
-                            )
-                        ).all()
-                        
-                        base_transactions = session.query(ExchangeTransaction).filter(
-                            and_(
-                                ExchangeTransaction.branch_id == branch_id,
-                                ExchangeTransaction.currency_id == base_currency.id,
-                                ExchangeTransaction.created_at >= base_currency_change_start_time,
-                                ExchangeTransaction.created_at < base_currency_change_end_time,
-                                ExchangeTransaction.status.in_(['completed', 'reversed']),
-                                ExchangeTransaction.type.in_(['buy', 'sell', 'initial_balance', 'adjust_balance', 'cash_out', 'reversal'])  # 排除Eod_diff
-                            )
-                        ).all()
-                        
-                        # 【修复】统计外币交易对本币的影响，排除冲正交易
-                        for tx in foreign_transactions:
-                            local_amount = float(tx.local_amount)
-                            if tx.type == 'reversal':
-                                # 冲正交易单独统计
-                                reversal_amount += local_amount
-                            elif local_amount > 0:
-                                income_amount += local_amount
-                            else:
-                                expense_amount += abs(local_amount)
-                        
-                        # 【修复】统计本币直接交易，排除冲正交易
-                        for tx in base_transactions:
-                            local_amount = float(tx.local_amount)
-                            if tx.type == 'reversal':
-                                # 冲正交易单独统计
-                                reversal_amount += local_amount
-                            elif local_amount > 0:
-                                income_amount += local_amount
-                            else:
-                                expense_amount += abs(local_amount)
-                        
-                        LogService.log_system_event(
-                            f"本币库存统计 - 收入金额: {income_amount}, 支出金额: {expense_amount}, 冲正金额: {reversal_amount}",
-                            operator_id=operator_id,
-                            branch_id=branch_id
-                        )
-                        
-                        # 【修复】删除重复计算，直接使用CalBaseCurrency的结果
-                        # base_currency_data已经在第3442行通过CalBaseCurrency函数计算完成
-                        # 这里不需要重新计算，避免覆盖正确的结果
-                    
+    
             except Exception as db_error:
                 session.rollback()
                 LogService.log_system_event(
@@ -3606,134 +3293,40 @@ class EODService:
                 )
                 # 即使步骤更新失败，也返回成功，因为数据已经生成
             
-            # 【新增】同步生成多语言PDF文件 - 确保界面和PDF数据完全一致
+            # 各语言收入报表PDF在进程池中并行生成，数据与界面显示完全一致；数据未变化且文件仍在时直接使用已生成的文件
             pdf_generated = False
             pdf_file_paths = {}
-            supported_languages = ['zh', 'en', 'th']  # 【修复】恢复生成三种语言版本
-            
-            # 【调试】记录语言配置
-            LogService.log_system_event(
-                f"🔧 PDF生成配置 - 支持语言: {supported_languages}, 当前语言参数: {original_language}",
-                operator_id=operator_id,
-                branch_id=branch_id
-            )
+            supported_languages = ['zh', 'en', 'th']
             
             try:
                 LogService.log_system_event(
-                    f"开始同步生成多语言收入报表PDF - 日结ID: {eod_id}, 语言: {supported_languages}",
+                    f"开始生成多语言收入报表PDF - 日结ID: {eod_id}, 语言: {supported_languages}, 时间范围: {start_time} ~ {end_time}",
                     operator_id=operator_id,
                     branch_id=branch_id
                 )
                 
-                # 构建与界面显示完全一致的PDF数据
-                # 【修复】使用实际的业务时间范围，也就是用于CalGain查询的时间段
-                LogService.log_system_event(
-                    f"📅 PDF数据时间范围 - 开始: {start_time} ({type(start_time)}), 结束: {end_time} ({type(end_time)})",
-                    operator_id=operator_id,
-                    branch_id=branch_id
-                )
-                
-                # 【关键修复】确保时间数据正确传递，直接引用CalGain查询参数
-                if start_time is None or end_time is None:
-                    LogService.log_system_event(
-                        f"⚠️ 警告: start_time或end_time为None，这将导致PDF时间显示错误",
-                        operator_id=operator_id,
-                        branch_id=branch_id
-                    )
-                
-                pdf_data = {
-                    'eod_id': eod_id,
-                    'eod_date': target_date,  # 保持原来的日期字段
-                    'time_range': {  # 【关键】用于CalGain查询的实际时间范围，直接引用不做任何转换
-                        'start_time': start_time,
-                        'end_time': end_time
-                    },
-                    'branch_id': branch_id,
-                    'date': target_date.isoformat(),  # 保持原格式
-                    'income_reports': income_data.get('currencies', []) if isinstance(income_data, dict) else [],
-                    'stock_reports': stock_data.get('currencies', []) if isinstance(stock_data, dict) else [],
-                    'base_currency_data': base_currency_data,  # 使用新的CalBaseCurrency结果
-                    'generated_at': datetime.now().isoformat()
-                }
-                
-                # 使用SimplePDFService生成PDF到manager目录
-                from services.simple_pdf_service import SimplePDFService
-                
-                # 构建EOD规范文件名前缀：YYYYMMDDEODxxx
-                date_str = target_date.strftime('%Y%m%d')
-                filename_prefix = f"{date_str}EOD{eod_id}income"
-                
-                # 【新增】生成三种语言版本的PDF
-                successful_generations = 0
-                LogService.log_system_event(
-                    f"🔧 开始循环生成PDF - 总语言数: {len(supported_languages)}, 语言列表: {supported_languages}",
-                    operator_id=operator_id,
-                    branch_id=branch_id
-                )
+                rendered = EODReportBundleService.render_income(session, eod_status, supported_languages)
+                report_timings.update(rendered['timings'])
                 
                 for lang in supported_languages:
-                    try:
-                        # 生成对应语言的文件名
-                        if lang == 'zh':
-                            filename = f"{filename_prefix}.pdf"  # 中文版保持原名
-                        else:
-                            filename = f"{filename_prefix}_{lang}.pdf"  # 其他语言加后缀
-                        
-                        LogService.log_system_event(
-                            f"🔧 开始生成{lang}语言PDF - 文件: {filename}, 循环索引: {supported_languages.index(lang) + 1}/{len(supported_languages)}",
-                            operator_id=operator_id,
-                            branch_id=branch_id
-                        )
-                        
-                        # 生成PDF到manager目录
-                        pdf_result = SimplePDFService.generate_eod_income_report_pdf_to_manager(
-                            pdf_data, 
-                            filename,
-                            target_date,
-                            eod_id,
-                            lang
-                        )
-                        
-                        # 【调试】记录PDF生成结果详情
-                        LogService.log_system_event(
-                            f"🔧 {lang}语言PDF生成结果 - pdf_result类型: {type(pdf_result)}, 内容: {pdf_result}",
-                            operator_id=operator_id,
-                            branch_id=branch_id
-                        )
-                        
-                        if pdf_result and pdf_result.get('success'):
-                            successful_generations += 1
-                            pdf_file_paths[lang] = pdf_result.get('file_path')
-                            LogService.log_system_event(
-                                f"✅ {lang}语言PDF生成成功 - 文件: {filename}, 路径: {pdf_result.get('file_path')}",
-                                operator_id=operator_id,
-                                branch_id=branch_id
-                            )
-                        else:
-                            error_msg = pdf_result.get('message', '未知错误') if pdf_result else '生成器返回空结果'
-                            LogService.log_system_event(
-                                f"❌ {lang}语言PDF生成失败 - 错误: {error_msg}, pdf_result: {pdf_result}",
-                                operator_id=operator_id,
-                                branch_id=branch_id
-                            )
-                    except Exception as lang_error:
+                    pdf_result = rendered['results'].get(lang)
+                    if pdf_result and pdf_result.get('success'):
+                        pdf_file_paths[lang] = pdf_result.get('file_path')
+                    else:
+                        error_msg = pdf_result.get('message', '未知错误') if pdf_result else '生成器返回空结果'
                         LogService.log_system_event(
-                            f"❌ {lang}语言PDF生成异常 - 错误: {str(lang_error)}",
+                            f"❌ {lang}语言PDF生成失败 - 错误: {error_msg}",
                             operator_id=operator_id,
                             branch_id=branch_id
                         )
                 
-                # 判断是否有成功生成的PDF
-                LogService.log_system_event(
-                    f"🔧 PDF生成总结 - 成功数: {successful_generations}/{len(supported_languages)}, 文件路径: {pdf_file_paths}",
-                    operator_id=operator_id,
-                    branch_id=branch_id
-                )
+                # 保存生成的文件和耗时
+                session.commit()
                 
-                if successful_generations > 0:
+                if pdf_file_paths:
                     pdf_generated = True
                     LogService.log_system_event(
-                        f"✅ 多语言PDF生成完成 - 成功: {successful_generations}/{len(supported_languages)}, 文件: {list(pdf_file_paths.keys())}",
+                        f"✅ 多语言PDF生成完成 - 成功: {len(pdf_file_paths)}/{len(supported_languages)}, 复用已生成文件: {rendered['reused']}, 文件: {list(pdf_file_paths.keys())}",
                         operator_id=operator_id,
                         branch_id=branch_id
                     )
@@ -3746,8 +3339,9 @@ class EODService:
             
             except Exception as pdf_error:
                 # PDF生成失败不影响主流程，只记录日志
+                session.rollback()
                 LogService.log_system_event(
-                    f"同步生成PDF异常 - 日结ID: {eod_id}, 错误: {str(pdf_error)}",
+                    f"生成PDF异常 - 日结ID: {eod_id}, 错误: {str(pdf_error)}",
                     operator_id=operator_id,
                     branch_id=branch_id
                 )
@@ -3762,11 +3356,12 @@ class EODService:
                 'reports_generated': True,
                 'step_updated': True,
                 'pdf_generated': pdf_generated,  # 标识PDF是否已生成
-                'pdf_file_paths': pdf_file_paths   # PDF文件路径
+                'pdf_file_paths': pdf_file_paths,  # PDF文件路径
+                'timings': report_timings  # 各阶段耗时（毫秒）
             }
             
             LogService.log_system_event(
-                f"🔧 收入统计完成 - PDF生成状态: {pdf_generated}, 文件路径: {pdf_file_paths}, 支持语言: {supported_languages}",
+                f"🔧 收入统计完成 - PDF生成状态: {pdf_generated}, 文件路径: {pdf_file_paths}, 耗时(ms): {report_timings}",
                 operator_id=operator_id,
                 branch_id=branch_id
             )
@@ -4131,14 +3726,18 @@ class EODService:
             else:  # 默认中文
                 filename = f"{date_str}EOD{eod_id}income.pdf"
             
-            # 获取manager目录下的文件路径
-            expected_file_path = SimplePDFService.get_manager_file_path(
-                'income', 
-                eod_id=eod_id, 
-                eod_date=target_date
-            )
-            # 确保使用正确的文件名
-            expected_file_path = os.path.join(os.path.dirname(expected_file_path), filename)
+            # 优先使用报表数据包中记录的已生成文件，否则按命名规范查找manager目录下的文件
+            stored = EODReportBundleService.stored_file(session, eod_id, 'income', language)
+            if stored:
+                expected_file_path = stored['file_path']
+            else:
+                expected_file_path = SimplePDFService.get_manager_file_path(
+                    'income', 
+                    eod_id=eod_id, 
+                    eod_date=target_date
+                )
+                # 确保使用正确的文件名
+                expected_file_path = os.path.join(os.path.dirname(expected_file_path), filename)
             
             # 检查同步生成的PDF是否存在
             if os.path.exists(expected_file_path):
@@ -4165,6 +3764,29 @@ class EODService:
                 branch_id=branch_id
             )
             
+            # 数据包中有收入统计数据模型时只重新生成该语言的PDF，不重新计算
+            bundle = EODReportBundleService.get(session, eod_id)
+            if bundle is not None and bundle.data:
+                rendered = EODReportBundleService.render_income(session, eod_status, [language])
+                session.commit()
+                pdf_result = rendered['results'].get(language) or {}
+                if pdf_result.get('success'):
+                    language_name = {'zh': '中文', 'th': '泰语', 'en': '英语'}.get(language, '中文')
+                    LogService.log_system_event(
+                        f"按已保存的数据模型重新生成{language_name}PDF文件成功 - 日结ID: {eod_id}, 文件: {filename}, 耗时(ms): {rendered['timings']}",
+                        operator_id=operator_id,
+                        branch_id=branch_id
+                    )
+                    
+                    return {
+                        'success': True,
+                        'message': f'收入报表已准备就绪（重新生成{language_name}PDF）',
+                        'pdf_file': filename,
+                        'file_path': pdf_result['file_path'],
+                        'source': 'regenerated',
+                        'language': language
+                    }
+            
             # 尝试重新生成PDF文件
             try:
                 from services.simple_pdf_service import SimplePDFService
@@ -4409,11 +4031,8 @@ class EODService:
             
             cleaned_count = 0
             for eod in processing_eods:
-                # 检查是否有对应的活跃会话锁定
-                session_lock = session.query(EODSessionLock).filter(
-                    EODSessionLock.eod_status_id == eod.id,
-                    EODSessionLock.is_active == True
-                ).first()
+                # 检查是否有对应的未到期会话租约
+                session_lock = EODLeaseService.holder(session, eod_status_id=eod.id)
                 
                 if not session_lock:
                     # 自动清理孤立的EOD记录
@@ -4458,9 +4077,9 @@ class EODService:
             DatabaseService.close_session(session)
 
     @staticmethod
-    def validate_eod_permission(eod_id, operator_id, session_id=None):
+    def validate_eod_permission(eod_id, operator_id, session_id=None, fencing_token=None):
         """
-        统一验证日结操作权限
+        统一验证日结操作权限（提供 fencing_token 时租约令牌必须一致，被接管的旧持有者不能继续操作）
         """
         session = DatabaseService.get_session()
         try:
@@ -4490,11 +4109,7 @@ class EODService:
             
             # 3. 检查会话锁定（如果提供了session_id）
             if session_id:
-                session_lock = session.query(EODSessionLock).filter(
-                    EODSessionLock.eod_status_id == eod_id,
-                    EODSessionLock.session_id == session_id,
-                    EODSessionLock.is_active == True
-                ).first()
+                session_lock = EODLeaseService.validate(session, eod_id, session_id, fencing_token)
                 
                 if not session_lock:
                     return {
@@ -4503,8 +4118,8 @@ class EODService:
                         'message': '会话锁定无效或已过期'
                     }
                 
-                # 更新会话活跃时间
-                session_lock.last_activity = datetime.now()
+                # 续期租约
+                EODLeaseService.renew(session, session_id, eod_status.branch_id, session_lock.fencing_token)
                 session.commit()
             
             return {
@@ -4530,16 +4145,7 @@ class EODService:
         """
         session = DatabaseService.get_session()
         try:
-            # 查询该EOD的所有会话锁定记录
-            session_locks = session.query(EODSessionLock).filter(
-                EODSessionLock.eod_status_id == eod_id
-            ).all()
-            
-            cleaned_count = 0
-            for session_lock in session_locks:
-                session.delete(session_lock)
-                cleaned_count += 1
-            
+            cleaned_count = EODLeaseService.release_eod(session, eod_id)
             session.commit()
             
             # 记录清理日志
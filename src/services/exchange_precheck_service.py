@@ -0,0 +1,399 @@
+# -*- coding: utf-8 -*-
+"""
+交易预检服务
+一次请求检查整篮交易（多币种、多笔）的余额充足性、余额报警阈值、交易用途限额、
+AMLO预约审核金额和 AMLO/BOT 触发条件，替代前端逐个调用
+/api/balance/check-transaction-impact、用途限额、预约检查和 /api/bot/check-trigger
+
+所有相关数据在开始时批量读取一次（余额、报警设置、用途限额、客户累计统计、USD汇率），
+之后按顺序在内存中逐笔推演：同一币种的多笔交易依次累计余额变动和客户累计金额，
+结果与逐笔过账时看到的状态一致
+"""
+
+import logging
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from models.exchange_models import (
+    BranchBalanceAlert, Currency, CurrencyBalance, ExchangeRate, TransactionPurposeLimit
+)
+from services.balance_alert_service import BalanceAlertService
+from services.reference_data_cache import ReferenceDataCache
+from services.repform.rule_engine import RuleEngine
+
+logger = logging.getLogger(__name__)
+
+AMLO_REPORT_TYPES = ('AMLO-1-01', 'AMLO-1-02', 'AMLO-1-03')
+BOT_REPORT_TYPES = {'buy': 'BOT_BuyFX', 'sell': 'BOT_SellFX'}
+
+# 与 BOTTriggerService._calculate_usd_equivalent 一致：当天没有USD汇率时使用的默认值
+DEFAULT_USD_RATE = Decimal('35.0')
+
+
+def _decimal(value: Any, field: str, index: int) -> Decimal:
+    try:
+        return Decimal(str(value))
+    except (InvalidOperation, TypeError, ValueError):
+        raise ValueError(f'第{index + 1}笔交易的 {field} 无效: {value}')
+
+
+class ExchangePrecheckService:
+    """交易预检服务"""
+
+    @staticmethod
+    def normalize_legs(legs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        校验并规范化交易明细
+
+        每笔交易: {"currency_id", "type": "buy"/"sell"（网点买入/卖出外币）, "amount"（外币金额，正数）,
+                   "rate", "local_amount"（可选，默认 amount * rate）, "purpose"（可选）, "use_fcd"（可选）}
+        也可以用 "denominations": [{"denomination", "quantity"}] 代替 amount
+        """
+        if not isinstance(legs, list) or not legs:
+            raise ValueError('缺少交易明细')
+
+        normalized = []
+        for index, leg in enumerate(legs):
+            if not isinstance(leg, dict):
+                raise ValueError(f'第{index + 1}笔交易格式错误')
+            if leg.get('type') not in ('buy', 'sell'):
+                raise ValueError(f'第{index + 1}笔交易的 type 必须为 buy 或 sell')
+            if not leg.get('currency_id'):
+                raise ValueError(f'第{index + 1}笔交易缺少 currency_id')
+
+            if leg.get('amount') is not None:
+                amount = abs(_decimal(leg['amount'], 'amount', index))
+            elif leg.get('denominations'):
+                amount = sum(
+                    (_decimal(d.get('denomination'), 'denomination', index) * int(d.get('quantity') or 0)
+                     for d in leg['denominations']),
+                    Decimal('0')
+                )
+            else:
+                raise ValueError(f'第{index + 1}笔交易缺少 amount')
+
+            rate = _decimal(leg.get('rate', 0), 'rate', index)
+            if leg.get('local_amount') is not None:
+                local_amount = abs(_decimal(leg['local_amount'], 'local_amount', index))
+            else:
+                local_amount = (amount * rate).quantize(Decimal('0.01'))
+
+            sign = 1 if leg['type'] == 'buy' else -1
+            normalized.append({
+                'index': index,
+                'currency_id': int(leg['currency_id']),
+                'type': leg['type'],
+                'amount': amount,
+                'rate': rate,
+                'local_amount': local_amount,
+                # 网点视角：买入外币时外币增加、本币减少；卖出相反
+                'foreign_change': amount * sign,
+                'base_change': -local_amount * sign,
+                'purpose': leg.get('purpose'),
+                'use_fcd': bool(leg.get('use_fcd', False))
+            })
+        return normalized
+
+    # ------------------------------------------------------------------
+    # 批量读取
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _load_snapshot(session: Session, branch_id: int, currency_ids: List[int],
+                       currency_codes: List[str], customer_id: Optional[str]) -> Dict[str, Any]:
+        balances = {
+            currency_id: Decimal(str(balance or 0))
+            for currency_id, balance in session.query(CurrencyBalance.currency_id, CurrencyBalance.balance).filter(
+                CurrencyBalance.branch_id == branch_id,
+                CurrencyBalance.currency_id.in_(currency_ids)
+            )
+        }
+
+        alerts = {
+            alert.currency_id: alert
+            for alert in session.query(BranchBalanceAlert).filter(
+                BranchBalanceAlert.branch_id == branch_id,
+                BranchBalanceAlert.currency_id.in_(currency_ids),
+                BranchBalanceAlert.is_active == True  # noqa: E712
+            )
+        }
+
+        purpose_limits = {
+            (limit.currency_code, limit.purpose_name): limit
+            for limit in session.query(TransactionPurposeLimit).filter(
+                TransactionPurposeLimit.branch_id == branch_id,
+                TransactionPurposeLimit.currency_code.in_(currency_codes),
+                TransactionPurposeLimit.is_active == True  # noqa: E712
+            )
+        }
+
+        usd_rate = session.query(ExchangeRate.buy_rate).join(
+            Currency, ExchangeRate.currency_id == Currency.id
+        ).filter(
+            Currency.currency_code == 'USD',
+            ExchangeRate.rate_date == date.today()
+        ).order_by(ExchangeRate.created_at.desc()).limit(1).scalar()
+
+        snapshot = {
+            'balances': balances,
+            'alerts': alerts,
+            'purpose_limits': purpose_limits,
+            'usd_rate': Decimal(str(usd_rate)) if usd_rate else DEFAULT_USD_RATE,
+            'customer_stats': None,
+            'customer_stats_24h': None,
+            'reservation': None
+        }
+
+        if customer_id:
+            snapshot['customer_stats'] = RuleEngine.get_customer_stats(session, customer_id, days=30)
+            snapshot['customer_stats_24h'] = RuleEngine.get_customer_24h_stats(session, customer_id)
+            try:
+                row = session.execute(text("""
+                    SELECT id, reservation_no, report_type, local_amount
+                    FROM Reserved_Transaction
+                    WHERE customer_id = :customer_id
+                      AND status = 'approved'
+                    ORDER BY created_at DESC
+                    LIMIT 1
+                """), {'customer_id': customer_id}).fetchone()
+            except Exception as e:
+                # 与 perform_exchange 一致：预约查询失败不阻止交易
+                logger.error(f"查询AMLO预约记录失败: {str(e)}")
+                session.rollback()
+                row = None
+            if row:
+                snapshot['reservation'] = {
+                    'id': row[0],
+                    'reservation_no': row[1],
+                    'report_type': row[2],
+                    'approved_amount': Decimal(str(row[3] or 0))
+                }
+        return snapshot
+
+    # ------------------------------------------------------------------
+    # 逐笔推演
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _alert_status(snapshot: Dict[str, Any], currency_id: int, currency_code: str,
+                      balance: Decimal) -> Dict[str, Any]:
+        alert = snapshot['alerts'].get(currency_id)
+        return BalanceAlertService._calculate_balance_status(
+            balance,
+            alert.min_threshold if alert else None,
+            alert.max_threshold if alert else None,
+            currency_code
+        )
+
+    @staticmethod
+    def _trigger_summary(results: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        triggered = [report_type for report_type, result in results.items() if result['triggered']]
+        blocking = [
+            report_type for report_type in triggered if not results[report_type].get('allow_continue', False)
+        ]
+        messages = [results[report_type].get('message_cn', '') for report_type in triggered]
+        return {
+            'triggered': bool(triggered),
+            'report_types': triggered,
+            'allow_continue': not blocking,
+            'messages': [m for m in messages if m]
+        }
+
+    @staticmethod
+    def _check_triggers(session: Session, branch_id: int, report_types, data: Dict[str, Any]) -> Dict[str, Any]:
+        results = {}
+        for report_type in report_types:
+            try:
+                results[report_type] = RuleEngine.check_triggers(session, report_type, data, branch_id)
+            except Exception as e:
+                logger.error(f"预检 {report_type} 触发检查失败: {str(e)}")
+                results[report_type] = {'triggered': False, 'allow_continue': True}
+        return ExchangePrecheckService._trigger_summary(results)
+
+    @staticmethod
+    def precheck(session: Session, branch_id: int, legs: List[Dict[str, Any]],
+                 customer_id: Optional[str] = None, purpose: Optional[str] = None,
+                 use_fcd: bool = False) -> Dict[str, Any]:
+        """
+        预检整篮交易（只读，不加锁、不写入）
+
+        Returns:
+            {
+                "can_proceed": 全部交易均可执行,
+                "legs": 每笔交易的检查结果,
+                "base_currency": 本币余额推演结果,
+                "customer_stats": 客户累计统计（提供 customer_id 时）
+            }
+        """
+        legs = ExchangePrecheckService.normalize_legs(legs)
+
+        base_currency_id = ReferenceDataCache.get_base_currency_id(session, branch_id)
+        if not base_currency_id:
+            raise ValueError('网点信息不完整或未设置本币')
+        base_currency = ReferenceDataCache.get_currency(session, base_currency_id)
+        base_code = base_currency.currency_code if base_currency else 'BASE'
+
+        currencies = {}
+        for leg in legs:
+            currency = ReferenceDataCache.get_currency(session, leg['currency_id'])
+            if currency is None:
+                raise ValueError(f"第{leg['index'] + 1}笔交易的币种不存在")
+            currencies[leg['currency_id']] = currency
+
+        currency_ids = sorted(set(currencies) | {base_currency_id})
+        codes = sorted({currency.currency_code for currency in currencies.values()})
+        snapshot = ExchangePrecheckService._load_snapshot(session, branch_id, currency_ids, codes, customer_id)
+
+        running = dict(snapshot['balances'])
+        stats = snapshot['customer_stats'] or {}
+        stats_24h = snapshot['customer_stats_24h'] or {}
+        cumulative_30d = Decimal(str(stats.get('cumulative_amount_30d', 0)))
+        count_30d = int(stats.get('transaction_count_30d', 0))
+        cumulative_24h = Decimal(str(stats_24h.get('cumulative_amount_24h', 0)))
+        count_24h = int(stats_24h.get('transaction_count_24h', 0))
+        reservation = snapshot['reservation']
+
+        results = []
+        for leg in legs:
+            currency = currencies[leg['currency_id']]
+            code = currency.currency_code
+            blocking = []
+
+            # 1. 余额充足性（同币种多笔依次累计）
+            foreign_before = running.get(leg['currency_id'], Decimal('0'))
+            foreign_after = foreign_before + leg['foreign_change']
+            running[leg['currency_id']] = foreign_after
+            base_before = running.get(base_currency_id, Decimal('0'))
+            base_after = base_before + leg['base_change']
+            running[base_currency_id] = base_after
+
+            foreign_sufficient = leg['foreign_change'] >= 0 or foreign_after >= 0
+            base_sufficient = leg['base_change'] >= 0 or base_after >= 0
+            if not foreign_sufficient:
+                blocking.append('foreign_balance_insufficient')
+            if not base_sufficient:
+                blocking.append('base_balance_insufficient')
+
+            # 2. 交易用途限额
+            purpose_name = leg['purpose'] or purpose
+            purpose_result = None
+            if purpose_name:
+                limit = snapshot['purpose_limits'].get((code, purpose_name))
+                if limit is not None:
+                    exceeded = leg['amount'] > Decimal(str(limit.max_amount))
+                    purpose_result = {
+                        'purpose_name': purpose_name,
+                        'max_amount': float(limit.max_amount),
+                        'exceeded': exceeded,
+                        'display_message': limit.display_message
+                    }
+                    if exceeded:
+                        blocking.append('purpose_limit_exceeded')
+
+            # 3. AMLO预约审核金额
+            reservation_result = None
+            if reservation is not None:
+                exceeded = leg['local_amount'] > reservation['approved_amount']
+                reservation_result = {
+                    'reservation_id': reservation['id'],
+                    'reservation_no': reservation['reservation_no'],
+                    'report_type': reservation['report_type'],
+                    'approved_amount': float(reservation['approved_amount']),
+                    'exceeded': exceeded
+                }
+                if exceeded:
+                    blocking.append('amount_exceeded')
+
+            # 4. AMLO/BOT触发条件（客户累计金额包含本篮中此前各笔及本笔）
+            amount_float = float(leg['amount'])
+            local_float = float(leg['local_amount'])
+            trigger_data = {
+                'total_amount': local_float,
+                'amount': amount_float,
+                'local_amount': local_float,
+                'currency_code': code,
+                'transaction_type': leg['type'],
+                'direction': leg['type'],
+                'payment_method': 'cash',
+                'customer_country_code': 'TH',
+                'transaction_date': date.today(),
+                'customer_id': customer_id or '',
+                'use_fcd': leg['use_fcd'] or use_fcd
+            }
+            if customer_id:
+                cumulative_30d += leg['local_amount']
+                count_30d += 1
+                cumulative_24h += leg['local_amount']
+                count_24h += 1
+                trigger_data.update({
+                    'cumulative_amount_30d': float(cumulative_30d),
+                    'transaction_count_30d': count_30d,
+                    'cumulative_amount_24h': float(cumulative_24h),
+                    'transaction_count_24h': count_24h
+                })
+            amlo = ExchangePrecheckService._check_triggers(session, branch_id, AMLO_REPORT_TYPES, trigger_data)
+
+            if code == 'USD':
+                usd_equivalent = leg['amount']
+            else:
+                usd_equivalent = leg['amount'] * leg['rate'] / snapshot['usd_rate']
+            trigger_data['usd_equivalent'] = float(usd_equivalent)
+            trigger_data['verification_amount'] = float(usd_equivalent)
+            bot_types = [BOT_REPORT_TYPES[leg['type']]]
+            if trigger_data['use_fcd']:
+                bot_types.append('BOT_FCD')
+            bot = ExchangePrecheckService._check_triggers(session, branch_id, bot_types, trigger_data)
+
+            if not amlo['allow_continue']:
+                blocking.append('amlo_blocked')
+            if not bot['allow_continue']:
+                blocking.append('bot_blocked')
+
+            results.append({
+                'index': leg['index'],
+                'currency_id': leg['currency_id'],
+                'currency_code': code,
+                'type': leg['type'],
+                'amount': amount_float,
+                'local_amount': local_float,
+                'balance': {
+                    'before': float(foreign_before),
+                    'after': float(foreign_after),
+                    'sufficient': foreign_sufficient,
+                    'alert': ExchangePrecheckService._alert_status(
+                        snapshot, leg['currency_id'], code, foreign_after
+                    )
+                },
+                'base_balance': {
+                    'before': float(base_before),
+                    'after': float(base_after),
+                    'sufficient': base_sufficient
+                },
+                'purpose_limit': purpose_result,
+                'reservation': reservation_result,
+                'amlo': amlo,
+                'bot': bot,
+                'usd_equivalent': float(usd_equivalent),
+                'blocking_reasons': blocking,
+                'can_proceed': not blocking
+            })
+
+        base_initial = snapshot['balances'].get(base_currency_id, Decimal('0'))
+        base_final = running.get(base_currency_id, Decimal('0'))
+        return {
+            'can_proceed': all(result['can_proceed'] for result in results),
+            'legs': results,
+            'base_currency': {
+                'currency_id': base_currency_id,
+                'currency_code': base_code,
+                'before': float(base_initial),
+                'after': float(base_final),
+                'sufficient': base_final >= 0 or base_final >= base_initial,
+                'alert': ExchangePrecheckService._alert_status(snapshot, base_currency_id, base_code, base_final)
+            },
+            'customer_stats': snapshot['customer_stats']
+        }
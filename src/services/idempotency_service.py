@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+"""
+幂等请求服务
+交易类接口（单笔兑换、双向交易、业务组票据打印）支持 Idempotency-Key 请求头：
+- 首次请求登记为 processing 后执行，成功（2xx）的响应保存到 idempotency_records，
+  TTL 内用同一 Key 重试直接返回保存的响应，不再经过余额锁、票据编号和合规检查
+- 同一 Key 的并发请求等待首个请求执行完成后返回其结果，不会与之竞争重复过账
+- 执行失败（非 2xx 或异常）时删除登记，客户端可以用同一 Key 重试
+- 未携带请求头的请求行为不变
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+import weakref
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import Any, Dict, Optional, Tuple
+
+from flask import Response, jsonify, make_response, request
+from sqlalchemy import delete, insert, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models.exchange_models import IdempotencyRecord
+from services.db_service import DatabaseService
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+REPLAY_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 100
+
+STATUS_PROCESSING = 'processing'
+STATUS_COMPLETED = 'completed'
+
+# 过期记录的清理间隔（秒），在登记新请求时顺带执行
+PURGE_INTERVAL = 300
+
+RecordIdent = Tuple[str, int, str]
+
+
+def _env_seconds(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class IdempotencyService:
+    """幂等请求结果存储（数据库记录 + 进程内执行中请求的等待通知）"""
+
+    _inflight: Dict[RecordIdent, threading.Event] = {}
+    _inflight_lock = threading.Lock()
+    _table_checked = weakref.WeakKeyDictionary()
+    _last_purge = 0.0
+
+    @staticmethod
+    def ttl_seconds() -> float:
+        """已完成结果的保存时间（IDEMPOTENCY_TTL_SECONDS，默认24小时）"""
+        return _env_seconds('IDEMPOTENCY_TTL_SECONDS', 86400)
+
+    @staticmethod
+    def wait_seconds() -> float:
+        """并发重复请求等待首个请求完成的最长时间（IDEMPOTENCY_WAIT_SECONDS，默认30秒）"""
+        return _env_seconds('IDEMPOTENCY_WAIT_SECONDS', 30)
+
+    @staticmethod
+    def lease_seconds() -> float:
+        """processing 记录超过该时间视为执行进程已退出，允许重新执行（IDEMPOTENCY_LEASE_SECONDS，默认300秒）"""
+        return _env_seconds('IDEMPOTENCY_LEASE_SECONDS', 300)
+
+    @staticmethod
+    def request_fingerprint(method: str, path: str, body: bytes) -> str:
+        """请求指纹：同一 Key 只能用于相同的请求"""
+        digest = hashlib.sha256()
+        digest.update(method.upper().encode('utf-8'))
+        digest.update(b'\n')
+        digest.update(path.encode('utf-8'))
+        digest.update(b'\n')
+        digest.update(body or b'')
+        return digest.hexdigest()
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        """
+        幂等记录表是否存在（迁移 016 创建）；不存在时请求按原方式执行
+        结果按主库 engine 缓存（命中缓存时不打开会话），不存在的结果每60秒重新检查一次
+        """
+        engine = DatabaseService.primary_engine()
+        cached = cls._table_checked.get(engine)
+        now = time.monotonic()
+        if cached is not None and (cached[0] or now - cached[1] < 60):
+            return cached[0]
+
+        exists = inspect(engine).has_table(IdempotencyRecord.__tablename__)
+        cls._table_checked[engine] = (exists, now)
+        return exists
+
+    # ------------------------------------------------------------------
+    # 登记与等待
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _ident_filter(table, ident: RecordIdent):
+        scope, operator_id, key = ident
+        return (
+            (table.c.scope == scope)
+            & (table.c.operator_id == operator_id)
+            & (table.c.idempotency_key == key)
+        )
+
+    @classmethod
+    def _try_claim(cls, ident: RecordIdent, request_hash: str) -> Dict[str, Any]:
+        """
+        尝试登记一次请求（独立短事务）
+
+        Returns:
+            {'action': 'execute', 'owner': ...}  由当前请求执行
+            {'action': 'replay', 'status': ..., 'body': ..., 'mimetype': ...}  返回已保存的结果
+            {'action': 'mismatch'}  同一 Key 已用于不同的请求
+            {'action': 'wait'}  另一个请求正在执行
+            {'action': 'retry'}  记录刚过期或被删除，立即重试登记
+        """
+        table = IdempotencyRecord.__table__
+        scope, operator_id, key = ident
+        owner = uuid.uuid4().hex
+        session = DatabaseService.get_session()
+        try:
+            now = datetime.now()
+            expires_at = now + timedelta(seconds=cls.ttl_seconds())
+            try:
+                session.execute(insert(table).values(
+                    scope=scope,
+                    operator_id=operator_id,
+                    idempotency_key=key,
+                    request_hash=request_hash,
+                    status=STATUS_PROCESSING,
+                    owner=owner,
+                    created_at=now,
+                    expires_at=expires_at
+                ))
+                session.commit()
+                return {'action': 'execute', 'owner': owner}
+            except IntegrityError:
+                session.rollback()
+
+            row = session.execute(
+                select(table).where(cls._ident_filter(table, ident))
+            ).first()
+            if row is None:
+                return {'action': 'retry'}
+
+            if row.expires_at <= now:
+                # 过期记录：条件删除后重新登记（并发时只有一个请求能删除成功）
+                session.execute(
+                    delete(table).where(table.c.id == row.id, table.c.expires_at <= now)
+                )
+                session.commit()
+                return {'action': 'retry'}
+
+            if row.request_hash != request_hash:
+                return {'action': 'mismatch'}
+
+            if row.status == STATUS_COMPLETED:
+                return {
+                    'action': 'replay',
+                    'status': row.response_status,
+                    'body': row.response_body,
+                    'mimetype': row.response_mimetype
+                }
+
+            if row.created_at is not None and row.created_at + timedelta(seconds=cls.lease_seconds()) <= now:
+                # 执行进程已退出仍未完成：按原 owner 条件接管
+                result = session.execute(
+                    update(table)
+                    .where(table.c.id == row.id, table.c.owner == row.owner, table.c.status == STATUS_PROCESSING)
+                    .values(owner=owner, created_at=now, expires_at=expires_at)
+                )
+                session.commit()
+                if result.rowcount == 1:
+                    logger.warning(f"幂等请求执行超时，重新执行: scope={scope}, operator_id={operator_id}, key={key}")
+                    return {'action': 'execute', 'owner': owner}
+
+            return {'action': 'wait'}
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            DatabaseService.close_session(session)
+
+    @classmethod
+    def begin(cls, scope: str, operator_id: int, key: str, request_hash: str) -> Dict[str, Any]:
+        """
+        登记请求；同一 Key 正在执行时等待其完成（最长 wait_seconds）
+
+        Returns:
+            _try_claim 的结果；等待超时返回 {'action': 'busy'}
+        """
+        cls.purge_expired_if_due()
+
+        ident = (scope, operator_id, key)
+        deadline = time.monotonic() + cls.wait_seconds()
+        delay = 0.05
+        while True:
+            outcome = cls._try_claim(ident, request_hash)
+            if outcome['action'] == 'execute':
+                with cls._inflight_lock:
+                    cls._inflight[ident] = threading.Event()
+                return outcome
+            if outcome['action'] == 'retry':
+                continue
+            if outcome['action'] != 'wait':
+                return outcome
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return {'action': 'busy'}
+
+            # 同进程内执行中的请求完成时会立即唤醒；其他进程执行的请求按退避间隔轮询
+            event = cls._inflight.get(ident)
+            if event is not None:
+                event.wait(min(remaining, 1.0))
+            else:
+                time.sleep(min(delay, remaining))
+                delay = min(delay * 2, 0.5)
+
+    @classmethod
+    def _notify(cls, ident: RecordIdent):
+        with cls._inflight_lock:
+            event = cls._inflight.pop(ident, None)
+        if event is not None:
+            event.set()
+
+    @classmethod
+    def complete(cls, scope: str, operator_id: int, key: str, owner: str,
+                 status_code: int, body: str, mimetype: Optional[str]):
+        """保存执行结果（只有登记该请求的 owner 能写入）"""
+        table = IdempotencyRecord.__table__
+        ident = (scope, operator_id, key)
+        session = DatabaseService.get_session()
+        try:
+            now = datetime.now()
+            session.execute(
+                update(table)
+                .where(cls._ident_filter(table, ident), table.c.owner == owner)
+                .values(
+                    status=STATUS_COMPLETED,
+                    response_status=status_code,
+                    response_body=body,
+                    response_mimetype=mimetype,
+                    completed_at=now,
+                    expires_at=now + timedelta(seconds=cls.ttl_seconds())
+                )
+            )
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            DatabaseService.close_session(session)
+            cls._notify(ident)
+
+    @classmethod
+    def release(cls, scope: str, operator_id: int, key: str, owner: str):
+        """执行失败：删除登记，允许用同一 Key 重试"""
+        table = IdempotencyRecord.__table__
+        ident = (scope, operator_id, key)
+        session = DatabaseService.get_session()
+        try:
+            session.execute(
+                delete(table).where(cls._ident_filter(table, ident), table.c.owner == owner)
+            )
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            DatabaseService.close_session(session)
+            cls._notify(ident)
+
+    # ------------------------------------------------------------------
+    # 过期清理
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def purge_expired(cls) -> int:
+        """删除已过期的幂等记录，返回删除数量"""
+        table = IdempotencyRecord.__table__
+        session = DatabaseService.get_session()
+        try:
+            result = session.execute(delete(table).where(table.c.expires_at <= datetime.now()))
+            session.commit()
+            return result.rowcount or 0
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            DatabaseService.close_session(session)
+
+    @classmethod
+    def purge_expired_if_due(cls):
+        now = time.monotonic()
+        if now - cls._last_purge < PURGE_INTERVAL:
+            return
+        cls._last_purge = now
+        try:
+            purged = cls.purge_expired()
+            if purged:
+                logger.info(f"已清理 {purged} 条过期幂等记录")
+        except Exception as e:
+            logger.warning(f"清理过期幂等记录失败: {str(e)}")
+
+
+def idempotent(scope: str):
+    """
+    幂等请求装饰器（放在 token_required / has_permission 之后，args[0] 为当前用户）
+    携带 Idempotency-Key 请求头时同一操作员、同一接口、同一 Key 只执行一次
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            key = request.headers.get(HEADER)
+            current_user = args[0] if args and isinstance(args[0], dict) else None
+            if key is None or current_user is None:
+                return f(*args, **kwargs)
+
+            key = key.strip()
+            if not key or len(key) > MAX_KEY_LENGTH:
+                return jsonify({
+                    'success': False,
+                    'message': f'{HEADER} 无效（长度应为1-{MAX_KEY_LENGTH}个字符）'
+                }), 400
+
+            if not IdempotencyService.is_enabled():
+                return f(*args, **kwargs)
+
+            operator_id = current_user['id']
+            request_hash = IdempotencyService.request_fingerprint(
+                request.method, request.path, request.get_data(cache=True)
+            )
+            outcome = IdempotencyService.begin(scope, operator_id, key, request_hash)
+
+            if outcome['action'] == 'replay':
+                response = Response(outcome['body'], status=outcome['status'], mimetype=outcome['mimetype'])
+                response.headers[REPLAY_HEADER] = 'true'
+                return response
+            if outcome['action'] == 'mismatch':
+                return jsonify({
+                    'success': False,
+                    'message': f'该 {HEADER} 已用于不同的请求内容'
+                }), 422
+            if outcome['action'] == 'busy':
+                return jsonify({
+                    'success': False,
+                    'message': '相同请求正在处理中，请稍后重试'
+                }), 409
+
+            owner = outcome['owner']
+            try:
+                response = make_response(f(*args, **kwargs))
+            except Exception:
+                IdempotencyService.release(scope, operator_id, key, owner)
+                raise
+
+            try:
+                if 200 <= response.status_code < 300 and not response.direct_passthrough:
+                    IdempotencyService.complete(
+                        scope, operator_id, key, owner,
+                        response.status_code, response.get_data(as_text=True), response.mimetype
+                    )
+                else:
+                    IdempotencyService.release(scope, operator_id, key, owner)
+            except Exception as e:
+                # 业务已执行完成，结果保存失败不影响本次响应（记录超过租约时间后可重新执行）
+                logger.error(f"保存幂等请求结果失败: scope={scope}, key={key}, error={str(e)}")
+            return response
+        return decorated
+    return decorator
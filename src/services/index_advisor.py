@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+"""
+索引建议
+从 SQLAlchemy 语句事件中收集实际执行的查询条件，按表汇总为查询形态并给出复合索引建议：
+- IndexAdvisor.start() 监听所有 Engine 的 before/after_cursor_execute，ORM、Core 和 text() 语句都会被记录；
+  设置 INDEX_ADVISOR_OUTPUT 后 create_app()（或压测工具）自动开启，进程退出时写出 JSON
+- 查询形态 = 表 + 等值条件列（=、IN、IS）+ 范围条件列（<、>、BETWEEN、LIKE）+ 排序列，
+  包在函数里的列（如 DATE(created_at)）无法使用索引，不计入
+- 建议索引列顺序：等值列在前（在该表各形态中出现越多越靠前），随后是一个范围列或排序列；
+  状态/类型等取值很少的列不进入索引；已有索引（模型声明或线上库）按前缀能覆盖的形态不再建议，
+  被其他建议覆盖的建议会合并
+- render_migration() 按 src/migrations 的格式生成迁移脚本
+
+用法见 scripts/index_advisor.py
+"""
+
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+MAX_INDEX_NAME = 64
+
+# 取值很少的列（状态、类型、标记），作为索引前导列收益很低，建议时跳过
+LOW_CARDINALITY_COLUMNS = (
+    'status', 'type', 'exchange_type', 'transaction_direction', 'direction', 'report_type',
+    'is_active', 'is_reported', 'is_deleted', 'bot_flag', 'fcd_flag', 'use_fcd', 'payment_method',
+)
+
+_KEYWORDS = {
+    'WHERE', 'JOIN', 'LEFT', 'RIGHT', 'INNER', 'OUTER', 'CROSS', 'ON', 'USING', 'GROUP', 'ORDER',
+    'LIMIT', 'HAVING', 'SET', 'UNION', 'FOR', 'AS', 'NATURAL', 'STRAIGHT_JOIN', 'WINDOW', 'OFFSET',
+}
+_TABLE_REF = re.compile(r'\b(?:FROM|JOIN|UPDATE)\s+`?(\w+)`?(?:\s+(?:AS\s+)?`?(\w+)`?)?', re.I)
+_WHERE = re.compile(r'\bWHERE\b(.*?)(?:\bGROUP\s+BY\b|\bORDER\s+BY\b|\bLIMIT\b|\bHAVING\b|\bFOR\s+UPDATE\b|$)', re.I | re.S)
+_ORDER_BY = re.compile(r'\bORDER\s+BY\s+(?:`?(\w+)`?\.)?`?(\w+)`?', re.I)
+_PREDICATE = re.compile(
+    r'(?<![\w:.%`])(?:`?(\w+)`?\.)?`?(\w+)`?\s*'
+    r'(<=|>=|<>|!=|=|<|>|\bNOT\s+IN\b|\bIN\b|\bBETWEEN\b|\bNOT\s+LIKE\b|\bLIKE\b|\bIS\s+NOT\b|\bIS\b)',
+    re.I
+)
+_EQUALITY_OPS = {'=', 'IN', 'IS'}
+_RANGE_OPS = {'<', '>', '<=', '>=', 'BETWEEN', 'LIKE'}
+
+
+@lru_cache(maxsize=4096)
+def parse_statement(statement: str) -> Tuple[Tuple[str, Tuple[str, ...], Tuple[str, ...], Optional[str]], ...]:
+    """
+    解析 SQL 中各表的查询条件
+
+    Returns:
+        ((表名, 等值列, 范围列, 排序列), ...)，列名均为排序后的元组
+    """
+    head = statement.lstrip()[:6].upper()
+    if head not in ('SELECT', 'UPDATE', 'DELETE'):
+        return ()
+
+    aliases = {}
+    tables = []
+    for table, alias in _TABLE_REF.findall(statement):
+        if table.upper() in _KEYWORDS or table.upper() == 'SELECT':
+            continue
+        tables.append(table)
+        aliases[table] = table
+        if alias and alias.upper() not in _KEYWORDS:
+            aliases[alias] = table
+    if not tables:
+        return ()
+    default_table = tables[0] if len(set(tables)) == 1 else None
+
+    def resolve(qualifier):
+        if qualifier:
+            return aliases.get(qualifier)
+        return default_table
+
+    equality = defaultdict(set)
+    ranges = defaultdict(set)
+    where = _WHERE.search(statement)
+    if where:
+        for qualifier, column, op in _PREDICATE.findall(where.group(1)):
+            table = resolve(qualifier)
+            if table is None or column.upper() in _KEYWORDS or column.upper() in ('AND', 'OR', 'NOT'):
+                continue
+            op = ' '.join(op.upper().split())
+            if op in _EQUALITY_OPS:
+                equality[table].add(column)
+            elif op in _RANGE_OPS:
+                ranges[table].add(column)
+
+    order = {}
+    order_match = _ORDER_BY.search(statement)
+    if order_match:
+        table = resolve(order_match.group(1))
+        if table is not None:
+            order[table] = order_match.group(2)
+
+    shapes = []
+    for table in sorted(set(equality) | set(ranges) | set(order)):
+        eq_columns = tuple(sorted(equality[table]))
+        range_columns = tuple(sorted(ranges[table] - equality[table]))
+        order_column = order.get(table)
+        if order_column in eq_columns:
+            order_column = None
+        shapes.append((table, eq_columns, range_columns, order_column))
+    return tuple(shapes)
+
+
+class IndexAdvisor:
+    """查询形态收集与索引建议"""
+
+    _lock = threading.Lock()
+    _installed = False
+    # (表, 等值列, 范围列, 排序列) -> {'count': 次数, 'total_ms': 累计耗时}
+    _shapes: Dict[Tuple, Dict[str, float]] = {}
+
+    @classmethod
+    def start(cls):
+        """开始收集（对所有 Engine 生效，可重复调用）"""
+        with cls._lock:
+            if cls._installed:
+                return
+            cls._installed = True
+        event.listen(Engine, 'before_cursor_execute', cls._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', cls._after_cursor_execute)
+
+    @classmethod
+    def stop(cls):
+        with cls._lock:
+            if not cls._installed:
+                return
+            cls._installed = False
+        event.remove(Engine, 'before_cursor_execute', cls._before_cursor_execute)
+        event.remove(Engine, 'after_cursor_execute', cls._after_cursor_execute)
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._shapes = {}
+
+    @classmethod
+    def init_from_env(cls):
+        """设置了 INDEX_ADVISOR_OUTPUT 时开始收集，进程退出时写出到该文件"""
+        path = os.environ.get('INDEX_ADVISOR_OUTPUT')
+        if not path or cls._installed:
+            return
+        cls.start()
+        atexit.register(cls.save, path)
+        logger.info(f"索引建议收集已开启，退出时写出: {path}")
+
+    @classmethod
+    def _before_cursor_execute(cls, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_index_advisor_start', []).append(time.perf_counter())
+
+    @classmethod
+    def _after_cursor_execute(cls, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('_index_advisor_start')
+        if not starts:
+            return
+        cls.record(statement, (time.perf_counter() - starts.pop()) * 1000)
+
+    @classmethod
+    def record(cls, statement: str, elapsed_ms: float = 0.0):
+        shapes = parse_statement(statement)
+        if not shapes:
+            return
+        with cls._lock:
+            for shape in shapes:
+                stats = cls._shapes.get(shape)
+                if stats is None:
+                    stats = cls._shapes[shape] = {'count': 0, 'total_ms': 0.0}
+                stats['count'] += 1
+                stats['total_ms'] += elapsed_ms
+
+    @classmethod
+    def shapes(cls) -> List[Dict[str, Any]]:
+        with cls._lock:
+            items = list(cls._shapes.items())
+        return [
+            {'table': table, 'equality': list(eq), 'range': list(rng), 'order_by': order,
+             'count': stats['count'], 'total_ms': round(stats['total_ms'], 3)}
+            for (table, eq, rng, order), stats in sorted(items, key=lambda item: -item[1]['total_ms'])
+        ]
+
+    @classmethod
+    def save(cls, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'collected_at': datetime.now().isoformat(timespec='seconds'), 'shapes': cls.shapes()},
+                      f, ensure_ascii=False, indent=2)
+
+    @staticmethod
+    def load(paths: Iterable[str]) -> List[Dict[str, Any]]:
+        """读取并合并多次收集的结果"""
+        merged = {}
+        for path in paths:
+            with open(path, 'r', encoding='utf-8') as f:
+                for shape in json.load(f)['shapes']:
+                    key = (shape['table'], tuple(shape['equality']), tuple(shape['range']), shape.get('order_by'))
+                    stats = merged.setdefault(key, {'count': 0, 'total_ms': 0.0})
+                    stats['count'] += shape['count']
+                    stats['total_ms'] += shape['total_ms']
+        return [
+            {'table': table, 'equality': list(eq), 'range': list(rng), 'order_by': order, **stats}
+            for (table, eq, rng, order), stats in merged.items()
+        ]
+
+    # ------------------------------------------------------------------
+    # 建议
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def existing_indexes(metadata=None, engine=None) -> Dict[str, List[Tuple[Tuple[str, ...], bool]]]:
+        """
+        表名 -> [(索引列, 是否唯一)]：主键、唯一约束、模型声明的索引，以及传入 engine 时线上库的索引
+        """
+        existing = defaultdict(list)
+        if metadata is not None:
+            for table in metadata.tables.values():
+                if table.primary_key.columns:
+                    existing[table.name].append((tuple(c.name for c in table.primary_key.columns), True))
+                for index in table.indexes:
+                    existing[table.name].append((tuple(c.name for c in index.columns), bool(index.unique)))
+                for constraint in table.constraints:
+                    columns = tuple(getattr(constraint, 'columns', ()))
+                    if columns and constraint.__class__.__name__ == 'UniqueConstraint':
+                        existing[table.name].append((tuple(c.name for c in columns), True))
+                for column in table.columns:
+                    if column.unique or column.index:
+                        existing[table.name].append(((column.name,), bool(column.unique)))
+        if engine is not None:
+            inspector = inspect(engine)
+            for table_name in inspector.get_table_names():
+                pk = inspector.get_pk_constraint(table_name).get('constrained_columns') or []
+                if pk:
+                    existing[table_name].append((tuple(pk), True))
+                for index in inspector.get_indexes(table_name):
+                    columns = tuple(c for c in index['column_names'] if c)
+                    existing[table_name].append((columns, bool(index.get('unique'))))
+        return dict(existing)
+
+    @staticmethod
+    def _covers(index_columns: Tuple[str, ...], columns: Tuple[str, ...], equality_count: int) -> bool:
+        """index_columns 能否服务 columns：等值部分允许任意顺序，其后的列必须依次一致"""
+        if len(index_columns) < len(columns):
+            return False
+        if set(index_columns[:equality_count]) != set(columns[:equality_count]):
+            return False
+        return tuple(index_columns[equality_count:len(columns)]) == tuple(columns[equality_count:])
+
+    @classmethod
+    def propose(cls, shapes: List[Dict[str, Any]], existing: Optional[Dict[str, List[Tuple[Tuple[str, ...], bool]]]] = None,
+                min_count: int = 1, tables: Optional[Iterable[str]] = None,
+                low_cardinality: Iterable[str] = LOW_CARDINALITY_COLUMNS) -> List[Dict[str, Any]]:
+        """
+        根据查询形态给出索引建议，按累计耗时（其次次数）降序
+
+        Args:
+            shapes: IndexAdvisor.shapes() 或 load() 的结果
+            existing: existing_indexes() 的结果
+            min_count: 形态出现次数下限
+            tables: 只对这些表给出建议
+            low_cardinality: 不作为索引列的低区分度列
+        """
+        existing = existing or {}
+        skipped = set(low_cardinality)
+        table_filter = set(tables) if tables else None
+        shapes = [s for s in shapes if s['count'] >= min_count
+                  and (table_filter is None or s['table'] in table_filter)]
+
+        frequency = defaultdict(Counter)
+        for shape in shapes:
+            for column in shape['equality']:
+                frequency[shape['table']][column] += shape['count']
+
+        candidates = {}
+        for shape in shapes:
+            table = shape['table']
+            # 单列唯一键（主键、唯一列）上的等值查找无需再建索引
+            unique_columns = {'id'} | {
+                cols[0] for cols, unique in existing.get(table, []) if unique and len(cols) == 1
+            }
+            if unique_columns & set(shape['equality']):
+                continue
+            equality = sorted((c for c in shape['equality'] if c not in skipped),
+                              key=lambda c: (-frequency[table][c], c))
+            ranges = [c for c in shape['range'] if c not in skipped]
+            tail = None
+            if ranges:
+                tail = max(ranges, key=lambda c: (frequency[table][c], c))
+            elif shape.get('order_by') and shape['order_by'] not in skipped:
+                tail = shape['order_by']
+            columns = tuple(equality) + ((tail,) if tail else ())
+            if not columns:
+                continue
+            if any(cls._covers(index_columns, columns, len(equality))
+                   for index_columns, _ in existing.get(table, [])):
+                continue
+            key = (table, columns, len(equality))
+            candidate = candidates.setdefault(key, {
+                'table': table, 'columns': list(columns), 'equality_count': len(equality),
+                'count': 0, 'total_ms': 0.0, 'shapes': 0
+            })
+            candidate['count'] += shape['count']
+            candidate['total_ms'] += shape['total_ms']
+            candidate['shapes'] += 1
+
+        # 合并：被另一条建议覆盖的建议并入后者
+        ordered = sorted(candidates.values(), key=lambda c: -len(c['columns']))
+        proposals = []
+        for candidate in ordered:
+            target = next(
+                (p for p in proposals if p['table'] == candidate['table']
+                 and cls._covers(tuple(p['columns']), tuple(candidate['columns']), candidate['equality_count'])),
+                None
+            )
+            if target is not None:
+                target['count'] += candidate['count']
+                target['total_ms'] += candidate['total_ms']
+                target['shapes'] += candidate['shapes']
+                continue
+            proposals.append(candidate)
+
+        for proposal in proposals:
+            proposal['name'] = cls.index_name(proposal['table'], proposal['columns'])
+            proposal['total_ms'] = round(proposal['total_ms'], 3)
+            del proposal['equality_count']
+        return sorted(proposals, key=lambda p: (-p['total_ms'], -p['count'], p['name']))
+
+    @staticmethod
+    def index_name(table: str, columns: List[str]) -> str:
+        name = f"idx_{table}_{'_'.join(columns)}"
+        return name[:MAX_INDEX_NAME]
+
+    @staticmethod
+    def render_migration(proposals: List[Dict[str, Any]], version: str, description: str) -> str:
+        """生成迁移脚本（与 src/migrations 中的编号迁移格式一致）"""
+        lines = '\n'.join(f"    ({p['table']!r}, {p['name']!r}, {tuple(p['columns'])!r})," for p in proposals)
+        tables = sorted({p['table'] for p in proposals})
+        return MIGRATION_TEMPLATE.format(
+            version=version,
+            description=description,
+            tables='、'.join(tables),
+            indexes=lines,
+        )
+
+
+MIGRATION_TEMPLATE = '''# -*- coding: utf-8 -*-
+"""
+数据库迁移: {description}
+
+迁移版本: {version}
+功能: 为 {tables} 增加热点查询条件的复合索引（由 scripts/index_advisor.py 根据实际执行的查询生成）；
+      已存在的同名索引跳过，回滚时只删除本迁移创建的索引
+"""
+
+import os
+import sys
+
+# Ensure project root is on sys.path to reuse existing services
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import Index, inspect  # noqa: E402
+
+from services.db_service import engine  # noqa: E402
+from models.exchange_models import Base  # noqa: E402
+
+# (表名, 索引名, 列)
+INDEXES = [
+{indexes}
+]
+
+
+def _index(table_name, name, columns):
+    table = Base.metadata.tables[table_name]
+    declared = next((index for index in table.indexes if index.name == name), None)
+    return declared if declared is not None else Index(name, *(table.c[column] for column in columns))
+
+
+def _existing(table_name):
+    return {{index['name'] for index in inspect(engine).get_indexes(table_name)}}
+
+
+def upgrade():
+    """执行迁移：创建索引"""
+    for table_name, name, columns in INDEXES:
+        if name in _existing(table_name):
+            print(f"⏭️  索引 {{name}} 已存在")
+            continue
+        _index(table_name, name, columns).create(engine)
+        print(f"✅ 已创建索引 {{name}} ({{', '.join(columns)}})")
+    return True
+
+
+def downgrade():
+    """回滚迁移：删除索引"""
+    for table_name, name, columns in INDEXES:
+        if name in _existing(table_name):
+            _index(table_name, name, columns).drop(engine)
+            print(f"✅ 已删除索引 {{name}}")
+    return True
+
+
+if __name__ == "__main__":
+    upgrade()
+'''
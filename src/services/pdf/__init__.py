@@ -25,14 +25,34 @@ PDF生成器模块
     pdf_path = generator.generate_pdf('AMLO-1-01', data, 'output.pdf')
 """
 
-from .amlo_pdf_generator import AMLOPDFGenerator
-from .amlo_form_filler import AMLOFormFiller, adapt_route_data_to_pdf_data
-
-# 新版AMLO PDF服务 (使用ReportLab Overlay方式)
-from .amlo_pdf_service import AMLOPDFService, generate_amlo_pdf
-from .amlo_csv_field_loader import AMLOCSVFieldLoader, get_csv_field_loader
-from .amlo_data_mapper import AMLODataMapper
-from .amlo_pdf_filler_overlay import AMLOPDFFillerOverlay
+import importlib
+
+# 导出名称 -> 所在子模块
+# 子模块依赖 ReportLab/PyPDF2 等较重的库，按需在首次访问时导入，导入本包本身不加载它们
+_LAZY_EXPORTS = {
+    # 旧版兼容
+    'AMLOPDFGenerator': 'amlo_pdf_generator',
+    'AMLOFormFiller': 'amlo_form_filler',
+    'adapt_route_data_to_pdf_data': 'amlo_form_filler',
+
+    # 新版AMLO PDF服务 (使用ReportLab Overlay方式)
+    'AMLOPDFService': 'amlo_pdf_service',
+    'generate_amlo_pdf': 'amlo_pdf_service',
+    'AMLOCSVFieldLoader': 'amlo_csv_field_loader',
+    'get_csv_field_loader': 'amlo_csv_field_loader',
+    'AMLODataMapper': 'amlo_data_mapper',
+    'AMLOPDFFillerOverlay': 'amlo_pdf_filler_overlay',
+}
+
+
+def __getattr__(name):
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{module_name}', __name__), name)
+    globals()[name] = value
+    return value
+
 
 __all__ = [
     # 旧版兼容
@@ -17,10 +17,20 @@ import csv
 from typing import Dict, List, Tuple
 from datetime import datetime
 
+try:
+    from ..shared_cache import SharedCache
+except ImportError:
+    import sys
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    from services.shared_cache import SharedCache
+
 
 class AMLOCSVFieldLoader:
     """AMLO CSV字段映射加载器"""
 
+    # 按CSV目录缓存映射，进程内所有加载器实例共用；reload_mappings() 通知所有工作进程重新读取
+    _cache = SharedCache.namespace('amlo_csv_fields', local=True)
+
     def __init__(self, csv_dir=None):
         """
         初始化加载器
@@ -34,11 +44,20 @@ class AMLOCSVFieldLoader:
             csv_dir = os.path.join(project_root, 'Re')
 
         self.csv_dir = csv_dir
-        self.field_mappings = {}
-        self._load_all_mappings()
 
-    def _load_all_mappings(self):
+    @property
+    def field_mappings(self) -> Dict[str, Dict[str, Dict]]:
+        """所有报告类型的字段映射"""
+        return self._cache.get_or_load(self.csv_dir, self._load_all_mappings)
+
+    @classmethod
+    def reload_mappings(cls):
+        """CSV映射文件更新后调用，所有工作进程在下次使用时重新读取"""
+        cls._cache.clear()
+
+    def _load_all_mappings(self) -> Dict[str, Dict[str, Dict]]:
         """加载所有CSV映射文件"""
+        field_mappings = {}
         csv_files = {
             'AMLO-1-01': '1-01-field-map.csv',
             'AMLO-1-02': '1-02-field-map.csv',
@@ -48,11 +67,13 @@ class AMLOCSVFieldLoader:
         for report_type, csv_file in csv_files.items():
             csv_path = os.path.join(self.csv_dir, csv_file)
             if os.path.exists(csv_path):
-                self.field_mappings[report_type] = self._load_csv(csv_path)
-                print(f"[AMLOCSVFieldLoader] Loaded {report_type}: {len(self.field_mappings[report_type])} fields")
+                field_mappings[report_type] = self._load_csv(csv_path)
+                print(f"[AMLOCSVFieldLoader] Loaded {report_type}: {len(field_mappings[report_type])} fields")
             else:
                 print(f"[AMLOCSVFieldLoader] Warning: {csv_path} not found")
-                self.field_mappings[report_type] = {}
+                field_mappings[report_type] = {}
+
+        return field_mappings
 
     def _load_csv(self, csv_path: str) -> Dict[str, Dict]:
         """
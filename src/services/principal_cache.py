@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+登录用户信息缓存
+token_required 每个请求都要查询用户、角色名和权限列表，这里按用户ID缓存构建好的 current_user：
+- 缓存有容量上限（AUTH_PRINCIPAL_CACHE_SIZE，默认1024，LRU淘汰）和 TTL（AUTH_PRINCIPAL_CACHE_TTL，默认60秒）
+- 用户、角色或权限变更后调用 bump_user/bump_role/bump_all：本进程立即失效，
+  同时递增 auth_principal_versions 表中的版本号（迁移 017 创建），其他工作进程每隔
+  AUTH_VERSION_POLL_SECONDS（默认5秒）读取一次版本表，版本不一致的缓存不再使用
+- AUTH_PERMISSIONS_IN_TOKEN=true 时登录令牌内携带用户信息和签发时的版本号，
+  版本未变化时无需查库即可使用（需要版本表存在，否则其他进程无法得知变更）
+- 版本表不存在时只在进程内失效，跨进程的变更由 TTL 兜底
+"""
+
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import inspect, insert, select, text, update
+from sqlalchemy.exc import IntegrityError
+
+from models.exchange_models import AuthPrincipalVersion, Operator
+from services.db_service import DatabaseService
+
+logger = logging.getLogger(__name__)
+
+SCOPE_USER = 'user'
+SCOPE_ROLE = 'role'
+SCOPE_ALL = 'all'
+
+ADMIN_ROLE_NAMES = ('系统管理员', 'System Administrator', 'admin', 'administrator')
+APP_ROLE_NAMES = ('App', 'APP')
+
+VersionKey = Tuple[str, int]
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _copy_principal(principal: Dict[str, Any]) -> Dict[str, Any]:
+    """返回副本，避免接口修改 current_user 时污染缓存"""
+    copied = dict(principal)
+    copied['permissions'] = list(principal.get('permissions') or [])
+    return copied
+
+
+class PrincipalCache:
+    """登录用户信息进程级缓存（LRU + TTL + 版本号失效）"""
+
+    _lock = threading.Lock()
+    _entries: 'OrderedDict[int, tuple]' = OrderedDict()
+    _versions: Dict[VersionKey, int] = {}
+    _generation = 0
+    _last_poll = 0.0
+    _table_checked = weakref.WeakKeyDictionary()
+    _counters = {'hits': 0, 'misses': 0, 'token_claims': 0}
+
+    @staticmethod
+    def max_size() -> int:
+        return max(1, int(_env_number('AUTH_PRINCIPAL_CACHE_SIZE', 1024)))
+
+    @staticmethod
+    def ttl_seconds() -> float:
+        return _env_number('AUTH_PRINCIPAL_CACHE_TTL', 60)
+
+    @staticmethod
+    def poll_seconds() -> float:
+        return _env_number('AUTH_VERSION_POLL_SECONDS', 5)
+
+    @staticmethod
+    def token_claims_enabled() -> bool:
+        return os.environ.get('AUTH_PERMISSIONS_IN_TOKEN', 'false').lower() in ('1', 'true', 'yes')
+
+    @classmethod
+    def is_enabled(cls, session) -> bool:
+        """
+        版本表是否存在（迁移 017 创建）
+        结果按 engine 缓存，不存在的结果每60秒重新检查一次
+        """
+        engine = session.get_bind()
+        engine = getattr(engine, 'engine', engine)
+        cached = cls._table_checked.get(engine)
+        now = time.monotonic()
+        if cached is not None and (cached[0] or now - cached[1] < 60):
+            return cached[0]
+
+        exists = inspect(engine).has_table(AuthPrincipalVersion.__tablename__)
+        cls._table_checked[engine] = (exists, now)
+        return exists
+
+    # ------------------------------------------------------------------
+    # 版本号
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def _refresh_versions(cls, session):
+        """到期时从版本表读取全部版本号（每个进程每个轮询周期一次查询）"""
+        now = time.monotonic()
+        if now - cls._last_poll < cls.poll_seconds():
+            return
+        if not cls.is_enabled(session):
+            return
+
+        table = AuthPrincipalVersion.__table__
+        try:
+            rows = session.execute(select(table.c.scope, table.c.ref_id, table.c.version)).all()
+        except Exception as e:
+            session.rollback()
+            logger.warning(f"读取认证版本表失败: {str(e)}")
+            cls._last_poll = now
+            return
+
+        versions = {(row.scope, row.ref_id): row.version for row in rows}
+        with cls._lock:
+            cls._versions = versions
+            cls._last_poll = now
+
+    @classmethod
+    def _current_versions(cls, user_id: int, role_id: Optional[int]) -> Tuple[int, int, int]:
+        versions = cls._versions
+        return (
+            versions.get((SCOPE_USER, user_id), 0),
+            versions.get((SCOPE_ROLE, role_id or 0), 0),
+            versions.get((SCOPE_ALL, 0), 0),
+        )
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _load(session, user_id: int) -> Optional[Dict[str, Any]]:
+        """从数据库构建 current_user；用户不存在或已禁用时返回 None"""
+        user = session.query(Operator).filter_by(id=user_id).first()
+        if not user or not user.is_active:
+            return None
+
+        role_row = session.execute(
+            text('SELECT role_name FROM roles WHERE id = :role_id'),
+            {'role_id': user.role_id}
+        ).fetchone()
+        role_name = role_row[0] if role_row else ''
+
+        # 与登录接口使用同样的SQL查询权限
+        permission_rows = session.execute(
+            text('''SELECT p.permission_name
+               FROM permissions p
+               JOIN role_permissions rp ON p.id = rp.permission_id
+               WHERE rp.role_id = :role_id
+               ORDER BY p.permission_name'''),
+            {'role_id': user.role_id}
+        ).fetchall()
+
+        return {
+            'id': user.id,
+            'login_code': user.login_code,
+            'name': user.name,
+            'branch_id': user.branch_id,
+            'role_id': user.role_id,
+            'role_name': role_name,
+            'permissions': [row[0] for row in permission_rows],
+            'is_admin': role_name in ADMIN_ROLE_NAMES,
+            'is_app_role': role_name in APP_ROLE_NAMES
+        }
+
+    @classmethod
+    def _store(cls, user_id: int, principal: Dict[str, Any], versions: Tuple[int, int, int], generation: int):
+        with cls._lock:
+            if cls._generation != generation:
+                # 加载期间发生过失效，结果可能是旧数据，不写入
+                return
+            cls._entries[user_id] = (principal, versions, time.monotonic())
+            cls._entries.move_to_end(user_id)
+            while len(cls._entries) > cls.max_size():
+                cls._entries.popitem(last=False)
+
+    @classmethod
+    def _from_claims(cls, session, user_id: int, claims: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """令牌内携带的用户信息在签发后版本未变化时可直接使用"""
+        if not claims or not cls.token_claims_enabled():
+            return None
+        principal = claims.get('principal')
+        issued_versions = claims.get('pver')
+        if not isinstance(principal, dict) or not isinstance(issued_versions, list):
+            return None
+        if principal.get('id') != user_id or not cls.is_enabled(session):
+            return None
+        if tuple(issued_versions) != cls._current_versions(user_id, principal.get('role_id')):
+            return None
+        return principal
+
+    @classmethod
+    def get_principal(cls, user_id, claims: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        获取 current_user（缓存命中且版本一致时不访问数据库）
+
+        Args:
+            user_id: 令牌中的用户ID
+            claims: 完整的令牌内容，AUTH_PERMISSIONS_IN_TOKEN 开启时从中读取用户信息
+
+        Returns:
+            current_user 字典；用户不存在或已禁用时返回 None
+        """
+        user_id = int(user_id)
+        session = DatabaseService.get_session()
+        try:
+            cls._refresh_versions(session)
+
+            entry = cls._entries.get(user_id)
+            if entry is not None:
+                principal, versions, loaded_at = entry
+                if versions == cls._current_versions(user_id, principal['role_id']) \
+                        and time.monotonic() - loaded_at < cls.ttl_seconds():
+                    with cls._lock:
+                        cls._counters['hits'] += 1
+                        if user_id in cls._entries:
+                            cls._entries.move_to_end(user_id)
+                    return _copy_principal(principal)
+
+            generation = cls._generation
+            principal = cls._from_claims(session, user_id, claims)
+            if principal is not None:
+                with cls._lock:
+                    cls._counters['token_claims'] += 1
+            else:
+                with cls._lock:
+                    cls._counters['misses'] += 1
+                principal = cls._load(session, user_id)
+                if principal is None:
+                    return None
+
+            versions = cls._current_versions(user_id, principal['role_id'])
+            cls._store(user_id, principal, versions, generation)
+            return _copy_principal(principal)
+        finally:
+            DatabaseService.close_session(session)
+
+    @classmethod
+    def token_claims(cls, user_id) -> Optional[Dict[str, Any]]:
+        """
+        生成写入令牌的用户信息和版本号
+        未开启 AUTH_PERMISSIONS_IN_TOKEN 时返回 None
+        """
+        if not cls.token_claims_enabled():
+            return None
+        principal = cls.get_principal(user_id)
+        if principal is None:
+            return None
+        return {
+            'principal': principal,
+            'pver': list(cls._current_versions(principal['id'], principal['role_id']))
+        }
+
+    # ------------------------------------------------------------------
+    # 失效
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def _bump_shared(cls, scope: str, ref_id: int):
+        """递增版本表中的版本号（独立短事务，失败时只记录日志，由 TTL 兜底）"""
+        table = AuthPrincipalVersion.__table__
+        session = DatabaseService.get_session()
+        try:
+            if not cls.is_enabled(session):
+                return
+            now = datetime.now()
+            condition = (table.c.scope == scope) & (table.c.ref_id == ref_id)
+            result = session.execute(
+                update(table).where(condition).values(version=table.c.version + 1, updated_at=now)
+            )
+            if result.rowcount == 0:
+                try:
+                    session.execute(insert(table).values(scope=scope, ref_id=ref_id, version=1, updated_at=now))
+                except IntegrityError:
+                    # 并发插入：改为递增对方刚插入的记录
+                    session.rollback()
+                    session.execute(
+                        update(table).where(condition).values(version=table.c.version + 1, updated_at=now)
+                    )
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"更新认证版本号失败: scope={scope}, ref_id={ref_id}, 错误: {str(e)}")
+        finally:
+            DatabaseService.close_session(session)
+
+    @classmethod
+    def _bump_local(cls, key: VersionKey, should_drop):
+        with cls._lock:
+            cls._versions = dict(cls._versions)
+            cls._versions[key] = cls._versions.get(key, 0) + 1
+            cls._generation += 1
+            for user_id in [uid for uid, entry in cls._entries.items() if should_drop(uid, entry[0])]:
+                del cls._entries[user_id]
+
+    @classmethod
+    def bump_user(cls, user_id):
+        """用户信息（网点、角色、状态）修改或删除并提交后调用"""
+        user_id = int(user_id)
+        cls._bump_shared(SCOPE_USER, user_id)
+        cls._bump_local((SCOPE_USER, user_id), lambda uid, principal: uid == user_id)
+
+    @classmethod
+    def bump_role(cls, role_id):
+        """角色名称或角色权限修改、角色删除并提交后调用"""
+        role_id = int(role_id)
+        cls._bump_shared(SCOPE_ROLE, role_id)
+        cls._bump_local((SCOPE_ROLE, role_id), lambda uid, principal: principal['role_id'] == role_id)
+
+    @classmethod
+    def bump_all(cls):
+        """批量修改用户/角色后调用，使全部缓存失效"""
+        cls._bump_shared(SCOPE_ALL, 0)
+        cls._bump_local((SCOPE_ALL, 0), lambda uid, principal: True)
+
+    @classmethod
+    def clear(cls):
+        """清空进程内缓存、已读取的版本号和统计（测试使用）"""
+        with cls._lock:
+            cls._entries.clear()
+            cls._versions = {}
+            cls._generation += 1
+            cls._last_poll = 0.0
+            for name in cls._counters:
+                cls._counters[name] = 0
+
+    @classmethod
+    def stats(cls) -> Dict[str, int]:
+        with cls._lock:
+            return dict(cls._counters, size=len(cls._entries))
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+查询次数预算
+统计每个请求（或一段代码）执行的SQL语句数和数据库耗时，用于发现 N+1 查询：
+- 不单独注册数据库事件：请求的语句数和耗时直接读取 RequestTracer 的追踪记录，
+  逐条语句（识别重复语句、代码块统计）由 RequestTracer 的语句观察者回调提供
+- QueryBudget.init_app(app) 按接口（方法 + 路由规则，如 "GET /api/dashboard/display-rates/<token>"）汇总，
+  设置 QUERY_BUDGET_ENABLED=true 时 create_app() 自动开启
+- 接口预算来自 set_budget() 或 JSON 文件（QUERY_BUDGET_FILE，格式 {"GET /api/...": 12}）；
+  超出预算记为违规，strict 模式（测试应用默认开启）下直接抛出 QueryBudgetExceeded，和功能错误一样让测试失败，
+  否则只记录警告日志
+- QueryBudget.limit(n) 用于测试中限制一段服务层代码的语句数
+- report() 列出语句数最多的接口，以及最差一次请求中重复执行最多的语句（N+1 的典型特征）
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from flask import current_app, g, has_request_context, request
+
+from services.request_tracing import RequestTracer
+
+logger = logging.getLogger(__name__)
+
+# 报告中每个接口列出的重复语句数
+TOP_STATEMENTS = 3
+
+_WHITESPACE = re.compile(r'\s+')
+# IN 列表展开后长度不同的同一语句归为一类
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*(?:\?|%s|%\(\w+\)s|:\w+|__\[POSTCOMPILE_\w+\])\s*,?)+\)', re.I)
+
+
+def normalize_statement(statement: str) -> str:
+    return _IN_LIST.sub('IN (...)', _WHITESPACE.sub(' ', statement).strip())[:300]
+
+
+class QueryBudgetExceeded(AssertionError):
+    """语句数超出预算"""
+
+
+class QueryCapture:
+    """一个请求或一段代码内执行的语句"""
+
+    __slots__ = ('label', 'count', 'db_ms', 'statements')
+
+    def __init__(self, label: str):
+        self.label = label
+        self.count = 0
+        self.db_ms = 0.0
+        self.statements: Counter = Counter()
+
+    def record(self, statement: str, elapsed_ms: float):
+        self.count += 1
+        self.db_ms += elapsed_ms
+        self.statements[normalize_statement(statement)] += 1
+
+    def repeated(self, top: int = TOP_STATEMENTS) -> List[Dict[str, Any]]:
+        """重复执行的语句（次数从多到少）"""
+        return [{'sql': sql, 'count': count} for sql, count in self.statements.most_common(top) if count > 1]
+
+    def describe(self, budget: int) -> str:
+        lines = [f"{self.label} 执行了 {self.count} 条SQL，预算 {budget} 条（数据库耗时 {self.db_ms:.1f}ms）"]
+        for item in self.repeated():
+            lines.append(f"  x{item['count']}: {item['sql']}")
+        return '\n'.join(lines)
+
+
+class QueryBudget:
+    """按接口统计SQL语句数并检查预算"""
+
+    _lock = threading.Lock()
+    _installed = False
+    _local = threading.local()
+    _budgets: Dict[str, int] = {}
+    # 接口 -> 请求数、语句数、数据库耗时、最差一次请求
+    _stats: Dict[str, Dict[str, Any]] = {}
+    _violations: List[Dict[str, Any]] = []
+
+    @classmethod
+    def start(cls):
+        """开始统计（注册为 RequestTracer 的语句观察者，可重复调用）"""
+        with cls._lock:
+            if cls._installed:
+                return
+            cls._installed = True
+        RequestTracer.add_statement_observer(cls._on_statement)
+
+    @classmethod
+    def stop(cls):
+        with cls._lock:
+            if not cls._installed:
+                return
+            cls._installed = False
+        RequestTracer.remove_statement_observer(cls._on_statement)
+
+    @classmethod
+    def reset(cls):
+        """清空统计和违规记录（预算保留）"""
+        with cls._lock:
+            cls._stats = {}
+            cls._violations = []
+
+    @classmethod
+    def init_from_env(cls, app):
+        """设置 QUERY_BUDGET_ENABLED=true 时开启，QUERY_BUDGET_FILE 指定预算文件"""
+        if os.environ.get('QUERY_BUDGET_ENABLED', 'false').lower() not in ('1', 'true', 'yes'):
+            return
+        path = os.environ.get('QUERY_BUDGET_FILE')
+        if path:
+            cls.load_budgets(path)
+        cls.init_app(app)
+        logger.info(f"查询次数预算统计已开启，预算文件: {path or '未设置'}")
+
+    @classmethod
+    def init_app(cls, app, strict: Optional[bool] = None):
+        """
+        注册请求钩子
+
+        Args:
+            app: Flask 应用
+            strict: 超出预算时是否抛出 QueryBudgetExceeded，默认在 app.testing 时开启
+        """
+        # 请求的语句数和耗时来自追踪记录，应用未启用请求追踪时一并启用
+        if 'request_tracer' not in app.extensions:
+            RequestTracer.init_app(app)
+        cls.start()
+        if strict is not None:
+            app.config['QUERY_BUDGET_STRICT'] = strict
+        app.before_request(cls._before_request)
+        app.after_request(cls._after_request)
+        app.teardown_request(cls._teardown_request)
+
+    # ------------------------------------------------------------------
+    # 预算
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def set_budget(cls, endpoint: str, max_statements: int):
+        """设置接口预算，endpoint 为 "方法 路由规则"，如 "GET /api/dashboard/business-stats" """
+        with cls._lock:
+            cls._budgets[endpoint] = int(max_statements)
+
+    @classmethod
+    def clear_budgets(cls):
+        with cls._lock:
+            cls._budgets = {}
+
+    @classmethod
+    def load_budgets(cls, path: str):
+        with open(path, 'r', encoding='utf-8') as f:
+            for endpoint, max_statements in json.load(f).items():
+                cls.set_budget(endpoint, max_statements)
+
+    @classmethod
+    def budget_for(cls, endpoint: str) -> Optional[int]:
+        return cls._budgets.get(endpoint)
+
+    # ------------------------------------------------------------------
+    # 统计
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def _captures(cls) -> List[QueryCapture]:
+        captures = getattr(cls._local, 'captures', None)
+        if captures is None:
+            captures = cls._local.captures = []
+        return captures
+
+    @classmethod
+    @contextmanager
+    def capture(cls, label: str = 'block'):
+        """统计代码块内本线程执行的语句，嵌套时外层也计入"""
+        cls.start()
+        capture = QueryCapture(label)
+        captures = cls._captures()
+        captures.append(capture)
+        try:
+            yield capture
+        finally:
+            captures.remove(capture)
+
+    @classmethod
+    @contextmanager
+    def limit(cls, max_statements: int, label: str = 'block'):
+        """代码块内的语句数超过 max_statements 时抛出 QueryBudgetExceeded"""
+        with cls.capture(label) as capture:
+            yield capture
+        if capture.count > max_statements:
+            raise QueryBudgetExceeded(capture.describe(max_statements))
+
+    @classmethod
+    def _on_statement(cls, statement: str, elapsed_ms: float):
+        for capture in getattr(cls._local, 'captures', None) or ():
+            capture.record(statement, elapsed_ms)
+
+    # ------------------------------------------------------------------
+    # 请求钩子
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def _before_request(cls):
+        capture = QueryCapture('<request>')
+        cls._captures().append(capture)
+        g._query_budget = capture
+
+    @classmethod
+    def _teardown_request(cls, exc=None):
+        capture = g.pop('_query_budget', None) if has_request_context() else None
+        if capture is not None and capture in cls._captures():
+            cls._captures().remove(capture)
+
+    @classmethod
+    def _after_request(cls, response):
+        capture = g.get('_query_budget')
+        if capture is None:
+            return response
+        # 之后的语句（如提交）仍计入，直到 teardown；这里汇总到目前为止的统计
+        endpoint = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        capture.label = f'{request.method} {endpoint}'
+        usage = RequestTracer.db_usage()
+        if usage is not None:
+            capture.count, capture.db_ms = usage
+        cls._record(capture)
+
+        budget = cls.budget_for(capture.label)
+        if budget is not None and capture.count > budget:
+            message = capture.describe(budget)
+            with cls._lock:
+                cls._violations.append({'endpoint': capture.label, 'count': capture.count, 'budget': budget,
+                                        'repeated': capture.repeated()})
+            if current_app.config.get('QUERY_BUDGET_STRICT', current_app.testing):
+                raise QueryBudgetExceeded(message)
+            logger.warning(f"查询次数超出预算: {message}")
+        return response
+
+    @classmethod
+    def _record(cls, capture: QueryCapture):
+        with cls._lock:
+            stats = cls._stats.get(capture.label)
+            if stats is None:
+                stats = cls._stats[capture.label] = {
+                    'requests': 0, 'statements': 0, 'max_statements': -1, 'db_ms': 0.0, 'max_db_ms': 0.0,
+                    'repeated': []
+                }
+            stats['requests'] += 1
+            stats['statements'] += capture.count
+            stats['db_ms'] += capture.db_ms
+            stats['max_db_ms'] = max(stats['max_db_ms'], capture.db_ms)
+            if capture.count > stats['max_statements']:
+                stats['max_statements'] = capture.count
+                stats['repeated'] = capture.repeated()
+
+    # ------------------------------------------------------------------
+    # 报告
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def violations(cls) -> List[Dict[str, Any]]:
+        with cls._lock:
+            return list(cls._violations)
+
+    @classmethod
+    def report(cls, top: int = 10) -> List[Dict[str, Any]]:
+        """语句数最多的接口（按单次请求最大语句数排序）"""
+        with cls._lock:
+            items = [(endpoint, dict(stats)) for endpoint, stats in cls._stats.items()]
+            budgets = dict(cls._budgets)
+        items.sort(key=lambda item: (-item[1]['max_statements'], -item[1]['db_ms']))
+        return [
+            {
+                'endpoint': endpoint,
+                'requests': stats['requests'],
+                'max_statements': stats['max_statements'],
+                'avg_statements': round(stats['statements'] / stats['requests'], 1),
+                'db_ms': round(stats['db_ms'], 3),
+                'max_db_ms': round(stats['max_db_ms'], 3),
+                'budget': budgets.get(endpoint),
+                'repeated': stats['repeated']
+            }
+            for endpoint, stats in items[:top]
+        ]
+
+    @classmethod
+    def render_report(cls, top: int = 10) -> str:
+        rows = cls.report(top)
+        if not rows:
+            return ''
+        lines = [f"{'接口':<55} {'请求':>6} {'最多SQL':>8} {'平均SQL':>8} {'预算':>6} {'DB耗时(ms)':>11}"]
+        for row in rows:
+            budget = '-' if row['budget'] is None else str(row['budget'])
+            flag = ' !' if row['budget'] is not None and row['max_statements'] > row['budget'] else ''
+            lines.append(f"{row['endpoint']:<55} {row['requests']:>6} {row['max_statements']:>8} "
+                         f"{row['avg_statements']:>8} {budget:>6} {row['db_ms']:>11.1f}{flag}")
+            for item in row['repeated']:
+                lines.append(f"    x{item['count']}: {item['sql'][:120]}")
+        return '\n'.join(lines)
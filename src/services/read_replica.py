@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+只读副本路由
+查询、导出、统计类接口用 @read_replica() 标记后，接口内 DatabaseService.get_session() 返回读副本会话：
+- 副本地址由 DB_REPLICA_URL 配置（MySQL 从库，测试时可用另一个本地 MySQL 或 SQLite 副本）；未配置时一律使用主库
+- 副本延迟（MySQL 的 Seconds_Behind_Source）超过容忍度（DB_REPLICA_MAX_LAG_SECONDS，默认5秒，
+  可按接口覆盖）、复制中断或副本无法连接时自动回退到主库；健康检查结果缓存 DB_REPLICA_CHECK_SECONDS（默认5秒）
+- 读副本会话中的写入（flush 或 INSERT/UPDATE/DELETE 语句，如接口内记录操作日志）仍发往主库
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Dict, Optional
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql.dml import UpdateBase
+
+from services import db_service
+
+logger = logging.getLogger(__name__)
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _is_write(clause) -> bool:
+    if clause is None:
+        return False
+    if isinstance(clause, UpdateBase):
+        return True
+    if getattr(clause, 'is_dml', False):
+        return True
+    text_value = getattr(clause, 'text', None)
+    return isinstance(text_value, str) and text_value.lstrip()[:6].upper() in db_service._WRITE_PREFIXES
+
+
+class ReplicaSession(Session):
+    """读取走副本、写入走主库的会话"""
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or _is_write(clause):
+            return db_service.SessionLocal.kw['bind']
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+
+class ReadReplica:
+    """读副本引擎、健康检查与路由统计"""
+
+    _lock = threading.Lock()
+    _engine = None
+    _session_factory: Optional[sessionmaker] = None
+    _configured_url: Optional[str] = None
+    _status: Dict[str, Any] = {'checked_at': None, 'lag_seconds': None, 'error': None}
+    _counters = {'routed': 0, 'fallback': 0}
+
+    @staticmethod
+    def max_lag_seconds() -> float:
+        return _env_number('DB_REPLICA_MAX_LAG_SECONDS', 5)
+
+    @staticmethod
+    def check_interval() -> float:
+        return _env_number('DB_REPLICA_CHECK_SECONDS', 5)
+
+    @classmethod
+    def configure(cls, url: Optional[str] = None, engine=None):
+        """
+        配置副本（默认读取 DB_REPLICA_URL）；传入 engine 时直接使用
+        重复调用会替换原有引擎并清除健康检查结果
+        """
+        with cls._lock:
+            if cls._engine is not None and cls._engine is not engine:
+                cls._engine.dispose()
+            cls._engine = None
+            cls._session_factory = None
+            cls._status = {'checked_at': None, 'lag_seconds': None, 'error': None}
+
+            url = url if url is not None else os.getenv('DB_REPLICA_URL')
+            cls._configured_url = url or ''
+            if engine is None and url:
+                pool_config = db_service.get_pool_config()
+                pool_config['pool_size'] = db_service._env_int('DB_REPLICA_POOL_SIZE', pool_config['pool_size'])
+                pool_config['max_overflow'] = db_service._env_int('DB_REPLICA_MAX_OVERFLOW', pool_config['max_overflow'])
+                connect_args = {'check_same_thread': False} if url.startswith('sqlite') else {}
+                engine = create_engine(url, connect_args=connect_args, **pool_config)
+            if engine is None:
+                return
+            cls._engine = engine
+            cls._session_factory = sessionmaker(class_=ReplicaSession, autocommit=False, autoflush=False, bind=engine)
+            db_service.register_session_listeners(cls._session_factory)
+            logger.info(f"读副本已配置: {engine.url.render_as_string(hide_password=True)}")
+
+    @classmethod
+    def engine(cls):
+        if cls._configured_url is None:
+            cls.configure()
+        return cls._engine
+
+    @staticmethod
+    def _query_lag(conn) -> Optional[float]:
+        """副本延迟秒数；复制中断返回 None，非从库（如测试用的独立副本）视为无延迟"""
+        if conn.dialect.name != 'mysql':
+            return 0.0
+        for statement, column in (('SHOW REPLICA STATUS', 'Seconds_Behind_Source'),
+                                  ('SHOW SLAVE STATUS', 'Seconds_Behind_Master')):
+            try:
+                row = conn.execute(text(statement)).mappings().first()
+            except Exception:
+                continue
+            if row is None:
+                return 0.0
+            lag = row.get(column)
+            return float(lag) if lag is not None else None
+        return 0.0
+
+    @classmethod
+    def _check(cls):
+        now = time.monotonic()
+        status = cls._status
+        if status['checked_at'] is not None and now - status['checked_at'] < cls.check_interval():
+            return status
+        try:
+            with cls._engine.connect() as conn:
+                lag = cls._query_lag(conn)
+            status = {'checked_at': now, 'lag_seconds': lag,
+                      'error': None if lag is not None else '复制已中断'}
+        except Exception as e:
+            logger.warning(f"读副本不可用，回退到主库: {str(e)}")
+            status = {'checked_at': now, 'lag_seconds': None, 'error': str(e)}
+        cls._status = status
+        return status
+
+    @classmethod
+    def session_factory(cls, max_lag_seconds: Optional[float] = None):
+        """
+        返回读副本会话工厂；未配置、延迟超过容忍度或不可用时返回主库会话工厂
+
+        Args:
+            max_lag_seconds: 本次读取可接受的最大延迟，默认 DB_REPLICA_MAX_LAG_SECONDS
+        """
+        if cls.engine() is None:
+            return db_service.SessionLocal
+        limit = cls.max_lag_seconds() if max_lag_seconds is None else max_lag_seconds
+        status = cls._check()
+        usable = status['lag_seconds'] is not None and status['lag_seconds'] <= limit
+        with cls._lock:
+            cls._counters['routed' if usable else 'fallback'] += 1
+        return cls._session_factory if usable else db_service.SessionLocal
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        with cls._lock:
+            return dict(
+                cls._counters,
+                configured=cls._engine is not None,
+                lag_seconds=cls._status['lag_seconds'],
+                error=cls._status['error']
+            )
+
+    @classmethod
+    def reset_stats(cls):
+        with cls._lock:
+            for name in cls._counters:
+                cls._counters[name] = 0
+
+
+@contextmanager
+def replica_scope(max_lag_seconds: Optional[float] = None):
+    """在此范围内 DatabaseService.get_session() 优先使用读副本"""
+    token = db_service._read_replica_scope.set(
+        ReadReplica.max_lag_seconds() if max_lag_seconds is None else max_lag_seconds
+    )
+    try:
+        yield
+    finally:
+        db_service._read_replica_scope.reset(token)
+
+
+def read_replica(max_lag_seconds: Optional[float] = None):
+    """
+    只读接口装饰器（放在 token_required / 权限装饰器之后，认证仍读主库）
+
+    Args:
+        max_lag_seconds: 该接口可接受的副本延迟，默认 DB_REPLICA_MAX_LAG_SECONDS
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            with replica_scope(max_lag_seconds):
+                return f(*args, **kwargs)
+        return decorated
+    return decorator
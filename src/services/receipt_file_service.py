@@ -57,6 +57,9 @@ class ReceiptFileService:
             logger.error(f"获取月份列表失败: {e}")
             return []
     
+    # 按文件名批量查询交易时每批的文件数
+    FILENAME_BATCH_SIZE = 500
+
     @staticmethod
     def get_receipt_files(year: str, month: str, branch_id: Optional[int] = None) -> List[Dict[str, Any]]:
         """获取指定年月的票据文件列表"""
@@ -79,79 +82,75 @@ class ReceiptFileService:
                         'modified_time': datetime.fromtimestamp(stat.st_mtime).isoformat(),
                         'print_count': 0  # 默认值，后续从数据库获取
                     }
-                    
-                    # 尝试从文件名解析交易信息
-                    transaction_info = ReceiptFileService._parse_filename(filename)
-                    if transaction_info:
-                        file_info.update(transaction_info)
-                    
                     files.append(file_info)
             
+            # 尝试从文件名解析交易信息（含打印次数），所有文件按批查询，不再逐个文件查询
+            transactions = ReceiptFileService._load_transactions(
+                [f['filename'] for f in files if ReceiptFileService._is_transaction_filename(f['filename'])]
+            )
+            for file_info in files:
+                transaction_info = ReceiptFileService._parse_filename(file_info['filename'], transactions)
+                if transaction_info:
+                    file_info.update(transaction_info)
+            
             # 按修改时间降序排列
             files.sort(key=lambda x: x['modified_time'], reverse=True)
             
-            # 获取打印次数信息
-            ReceiptFileService._update_print_counts(files)
-            
             return files
         except Exception as e:
             logger.error(f"获取票据文件列表失败: {e}")
             return []
     
     @staticmethod
-    def _parse_filename(filename: str) -> Optional[Dict[str, Any]]:
-        """解析票据文件名获取交易信息"""
-        try:
-            # 文件名格式通常为：A005202506240041.pdf
-            # A005: 网点代码，20250624: 日期，0041: 流水号
-            name_without_ext = filename.replace('.pdf', '').replace('.PDF', '')
-            
-            if len(name_without_ext) >= 16:
-                # 提取可能的交易编号
-                transaction_no = name_without_ext
-                
-                # 尝试从数据库查找对应的交易记录
-                session = DatabaseService.get_session()
-                try:
-                    transaction = session.query(ExchangeTransaction).filter(
-                        ExchangeTransaction.receipt_filename == filename
-                    ).first()
-                    
-                    if transaction:
-                        return {
-                            'transaction_no': transaction.transaction_no,
-                            'customer_name': transaction.customer_name,
-                            'amount': float(transaction.amount) if transaction.amount else 0,
-                            'currency_id': transaction.currency_id,
-                            'transaction_date': transaction.transaction_date.isoformat() if transaction.transaction_date else None,
-                            'print_count': transaction.print_count or 0
-                        }
-                finally:
-                    DatabaseService.close_session(session)
-            
-            return None
-        except Exception as e:
-            logger.error(f"解析文件名失败 {filename}: {e}")
-            return None
+    def _is_transaction_filename(filename: str) -> bool:
+        """文件名格式通常为：A005202506240041.pdf（A005: 网点代码，20250624: 日期，0041: 流水号）"""
+        return len(filename.replace('.pdf', '').replace('.PDF', '')) >= 16
     
     @staticmethod
-    def _update_print_counts(files: List[Dict[str, Any]]) -> None:
-        """更新文件的打印次数信息"""
+    def _load_transactions(filenames: List[str]) -> Dict[str, Dict[str, Any]]:
+        """按票据文件名批量查询交易记录，同名文件取最早的交易"""
+        transactions = {}
+        if not filenames:
+            return transactions
+        
+        session = DatabaseService.get_session()
         try:
-            session = DatabaseService.get_session()
-            try:
-                for file_info in files:
-                    if 'transaction_no' in file_info:
-                        transaction = session.query(ExchangeTransaction).filter(
-                            ExchangeTransaction.receipt_filename == file_info['filename']
-                        ).first()
-                        
-                        if transaction:
-                            file_info['print_count'] = transaction.print_count or 0
-            finally:
-                DatabaseService.close_session(session)
+            for start in range(0, len(filenames), ReceiptFileService.FILENAME_BATCH_SIZE):
+                batch = filenames[start:start + ReceiptFileService.FILENAME_BATCH_SIZE]
+                rows = session.query(ExchangeTransaction).filter(
+                    ExchangeTransaction.receipt_filename.in_(batch)
+                ).order_by(ExchangeTransaction.id).all()
+                for transaction in rows:
+                    if transaction.receipt_filename in transactions:
+                        continue
+                    transactions[transaction.receipt_filename] = {
+                        'transaction_no': transaction.transaction_no,
+                        'customer_name': transaction.customer_name,
+                        'amount': float(transaction.amount) if transaction.amount else 0,
+                        'currency_id': transaction.currency_id,
+                        'transaction_date': transaction.transaction_date.isoformat() if transaction.transaction_date else None,
+                        'print_count': transaction.print_count or 0
+                    }
         except Exception as e:
-            logger.error(f"更新打印次数失败: {e}")
+            logger.error(f"查询票据交易记录失败: {e}")
+        finally:
+            DatabaseService.close_session(session)
+        return transactions
+    
+    @staticmethod
+    def _parse_filename(filename: str, transactions: Optional[Dict[str, Dict[str, Any]]] = None) -> Optional[Dict[str, Any]]:
+        """
+        解析票据文件名获取交易信息
+        
+        Args:
+            filename: 票据文件名
+            transactions: _load_transactions 批量查询的结果，未提供时单独查询该文件
+        """
+        if not ReceiptFileService._is_transaction_filename(filename):
+            return None
+        if transactions is None:
+            transactions = ReceiptFileService._load_transactions([filename])
+        return transactions.get(filename)
     
     @staticmethod
     def record_print_action(filename: str, operator_id: int) -> bool:
@@ -0,0 +1,243 @@
+"""
+票据编号分配器
+在独立的短事务中分配票据编号，避免整笔交易期间一直持有 receipt_sequences 行锁；
+外层事务回滚时写入作废记录，保证编号严格连续可追溯
+"""
+
+import logging
+from datetime import date, datetime
+from typing import List, Optional
+
+from sqlalchemy import case, event, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models.exchange_models import ExchangeTransaction, ReceiptSequence, VoidedReceiptNumber
+from services.db_service import DatabaseService
+from services.reference_data_cache import ReferenceDataCache
+
+logger = logging.getLogger(__name__)
+
+# 外层会话 info 中记录已分配但尚未随外层事务提交的票据编号
+PENDING_KEY = 'pending_receipt_numbers'
+LISTENING_KEY = 'receipt_allocator_listening'
+
+
+class ReceiptSequenceAllocator:
+    """票据编号分配器（网点代码取自参考数据缓存 + 独立短事务分配）"""
+
+    @staticmethod
+    def get_branch_code(branch_id: int, session: Session) -> str:
+        """获取网点代码（参考数据缓存）"""
+        branch = ReferenceDataCache.get_branch(session, branch_id)
+        if branch is None or not branch.branch_code:
+            raise ValueError(f"网点ID {branch_id} 不存在")
+        return branch.branch_code
+
+    @staticmethod
+    def invalidate_branch_code(branch_id: Optional[int] = None):
+        """网点代码变更或网点删除后清除缓存（网点缓存按版本整体失效）"""
+        ReferenceDataCache.invalidate_branches()
+
+    @staticmethod
+    def _use_autonomous_transaction(session: Session) -> bool:
+        """
+        MySQL 下使用独立短事务分配编号；SQLite 是库级写锁，外层事务写入后
+        独立事务无法再写入，因此沿用外层事务分配（回滚时编号随之回滚，不产生空号）
+        """
+        bind = session.get_bind()
+        return bind.dialect.name != 'sqlite'
+
+    @classmethod
+    def _allocate_in(cls, session: Session, branch_id: int, count: int) -> List[dict]:
+        """
+        在给定会话中分配 count 个连续编号（不提交）
+        递增和跨日重置在一条 UPDATE 中完成，语句本身即获取行锁（SQLite 为库级写锁），
+        不存在先读后写的竞争窗口
+        """
+        branch_code = cls.get_branch_code(branch_id, session)
+        today = date.today()
+        table = ReceiptSequence.__table__
+
+        result = session.execute(
+            update(table)
+            .where(table.c.branch_id == branch_id)
+            .values(
+                current_sequence=case(
+                    (table.c.last_date == today, table.c.current_sequence + count),
+                    else_=count
+                ),
+                last_date=today,
+                updated_at=datetime.utcnow()
+            )
+        )
+
+        if result.rowcount == 0:
+            # 如果没有序列记录，创建一个
+            session.execute(insert(table).values(
+                branch_id=branch_id,
+                current_sequence=count,
+                last_date=today,
+                updated_at=datetime.utcnow()
+            ))
+            last = count
+        else:
+            last = session.execute(
+                select(table.c.current_sequence).where(table.c.branch_id == branch_id)
+            ).scalar()
+
+        date_str = today.strftime('%Y%m%d')
+        return [
+            {
+                'branch_id': branch_id,
+                'receipt_number': f"{branch_code}{date_str}{seq:04d}",
+                'sequence_date': today,
+                'sequence_no': seq
+            }
+            for seq in range(last - count + 1, last + 1)
+        ]
+
+    @classmethod
+    def _allocate_committed(cls, session_factory, branch_id: int, count: int) -> List[dict]:
+        """在独立会话中分配并立即提交；首次创建序列行时并发插入冲突则重试"""
+        for attempt in range(2):
+            alloc_session = session_factory()
+            try:
+                allocated = cls._allocate_in(alloc_session, branch_id, count)
+                alloc_session.commit()
+                return allocated
+            except IntegrityError:
+                alloc_session.rollback()
+                if attempt:
+                    raise
+            except Exception:
+                alloc_session.rollback()
+                raise
+            finally:
+                DatabaseService.close_session(alloc_session)
+
+    @classmethod
+    def allocate(
+        cls,
+        branch_id: int,
+        count: int = 1,
+        session: Optional[Session] = None,
+        autonomous: Optional[bool] = None
+    ) -> List[str]:
+        """
+        为网点分配 count 个连续票据编号
+        格式：{网点代码}{日期YYYYMMDD}{4位序列号}
+
+        Args:
+            branch_id: 网点ID
+            count: 需要的编号数量（批量交易一次分配整段编号）
+            session: 外层业务会话（可选）。提供时编号与该会话的事务绑定，
+                     事务回滚则写入作废记录
+            autonomous: 是否使用独立短事务分配，默认按数据库类型决定
+
+        Returns:
+            list: 票据编号列表
+        """
+        if count < 1:
+            raise ValueError("count 必须大于0")
+
+        # 没有外层会话：自行创建会话分配并提交（独立事务，不并入请求内的外层事务）
+        if session is None:
+            with DatabaseService.autonomous_transaction():
+                allocated = cls._allocate_committed(DatabaseService.get_session, branch_id, count)
+            return [item['receipt_number'] for item in allocated]
+
+        if autonomous is None:
+            autonomous = cls._use_autonomous_transaction(session)
+
+        # 沿用外层事务：编号随外层事务一起提交或回滚
+        if not autonomous:
+            allocated = cls._allocate_in(session, branch_id, count)
+            return [item['receipt_number'] for item in allocated]
+
+        # 独立短事务：行锁只持有到分配提交为止
+        bind = session.get_bind()
+        allocated = cls._allocate_committed(lambda: Session(bind=bind, autoflush=False), branch_id, count)
+
+        cls._track_pending(session, bind, allocated)
+        return [item['receipt_number'] for item in allocated]
+
+    @classmethod
+    def _track_pending(cls, session: Session, bind, allocated: List[dict]):
+        """把独立事务分配的编号挂到外层事务上，外层提交则确认，回滚则作废"""
+        if not session.in_transaction():
+            session.begin()
+
+        session.info.setdefault(PENDING_KEY, []).extend(allocated)
+        session.info['receipt_allocator_bind'] = bind
+
+        if not session.info.get(LISTENING_KEY):
+            event.listen(session, 'after_commit', cls._on_commit)
+            event.listen(session, 'after_transaction_end', cls._on_transaction_end)
+            session.info[LISTENING_KEY] = True
+
+    @staticmethod
+    def _on_commit(session: Session):
+        session.info.pop(PENDING_KEY, None)
+
+    @classmethod
+    def _on_transaction_end(cls, session: Session, transaction):
+        # 只处理最外层事务；提交时 _on_commit 已清空待确认列表
+        if transaction.parent is not None:
+            return
+        pending = session.info.pop(PENDING_KEY, None)
+        if pending:
+            cls.void_numbers(session.info.get('receipt_allocator_bind'), pending)
+
+    @staticmethod
+    def void_numbers(bind, allocated: List[dict], reason: str = 'transaction_rollback'):
+        """在独立事务中写入作废记录（补偿记录），失败只记录日志"""
+        void_session = Session(bind=bind) if bind is not None else DatabaseService.get_session()
+        try:
+            for item in allocated:
+                void_session.add(VoidedReceiptNumber(
+                    branch_id=item['branch_id'],
+                    receipt_number=item['receipt_number'],
+                    sequence_date=item['sequence_date'],
+                    sequence_no=item['sequence_no'],
+                    reason=reason,
+                    created_at=datetime.now()
+                ))
+            void_session.commit()
+            logger.warning(f"外层事务回滚，已作废票据编号: {[item['receipt_number'] for item in allocated]}")
+        except Exception as e:
+            void_session.rollback()
+            logger.error(f"写入作废票据编号失败: {[item['receipt_number'] for item in allocated]}, 错误: {str(e)}")
+        finally:
+            void_session.close()
+
+    @classmethod
+    def find_sequence_gaps(cls, session: Session, branch_id: int, sequence_date: date) -> List[str]:
+        """
+        检查指定网点某日的票据编号连续性
+        已使用编号 = 交易记录中的编号 ∪ 作废记录中的编号
+
+        Returns:
+            list: 缺失的票据编号（为空表示连续）
+        """
+        branch_code = cls.get_branch_code(branch_id, session)
+        prefix = f"{branch_code}{sequence_date.strftime('%Y%m%d')}"
+
+        used = {
+            no for (no,) in session.query(ExchangeTransaction.transaction_no).filter(
+                ExchangeTransaction.branch_id == branch_id,
+                ExchangeTransaction.transaction_no.like(f"{prefix}%")
+            )
+        }
+        used.update(
+            no for (no,) in session.query(VoidedReceiptNumber.receipt_number).filter(
+                VoidedReceiptNumber.branch_id == branch_id,
+                VoidedReceiptNumber.sequence_date == sequence_date
+            )
+        )
+
+        sequences = sorted(int(no[len(prefix):]) for no in used if no[len(prefix):].isdigit())
+        if not sequences:
+            return []
+        present = set(sequences)
+        return [f"{prefix}{seq:04d}" for seq in range(1, sequences[-1] + 1) if seq not in present]
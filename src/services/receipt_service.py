@@ -5,8 +5,10 @@
 
 from datetime import datetime, date
 from sqlalchemy import and_
-from models.exchange_models import ReceiptSequence, Branch
+from models.exchange_models import ReceiptSequence
 from services.db_service import DatabaseService
+from services.receipt_sequence_allocator import ReceiptSequenceAllocator
+from services.reference_data_cache import ReferenceDataCache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -27,69 +29,28 @@ class ReceiptService:
         Returns:
             str: 生成的票据编号
         """
+        return ReceiptService.generate_receipt_numbers(branch_id, 1, session)[0]
+
+    @staticmethod
+    def generate_receipt_numbers(branch_id, count, session=None):
+        """
+        一次分配多个连续票据编号（批量交易使用，只加一次序列锁）
         
-        # 如果没有提供session，则创建一个
-        should_close_session = False
-        if session is None:
-            session = DatabaseService.get_session()
-            should_close_session = True
+        Args:
+            branch_id: 网点ID
+            count: 编号数量
+            session: 数据库会话（可选，如果不提供则自动创建）
             
+        Returns:
+            list: 票据编号列表
+        """
         try:
-            # 获取网点信息
-            branch = session.query(Branch).filter_by(id=branch_id).first()
-            if not branch:
-                raise ValueError(f"网点ID {branch_id} 不存在")
-            
-            # 当前日期
-            today = date.today()
-            date_str = today.strftime('%Y%m%d')
-            
-            # 使用数据库行锁确保线程安全
-            sequence_record = session.query(ReceiptSequence).filter_by(
-                branch_id=branch_id
-            ).with_for_update().first()
-            
-            if not sequence_record:
-                # 如果没有序列记录，创建一个
-                sequence_record = ReceiptSequence(
-                    branch_id=branch_id,
-                    current_sequence=0,
-                    last_date=today,
-                    updated_at=datetime.utcnow()
-                )
-                session.add(sequence_record)
-                session.flush()  # 确保记录已插入
-            
-            # 检查日期是否变更，如果是新的一天，重置序列号
-            # SQLAlchemy会自动处理DATE类型的转换
-            if sequence_record.last_date != today:
-                sequence_record.current_sequence = 0
-                sequence_record.last_date = today
-            
-            # 递增序列号
-            sequence_record.current_sequence += 1
-            sequence_record.updated_at = datetime.utcnow()
-            
-            # 生成票据编号：网点代码 + 日期 + 4位序列号
-            receipt_number = f"{branch.branch_code}{date_str}{sequence_record.current_sequence:04d}"
-            
-            # 提交更改（如果是外部传入的session，由调用方决定是否提交）
-            if should_close_session:
-                session.commit()
-            
-            logger.info(f"生成票据编号: {receipt_number} (网点: {branch.branch_code}, 日期: {date_str}, 序列: {sequence_record.current_sequence})")
-            
-            return receipt_number
-            
+            receipt_numbers = ReceiptSequenceAllocator.allocate(branch_id, count, session)
+            logger.info(f"生成票据编号: {receipt_numbers} (网点ID: {branch_id})")
+            return receipt_numbers
         except Exception as e:
             logger.error(f"生成票据编号失败: {str(e)}")
-            if should_close_session:
-                session.rollback()
             raise
-            
-        finally:
-            if should_close_session:
-                DatabaseService.close_session(session)
     
     @staticmethod
     def get_current_sequence(branch_id):
@@ -117,7 +78,7 @@ class ReceiptService:
                 }
             
             # 获取网点信息
-            branch = session.query(Branch).filter_by(id=branch_id).first()
+            branch = ReferenceDataCache.get_branch(session, branch_id)
             today = date.today()
             
             # 预测下一个编号
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+参考数据缓存
+网点、币种、网点本币、AMLO机构/网点代码和网点币种启用状态在交易热路径上被反复查询，
+这里提供进程级缓存：
+- 缓存值是与会话无关的只读快照（namedtuple），可以跨请求、跨线程共享
+- 每类数据有独立的版本号，管理接口修改对应表后调用 invalidate_* 使该类缓存整体失效
+- 多进程部署时其他进程无法收到失效通知，缓存另有 TTL（REFERENCE_CACHE_TTL，默认300秒）兜底
+- stats() 返回各类数据的命中/未命中次数
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from typing import Any, Callable, Dict, FrozenSet, Hashable, Optional
+
+from sqlalchemy.orm import Session
+
+from models.exchange_models import Branch, BranchCurrency, Currency
+
+logger = logging.getLogger(__name__)
+
+KIND_BRANCH = 'branch'
+KIND_CURRENCY = 'currency'
+KIND_BRANCH_CURRENCY = 'branch_currency'
+KINDS = (KIND_BRANCH, KIND_CURRENCY, KIND_BRANCH_CURRENCY)
+
+# AMLO报告编号在网点未配置代码时使用的默认值
+DEFAULT_AMLO_CODE = '001'
+
+BranchRef = namedtuple('BranchRef', [c.key for c in Branch.__table__.columns])
+CurrencyRef = namedtuple('CurrencyRef', [c.key for c in Currency.__table__.columns])
+
+
+def _snapshot(ref_type, obj):
+    return ref_type(**{field: getattr(obj, field) for field in ref_type._fields})
+
+
+class ReferenceDataCache:
+    """参考数据进程级缓存（按数据类别版本化失效）"""
+
+    _lock = threading.Lock()
+    _entries: Dict[Hashable, tuple] = {}
+    _versions: Dict[str, int] = {kind: 0 for kind in KINDS}
+    _counters: Dict[str, Dict[str, int]] = {kind: {'hits': 0, 'misses': 0} for kind in KINDS}
+
+    @staticmethod
+    def ttl_seconds() -> float:
+        try:
+            return float(os.environ.get('REFERENCE_CACHE_TTL', 300))
+        except (TypeError, ValueError):
+            return 300.0
+
+    @classmethod
+    def _get(cls, kind: str, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        读取缓存；未命中时调用 loader 加载
+        loader 返回 None（记录不存在）时不缓存，加载期间发生失效时也不写入旧值
+        """
+        cache_key = (kind, key)
+        version = cls._versions[kind]
+        entry = cls._entries.get(cache_key)
+        now = time.monotonic()
+        if entry is not None and entry[0] == version and now - entry[1] < cls.ttl_seconds():
+            with cls._lock:
+                cls._counters[kind]['hits'] += 1
+            return entry[2]
+
+        with cls._lock:
+            cls._counters[kind]['misses'] += 1
+
+        value = loader()
+        if value is not None:
+            with cls._lock:
+                if cls._versions[kind] == version:
+                    cls._entries[cache_key] = (version, now, value)
+        return value
+
+    # ------------------------------------------------------------------
+    # 网点
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def get_branch(cls, session: Session, branch_id: int) -> Optional[BranchRef]:
+        """获取网点快照，不存在时返回 None"""
+        def load():
+            branch = session.query(Branch).filter_by(id=branch_id).first()
+            return _snapshot(BranchRef, branch) if branch else None
+        return cls._get(KIND_BRANCH, branch_id, load)
+
+    @classmethod
+    def get_base_currency_id(cls, session: Session, branch_id: int) -> Optional[int]:
+        """获取网点本币ID"""
+        branch = cls.get_branch(session, branch_id)
+        return branch.base_currency_id if branch else None
+
+    @classmethod
+    def get_amlo_codes(cls, session: Session, branch_id: int) -> Dict[str, str]:
+        """获取网点的AMLO机构代码和网点代码（3位，未配置时为 001）"""
+        branch = cls.get_branch(session, branch_id)
+        if branch is None:
+            logger.warning(f"网点ID {branch_id} 不存在，AMLO代码使用默认值")
+            return {'institution_code': DEFAULT_AMLO_CODE, 'branch_code': DEFAULT_AMLO_CODE}
+        return {
+            'institution_code': str(branch.amlo_institution_code or DEFAULT_AMLO_CODE).zfill(3),
+            'branch_code': str(branch.amlo_branch_code or DEFAULT_AMLO_CODE).zfill(3)
+        }
+
+    # ------------------------------------------------------------------
+    # 币种
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def get_currency(cls, session: Session, currency_id: int) -> Optional[CurrencyRef]:
+        """获取币种快照，不存在时返回 None"""
+        def load():
+            currency = session.query(Currency).filter_by(id=currency_id).first()
+            return _snapshot(CurrencyRef, currency) if currency else None
+        return cls._get(KIND_CURRENCY, currency_id, load)
+
+    @classmethod
+    def get_currency_by_code(cls, session: Session, currency_code: str) -> Optional[CurrencyRef]:
+        """按币种代码获取币种快照"""
+        def load():
+            currency = session.query(Currency).filter_by(currency_code=currency_code).first()
+            return _snapshot(CurrencyRef, currency) if currency else None
+        return cls._get(KIND_CURRENCY, ('code', currency_code), load)
+
+    # ------------------------------------------------------------------
+    # 网点币种启用状态
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def get_disabled_currency_ids(cls, session: Session, branch_id: int) -> FrozenSet[int]:
+        """获取网点禁用的币种ID（branch_currencies 中没有记录的币种默认启用）"""
+        def load():
+            rows = session.query(BranchCurrency.currency_id).filter(
+                BranchCurrency.branch_id == branch_id,
+                BranchCurrency.is_enabled == False  # noqa: E712
+            ).all()
+            return frozenset(row[0] for row in rows)
+        return cls._get(KIND_BRANCH_CURRENCY, branch_id, load)
+
+    # ------------------------------------------------------------------
+    # 失效与统计
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def _invalidate(cls, kind: str):
+        with cls._lock:
+            cls._versions[kind] += 1
+            for cache_key in [k for k in cls._entries if k[0] == kind]:
+                del cls._entries[cache_key]
+
+    @classmethod
+    def invalidate_branches(cls):
+        """网点新增、修改、删除后调用"""
+        cls._invalidate(KIND_BRANCH)
+
+    @classmethod
+    def invalidate_currencies(cls):
+        """币种新增、修改、删除后调用"""
+        cls._invalidate(KIND_CURRENCY)
+
+    @classmethod
+    def invalidate_branch_currencies(cls):
+        """网点币种启用/禁用后调用"""
+        cls._invalidate(KIND_BRANCH_CURRENCY)
+
+    @classmethod
+    def invalidate_all(cls):
+        for kind in KINDS:
+            cls._invalidate(kind)
+
+    @classmethod
+    def stats(cls) -> Dict[str, Dict[str, int]]:
+        """各类数据的命中/未命中次数、缓存条目数和当前版本号"""
+        with cls._lock:
+            sizes = {kind: 0 for kind in KINDS}
+            for kind, _ in cls._entries:
+                sizes[kind] += 1
+            return {
+                kind: {
+                    'hits': cls._counters[kind]['hits'],
+                    'misses': cls._counters[kind]['misses'],
+                    'size': sizes[kind],
+                    'version': cls._versions[kind]
+                }
+                for kind in KINDS
+            }
+
+    @classmethod
+    def reset_stats(cls):
+        with cls._lock:
+            for counters in cls._counters.values():
+                counters['hits'] = 0
+                counters['misses'] = 0
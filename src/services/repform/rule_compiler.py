@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+RuleCompiler - 触发规则编译器
+把 trigger_rules 的 rule_expression 预先编译为闭包，按 (report_type, branch_id)
+缓存在进程内；评估结果与 RuleEngine.evaluate_rule_with_details 完全一致
+版本: v1.0
+"""
+
+import copy
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+Evaluator = Callable[[Dict[str, Any]], Tuple[bool, Dict[str, Any]]]
+
+_NUMERIC_OPERATORS = {
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+}
+
+_RULES_SQL = text("""
+    SELECT
+        id,
+        rule_name,
+        report_type,
+        rule_expression,
+        description_cn,
+        description_en,
+        description_th,
+        priority,
+        allow_continue,
+        warning_message_cn,
+        warning_message_en,
+        warning_message_th,
+        branch_id
+    FROM trigger_rules
+    WHERE report_type = :report_type
+        AND is_active = TRUE
+        AND (branch_id IS NULL OR branch_id = :branch_id)
+    ORDER BY priority DESC, id ASC
+""")
+
+
+def _to_float(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except Exception:
+        return None
+
+
+def _compile_comparator(operator: Any, expected: Any) -> Callable[[Any], bool]:
+    """
+    把单个比较条件编译为 actual -> bool 的闭包
+    语义与 RuleEngine._compare_values 相同，期望值的类型转换只在编译时做一次
+    """
+    none_result = operator in ['!=', 'NOT IN']
+
+    if operator in _NUMERIC_OPERATORS:
+        compare = _NUMERIC_OPERATORS[operator]
+        expected_float = _to_float(expected)
+
+        def numeric(actual):
+            if actual is None:
+                return none_result
+            if expected_float is None:
+                return False
+            try:
+                return compare(float(actual), expected_float)
+            except Exception:
+                return False
+        return numeric
+
+    if operator in ('=', '==', '!=', '<>'):
+        negate = operator in ('!=', '<>')
+        expected_float = _to_float(expected)
+        expected_str = str(expected)
+
+        if operator in ('=', '==') and isinstance(expected, bool):
+            def boolean(actual):
+                if actual is None:
+                    return none_result
+                return bool(actual) == expected
+            return boolean
+
+        def equality(actual):
+            if actual is None:
+                return none_result
+            if expected_float is not None:
+                try:
+                    return (float(actual) == expected_float) != negate
+                except Exception:
+                    pass
+            return (str(actual) == expected_str) != negate
+        return equality
+
+    if operator in ('IN', 'NOT IN'):
+        negate = operator == 'NOT IN'
+        if isinstance(expected, (list, tuple, set)):
+            members = expected
+            try:
+                members = frozenset(expected)
+            except TypeError:
+                pass
+
+            def membership(actual):
+                if actual is None:
+                    return none_result
+                try:
+                    return (actual in members) != negate
+                except TypeError:
+                    return (actual in list(expected)) != negate
+            return membership
+
+        def single(actual):
+            if actual is None:
+                return none_result
+            return (actual == expected) != negate
+        return single
+
+    if operator in ('LIKE', 'NOT LIKE'):
+        negate = operator == 'NOT LIKE'
+        needle = str(expected).lower()
+
+        def like(actual):
+            if actual is None:
+                return none_result
+            return (needle in str(actual).lower()) != negate
+        return like
+
+    def unsupported(actual):
+        if actual is None:
+            return none_result
+        logger.warning(f"Unsupported operator: {operator}")
+        return False
+    return unsupported
+
+
+def _is_well_formed(expression: Any) -> bool:
+    """只编译结构完整的表达式；其余表达式回退到 RuleEngine 的解释执行以保证结果一致"""
+    if not isinstance(expression, dict):
+        return False
+    if not isinstance(expression.get('logic', 'AND'), str):
+        return False
+    conditions = expression.get('conditions', [])
+    if not isinstance(conditions, list):
+        return False
+    for condition in conditions:
+        if not isinstance(condition, dict):
+            return False
+        if 'logic' in condition and 'conditions' in condition and not _is_well_formed(condition):
+            return False
+    return True
+
+
+def compile_expression(expression: Any) -> Evaluator:
+    """
+    编译规则表达式
+
+    Returns:
+        data -> (是否匹配, 条件详情) 的闭包，返回值与
+        RuleEngine.evaluate_rule_with_details(expression, data) 相同
+    """
+    if not _is_well_formed(expression):
+        from services.repform.rule_engine import RuleEngine
+        return lambda data: RuleEngine.evaluate_rule_with_details(expression, data)
+
+    logic = expression.get('logic', 'AND').upper()
+    conditions = expression.get('conditions', [])
+
+    if not conditions:
+        return lambda data: (False, {'matched': [], 'unmatched': []})
+
+    steps = []
+    for condition in conditions:
+        if 'logic' in condition and 'conditions' in condition:
+            steps.append((True, condition.get('logic'), compile_expression(condition)))
+        else:
+            field_name = condition.get('field')
+            operator = condition.get('operator')
+            expected_value = condition.get('value')
+            steps.append((False, (field_name, operator, expected_value),
+                          _compile_comparator(operator, expected_value)))
+
+    def evaluate(data: Dict[str, Any]) -> Tuple[bool, Dict[str, Any]]:
+        matched_conditions = []
+        unmatched_conditions = []
+        results = []
+
+        for nested, spec, step in steps:
+            if nested:
+                nested_result, nested_details = step(data)
+                condition_detail = {
+                    'nested_logic': spec,
+                    'nested_result': nested_result,
+                    'nested_details': nested_details,
+                    'matched': nested_result
+                }
+                result = nested_result
+            else:
+                field_name, operator, expected_value = spec
+                actual_value = data.get(field_name)
+                result = step(actual_value)
+                condition_detail = {
+                    'field': field_name,
+                    'operator': operator,
+                    'expected_value': expected_value,
+                    'actual_value': actual_value,
+                    'matched': result
+                }
+
+            results.append(result)
+            if result:
+                matched_conditions.append(condition_detail)
+            else:
+                unmatched_conditions.append(condition_detail)
+
+        if logic == 'AND':
+            is_triggered = all(results) and len(results) > 0
+        elif logic == 'OR':
+            is_triggered = any(results) and len(results) > 0
+        else:  # NOT
+            is_triggered = not any(results)
+
+        return is_triggered, {
+            'matched': matched_conditions,
+            'unmatched': unmatched_conditions,
+            'logic': logic
+        }
+
+    return evaluate
+
+
+class CompiledRule:
+    """编译后的触发规则（规则行 + 解析后的表达式 + 评估闭包）"""
+
+    __slots__ = ('row', 'expression', 'evaluate')
+
+    def __init__(self, row: Dict[str, Any], expression: Dict[str, Any]):
+        self.row = row
+        self.expression = expression
+        self.evaluate = compile_expression(expression)
+
+
+class RuleCache:
+    """
+    进程内编译规则缓存
+    规则通过 /api/compliance/trigger-rules 修改时调用 invalidate()；
+    其他进程或脚本直接改库的情况由 TTL 兜底（RULE_CACHE_TTL 秒，默认60）
+    """
+
+    _plans: Dict[Tuple[str, int], Tuple[float, int, List[CompiledRule]]] = {}
+    _version = 0
+    _lock = threading.Lock()
+
+    @classmethod
+    def _ttl(cls) -> float:
+        return float(os.environ.get('RULE_CACHE_TTL', '60'))
+
+    @classmethod
+    def get_rules(cls, db_session: Session, report_type: str, branch_id: Optional[int]) -> List[CompiledRule]:
+        """获取 (report_type, branch_id) 的启用规则（按优先级排序），未命中时查询并编译"""
+        key = (report_type, branch_id or 0)
+        entry = cls._plans.get(key)
+        if entry is not None and entry[1] == cls._version and time.monotonic() - entry[0] < cls._ttl():
+            return entry[2]
+
+        version = cls._version
+        rules = cls._load(db_session, report_type, branch_id or 0)
+        with cls._lock:
+            # 加载期间发生失效时不回填旧规则
+            if version == cls._version:
+                cls._plans[key] = (time.monotonic(), version, rules)
+        return rules
+
+    @staticmethod
+    def _load(db_session: Session, report_type: str, branch_id: int) -> List[CompiledRule]:
+        result = db_session.execute(_RULES_SQL, {'report_type': report_type, 'branch_id': branch_id})
+
+        rules = []
+        for row in result:
+            rule_dict = dict(row._mapping)
+            try:
+                expression = json.loads(rule_dict['rule_expression'])
+            except Exception as parse_error:
+                logger.error(f"规则 {rule_dict['id']} 表达式解析失败: {str(parse_error)}")
+                continue
+            rules.append(CompiledRule(rule_dict, expression))
+
+        logger.debug("编译触发规则 %s (网点 %s): %d 条", report_type, branch_id, len(rules))
+        return rules
+
+    @classmethod
+    def invalidate(cls):
+        """清空所有已编译规则"""
+        with cls._lock:
+            cls._version += 1
+            cls._plans.clear()
+
+    @staticmethod
+    def matched_rule_dict(rule: CompiledRule, condition_details: Dict[str, Any]) -> Dict[str, Any]:
+        """构建与旧版 check_triggers 相同的匹配规则字典（每次返回新对象，调用方可以修改）"""
+        rule_dict = dict(rule.row)
+        rule_dict['condition_details'] = condition_details
+        rule_dict['rule_expression_parsed'] = copy.deepcopy(rule.expression)
+        return rule_dict
@@ -7,11 +7,18 @@ RuleEngine - 规则引擎
 """
 
 import json
+import logging
 from typing import Dict, Any, List, Optional
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 
+from services.customer_exposure_service import CustomerExposureService
+from services.request_tracing import traced
+from .rule_compiler import RuleCache
+
+logger = logging.getLogger(__name__)
+
 
 class RuleEngine:
     """规则引擎类"""
@@ -250,6 +257,7 @@ class RuleEngine:
             return False
 
     @staticmethod
+    @traced('rule.check_triggers')
     def check_triggers(
         db_session: Session,
         report_type: str,
@@ -275,83 +283,33 @@ class RuleEngine:
             }
         """
         try:
-            print(f"\n[RuleEngine.check_triggers] ========== 开始检查触发条件 ==========", flush=True)
-            print(f"[RuleEngine.check_triggers] 报告类型: {report_type}", flush=True)
-            print(f"[RuleEngine.check_triggers] 网点ID: {branch_id}", flush=True)
-            print(f"[RuleEngine.check_triggers] 交易数据: {data}", flush=True)
+            logger.debug("[RuleEngine.check_triggers] 报告类型: %s, 网点ID: %s, 交易数据: %s",
+                         report_type, branch_id, data)
 
-            # 查询该报告类型的启用规则
-            sql = text("""
-                SELECT
-                    id,
-                    rule_name,
-                    report_type,
-                    rule_expression,
-                    description_cn,
-                    description_en,
-                    description_th,
-                    priority,
-                    allow_continue,
-                    warning_message_cn,
-                    warning_message_en,
-                    warning_message_th,
-                    branch_id
-                FROM trigger_rules
-                WHERE report_type = :report_type
-                    AND is_active = TRUE
-                    AND (branch_id IS NULL OR branch_id = :branch_id)
-                ORDER BY priority DESC, id ASC
-            """)
-
-            result = db_session.execute(
-                sql,
-                {'report_type': report_type, 'branch_id': branch_id or 0}
-            )
-
-            all_rules = list(result)
-            print(f"[RuleEngine.check_triggers] 查询到 {len(all_rules)} 条启用的规则", flush=True)
+            # 该报告类型的启用规则（已编译，按优先级排序）
+            compiled_rules = RuleCache.get_rules(db_session, report_type, branch_id)
 
             matched_rules = []
 
-            for row in all_rules:
-                rule_dict = dict(row._mapping)
-                rule_id = rule_dict['id']
-                rule_name = rule_dict['rule_name']
-                priority = rule_dict['priority']
-
-                print(f"\n[RuleEngine.check_triggers] --- 评估规则 {rule_id}: {rule_name} (优先级: {priority}) ---", flush=True)
-
-                # 解析rule_expression
-                try:
-                    rule_expression = json.loads(rule_dict['rule_expression'])
-                    print(f"[RuleEngine.check_triggers] 规则表达式: {rule_expression}", flush=True)
-                except Exception as parse_error:
-                    print(f"[RuleEngine.check_triggers] [ERROR] 规则表达式解析失败: {str(parse_error)}", flush=True)
-                    continue
-
+            for rule in compiled_rules:
                 # 评估规则，并收集条件匹配详情
-                is_matched, condition_details = RuleEngine.evaluate_rule_with_details(rule_expression, data)
+                is_matched, condition_details = rule.evaluate(data)
 
-                match_result = 'MATCHED' if is_matched else 'NOT_MATCHED'
-                print(f"[RuleEngine.check_triggers] 规则匹配结果: {match_result}", flush=True)
-                print(f"[RuleEngine.check_triggers] 匹配的条件: {condition_details.get('matched', [])}", flush=True)
-                print(f"[RuleEngine.check_triggers] 未匹配的条件: {condition_details.get('unmatched', [])}", flush=True)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("[RuleEngine.check_triggers] 规则 %s: %s (优先级: %s) -> %s, 匹配: %s, 未匹配: %s",
+                                 rule.row['id'], rule.row['rule_name'], rule.row['priority'],
+                                 'MATCHED' if is_matched else 'NOT_MATCHED',
+                                 condition_details.get('matched', []), condition_details.get('unmatched', []))
 
                 if is_matched:
-                    print(f"[RuleEngine.check_triggers] [OK] 规则 {rule_id} 匹配成功，添加到结果列表", flush=True)
-                    rule_dict['condition_details'] = condition_details  # 添加条件详情
-                    rule_dict['rule_expression_parsed'] = rule_expression  # 添加解析后的表达式
-                    matched_rules.append(rule_dict)
-
-            # 构建返回结果
-            print(f"\n[RuleEngine.check_triggers] ========== 评估完成 ==========", flush=True)
-            print(f"[RuleEngine.check_triggers] 共匹配 {len(matched_rules)} 条规则", flush=True)
+                    matched_rules.append(RuleCache.matched_rule_dict(rule, condition_details))
 
             if matched_rules:
                 highest_priority_rule = matched_rules[0]
-                print(f"[RuleEngine.check_triggers] 最高优先级规则: {highest_priority_rule['rule_name']} (ID: {highest_priority_rule['id']})", flush=True)
+                logger.debug("[RuleEngine.check_triggers] 共匹配 %d 条规则，最高优先级规则: %s (ID: %s)",
+                             len(matched_rules), highest_priority_rule['rule_name'], highest_priority_rule['id'])
 
-                result_dict = {
+                return {
                     'triggered': True,
                     'trigger_rules': matched_rules,
                     'highest_priority_rule': highest_priority_rule,
@@ -363,11 +321,9 @@ class RuleEngine:
                     'unmatched_conditions': highest_priority_rule.get('condition_details', {}).get('unmatched', []),  # 新增
                     'rule_expression': highest_priority_rule.get('rule_expression_parsed')  # 新增
                 }
-
-                print(f"[RuleEngine.check_triggers] 返回结果: triggered=True", flush=True)
-                return result_dict
             else:
-                print(f"[RuleEngine.check_triggers] 返回结果: triggered=False (无匹配规则)", flush=True)
+                logger.debug("[RuleEngine.check_triggers] %s 无匹配规则（共 %d 条启用规则）",
+                             report_type, len(compiled_rules))
                 return {
                     'triggered': False,
                     'trigger_rules': [],
@@ -376,11 +332,14 @@ class RuleEngine:
                 }
 
         except Exception as e:
-            print(f"[RuleEngine.check_triggers] [EXCEPTION] 异常: {str(e)}", flush=True)
-            import traceback
-            traceback.print_exc()
+            logger.error(f"[RuleEngine.check_triggers] 异常: {str(e)}", exc_info=True)
             raise
 
+    @staticmethod
+    def invalidate_rule_cache():
+        """触发规则变更后清空已编译规则缓存"""
+        RuleCache.invalidate()
+
     @staticmethod
     def get_customer_stats(
         db_session: Session,
@@ -405,6 +364,10 @@ class RuleEngine:
             }
         """
         try:
+            # 优先读取客户额度桶（只与该客户的交易天数有关，与交易表总行数无关）
+            if CustomerExposureService.is_enabled(db_session):
+                return CustomerExposureService.get_stats(db_session, customer_id, days)
+
             start_date = (datetime.now() - timedelta(days=days)).date()
 
             # 总体统计（跨网点）
@@ -507,6 +470,9 @@ class RuleEngine:
             }
         """
         try:
+            if CustomerExposureService.is_enabled(db_session):
+                return CustomerExposureService.get_24h_stats(db_session, customer_id)
+
             start_time = datetime.now() - timedelta(hours=24)
 
             # 24小时统计
@@ -7,12 +7,12 @@
 import re
 from datetime import datetime, date
 from typing import Optional, Dict, Any
-from sqlalchemy import text
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 
 from models.report_number_models import AMLOReportSequence, BOTReportSequence, ReportNumberLog
 from services.db_service import DatabaseService
+from services.reference_data_cache import ReferenceDataCache
 
 
 class ReportNumberGenerator:
@@ -32,53 +32,11 @@ class ReportNumberGenerator:
     
     @staticmethod
     def get_branch_codes(session: Session, branch_id: int) -> Dict[str, str]:
-        """获取网点的AMLO机构代码和支行代码"""
+        """获取网点的AMLO机构代码和支行代码（参考数据缓存，未配置或查询失败时为 001）"""
         try:
-            print(f"[get_branch_codes] [START] Getting AMLO codes for branch {branch_id}")
-
-            # 检查branches表是否存在
-            sql = text("SHOW TABLES LIKE 'branches'")
-            result = session.execute(sql).fetchone()
-
-            if not result:
-                print("[get_branch_codes] [ERROR] Branches table does not exist, using default codes")
-                return {
-                    'institution_code': '001',
-                    'branch_code': '001'
-                }
-
-            print("[get_branch_codes] [OK] Branches table exists")
-
-            sql = text("""
-                SELECT id, amlo_institution_code, amlo_branch_code
-                FROM branches
-                WHERE id = :branch_id
-            """)
-            result = session.execute(sql, {'branch_id': branch_id}).fetchone()
-
-            if not result:
-                print(f"[get_branch_codes] [ERROR] Branch ID {branch_id} not found, using default codes")
-                return {
-                    'institution_code': '001',
-                    'branch_code': '001'
-                }
-
-            print(f"[get_branch_codes] [QUERY] id={result.id}, amlo_institution_code={result.amlo_institution_code}, amlo_branch_code={result.amlo_branch_code}")
-
-            # 确保代码格式正确（3位数字）
-            institution_code = str(result.amlo_institution_code or '001').zfill(3)
-            branch_code = str(result.amlo_branch_code or '001').zfill(3)
-
-            print(f"[get_branch_codes] [SUCCESS] Final codes: institution_code={institution_code}, branch_code={branch_code}")
-
-            return {
-                'institution_code': institution_code,
-                'branch_code': branch_code
-            }
+            return ReferenceDataCache.get_amlo_codes(session, branch_id)
         except Exception as e:
             print(f"[get_branch_codes] [ERROR] Failed to get branch codes: {e}, using default codes")
-            import traceback
-            traceback.print_exc()
             return {
                 'institution_code': '001',
                 'branch_code': '001'
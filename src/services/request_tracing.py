@@ -0,0 +1,475 @@
+# -*- coding: utf-8 -*-
+"""
+请求追踪与接口指标
+- 每个请求分配请求ID（沿用客户端传入的 X-Request-ID，否则生成），并在响应头中返回
+- span(name) / @traced(name) 记录请求内的耗时片段：认证、规则评估、PDF生成；
+  数据库语句通过 SQLAlchemy 事件按请求汇总次数和耗时，慢语句单独记录；
+  其他需要逐条语句的统计（查询次数预算）通过 add_statement_observer 复用同一组事件，不另外计时
+- 每个接口、每类片段维护延迟直方图，由 /metrics 输出（Prometheus 文本格式，?format=json 输出JSON）
+- 追踪记录按采样率（TRACE_SAMPLE_RATE，默认0.01）写出，慢请求（TRACE_SLOW_MS，默认1000毫秒）和5xx总是写出；
+  写出经 QueueHandler 交给后台线程，请求线程不做文件I/O，队列满时直接丢弃并计数
+- 逐请求的调试输出（请求头等）只在 VERBOSE_REQUEST_LOG=true 时打印
+"""
+
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import wraps
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+TRACE_LOGGER_NAME = 'request_trace'
+
+# 直方图桶上限（毫秒），最后一个桶为 +Inf
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# 单个请求最多保留的片段数，防止循环中的片段撑大追踪记录
+MAX_SPANS_PER_REQUEST = 200
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class Histogram:
+    """固定桶的延迟直方图（调用方负责加锁）"""
+
+    __slots__ = ('buckets', 'count', 'total')
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value_ms: float):
+        index = len(BUCKETS_MS)
+        for i, bound in enumerate(BUCKETS_MS):
+            if value_ms <= bound:
+                index = i
+                break
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += value_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        cumulative = []
+        running = 0
+        for count in self.buckets:
+            running += count
+            cumulative.append(running)
+        return {
+            'count': self.count,
+            'sum_ms': round(self.total, 3),
+            'buckets': dict(zip([str(b) for b in BUCKETS_MS] + ['+Inf'], cumulative))
+        }
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """队列满时丢弃记录并计数，不阻塞请求线程，也不输出 handleError 堆栈"""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            RequestTracer._count('dropped')
+
+
+class RequestTracer:
+    """请求追踪中间件与进程级指标"""
+
+    _lock = threading.Lock()
+    _endpoint_hist: Dict[Tuple[str, str], Histogram] = {}
+    _status_counts: Dict[Tuple[str, str, str], int] = {}
+    _span_hist: Dict[str, Histogram] = {}
+    _counters = {'emitted': 0, 'dropped': 0}
+    _queue: Optional[queue.Queue] = None
+    _listener: Optional[QueueListener] = None
+    _trace_logger = logging.getLogger(TRACE_LOGGER_NAME)
+    _db_listeners_installed = False
+    # 每条语句执行后调用 observer(statement, elapsed_ms)
+    _statement_observers: List[Callable[[str, float], None]] = []
+
+    @staticmethod
+    def sample_rate() -> float:
+        return _env_number('TRACE_SAMPLE_RATE', 0.01)
+
+    @staticmethod
+    def slow_ms() -> float:
+        return _env_number('TRACE_SLOW_MS', 1000)
+
+    @staticmethod
+    def db_slow_ms() -> float:
+        return _env_number('TRACE_DB_SLOW_MS', 200)
+
+    @staticmethod
+    def verbose() -> bool:
+        """是否打开逐请求调试输出（VERBOSE_REQUEST_LOG）"""
+        return os.environ.get('VERBOSE_REQUEST_LOG', 'false').lower() in ('1', 'true', 'yes')
+
+    @classmethod
+    def _count(cls, name: str):
+        with cls._lock:
+            cls._counters[name] += 1
+
+    # ------------------------------------------------------------------
+    # 初始化
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def init_app(cls, app, handler: Optional[logging.Handler] = None):
+        """
+        注册请求钩子并启动后台写出线程
+
+        Args:
+            app: Flask 应用
+            handler: 追踪记录的实际写出处理器，默认写入 logs/request_trace.log（TRACE_LOG_FILE）
+        """
+        cls.start(handler)
+        cls.install_db_listeners()
+        app.before_request(cls._before_request)
+        app.after_request(cls._after_request)
+        app.extensions['request_tracer'] = cls
+
+    @classmethod
+    def start(cls, handler: Optional[logging.Handler] = None):
+        """启动（或替换）后台写出线程"""
+        cls.stop()
+        if handler is None:
+            from config.log_config import LogConfig
+            path = os.environ.get('TRACE_LOG_FILE') or os.path.join(LogConfig.get_log_dir(), 'request_trace.log')
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            handler = RotatingFileHandler(path, **LogConfig.get_rotation_config())
+        handler.setFormatter(logging.Formatter('%(message)s'))
+
+        cls._queue = queue.Queue(maxsize=int(_env_number('TRACE_QUEUE_SIZE', 10000)))
+        cls._trace_logger.handlers = [_DroppingQueueHandler(cls._queue)]
+        cls._trace_logger.setLevel(logging.INFO)
+        cls._trace_logger.propagate = False
+        cls._listener = QueueListener(cls._queue, handler, respect_handler_level=False)
+        cls._listener.start()
+
+    @classmethod
+    def stop(cls):
+        """停止后台线程并写出队列中剩余的记录"""
+        if cls._listener is not None:
+            cls._listener.stop()
+            cls._listener = None
+
+    @classmethod
+    def install_db_listeners(cls):
+        """按请求汇总数据库语句次数和耗时（对所有 Engine 生效，只注册一次）"""
+        with cls._lock:
+            if cls._db_listeners_installed:
+                return
+            cls._db_listeners_installed = True
+        event.listen(Engine, 'before_cursor_execute', cls._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', cls._after_cursor_execute)
+
+    @classmethod
+    def add_statement_observer(cls, observer: Callable[[str, float], None]):
+        """注册逐条语句的观察者（重复注册无副作用）"""
+        cls.install_db_listeners()
+        with cls._lock:
+            if observer not in cls._statement_observers:
+                cls._statement_observers = cls._statement_observers + [observer]
+
+    @classmethod
+    def remove_statement_observer(cls, observer: Callable[[str, float], None]):
+        with cls._lock:
+            cls._statement_observers = [o for o in cls._statement_observers if o != observer]
+
+    # ------------------------------------------------------------------
+    # 请求钩子
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def current_request_id() -> Optional[str]:
+        if has_request_context():
+            trace = g.get('_trace')
+            if trace:
+                return trace['id']
+        return None
+
+    @staticmethod
+    def db_usage() -> Optional[Tuple[int, float]]:
+        """当前请求到目前为止执行的语句数和数据库耗时（毫秒），请求外或未追踪时返回 None"""
+        if has_request_context():
+            trace = g.get('_trace')
+            if trace:
+                return trace['db_count'], trace['db_ms']
+        return None
+
+    @classmethod
+    def _before_request(cls):
+        request_id = (request.headers.get(REQUEST_ID_HEADER) or '')[:64] or uuid.uuid4().hex[:16]
+        g._trace = {
+            'id': request_id,
+            'start': time.perf_counter(),
+            'spans': [],
+            'db_count': 0,
+            'db_ms': 0.0
+        }
+
+    @classmethod
+    def _after_request(cls, response):
+        trace = g.get('_trace')
+        if not trace:
+            return response
+        duration_ms = (time.perf_counter() - trace['start']) * 1000
+        endpoint = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        method = request.method
+        status_class = f'{response.status_code // 100}xx'
+
+        with cls._lock:
+            hist = cls._endpoint_hist.get((method, endpoint))
+            if hist is None:
+                hist = cls._endpoint_hist[(method, endpoint)] = Histogram()
+            hist.observe(duration_ms)
+            key = (method, endpoint, status_class)
+            cls._status_counts[key] = cls._status_counts.get(key, 0) + 1
+
+        response.headers[REQUEST_ID_HEADER] = trace['id']
+
+        reason = None
+        if response.status_code >= 500:
+            reason = 'error'
+        elif duration_ms >= cls.slow_ms():
+            reason = 'slow'
+        elif random.random() < cls.sample_rate():
+            reason = 'sampled'
+        if reason:
+            cls._emit({
+                'request_id': trace['id'],
+                'method': method,
+                'path': request.path,
+                'endpoint': endpoint,
+                'status': response.status_code,
+                'duration_ms': round(duration_ms, 3),
+                'db': {'count': trace['db_count'], 'ms': round(trace['db_ms'], 3)},
+                'spans': trace['spans'],
+                'reason': reason
+            })
+        return response
+
+    @classmethod
+    def _emit(cls, record: Dict[str, Any]):
+        if cls._listener is None:
+            return
+        cls._trace_logger.info(json.dumps(record, ensure_ascii=False, default=str))
+        cls._count('emitted')
+
+    # ------------------------------------------------------------------
+    # 片段
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def _record_span(cls, name: str, started: float, elapsed_ms: float, attrs: Dict[str, Any]):
+        with cls._lock:
+            hist = cls._span_hist.get(name)
+            if hist is None:
+                hist = cls._span_hist[name] = Histogram()
+            hist.observe(elapsed_ms)
+
+        if has_request_context():
+            trace = g.get('_trace')
+            if trace and len(trace['spans']) < MAX_SPANS_PER_REQUEST:
+                span_record = {
+                    'name': name,
+                    'start_ms': round((started - trace['start']) * 1000, 3),
+                    'ms': round(elapsed_ms, 3)
+                }
+                if attrs:
+                    span_record.update(attrs)
+                trace['spans'].append(span_record)
+
+    @classmethod
+    @contextmanager
+    def span(cls, name: str, **attrs):
+        """记录一个耗时片段（请求外调用时只计入直方图）"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            cls._record_span(name, started, (time.perf_counter() - started) * 1000, attrs)
+
+    @classmethod
+    def _before_cursor_execute(cls, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_trace_query_start', []).append(time.perf_counter())
+
+    @classmethod
+    def _after_cursor_execute(cls, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('_trace_query_start')
+        if not starts:
+            return
+        started = starts.pop()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with cls._lock:
+            hist = cls._span_hist.get('db')
+            if hist is None:
+                hist = cls._span_hist['db'] = Histogram()
+            hist.observe(elapsed_ms)
+        for observer in cls._statement_observers:
+            observer(statement, elapsed_ms)
+
+        if not has_request_context():
+            return
+        trace = g.get('_trace')
+        if not trace:
+            return
+        trace['db_count'] += 1
+        trace['db_ms'] += elapsed_ms
+        if elapsed_ms >= cls.db_slow_ms() and len(trace['spans']) < MAX_SPANS_PER_REQUEST:
+            trace['spans'].append({
+                'name': 'db.slow',
+                'start_ms': round((started - trace['start']) * 1000, 3),
+                'ms': round(elapsed_ms, 3),
+                'sql': ' '.join(statement.split())[:200]
+            })
+
+    # ------------------------------------------------------------------
+    # 指标输出
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def snapshot(cls) -> Dict[str, Any]:
+        """接口、片段直方图及缓存统计"""
+        with cls._lock:
+            endpoints = {}
+            for (method, endpoint), hist in cls._endpoint_hist.items():
+                item = hist.snapshot()
+                item['status'] = {
+                    status: count for (m, e, status), count in cls._status_counts.items()
+                    if m == method and e == endpoint
+                }
+                endpoints[f'{method} {endpoint}'] = item
+            spans = {name: hist.snapshot() for name, hist in cls._span_hist.items()}
+            tracing = dict(cls._counters, queue_size=cls._queue.qsize() if cls._queue is not None else 0)
+
+        from services.db_service import DatabaseService
+        from services.principal_cache import PrincipalCache
+        from services.read_replica import ReadReplica
+        from services.reference_data_cache import ReferenceDataCache
+        return {
+            'endpoints': endpoints,
+            'spans': spans,
+            'tracing': tracing,
+            'db_pool': DatabaseService.pool_stats(),
+            'db_replica': ReadReplica.stats(),
+            'caches': {
+                'reference_data': ReferenceDataCache.stats(),
+                'principal': PrincipalCache.stats()
+            }
+        }
+
+    @classmethod
+    def render_prometheus(cls) -> str:
+        """Prometheus 文本格式"""
+        data = cls.snapshot()
+        lines: List[str] = []
+
+        def label_str(labels: Dict[str, Any]) -> str:
+            parts = []
+            for key, value in labels.items():
+                escaped = str(value).replace('\\', '\\\\').replace('"', '\\"')
+                parts.append(f'{key}="{escaped}"')
+            return '{' + ','.join(parts) + '}'
+
+        def histogram(metric: str, labels: Dict[str, Any], item: Dict[str, Any]):
+            for bound, count in item['buckets'].items():
+                lines.append(f'{metric}_bucket{label_str(dict(labels, le=bound))} {count}')
+            lines.append(f"{metric}_sum{label_str(labels)} {item['sum_ms']}")
+            lines.append(f"{metric}_count{label_str(labels)} {item['count']}")
+
+        lines.append('# TYPE http_request_duration_ms histogram')
+        for key, item in sorted(data['endpoints'].items()):
+            method, endpoint = key.split(' ', 1)
+            histogram('http_request_duration_ms', {'method': method, 'endpoint': endpoint}, item)
+        lines.append('# TYPE http_requests_total counter')
+        for key, item in sorted(data['endpoints'].items()):
+            method, endpoint = key.split(' ', 1)
+            for status, count in sorted(item['status'].items()):
+                labels = {'method': method, 'endpoint': endpoint, 'status': status}
+                lines.append(f'http_requests_total{label_str(labels)} {count}')
+
+        lines.append('# TYPE span_duration_ms histogram')
+        for name, item in sorted(data['spans'].items()):
+            histogram('span_duration_ms', {'span': name}, item)
+
+        lines.append('# TYPE trace_records_total counter')
+        for name in ('emitted', 'dropped'):
+            lines.append(f"trace_records_total{label_str({'result': name})} {data['tracing'][name]}")
+
+        pool = data['db_pool']
+        for name in ('size', 'checked_out', 'overflow', 'max_overflow'):
+            lines.append(f'# TYPE db_pool_{name} gauge')
+            lines.append(f'db_pool_{name} {pool[name]}')
+        for name in ('checkouts', 'slow_waits', 'timeouts'):
+            if name in pool:
+                lines.append(f'# TYPE db_pool_{name}_total counter')
+                lines.append(f'db_pool_{name}_total {pool[name]}')
+        if 'wait_ms_total' in pool:
+            lines.append('# TYPE db_pool_wait_ms_sum counter')
+            lines.append(f"db_pool_wait_ms_sum {pool['wait_ms_total']}")
+            lines.append('# TYPE db_pool_wait_ms_max gauge')
+            lines.append(f"db_pool_wait_ms_max {pool['wait_ms_max']}")
+
+        replica = data['db_replica']
+        lines.append('# TYPE db_replica_sessions_total counter')
+        for result in ('routed', 'fallback'):
+            lines.append(f"db_replica_sessions_total{label_str({'result': result})} {replica[result]}")
+        if replica['lag_seconds'] is not None:
+            lines.append('# TYPE db_replica_lag_seconds gauge')
+            lines.append(f"db_replica_lag_seconds {replica['lag_seconds']}")
+
+        lines.append('# TYPE reference_cache_requests_total counter')
+        for kind, stats in sorted(data['caches']['reference_data'].items()):
+            for result in ('hits', 'misses'):
+                lines.append(f"reference_cache_requests_total{label_str({'kind': kind, 'result': result})} {stats[result]}")
+
+        lines.append('# TYPE principal_cache_requests_total counter')
+        principal = data['caches']['principal']
+        for result in ('hits', 'misses', 'token_claims'):
+            lines.append(f"principal_cache_requests_total{label_str({'result': result})} {principal[result]}")
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    def reset(cls):
+        """清空指标（测试使用）"""
+        with cls._lock:
+            cls._endpoint_hist.clear()
+            cls._status_counts.clear()
+            cls._span_hist.clear()
+            for name in cls._counters:
+                cls._counters[name] = 0
+
+
+def span(name: str, **attrs):
+    """RequestTracer.span 的快捷方式"""
+    return RequestTracer.span(name, **attrs)
+
+
+def traced(name: str):
+    """把整个函数记录为一个片段"""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            with RequestTracer.span(name):
+                return f(*args, **kwargs)
+        return decorated
+    return decorator
@@ -0,0 +1,516 @@
+# -*- coding: utf-8 -*-
+"""
+共享缓存
+汇率发布缓存、翻译文本、币种翻译配置和AMLO字段映射原来各自保存在进程内字典中，
+gunicorn 多工作进程部署时每个进程一份，清除缓存只对处理该请求的进程生效。
+这里提供统一的命名空间缓存：
+- 后端由 CACHE_BACKEND 选择：
+  memory（默认，进程内 LRU，容量 CACHE_MAX_ENTRIES，默认10000）、
+  file（CACHE_DIR 目录下的文件缓存，同一主机的工作进程共享，命名空间代数保存在 mmap 文件中）、
+  redis（CACHE_REDIS_URL；未安装 redis 包时使用进程内的 LocalRedisClient 替代）
+- 每个命名空间有一个代数（generation），clear() 递增代数使该命名空间所有条目失效，
+  其他进程下次访问时读到新代数即视为收到失效通知，并回调 subscribe() 注册的函数
+- local=True 的命名空间只在后端共享代数，值保存在本进程（适合可从文件重新加载、不值得序列化的数据）
+- 条目可设置 TTL（秒），按墙上时间计算，跨进程一致
+- 值使用 pickle 序列化，缓存目录和 Redis 只能由本系统使用
+"""
+
+import fnmatch
+import hashlib
+import logging
+import mmap
+import os
+import pickle
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows 下只有进程内锁
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+BACKEND_MEMORY = 'memory'
+BACKEND_FILE = 'file'
+BACKEND_REDIS = 'redis'
+
+# 条目：(代数, 过期时间戳或None, 键, 值)
+Entry = Tuple[int, Optional[float], Hashable, Any]
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _key_digest(key: Hashable) -> str:
+    return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+
+class MemoryLRUBackend:
+    """进程内 LRU 后端"""
+
+    poll_seconds = 0.0
+    # 值和代数是否跨进程共享
+    shared = False
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max(1, int(max_entries))
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[Tuple[str, Hashable], Entry]' = OrderedDict()
+        self._generations: Dict[str, int] = {}
+
+    def generation(self, namespace: str) -> int:
+        return self._generations.get(namespace, 0)
+
+    def bump(self, namespace: str) -> int:
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            for cache_key in [k for k in self._entries if k[0] == namespace]:
+                del self._entries[cache_key]
+            return self._generations[namespace]
+
+    def get(self, namespace: str, key: Hashable) -> Optional[Entry]:
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is not None:
+                self._entries.move_to_end((namespace, key))
+            return entry
+
+    def set(self, namespace: str, key: Hashable, entry: Entry):
+        with self._lock:
+            self._entries[(namespace, key)] = entry
+            self._entries.move_to_end((namespace, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, namespace: str, key: Hashable):
+        with self._lock:
+            self._entries.pop((namespace, key), None)
+
+    def entries(self, namespace: str) -> List[Entry]:
+        with self._lock:
+            return [entry for (ns, _), entry in self._entries.items() if ns == namespace]
+
+
+class FileCacheBackend:
+    """
+    文件后端
+    每个条目一个文件（<目录>/<命名空间>/<键摘要>.pkl，先写临时文件再原子替换），
+    命名空间代数保存在 generations.bin 中，按命名空间 crc32 取槽位，各进程通过 mmap 读取；
+    槽位冲突只会导致多余的失效，不影响正确性
+    """
+
+    SLOTS = 4096
+    SLOT_SIZE = 8
+    poll_seconds = 0.0
+    shared = True
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        path = os.path.join(directory, 'generations.bin')
+        size = self.SLOTS * self.SLOT_SIZE
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+
+    def _offset(self, namespace: str) -> int:
+        return (zlib.crc32(namespace.encode('utf-8')) % self.SLOTS) * self.SLOT_SIZE
+
+    def _path(self, namespace: str, key: Hashable) -> str:
+        return os.path.join(self.directory, namespace, f'{_key_digest(key)}.pkl')
+
+    def generation(self, namespace: str) -> int:
+        offset = self._offset(namespace)
+        return int.from_bytes(self._map[offset:offset + self.SLOT_SIZE], 'little')
+
+    def bump(self, namespace: str) -> int:
+        offset = self._offset(namespace)
+        # 每次单独打开锁文件：fork 出的工作进程共享已打开的描述符，对其加 flock 不能互斥
+        with self._lock, open(os.path.join(self.directory, 'generations.lock'), 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            value = self.generation(namespace) + 1
+            self._map[offset:offset + self.SLOT_SIZE] = value.to_bytes(self.SLOT_SIZE, 'little')
+        # 旧代数的文件已不会被读取，这里顺便清理
+        folder = os.path.join(self.directory, namespace)
+        for name in os.listdir(folder) if os.path.isdir(folder) else ():
+            try:
+                os.remove(os.path.join(folder, name))
+            except OSError:
+                pass
+        return value
+
+    @staticmethod
+    def _read(path: str) -> Optional[Entry]:
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"读取缓存文件失败 {path}: {str(e)}")
+            return None
+
+    def get(self, namespace: str, key: Hashable) -> Optional[Entry]:
+        return self._read(self._path(namespace, key))
+
+    def set(self, namespace: str, key: Hashable, entry: Entry):
+        path = self._path(namespace, key)
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def delete(self, namespace: str, key: Hashable):
+        try:
+            os.remove(self._path(namespace, key))
+        except FileNotFoundError:
+            pass
+
+    def entries(self, namespace: str) -> List[Entry]:
+        folder = os.path.join(self.directory, namespace)
+        if not os.path.isdir(folder):
+            return []
+        result = []
+        for name in sorted(os.listdir(folder)):
+            if name.endswith('.pkl'):
+                entry = self._read(os.path.join(folder, name))
+                if entry is not None:
+                    result.append(entry)
+        return result
+
+
+class LocalRedisClient:
+    """
+    进程内的 Redis 替代实现，只支持 RedisBackend 用到的命令
+    用于开发和测试环境，不能在进程之间共享
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict[str, Tuple[bytes, Optional[float]]] = {}
+        self._channels: Dict[str, List[Callable[[bytes], None]]] = defaultdict(list)
+
+    def _alive(self, name: str) -> Optional[bytes]:
+        item = self._data.get(name)
+        if item is None:
+            return None
+        if item[1] is not None and item[1] <= time.time():
+            del self._data[name]
+            return None
+        return item[0]
+
+    def get(self, name: str) -> Optional[bytes]:
+        with self._lock:
+            return self._alive(name)
+
+    def set(self, name: str, value: bytes, ex: Optional[int] = None):
+        with self._lock:
+            self._data[name] = (value, time.time() + ex if ex else None)
+        return True
+
+    def delete(self, *names: str) -> int:
+        with self._lock:
+            return sum(self._data.pop(name, None) is not None for name in names)
+
+    def incr(self, name: str) -> int:
+        with self._lock:
+            value = int(self._alive(name) or 0) + 1
+            self._data[name] = (str(value).encode(), None)
+            return value
+
+    def scan_iter(self, match: str = '*') -> Iterable[str]:
+        with self._lock:
+            return [name for name in list(self._data) if fnmatch.fnmatchcase(name, match) and self._alive(name)]
+
+    def publish(self, channel: str, message: str) -> int:
+        listeners = list(self._channels.get(channel, ()))
+        for listener in listeners:
+            listener(message.encode() if isinstance(message, str) else message)
+        return len(listeners)
+
+    def subscribe(self, channel: str, listener: Callable[[bytes], None]):
+        self._channels[channel].append(listener)
+
+
+class RedisBackend:
+    """
+    Redis 后端
+    键为 <前缀><命名空间>:<键摘要>，代数为 <前缀><命名空间>:__generation__（INCR），
+    失效时同时向 <前缀>invalidate 频道发布命名空间名，供外部订阅者使用
+    """
+
+    def __init__(self, client, prefix: str = 'exchange:cache:', poll_seconds: float = 1.0):
+        self.client = client
+        self.prefix = prefix
+        self.poll_seconds = poll_seconds
+        self.shared = not isinstance(client, LocalRedisClient)
+
+    def _name(self, namespace: str, suffix: str) -> str:
+        return f'{self.prefix}{namespace}:{suffix}'
+
+    def generation(self, namespace: str) -> int:
+        return int(self.client.get(self._name(namespace, '__generation__')) or 0)
+
+    def bump(self, namespace: str) -> int:
+        generation_key = self._name(namespace, '__generation__')
+        value = int(self.client.incr(generation_key))
+        # redis-py 默认返回 bytes 键，先解码再排除代数键
+        stale = [name for name in self.client.scan_iter(match=self._name(namespace, '*'))
+                 if (name.decode() if isinstance(name, bytes) else name) != generation_key]
+        if stale:
+            self.client.delete(*stale)
+        self.client.publish(f'{self.prefix}invalidate', namespace)
+        return value
+
+    def get(self, namespace: str, key: Hashable) -> Optional[Entry]:
+        raw = self.client.get(self._name(namespace, _key_digest(key)))
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, namespace: str, key: Hashable, entry: Entry):
+        expires_at = entry[1]
+        ex = max(1, int(expires_at - time.time()) + 1) if expires_at is not None else None
+        self.client.set(self._name(namespace, _key_digest(key)),
+                        pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL), ex=ex)
+
+    def delete(self, namespace: str, key: Hashable):
+        self.client.delete(self._name(namespace, _key_digest(key)))
+
+    def entries(self, namespace: str) -> List[Entry]:
+        result = []
+        for name in self.client.scan_iter(match=self._name(namespace, '*')):
+            if isinstance(name, bytes):
+                name = name.decode()
+            if name.endswith('__generation__'):
+                continue
+            raw = self.client.get(name)
+            if raw is not None:
+                result.append(pickle.loads(raw))
+        return result
+
+
+class CacheNamespace:
+    """命名空间句柄，由 SharedCache.namespace() 创建"""
+
+    def __init__(self, name: str, ttl: Optional[float] = None, local: bool = False):
+        self.name = name
+        self.ttl = ttl
+        self.local = local
+        self._values: Dict[Hashable, Entry] = {}
+
+    def _store(self, key: Hashable, entry: Optional[Entry] = None, delete: bool = False):
+        if self.local:
+            if delete:
+                self._values.pop(key, None)
+            else:
+                self._values[key] = entry
+            return
+        backend = SharedCache.backend()
+        if delete:
+            backend.delete(self.name, key)
+        else:
+            backend.set(self.name, key, entry)
+
+    def _entry(self, key: Hashable) -> Optional[Entry]:
+        if self.local:
+            return self._values.get(key)
+        return SharedCache.backend().get(self.name, key)
+
+    def _valid(self, entry: Optional[Entry], generation: int, now: float) -> bool:
+        return entry is not None and entry[0] == generation and (entry[1] is None or entry[1] > now)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        generation = SharedCache.generation(self.name)
+        entry = self._entry(key)
+        if self._valid(entry, generation, time.time()):
+            SharedCache._count(self.name, 'hits')
+            return entry[3]
+        SharedCache._count(self.name, 'misses')
+        return default
+
+    def __contains__(self, key: Hashable) -> bool:
+        generation = SharedCache.generation(self.name)
+        return self._valid(self._entry(key), generation, time.time())
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        self._store(key, (SharedCache.generation(self.name), expires_at, key, value))
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """
+        读取缓存；未命中时调用 loader 加载
+        loader 返回 None 时不缓存，加载期间命名空间被清除时也不写入旧值
+        """
+        generation = SharedCache.generation(self.name)
+        entry = self._entry(key)
+        if self._valid(entry, generation, time.time()):
+            SharedCache._count(self.name, 'hits')
+            return entry[3]
+        SharedCache._count(self.name, 'misses')
+
+        value = loader()
+        if value is not None and SharedCache.generation(self.name) == generation:
+            ttl = self.ttl if ttl is None else ttl
+            self._store(key, (generation, time.time() + ttl if ttl else None, key, value))
+        return value
+
+    def delete(self, key: Hashable):
+        self._store(key, delete=True)
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """当前有效的全部条目"""
+        generation = SharedCache.generation(self.name)
+        now = time.time()
+        entries = self._values.values() if self.local else SharedCache.backend().entries(self.name)
+        return [(entry[2], entry[3]) for entry in list(entries) if self._valid(entry, generation, now)]
+
+    def __len__(self) -> int:
+        return len(self.items())
+
+    def clear(self):
+        """清除命名空间（所有进程）"""
+        SharedCache.invalidate(self.name)
+
+
+class SharedCache:
+    """共享缓存入口（后端选择、命名空间代数和失效通知）"""
+
+    _lock = threading.Lock()
+    _backend = None
+    _namespaces: Dict[str, CacheNamespace] = {}
+    _generations: Dict[str, Tuple[int, float]] = {}
+    _subscribers: Dict[str, List[Callable[[str], None]]] = defaultdict(list)
+    _counters: Dict[str, Dict[str, int]] = defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+    @staticmethod
+    def _create_backend():
+        kind = os.environ.get('CACHE_BACKEND', BACKEND_MEMORY).lower()
+        if kind == BACKEND_FILE:
+            directory = os.environ.get('CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'exchange_shared_cache')
+            logger.info(f"共享缓存使用文件后端: {directory}")
+            return FileCacheBackend(directory)
+        if kind == BACKEND_REDIS:
+            url = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+            poll = _env_number('CACHE_POLL_SECONDS', 1)
+            try:
+                import redis
+            except ImportError:
+                logger.warning("未安装 redis 包，共享缓存使用进程内 LocalRedisClient，不能跨进程共享")
+                return RedisBackend(LocalRedisClient(), poll_seconds=poll)
+            logger.info(f"共享缓存使用 Redis 后端: {url}")
+            return RedisBackend(redis.Redis.from_url(url), poll_seconds=poll)
+        if kind != BACKEND_MEMORY:
+            logger.warning(f"未知的 CACHE_BACKEND={kind}，使用进程内缓存")
+        return MemoryLRUBackend(int(_env_number('CACHE_MAX_ENTRIES', 10000)))
+
+    @classmethod
+    def backend(cls):
+        if cls._backend is None:
+            with cls._lock:
+                if cls._backend is None:
+                    cls._backend = cls._create_backend()
+        return cls._backend
+
+    @classmethod
+    def configure(cls, backend=None):
+        """指定后端（None 表示下次使用时按环境变量重新创建），同时清空本进程状态"""
+        with cls._lock:
+            cls._backend = backend
+            cls._generations = {}
+            cls._counters.clear()
+            for namespace in cls._namespaces.values():
+                namespace._values.clear()
+
+    @classmethod
+    def namespace(cls, name: str, ttl: Optional[float] = None, local: bool = False) -> CacheNamespace:
+        """获取命名空间（同名命名空间在进程内只有一个实例）"""
+        with cls._lock:
+            namespace = cls._namespaces.get(name)
+            if namespace is None:
+                namespace = cls._namespaces[name] = CacheNamespace(name, ttl=ttl, local=local)
+            return namespace
+
+    @classmethod
+    def subscribe(cls, name: str, callback: Callable[[str], None]):
+        """注册失效回调：本进程或其他进程清除该命名空间后，本进程下次访问时调用 callback(name)"""
+        with cls._lock:
+            cls._subscribers[name].append(callback)
+
+    @classmethod
+    def generation(cls, name: str) -> int:
+        """
+        命名空间当前代数
+        后端有轮询间隔时（Redis）在间隔内使用上次读到的值；代数变化时丢弃本进程的值并通知订阅者
+        """
+        backend = cls.backend()
+        now = time.monotonic()
+        seen = cls._generations.get(name)
+        if seen is not None and backend.poll_seconds and now - seen[1] < backend.poll_seconds:
+            return seen[0]
+
+        current = backend.generation(name)
+        if seen is None or seen[0] != current:
+            with cls._lock:
+                cls._generations[name] = (current, now)
+            if seen is not None:
+                cls._notify(name)
+        elif backend.poll_seconds:
+            cls._generations[name] = (current, now)
+        return current
+
+    @classmethod
+    def _notify(cls, name: str):
+        namespace = cls._namespaces.get(name)
+        if namespace is not None:
+            namespace._values.clear()
+        for callback in list(cls._subscribers.get(name, ())):
+            try:
+                callback(name)
+            except Exception as e:
+                logger.warning(f"缓存失效回调执行失败 {name}: {str(e)}")
+
+    @classmethod
+    def invalidate(cls, name: str):
+        """清除命名空间：递增后端代数，本进程立即生效，其他进程下次访问时生效"""
+        current = cls.backend().bump(name)
+        with cls._lock:
+            cls._generations[name] = (current, time.monotonic())
+        cls._notify(name)
+
+    @classmethod
+    def _count(cls, name: str, counter: str):
+        with cls._lock:
+            cls._counters[name][counter] += 1
+
+    @classmethod
+    def stats(cls) -> Dict[str, Dict[str, int]]:
+        """各命名空间的命中/未命中次数和本进程看到的代数"""
+        with cls._lock:
+            names = set(cls._counters) | set(cls._generations)
+            return {
+                name: {
+                    'hits': cls._counters[name]['hits'] if name in cls._counters else 0,
+                    'misses': cls._counters[name]['misses'] if name in cls._counters else 0,
+                    'generation': cls._generations.get(name, (0, 0))[0]
+                }
+                for name in sorted(names)
+            }
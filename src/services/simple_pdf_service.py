@@ -10,13 +10,7 @@ import os
 import logging
 import base64
 from datetime import datetime
-from .pdf_base import PDFBase
-from .exchange_pdf_generator import ExchangePDFGenerator
-from .dual_direction_pdf_generator import DualDirectionPDFGenerator
-from .reversal_pdf_generator import ReversalPDFGenerator
-from .balance_pdf_generator import BalancePDFGenerator
-from .summary_pdf_generator import SummaryPDFGenerator
-from .eod_report_pdf_generator import EODReportPDFGenerator
+from .request_tracing import traced
 
 logger = logging.getLogger(__name__)
 
@@ -38,6 +32,7 @@ class SimplePDFService:
         Returns:
             str: 完整的文件路径
         """
+        from .pdf_base import PDFBase
         try:
             # 获取当前时间或使用指定日期
             if eod_date:
@@ -77,6 +72,7 @@ class SimplePDFService:
             return PDFBase.create_temp_file()
     
     @staticmethod
+    @traced('pdf.exchange_receipt')
     def generate_exchange_receipt(transaction, session, reprint_time=None, language='zh'):
         """
         生成兑换交易PDF票据
@@ -90,6 +86,8 @@ class SimplePDFService:
         Returns:
             str: PDF文件的base64编码内容
         """
+        from .pdf_base import PDFBase
+        from .exchange_pdf_generator import ExchangePDFGenerator
         try:
             # 获取相关数据
             from models.exchange_models import Currency, Operator, Branch
@@ -162,6 +160,7 @@ class SimplePDFService:
             raise
 
     @staticmethod
+    @traced('pdf.dual_direction_receipt')
     def generate_dual_direction_receipt(business_group_data, session, language='zh'):
         """
         生成双向交易PDF票据
@@ -174,6 +173,7 @@ class SimplePDFService:
         Returns:
             str: PDF文件的base64编码内容
         """
+        from .dual_direction_pdf_generator import DualDirectionPDFGenerator
         try:
             return DualDirectionPDFGenerator.generate_dual_direction_receipt(business_group_data, session, language)
         except Exception as e:
@@ -181,6 +181,7 @@ class SimplePDFService:
             raise
 
     @staticmethod
+    @traced('pdf.reversal_receipt')
     def generate_reversal_receipt(transaction, session, reprint_time=None, language='zh'):
         """
         生成交易冲正PDF票据
@@ -194,6 +195,8 @@ class SimplePDFService:
         Returns:
             str: PDF文件的base64编码内容
         """
+        from .pdf_base import PDFBase
+        from .reversal_pdf_generator import ReversalPDFGenerator
         try:
             # 获取相关数据
             from models.exchange_models import Currency, Operator, Branch, ExchangeTransaction
@@ -246,6 +249,7 @@ class SimplePDFService:
             raise
     
     @staticmethod
+    @traced('pdf.balance_receipt')
     def generate_balance_receipt(transaction, session, balance_type, reprint_time=None, language='zh'):
         """
         生成余额操作PDF票据
@@ -260,6 +264,8 @@ class SimplePDFService:
         Returns:
             str: PDF文件的base64编码内容
         """
+        from .pdf_base import PDFBase
+        from .balance_pdf_generator import BalancePDFGenerator
         try:
             # 获取相关数据
             from models.exchange_models import Currency, Operator, Branch
@@ -310,6 +316,7 @@ class SimplePDFService:
             raise
     
     @staticmethod
+    @traced('pdf.summary_receipt')
     def generate_summary_receipt(summary_data, language='zh'):
         """
         生成期初余额汇总PDF票据
@@ -321,6 +328,8 @@ class SimplePDFService:
         Returns:
             str: PDF文件的base64编码内容
         """
+        from .pdf_base import PDFBase
+        from .summary_pdf_generator import SummaryPDFGenerator
         try:
             # 生成临时文件路径
             temp_file = PDFBase.create_temp_file()
@@ -357,6 +366,7 @@ class SimplePDFService:
         Returns:
             str: 文件路径
         """
+        from .pdf_base import PDFBase
         return PDFBase.get_receipt_file_path(transaction_no, transaction_date, language)
     
     @staticmethod
@@ -371,6 +381,7 @@ class SimplePDFService:
         Returns:
             str: PDF文件的base64编码内容
         """
+        from .eod_report_pdf_generator import EODReportPDFGenerator
         try:
             # 处理不同类型的输入数据
             if isinstance(income_data, dict):
@@ -439,6 +450,8 @@ class SimplePDFService:
         Returns:
             dict: 包含success状态和file_path的字典
         """
+        from .pdf_base import PDFBase
+        from .eod_report_pdf_generator import EODReportPDFGenerator
         try:
             # 构建报表数据
             report_data = {
@@ -496,6 +509,7 @@ class SimplePDFService:
         Returns:
             dict: 包含success状态和file_path的字典
         """
+        from .eod_report_pdf_generator import EODReportPDFGenerator
         try:
             # 使用get_manager_file_path获取文件路径
             output_file = SimplePDFService.get_manager_file_path(
@@ -624,6 +638,7 @@ class SimplePDFService:
         Returns:
             str: PDF文件的base64编码内容
         """
+        from .eod_report_pdf_generator import EODReportPDFGenerator
         try:
             # 处理不同类型的输入数据
             if isinstance(stock_data, dict):
@@ -686,6 +701,8 @@ class SimplePDFService:
         Returns:
             str: PDF文件的base64编码内容
         """
+        from .pdf_base import PDFBase
+        from .eod_report_pdf_generator import EODReportPDFGenerator
         try:
             # 构建报表数据
             report_data = {
@@ -730,6 +747,8 @@ class SimplePDFService:
         Returns:
             str: PDF文件的base64编码内容
         """
+        from .pdf_base import PDFBase
+        from .eod_report_pdf_generator import EODReportPDFGenerator
         try:
             # 构建报表数据
             report_data = {
@@ -776,6 +795,7 @@ class SimplePDFService:
         Returns:
             dict: 包含成功状态和文件路径的字典
         """
+        from .eod_report_pdf_generator import EODReportPDFGenerator
         try:
             # 构建输出文件路径
             receipts_dir = os.path.join(os.path.dirname(__file__), '..', 'receipts')
@@ -852,6 +872,7 @@ class SimplePDFService:
         Returns:
             dict: 包含成功状态和文件路径的字典
         """
+        from .eod_report_pdf_generator import EODReportPDFGenerator
         try:
             # 从report_data中提取eod_id
             eod_id = None
@@ -5,6 +5,8 @@ from typing import List, Dict, Any, Optional
 import uuid
 import json
 from services.db_service import DatabaseService
+from services.balance_service import BalanceService
+from services.eod_lease_service import BusinessLockedError, EODLeaseService
 from services.receipt_service import ReceiptService
 from models.exchange_models import ExchangeTransaction, CurrencyBalance, Currency
 from sqlalchemy import text
@@ -169,14 +171,18 @@ class TransactionSplitService:
         current_time = current_datetime.strftime('%H:%M:%S')
         created_at = current_datetime  # created_at 使用 datetime 对象
 
+        # 一次分配整组票据编号（只加一次序列锁，编号连续）
+        transaction_nos = TransactionSplitService.generate_transaction_nos(
+            branch_id, len(transaction_groups), session
+        ) if transaction_groups else []
+
         for sequence, group in enumerate(transaction_groups, 1):
             # 计算加权平均汇率
             avg_rate = TransactionSplitService.calculate_weighted_average_rate(
                 group['items'], group['direction']
             )
 
-            # 生成交易号 - 使用统一的ReceiptService
-            transaction_no = TransactionSplitService.generate_transaction_no(branch_id, sequence, session)
+            transaction_no = transaction_nos[sequence - 1]
 
             # 确定交易类型和金额符号（站在网点角度）
             logger.info(f"[create_transaction_records] 分组{sequence}: 方向={group['direction']}, 总金额={group['total_amount']}, 平均汇率={avg_rate}")
@@ -233,6 +239,11 @@ class TransactionSplitService:
         """
         return ReceiptService.generate_receipt_number(branch_id, session)
 
+    @staticmethod
+    def generate_transaction_nos(branch_id: int, count: int, session=None) -> List[str]:
+        """一次生成 count 个连续交易号 - 使用统一的ReceiptService"""
+        return ReceiptService.generate_receipt_numbers(branch_id, count, session)
+
     @staticmethod
     def execute_split_transaction(
         denomination_data: Dict[str, Any],
@@ -289,8 +300,10 @@ class TransactionSplitService:
                 logger.info(f"[TransactionSplitService] 交易记录 {i+1}: 币种ID={record['currency_id']}, 方向={record['transaction_direction']}, 外币金额={record['amount']}, 本币金额={record['local_amount']}")
 
             # 4. 验证余额充足性（仅记录警告，不阻止交易）
+            # 不在这里加行锁：余额行统一在过账时按固定顺序锁定
             validation_result = TransactionSplitService.validate_balance_sufficiency(
-                session, transaction_records, branch_id, base_currency_id, 'zh-CN'  # Default to Chinese for internal validation
+                session, transaction_records, branch_id, base_currency_id, 'zh-CN',  # Default to Chinese for internal validation
+                lock_rows=False
             )
 
             # 记录验证结果，但不阻止交易（允许预约）
@@ -298,54 +311,13 @@ class TransactionSplitService:
                 logger.warning(f"[TransactionSplitService] 余额验证失败，但允许继续执行（用于预约）: {validation_result['message']}")
                 # 不返回错误，继续执行交易
 
-            # 5. 执行交易记录插入和余额更新
-            created_transactions = []
-
-            for record_data in transaction_records:
-                # 创建交易记录
-                transaction = ExchangeTransaction(**record_data)
-                session.add(transaction)
-                session.flush()  # 获取ID
-
-                # 更新外币余额
-                foreign_balance_result = TransactionSplitService.update_currency_balance(
-                    session, record_data, transaction.id
-                )
-
-                if not foreign_balance_result['success']:
-                    session.rollback()
-                    return {
-                        'success': False,
-                        'message': f'更新外币余额失败: {foreign_balance_result["message"]}',
-                        'data': None
-                    }
-
-                # 更新本币余额
-                local_amount = Decimal(str(record_data['local_amount']))
-                if local_amount != 0:  # 如果有本币变动
-                    base_currency_record = {
-                        'currency_id': base_currency_id,
-                        'branch_id': record_data['branch_id'],
-                        'amount': float(local_amount)  # 本币变动金额（已带正负号）
-                    }
-
-                    base_balance_result = TransactionSplitService.update_currency_balance(
-                        session, base_currency_record, transaction.id
-                    )
-
-                    if not base_balance_result['success']:
-                        session.rollback()
-                        return {
-                            'success': False,
-                            'message': f'更新本币余额失败: {base_balance_result["message"]}',
-                            'data': None
-                        }
-
-                # 更新交易记录的余额信息（外币余额）
-                transaction.balance_before = foreign_balance_result['balance_before']
-                transaction.balance_after = foreign_balance_result['balance_after']
+            # 5. 批量过账余额并插入交易记录
+            transactions = TransactionSplitService.post_transaction_records(
+                session, transaction_records, base_currency_id
+            )
 
-                created_transactions.append({
+            created_transactions = [
+                {
                     'id': transaction.id,
                     'transaction_no': transaction.transaction_no,
                     'currency_id': transaction.currency_id,
@@ -353,7 +325,12 @@ class TransactionSplitService:
                     'amount': transaction.amount,
                     'local_amount': transaction.local_amount,
                     'rate': transaction.rate
-                })
+                }
+                for transaction in transactions
+            ]
+
+            # 入口只按缓存快速拒绝，提交前在本事务中查询网点是否进入日结（本次请求唯一的锁定状态读取）
+            EODLeaseService.ensure_business_unlocked(session, branch_id)
 
             session.commit()
 
@@ -468,6 +445,14 @@ class TransactionSplitService:
                 }
             }
 
+        except BusinessLockedError as e:
+            session.rollback()
+            return {
+                'success': False,
+                'message': str(e),
+                'lock_reason': 'eod_in_progress',
+                'data': e.lock
+            }
         except Exception as e:
             session.rollback()
             logger.error(f"执行拆分交易失败: {str(e)}")
@@ -479,11 +464,59 @@ class TransactionSplitService:
         finally:
             DatabaseService.close_session(session)
 
+    @staticmethod
+    def post_transaction_records(
+        session, transaction_records: List[Dict[str, Any]], base_currency_id: int
+    ) -> List[ExchangeTransaction]:
+        """
+        批量过账一组交易记录（不提交）
+
+        所有外币/本币变动作为多条腿一次交给 BalanceService.post_balance_legs：
+        涉及的余额行按 (branch_id, currency_id) 排序后只锁定一次、每个币种只更新一次；
+        各腿按记录顺序依次计算前后余额，与逐条过账的结果一致。
+        交易记录在余额计算完成后一次性插入。
+
+        Args:
+            session: 数据库会话
+            transaction_records: create_transaction_records 生成的记录
+            base_currency_id: 本币ID
+
+        Returns:
+            已插入（已获取ID）的交易记录对象列表，顺序与 transaction_records 一致
+        """
+        legs = []
+        foreign_leg_index = []
+        for record_data in transaction_records:
+            foreign_leg_index.append(len(legs))
+            legs.append((record_data['branch_id'], record_data['currency_id'], Decimal(str(record_data['amount']))))
+
+            local_amount = Decimal(str(record_data['local_amount']))
+            if local_amount != 0:  # 如果有本币变动
+                legs.append((record_data['branch_id'], base_currency_id, local_amount))
+
+        # 双向交易允许余额为负（余额不足只做预警，见 validate_balance_sufficiency）
+        leg_results = BalanceService.post_balance_legs(session, legs, lock_for_update=True, allow_negative=True)
+
+        transactions = []
+        for record_data, leg_index in zip(transaction_records, foreign_leg_index):
+            # 交易记录的余额信息为外币余额
+            foreign_leg = leg_results[leg_index]
+            transactions.append(ExchangeTransaction(
+                **record_data,
+                balance_before=foreign_leg['balance_before'],
+                balance_after=foreign_leg['balance_after']
+            ))
+
+        session.add_all(transactions)
+        session.flush()  # 一次获取所有ID
+        return transactions
+
     @staticmethod
     def validate_balance_sufficiency(
-        session, transaction_records: List[Dict[str, Any]], branch_id: int, base_currency_id: int, language: str = 'zh-CN'
+        session, transaction_records: List[Dict[str, Any]], branch_id: int, base_currency_id: int, language: str = 'zh-CN',
+        lock_rows: bool = True
     ) -> Dict[str, Any]:
-        """验证余额充足性"""
+        """验证余额充足性（lock_rows=False 时只读取不加行锁）"""
         try:
             logger.info(f"[TransactionSplitService] validate_balance_sufficiency 开始验证余额，记录数: {len(transaction_records)}")
 
@@ -498,10 +531,11 @@ class TransactionSplitService:
                 # 检查外币余额
                 if amount_change < 0:  # 减少外币库存
                     logger.info(f"[TransactionSplitService] 需要减少外币库存，检查余额充足性...")
-                    balance = session.query(CurrencyBalance).filter_by(
+                    balance_query = session.query(CurrencyBalance).filter_by(
                         branch_id=branch_id,
                         currency_id=currency_id
-                    ).with_for_update().first()
+                    )
+                    balance = (balance_query.with_for_update() if lock_rows else balance_query).first()
 
                     logger.info(f"[TransactionSplitService] 当前外币余额记录: {balance}")
                     if balance:
@@ -530,10 +564,11 @@ class TransactionSplitService:
                 # 检查本币余额（如果有本币相关的余额记录）
                 if local_amount_change < 0:  # 减少本币库存
                     logger.info(f"[TransactionSplitService] 需要减少本币库存，检查余额充足性...")
-                    base_balance = session.query(CurrencyBalance).filter_by(
+                    base_balance_query = session.query(CurrencyBalance).filter_by(
                         branch_id=branch_id,
                         currency_id=base_currency_id
-                    ).with_for_update().first()
+                    )
+                    base_balance = (base_balance_query.with_for_update() if lock_rows else base_balance_query).first()
                     
                     logger.info(f"[TransactionSplitService] 当前本币余额记录: {base_balance}")
                     if base_balance:
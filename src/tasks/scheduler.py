@@ -37,6 +37,23 @@ def init_scheduler():
     except Exception as e:
         logger.error(f"添加清理任务失败: {str(e)}")
     
+    # 添加日间余额检查点任务（设置 BALANCE_CHECKPOINT_INTERVAL_MINUTES 时按该间隔执行）
+    try:
+        from services.balance_checkpoint_service import BalanceCheckpointService
+        
+        interval = BalanceCheckpointService.interval_minutes()
+        if interval:
+            scheduler.add_job(
+                BalanceCheckpointService.record_intraday_all,
+                trigger=IntervalTrigger(minutes=interval),
+                id='record_intraday_balance_checkpoints',
+                name='写入日间余额检查点',
+                replace_existing=True
+            )
+            logger.info(f"[OK] 已添加定时任务: 写入日间余额检查点（每{interval}分钟执行）")
+    except Exception as e:
+        logger.error(f"添加余额检查点任务失败: {str(e)}")
+    
     # 启动调度器
     scheduler.start()
     logger.info("[OK] 任务调度器已启动")
@@ -1,17 +1,19 @@
 import json
 import os
 from flask import request, has_request_context
+from services.shared_cache import SharedCache
 
 class I18nUtils:
     """后端国际化工具类"""
     
     _messages = {}
-    _loaded = False
+    # 翻译文件在各进程本地加载，reload_messages() 通过共享缓存通知所有工作进程重新加载
+    _cache = SharedCache.namespace('i18n_messages', local=True)
     
     @classmethod
     def _load_messages(cls):
         """加载所有语言的消息"""
-        if cls._loaded:
+        if cls._cache.get('messages') is not None:
             return
             
         # 使用模块化翻译文件
@@ -215,7 +217,12 @@ class I18nUtils:
                                 'supervisor_signature': 'ลายเซ็นผู้ดูแล'
                             }
         
-        cls._loaded = True
+        cls._cache.set('messages', cls._messages)
+    
+    @classmethod
+    def reload_messages(cls):
+        """翻译文件更新后调用，所有工作进程在下次获取消息时重新加载"""
+        cls._cache.clear()
     
     @classmethod
     def get_language(cls):
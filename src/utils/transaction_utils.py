@@ -25,6 +25,27 @@ def generate_unified_transaction_no(branch_id, transaction_type='EXCHANGE', sess
     except Exception as e:
         raise Exception(f"票据号生成失败: {e}")
 
+def generate_unified_transaction_nos(branch_id, count, transaction_type='EXCHANGE', session=None):
+    """
+    批量生成统一格式的单据号（一次分配一段连续编号）
+    
+    Args:
+        branch_id: 网点ID (必须提供)
+        count: 需要的单据号数量
+        transaction_type: 业务类型 (EXCHANGE, ADJUSTMENT, INITIAL, REVERSAL, EOD)
+        session: 数据库会话
+    
+    Returns:
+        list: 连续的单据号列表
+    """
+    if not branch_id:
+        raise ValueError("branch_id 是必需参数，无法生成统一格式的单据号")
+    
+    try:
+        return ReceiptService.generate_receipt_numbers(branch_id, count, session)
+    except Exception as e:
+        raise Exception(f"票据号生成失败: {e}")
+
 def generate_transaction_no(branch_id=None, session=None):
     """
     生成唯一的交易编号
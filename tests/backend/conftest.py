@@ -235,3 +235,20 @@ def reset_mocks():
     """Reset all mocks before each test"""
     yield
     # Cleanup can be added here if needed
+
+
+def pytest_terminal_summary(terminalreporter):
+    """Print the endpoints with the most SQL statements when QueryBudget collected any"""
+    query_budget = sys.modules.get('services.query_budget')
+    if query_budget is None:
+        return
+    report = query_budget.QueryBudget.render_report()
+    if report:
+        terminalreporter.section('query budget: top endpoints by SQL statements')
+        terminalreporter.write_line(report)
+    path = os.environ.get('QUERY_BUDGET_REPORT')
+    if path:
+        import json
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'endpoints': query_budget.QueryBudget.report(top=50),
+                       'violations': query_budget.QueryBudget.violations()}, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+余额检查点测试
+验证历史补写与对账、日间检查点参与理论余额计算后与原逐币种实现一致、
+日间检查点时点留出结算延迟、写入后才提交的时点之前交易可由对账发现、
+日结完成写入检查点、首次日结的开始时间取任意类型的第一笔交易，
+以及库存报表改读检查点后结果不变（含上次日结没有完成时间的情况）
+
+运行方式：
+    pytest tests/backend/services/test_balance_checkpoints.py -v
+"""
+
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, func
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../..', 'src'))
+
+from models.exchange_models import (
+    BalanceCheckpoint, Branch, Currency, EODBalanceVerification, EODStatus, ExchangeTransaction
+)
+from scripts.generate_synthetic_data import SyntheticDataGenerator, create_tables
+from services import db_service
+from services.balance_checkpoint_service import BalanceCheckpointService
+from services.eod_balance_engine import TheoreticalBalanceEngine
+from services.eod_service import EODService
+from services.log_service import LogService
+
+OPTIONS = dict(start_date=date(2024, 3, 1), days=4, branches=2, currencies=5, tellers=2, tx_per_day=40,
+               customers=30, reversal_rate=0.1, adjust_rate=1.0, diff_rate=0.3, batch=500, progress=None)
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'checkpoints.db'}", connect_args={'check_same_thread': False})
+    create_tables(engine)
+    generator = SyntheticDataGenerator(engine, seed=5, **OPTIONS)
+    generator.prepare()
+    generator.run()
+    original_bind = db_service.SessionLocal.kw['bind']
+    db_service.SessionLocal.configure(bind=engine)
+    monkeypatch.setattr(db_service, 'engine', engine)
+    session = db_service.SessionLocal()
+    # 每个网点最后一次日结改为进行中（待计算步骤3）
+    for branch in session.query(Branch).all():
+        eod_status = session.query(EODStatus).filter_by(branch_id=branch.id).order_by(EODStatus.id.desc()).first()
+        session.query(EODBalanceVerification).filter_by(eod_status_id=eod_status.id).delete()
+        eod_status.status = 'processing'
+        eod_status.completed_at = None
+        eod_status.step = 3
+    session.commit()
+    yield session
+    session.close()
+    db_service.SessionLocal.configure(bind=original_bind)
+    engine.dispose()
+
+
+def processing_eods(session):
+    return session.query(EODStatus).filter_by(status='processing').order_by(EODStatus.id).all()
+
+
+def calculate(session, eod_status, legacy=False):
+    branch = session.get(Branch, eod_status.branch_id)
+    currencies = session.query(Currency).order_by(Currency.id).all()
+    if legacy:
+        return EODService._calculate_balances_legacy(session, eod_status, branch, currencies)
+    return TheoreticalBalanceEngine.calculate(session, eod_status, branch, currencies)
+
+
+class TestBalanceCheckpoints:
+    """测试余额检查点"""
+
+    def test_backfill_and_verify(self, history):
+        counts = BalanceCheckpointService.backfill(history)
+        history.commit()
+        verifications = history.query(EODBalanceVerification).count()
+        assert counts == {'eod': verifications, 'opening': 2 * 6}
+        assert BalanceCheckpointService.verify(history) == []
+        assert BalanceCheckpointService.backfill(history) == {'eod': 0, 'opening': 0}
+
+        # 首次日结前的开始时间取首笔交易检查点
+        first = BalanceCheckpointService.first_activity_at(history, 1)
+        assert first == min(c.checkpoint_at for c in history.query(BalanceCheckpoint).filter_by(
+            branch_id=1, kind='opening')) - timedelta(seconds=1)
+
+        checkpoint = history.query(BalanceCheckpoint).filter_by(kind='eod').first()
+        checkpoint.balance = checkpoint.balance + 1
+        history.commit()
+        mismatches = BalanceCheckpointService.verify(history)
+        assert [(m['id'], m['reason']) for m in mismatches] == [(checkpoint.id, '与日结实际余额不一致')]
+
+    def test_intraday_checkpoints_keep_parity(self, history):
+        BalanceCheckpointService.backfill(history)
+        for eod_status in processing_eods(history):
+            for hours in (8, 3):
+                BalanceCheckpointService.record_intraday(
+                    history, eod_status.branch_id, eod_status.started_at - timedelta(hours=hours))
+        history.commit()
+        intraday = history.query(BalanceCheckpoint).filter_by(kind='intraday').all()
+        assert len(intraday) == 2 * 2 * 6
+        assert BalanceCheckpointService.verify(history) == []
+
+        for eod_status in processing_eods(history):
+            assert calculate(history, eod_status) == calculate(history, eod_status, legacy=True)
+
+        # 理论余额从最近的日间检查点开始累加
+        latest = max(intraday, key=lambda c: (c.checkpoint_at, c.id))
+        latest.period_change = latest.period_change + 100
+        history.commit()
+        eod_status = history.query(EODStatus).filter_by(branch_id=latest.branch_id, status='processing').one()
+        changed = {c['currency_id']: c['daily_change'] for c in calculate(history, eod_status)}
+        expected = {c['currency_id']: c['daily_change'] for c in calculate(history, eod_status, legacy=True)}
+        assert changed[latest.currency_id] == expected[latest.currency_id] + 100
+        assert [m['id'] for m in BalanceCheckpointService.verify(history)] == [latest.id]
+
+    def test_intraday_checkpoint_reports_late_transactions(self, history, monkeypatch):
+        BalanceCheckpointService.backfill(history)
+        monkeypatch.setenv('BALANCE_CHECKPOINT_SETTLE_SECONDS', '600')
+        BalanceCheckpointService.record_intraday(history, 1)
+        history.commit()
+        latest = history.query(func.max(BalanceCheckpoint.checkpoint_at)).filter_by(kind='intraday').scalar()
+        assert latest <= datetime.now() - timedelta(seconds=600)
+        history.query(BalanceCheckpoint).filter_by(kind='intraday').delete()
+
+        eod_status = processing_eods(history)[0]
+        at = eod_status.started_at - timedelta(hours=3)
+        BalanceCheckpointService.record_intraday(history, eod_status.branch_id, at)
+        history.commit()
+        assert BalanceCheckpointService.verify(history) == []
+
+        # 时点之前开始、检查点写入后才提交的交易
+        source = history.query(ExchangeTransaction).filter(
+            ExchangeTransaction.branch_id == eod_status.branch_id,
+            ExchangeTransaction.type == 'buy',
+            ExchangeTransaction.status == 'completed',
+            ExchangeTransaction.created_at < at
+        ).order_by(ExchangeTransaction.created_at.desc()).first()
+        late = ExchangeTransaction(
+            branch_id=source.branch_id, currency_id=source.currency_id, type='buy', amount=source.amount,
+            rate=source.rate, local_amount=source.local_amount, customer_name='late', operator_id=source.operator_id,
+            transaction_date=source.transaction_date, transaction_time=source.transaction_time,
+            transaction_no=f'{source.transaction_no}-L', created_at=at - timedelta(seconds=1), status='completed')
+        history.add(late)
+        history.commit()
+
+        flagged = {m['currency_id']: m['reason'] for m in BalanceCheckpointService.verify(history)}
+        base_currency_id = history.get(Branch, eod_status.branch_id).base_currency_id
+        assert set(flagged) == {source.currency_id, base_currency_id}
+        assert all(f'ID: {late.id}' in reason for reason in flagged.values())
+
+    def test_completed_eod_becomes_next_opening(self, history):
+        eod_status = processing_eods(history)[0]
+        calculations = calculate(history, eod_status)
+        for item in calculations:
+            history.add(EODBalanceVerification(
+                eod_status_id=eod_status.id, currency_id=item['currency_id'],
+                opening_balance=item['opening_balance'], theoretical_balance=item['theoretical_balance'],
+                actual_balance=item['actual_balance'], is_match=item['difference'] == 0,
+                difference=item['difference']))
+        eod_status.status = 'completed'
+        eod_status.completed_at = eod_status.started_at + timedelta(minutes=20)
+        history.flush()
+        assert BalanceCheckpointService.record_eod(history, eod_status) == len(calculations)
+        assert BalanceCheckpointService.record_eod(history, eod_status) == 0
+        history.commit()
+
+        openings = BalanceCheckpointService.openings(
+            history, eod_status.branch_id, 1, [c['currency_id'] for c in calculations],
+            eod_status.completed_at + timedelta(days=1))
+        for item in calculations:
+            balance, start, source = openings[item['currency_id']]
+            assert (float(balance), start, source) == (item['actual_balance'], eod_status.completed_at, 'eod')
+        assert BalanceCheckpointService.verify(history) == []
+
+    def test_stock_report_reads_checkpoints(self, history):
+        from routes.app_reports import CalBalance
+
+        eod_status = processing_eods(history)[0]
+        start, end = eod_status.started_at - timedelta(days=1), eod_status.started_at
+        history.close()
+        before = CalBalance(eod_status.branch_id, start, end)
+        session = db_service.SessionLocal()
+        BalanceCheckpointService.backfill(session)
+        session.commit()
+        session.close()
+        after = CalBalance(eod_status.branch_id, start, end)
+        assert after == before
+        assert any(c['opening_balance'] for c in after['currencies'])
+
+    def test_first_eod_starts_at_first_transaction_of_any_type(self, history, monkeypatch):
+        monkeypatch.setattr(LogService, 'log_system_event', staticmethod(lambda *args, **kwargs: None))
+        branch_id = 2
+        eod_ids = [e.id for e in history.query(EODStatus.id).filter_by(branch_id=branch_id)]
+        history.query(EODBalanceVerification).filter(EODBalanceVerification.eod_status_id.in_(eod_ids)).delete(
+            synchronize_session=False)
+        history.query(EODStatus).filter_by(branch_id=branch_id).delete()
+        BalanceCheckpointService.backfill(history)
+
+        # 最早的交易不是可作为期初的类型
+        source = history.query(ExchangeTransaction).filter_by(branch_id=branch_id).order_by(
+            ExchangeTransaction.created_at).first()
+        earliest = source.created_at - timedelta(hours=1)
+        history.add(ExchangeTransaction(
+            branch_id=branch_id, currency_id=source.currency_id, type='Eod_diff', amount=1, rate=1, local_amount=0,
+            customer_name='diff', operator_id=source.operator_id, transaction_date=earliest.date(),
+            transaction_time=earliest.strftime('%H:%M:%S'), transaction_no=f'{source.transaction_no}-D',
+            created_at=earliest, status='completed'))
+        history.commit()
+
+        assert BalanceCheckpointService.first_activity_at(history, branch_id) > earliest
+        assert BalanceCheckpointService.first_activity_at(history, branch_id, any_type=True) == earliest
+        result = EODService.start_eod(branch_id, 1, date.today(), session_id='terminal-a', ip_address='127.0.0.1')
+        assert result['success'], result['message']
+        history.expire_all()
+        assert history.get(EODStatus, result['eod_id']).business_start_time == earliest
+
+    def test_stock_report_uses_undated_completed_eod(self, history):
+        from routes.app_reports import CalBalance
+
+        # 历史日结都没有完成时间：期初沿用最近一次日结的实际余额，不退回第一笔交易
+        eod_status = processing_eods(history)[0]
+        branch_id = eod_status.branch_id
+        history.query(EODStatus).filter_by(branch_id=branch_id, status='completed').update({'completed_at': None})
+        history.commit()
+        latest = history.query(EODStatus).filter_by(branch_id=branch_id, status='completed').order_by(
+            EODStatus.id.desc()).first()
+        expected = {v.currency.currency_code: float(v.actual_balance)
+                    for v in history.query(EODBalanceVerification).filter_by(eod_status_id=latest.id)}
+        start, end = eod_status.started_at - timedelta(days=1), eod_status.started_at
+        history.close()
+
+        result = CalBalance(branch_id, start, end)
+        openings = {c['currency_code']: c['opening_balance'] for c in result['currencies'] if c['currency_code'] in expected}
+        assert openings and all(openings[code] == expected[code] for code in openings)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+多腿余额过账引擎测试
+验证 BalanceService.post_balance_legs 的前后余额、负余额校验和缺失记录插入
+
+运行方式：
+    pytest tests/backend/services/test_balance_posting.py -v
+"""
+
+import os
+import sys
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../..', 'src'))
+
+from models.exchange_models import Base, CurrencyBalance
+from services.balance_service import BalanceService
+
+
+@pytest.fixture
+def session():
+    engine = create_engine(
+        'sqlite://',
+        connect_args={'check_same_thread': False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine, tables=[CurrencyBalance.__table__])
+    Session = sessionmaker(bind=engine, autoflush=False)
+    session = Session()
+    session.add_all([
+        CurrencyBalance(branch_id=1, currency_id=1, balance=Decimal('1000.00')),
+        CurrencyBalance(branch_id=1, currency_id=2, balance=Decimal('50000.00')),
+        CurrencyBalance(branch_id=2, currency_id=1, balance=Decimal('10.00')),
+    ])
+    session.commit()
+    yield session
+    session.close()
+
+
+def _balance(session, branch_id, currency_id):
+    return Decimal(str(session.query(CurrencyBalance.balance).filter_by(
+        branch_id=branch_id, currency_id=currency_id
+    ).scalar()))
+
+
+class TestPostBalanceLegs:
+    """测试多腿过账"""
+
+    def test_returns_before_after_in_leg_order(self, session):
+        results = BalanceService.post_balance_legs(session, [
+            (1, 2, Decimal('-3500.00')),
+            (1, 1, Decimal('100.00')),
+        ])
+        session.commit()
+
+        assert [(r['branch_id'], r['currency_id']) for r in results] == [(1, 2), (1, 1)]
+        assert results[0]['balance_before'] == Decimal('50000.00')
+        assert results[0]['balance_after'] == Decimal('46500.00')
+        assert results[1]['balance_before'] == Decimal('1000.00')
+        assert results[1]['balance_after'] == Decimal('1100.00')
+        assert _balance(session, 1, 2) == Decimal('46500.00')
+        assert _balance(session, 1, 1) == Decimal('1100.00')
+        # 其他网点不受影响
+        assert _balance(session, 2, 1) == Decimal('10.00')
+
+    def test_same_key_legs_apply_sequentially(self, session):
+        results = BalanceService.post_balance_legs(session, [
+            (1, 1, Decimal('200.00')),
+            (1, 1, Decimal('-50.00')),
+        ])
+        session.commit()
+
+        assert results[0]['balance_after'] == Decimal('1200.00')
+        assert results[1]['balance_before'] == Decimal('1200.00')
+        assert results[1]['balance_after'] == Decimal('1150.00')
+        assert _balance(session, 1, 1) == Decimal('1150.00')
+
+    def test_creates_missing_balance_rows(self, session):
+        results = BalanceService.post_balance_legs(session, [
+            (3, 1, Decimal('25.00')),
+            (1, 1, Decimal('-25.00')),
+        ])
+        session.commit()
+
+        assert results[0]['balance_before'] == Decimal('0')
+        assert results[0]['balance_after'] == Decimal('25.00')
+        assert _balance(session, 3, 1) == Decimal('25.00')
+        assert session.query(CurrencyBalance).filter_by(branch_id=3).count() == 1
+
+    def test_insufficient_balance_rejects_whole_leg_set(self, session):
+        with pytest.raises(ValueError, match='余额不足'):
+            BalanceService.post_balance_legs(session, [
+                (1, 1, Decimal('100.00')),
+                (2, 1, Decimal('-20.00')),
+            ])
+        session.rollback()
+
+        assert _balance(session, 1, 1) == Decimal('1000.00')
+        assert _balance(session, 2, 1) == Decimal('10.00')
+
+    def test_allow_negative_permits_overdraft(self, session):
+        results = BalanceService.post_balance_legs(
+            session, [(2, 1, Decimal('-20.00'))], allow_negative=True
+        )
+        session.commit()
+
+        assert results[0]['balance_after'] == Decimal('-10.00')
+        assert _balance(session, 2, 1) == Decimal('-10.00')
+
+    def test_single_leg_wrapper_keeps_tuple_result(self, session):
+        before, after = BalanceService.update_currency_balance(
+            session=session,
+            currency_id=2,
+            branch_id=1,
+            amount=Decimal('500.00')
+        )
+        session.commit()
+
+        assert (before, after) == (Decimal('50000.00'), Decimal('50500.00'))
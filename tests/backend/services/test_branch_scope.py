@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+网点数据隔离测试
+验证 ORM 查询（含别名、聚合、关系懒加载）与 scoped_text() 原生查询不会返回其他网点的数据，
+以及全局表、unrestricted() 退出范围和无请求上下文时的 restrict() 范围
+
+运行方式：
+    pytest tests/backend/services/test_branch_scope.py -v
+"""
+
+import os
+import sys
+
+import pytest
+from flask import Flask, g
+from sqlalchemy import Column, ForeignKey, Integer, String, create_engine, func, select
+from sqlalchemy.orm import aliased, declarative_base, relationship, sessionmaker
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../..', 'src'))
+
+from services.branch_scope import BranchScope, scoped_text
+
+Base = declarative_base()
+
+
+class Currency(Base):
+    __tablename__ = 'currencies'
+    id = Column(Integer, primary_key=True)
+    code = Column(String(3))
+    branch_id = Column(Integer)
+
+
+class Customer(Base):
+    __tablename__ = 'customers'
+    id = Column(Integer, primary_key=True)
+    name = Column(String(20))
+    trades = relationship('Trade', back_populates='customer')
+
+
+class Trade(Base):
+    __tablename__ = 'trades'
+    id = Column(Integer, primary_key=True)
+    branch_id = Column(Integer, nullable=False)
+    customer_id = Column(Integer, ForeignKey('customers.id'))
+    amount = Column(Integer)
+    customer = relationship('Customer', back_populates='trades')
+
+
+@pytest.fixture
+def session():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    customer = Customer(id=1, name='shared')
+    db.add_all([
+        customer,
+        Currency(id=1, code='USD', branch_id=1),
+        Trade(id=1, branch_id=1, customer=customer, amount=100),
+        Trade(id=2, branch_id=1, customer=customer, amount=200),
+        Trade(id=3, branch_id=2, customer=customer, amount=999),
+    ])
+    db.commit()
+    BranchScope.install(Base)
+    yield db
+    BranchScope.uninstall()
+    db.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def branch_one_request():
+    app = Flask(__name__)
+    with app.test_request_context('/'):
+        g.current_user = {'id': 7, 'branch_id': 1, 'permissions': []}
+        yield
+
+
+class TestBranchScope:
+    """测试网点数据隔离"""
+
+    def test_orm_queries_do_not_leak_other_branches(self, session, branch_one_request):
+        assert BranchScope.scoped_models() == ['Trade']
+        assert sorted(t.id for t in session.query(Trade).all()) == [1, 2]
+        assert session.execute(select(func.sum(Trade.amount))).scalar() == 300
+        assert session.query(Trade).filter(Trade.id == 3).first() is None
+
+        alias = aliased(Trade)
+        assert sorted(session.scalars(select(alias.id))) == [1, 2]
+
+        session.expire_all()
+        customer = session.get(Customer, 1)
+        assert sorted(t.id for t in customer.trades) == [1, 2]
+
+        # 全局表不受限制
+        assert session.query(Currency).count() == 1
+
+    def test_unrestricted_scope_and_no_user(self, session, branch_one_request):
+        with BranchScope.unrestricted():
+            assert session.query(Trade).count() == 3
+        assert session.query(Trade).count() == 2
+
+        del g.current_user
+        assert session.query(Trade).count() == 3
+
+    def test_restrict_scope_without_request(self, session):
+        assert session.query(Trade).count() == 3
+        with BranchScope.restrict(2):
+            assert [t.id for t in session.query(Trade)] == [3]
+        with BranchScope.restrict(1):
+            assert session.query(Trade).count() == 2
+
+    def test_scoped_text_injects_branch_predicate(self, session, branch_one_request):
+        sql = "SELECT id FROM trades WHERE amount > :amount{branch_scope} ORDER BY id"
+        params = {'amount': 0}
+        assert [row[0] for row in session.execute(scoped_text(sql, params), params)] == [1, 2]
+
+        params = {'amount': 0}
+        with BranchScope.unrestricted():
+            statement = scoped_text(sql, params)
+        assert 'scope_branch_id' not in params
+        assert [row[0] for row in session.execute(statement, params)] == [1, 2, 3]
+
+        BranchScope.uninstall()
+        params = {'amount': 0}
+        assert str(scoped_text(sql, params)) == sql.replace('{branch_scope}', '')
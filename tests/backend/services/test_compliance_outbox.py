@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+合规检查发件箱测试
+验证发件箱记录随交易事务提交/回滚、任务只被处理一次、失败重试和结果查询
+
+运行方式：
+    pytest tests/backend/services/test_compliance_outbox.py -v
+"""
+
+import os
+import sys
+import threading
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../..', 'src'))
+
+from models.exchange_models import Base, ComplianceOutbox, Currency, ExchangeTransaction
+from services import compliance_outbox_service
+from services.amlo_trigger_service import AMLOTriggerService
+from services.bot_trigger_service import BOTTriggerService
+from services.compliance_outbox_service import (
+    MAX_ATTEMPTS, ComplianceOutboxService, ComplianceOutboxWorker
+)
+
+
+@pytest.fixture
+def Session(tmp_path, monkeypatch):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'outbox.db'}",
+        connect_args={'check_same_thread': False, 'timeout': 30}
+    )
+    Base.metadata.create_all(engine, tables=[
+        Currency.__table__, ExchangeTransaction.__table__, ComplianceOutbox.__table__
+    ])
+    Session = sessionmaker(bind=engine, autoflush=False)
+    session = Session()
+    session.add(Currency(id=2, currency_code='USD', currency_name='US Dollar'))
+    session.commit()
+    session.close()
+
+    monkeypatch.setattr(compliance_outbox_service.DatabaseService, 'get_session', staticmethod(Session))
+    yield Session
+    ComplianceOutboxWorker.stop()
+    engine.dispose()
+
+
+@pytest.fixture
+def checks(monkeypatch):
+    """替换AMLO/BOT触发服务，记录调用次数"""
+    calls = {'amlo': 0, 'bot': 0}
+    lock = threading.Lock()
+
+    def fake_amlo(session, transaction, currency, branch_id, operator_id):
+        with lock:
+            calls['amlo'] += 1
+        return {'amlo_101_created': True, 'amlo_102_created': False, 'amlo_103_created': False}
+
+    def fake_bot(session, transaction, currency, branch_id, operator_id):
+        with lock:
+            calls['bot'] += 1
+        return {'bot_buyfx_created': False, 'bot_sellfx_created': True, 'bot_fcd_created': False}
+
+    monkeypatch.setattr(AMLOTriggerService, 'check_and_create_amlo_records', staticmethod(fake_amlo))
+    monkeypatch.setattr(BOTTriggerService, 'check_and_create_bot_records', staticmethod(fake_bot))
+    return calls
+
+
+def _create_trade(Session, commit=True):
+    session = Session()
+    transaction = ExchangeTransaction(
+        transaction_no=f"T{datetime.now().strftime('%H%M%S%f')}", branch_id=1, currency_id=2,
+        type='buy', amount=100, rate=35, local_amount=-3500, operator_id=1,
+        transaction_date=date.today(), transaction_time='10:00:00', created_at=datetime.now()
+    )
+    session.add(transaction)
+    outbox = ComplianceOutboxService.enqueue(session, transaction, currency_id=2, branch_id=1, operator_id=1)
+    ids = (transaction.id, outbox.id)
+    if commit:
+        session.commit()
+    else:
+        session.rollback()
+    session.close()
+    return ids
+
+
+class TestComplianceOutbox:
+    """测试合规检查发件箱"""
+
+    def test_outbox_rolls_back_with_trade(self, Session):
+        _create_trade(Session, commit=False)
+
+        session = Session()
+        assert session.query(ComplianceOutbox).count() == 0
+        session.close()
+
+    def test_process_returns_compliance_block_once(self, Session, checks):
+        transaction_id, outbox_id = _create_trade(Session)
+
+        result = ComplianceOutboxService.process(outbox_id)
+        assert result == {
+            'amlo': {'triggered': True, 'reports': ['AMLO-1-01']},
+            'bot': {'triggered': True, 'reports': ['BOT_SellFX']}
+        }
+        # 已完成的任务不会再次处理
+        assert ComplianceOutboxService.process(outbox_id) is None
+        assert checks == {'amlo': 1, 'bot': 1}
+
+        session = Session()
+        status = ComplianceOutboxService.get_status(session, transaction_id)
+        assert status['status'] == 'done'
+        assert status['amlo']['reports'] == ['AMLO-1-01']
+        assert ComplianceOutboxService.get_status(session, transaction_id, branch_id=99) is None
+        session.close()
+
+    def test_concurrent_workers_process_each_task_once(self, Session, checks):
+        outbox_ids = [_create_trade(Session)[1] for _ in range(10)]
+
+        threads = [threading.Thread(target=ComplianceOutboxWorker.drain) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert checks == {'amlo': len(outbox_ids), 'bot': len(outbox_ids)}
+        session = Session()
+        assert {s for (s,) in session.query(ComplianceOutbox.status)} == {'done'}
+        session.close()
+
+    def test_failure_is_retried_then_marked_failed(self, Session, monkeypatch):
+        def broken(*args, **kwargs):
+            raise RuntimeError('规则表不可用')
+
+        monkeypatch.setattr(ComplianceOutboxService, 'run_checks', staticmethod(broken))
+        transaction_id, outbox_id = _create_trade(Session)
+
+        for _ in range(MAX_ATTEMPTS + 1):
+            assert ComplianceOutboxService.process(outbox_id) is None
+
+        session = Session()
+        outbox = session.get(ComplianceOutbox, outbox_id)
+        assert outbox.status == 'failed'
+        assert outbox.attempts == MAX_ATTEMPTS
+        assert '规则表不可用' in ComplianceOutboxService.get_status(session, transaction_id)['error']
+        session.close()
+
+    def test_worker_pool_submit(self, Session, checks):
+        _, outbox_id = _create_trade(Session)
+
+        future = ComplianceOutboxWorker.submit(outbox_id)
+        assert future.result(timeout=10)['bot']['reports'] == ['BOT_SellFX']
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+客户累计额度桶测试
+验证交易写入/冲正、批量语句和无原子 upsert 的数据库下额度桶的维护，以及与 RuleEngine 原始交易表查询结果一致（含冲正后的首末交易时间）
+
+运行方式：
+    pytest tests/backend/services/test_customer_exposure.py -v
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import count
+
+import pytest
+from sqlalchemy import create_engine, delete, insert, text, update
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../..', 'src'))
+
+from models.exchange_models import Base, CustomerExposureBucket, EODCashOut, ExchangeTransaction
+from services import customer_exposure_service
+from services.customer_exposure_service import CustomerExposureService
+from services.repform.rule_engine import RuleEngine
+
+_numbers = count(1)
+
+
+@pytest.fixture
+def session(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'exposure.db'}",
+        connect_args={'check_same_thread': False, 'timeout': 30}
+    )
+    tables = [ExchangeTransaction.__table__, EODCashOut.__table__, CustomerExposureBucket.__table__]
+    # 同一进程中其他测试加载了 denomination_models 时，删除交易会级联加载面值明细
+    if 'transaction_denominations' in Base.metadata.tables:
+        tables.append(Base.metadata.tables['transaction_denominations'])
+    Base.metadata.create_all(engine, tables=tables)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    CustomerExposureService.register_listeners(Session)
+    session = Session()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def _transaction(customer_id, local_amount, created_at, branch_id=1, status='completed'):
+    return ExchangeTransaction(
+        transaction_no=f"T{next(_numbers):08d}", branch_id=branch_id, currency_id=2, type='buy',
+        amount=Decimal('1'), rate=Decimal('35'), local_amount=Decimal(str(local_amount)),
+        customer_id=customer_id, operator_id=1, transaction_date=created_at.date(),
+        transaction_time=created_at.strftime('%H:%M:%S'), created_at=created_at, status=status
+    )
+
+
+def _raw_stats(session, monkeypatch, customer_id, now=None):
+    """额度桶关闭时 RuleEngine 走原始交易表查询"""
+    with monkeypatch.context() as m:
+        m.setattr(CustomerExposureService, 'is_enabled', classmethod(lambda cls, s: False))
+        return RuleEngine.get_customer_stats(session, customer_id), \
+            RuleEngine.get_customer_24h_stats(session, customer_id)
+
+
+def _populate(session, now):
+    rows = [
+        _transaction('P1', 1000, now - timedelta(minutes=5)),
+        _transaction('P1', -250.50, now - timedelta(hours=3), branch_id=2),
+        _transaction('P1', 700, now - timedelta(hours=23, minutes=59)),
+        _transaction('P1', 900, now - timedelta(hours=24, minutes=30)),
+        _transaction('P1', 400, now - timedelta(days=10)),
+        _transaction('P1', 5000, now - timedelta(days=40)),
+        _transaction('P1', 300, now - timedelta(hours=1), status='reversed'),
+        _transaction('P2', 800, now - timedelta(hours=2)),
+        _transaction(None, 600, now - timedelta(hours=2)),
+    ]
+    session.add_all(rows)
+    session.commit()
+    return rows
+
+
+class TestCustomerExposureBuckets:
+    """测试额度桶维护与查询"""
+
+    def test_buckets_match_raw_queries(self, session, monkeypatch):
+        _populate(session, datetime.now())
+
+        stats = CustomerExposureService.get_stats(session, 'P1')
+        stats_24h = CustomerExposureService.get_24h_stats(session, 'P1')
+        raw_stats, raw_24h = _raw_stats(session, monkeypatch, 'P1')
+
+        assert stats['transaction_count_30d'] == raw_stats['transaction_count_30d'] == 5
+        assert stats['cumulative_amount_30d'] == pytest.approx(raw_stats['cumulative_amount_30d'])
+        assert stats['branch_breakdown'] == raw_stats['branch_breakdown']
+        assert stats['last_transaction_date'] == raw_stats['last_transaction_date']
+
+        assert stats_24h['transaction_count_24h'] == raw_24h['transaction_count_24h'] == 3
+        assert stats_24h['cumulative_amount_24h'] == pytest.approx(raw_24h['cumulative_amount_24h'])
+        assert stats_24h['first_transaction_time'] == raw_24h['first_transaction_time']
+        assert stats_24h['last_transaction_time'] == raw_24h['last_transaction_time']
+
+        # RuleEngine 在额度桶可用时直接读取额度桶
+        assert RuleEngine.get_customer_stats(session, 'P1') == stats
+
+    def test_reversal_and_delete_update_buckets(self, session):
+        now = datetime.now()
+        first = _transaction('P1', 1000, now - timedelta(minutes=10))
+        second = _transaction('P1', 500, now - timedelta(minutes=5))
+        session.add_all([first, second])
+        session.commit()
+        assert CustomerExposureService.get_24h_stats(session, 'P1')['transaction_count_24h'] == 2
+
+        first.status = 'reversed'
+        session.commit()
+        stats = CustomerExposureService.get_24h_stats(session, 'P1')
+        assert stats['transaction_count_24h'] == 1
+        assert stats['cumulative_amount_24h'] == 500
+
+        second.local_amount = Decimal('750')
+        session.commit()
+        assert CustomerExposureService.get_stats(session, 'P1')['cumulative_amount_30d'] == 750
+
+        session.delete(second)
+        session.commit()
+        assert CustomerExposureService.get_stats(session, 'P1')['transaction_count_30d'] == 0
+        assert CustomerExposureService.check_consistency(session) == []
+
+    def test_24h_stats_match_raw_query_after_reversals(self, session, monkeypatch):
+        now = (datetime.now() - timedelta(hours=1)).replace(minute=30, second=0, microsecond=123456)
+        # 同一小时桶内最早和最晚的交易被冲正，桶内首末时间不再收紧
+        rows = [
+            _transaction('P1', 1000, now - timedelta(minutes=20)),
+            _transaction('P1', 500, now - timedelta(minutes=15)),
+            _transaction('P1', 300, now - timedelta(minutes=10)),
+            _transaction('P1', 200, now - timedelta(minutes=5)),
+        ]
+        session.add_all(rows)
+        session.commit()
+        rows[0].status = 'reversed'
+        rows[3].status = 'reversed'
+        session.commit()
+
+        stats_24h = CustomerExposureService.get_24h_stats(session, 'P1')
+        _, raw_24h = _raw_stats(session, monkeypatch, 'P1')
+        assert stats_24h == raw_24h
+        assert stats_24h['transaction_count_24h'] == 2
+        assert stats_24h['first_transaction_time'] == str(rows[1].created_at)
+        assert stats_24h['last_transaction_time'] == str(rows[2].created_at)
+
+    def test_rebuild_repairs_direct_sql_changes(self, session):
+        rows = _populate(session, datetime.now())
+        assert CustomerExposureService.check_consistency(session) == []
+
+        # 原生 SQL 文本直接修改交易表，额度桶不会同步
+        session.execute(text("UPDATE exchange_transactions SET status = 'reversed' WHERE id = :id"),
+                        {'id': rows[0].id})
+        session.commit()
+        mismatches = CustomerExposureService.check_consistency(session, customer_id='P1')
+        assert len(mismatches) == 1
+        assert mismatches[0]['expected_count'] == mismatches[0]['actual_count'] - 1
+
+        CustomerExposureService.rebuild(session, customer_id='P1')
+        session.commit()
+        assert CustomerExposureService.check_consistency(session) == []
+        assert CustomerExposureService.get_24h_stats(session, 'P1')['transaction_count_24h'] == 2
+
+    def test_bulk_statements_update_buckets(self, session):
+        now = datetime.now()
+        rows = _populate(session, now)
+
+        # Query.update / Query.delete
+        session.query(ExchangeTransaction).filter(ExchangeTransaction.id == rows[0].id).update(
+            {'status': 'reversed'}, synchronize_session=False)
+        session.query(ExchangeTransaction).filter_by(branch_id=2).delete()
+        session.commit()
+        assert CustomerExposureService.check_consistency(session) == []
+
+        # Core 语句和按主键批量更新
+        table = ExchangeTransaction.__table__
+        session.execute(update(table).where(table.c.customer_id == 'P2').values(local_amount=Decimal('1200')))
+        session.execute(update(ExchangeTransaction), [{'id': rows[2].id, 'customer_id': 'P3'}])
+        session.execute(insert(table), [{
+            'transaction_no': 'CORE0001', 'branch_id': 3, 'currency_id': 2, 'type': 'sell', 'amount': 1,
+            'rate': 35, 'local_amount': Decimal('-90'), 'customer_id': 'P3', 'operator_id': 1,
+            'transaction_date': now.date(), 'transaction_time': now.strftime('%H:%M:%S'), 'created_at': now
+        }])
+        session.commit()
+        assert CustomerExposureService.check_consistency(session) == []
+        assert CustomerExposureService.get_stats(session, 'P3')['transaction_count_30d'] == 2
+
+        session.execute(delete(ExchangeTransaction).where(ExchangeTransaction.customer_id == 'P1'))
+        session.commit()
+        assert CustomerExposureService.get_stats(session, 'P1')['transaction_count_30d'] == 0
+        assert CustomerExposureService.check_consistency(session) == []
+
+    def test_update_then_insert_without_upsert(self, session, monkeypatch):
+        monkeypatch.setattr(customer_exposure_service, 'UPSERT_DIALECTS', ())
+        now = datetime.now()
+        _populate(session, now)
+        # 与已有交易落在同一小时桶：走 UPDATE
+        session.add(_transaction('P1', 100, now - timedelta(minutes=5)))
+        session.commit()
+        assert CustomerExposureService.check_consistency(session) == []
+        created_at = now - timedelta(minutes=5)
+        bucket = session.query(CustomerExposureBucket).filter_by(
+            customer_id='P1', branch_id=1, bucket_hour=created_at.replace(minute=0, second=0, microsecond=0)).one()
+        assert (bucket.transaction_count, bucket.amount) == (2, Decimal('1100'))
+        assert CustomerExposureService.get_24h_stats(session, 'P1')['transaction_count_24h'] == 4
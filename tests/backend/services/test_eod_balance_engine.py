@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+日结理论余额批量计算测试
+验证 TheoreticalBalanceEngine 在合成历史数据上与原逐币种实现结果完全一致（含无上次日结、
+上次日结 completed_at 为空的回退路径），以及语句数不随币种数增长
+
+运行方式：
+    pytest tests/backend/services/test_eod_balance_engine.py -v
+"""
+
+import os
+import sys
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../..', 'src'))
+
+from models.exchange_models import Branch, Currency, EODBalanceVerification, EODStatus
+from scripts.generate_synthetic_data import SyntheticDataGenerator, create_tables
+from services import db_service
+from services.eod_balance_engine import TheoreticalBalanceEngine
+from services.eod_service import EODService
+from services.query_budget import QueryBudget
+
+OPTIONS = dict(start_date=date(2024, 3, 1), days=5, branches=2, currencies=6, tellers=2, tx_per_day=40,
+               customers=30, reversal_rate=0.1, adjust_rate=1.0, diff_rate=0.3, batch=500, progress=None)
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'eod.db'}", connect_args={'check_same_thread': False})
+    create_tables(engine)
+    generator = SyntheticDataGenerator(engine, seed=11, **OPTIONS)
+    generator.prepare()
+    generator.run()
+    original_bind = db_service.SessionLocal.kw['bind']
+    db_service.SessionLocal.configure(bind=engine)
+    monkeypatch.setattr(db_service, 'engine', engine)
+    session = db_service.SessionLocal()
+    # 每个网点最后一次日结改为进行中（待计算步骤3），覆盖最后一个营业日的交易
+    for branch in session.query(Branch).all():
+        eod_status = session.query(EODStatus).filter_by(branch_id=branch.id).order_by(EODStatus.id.desc()).first()
+        session.query(EODBalanceVerification).filter_by(eod_status_id=eod_status.id).delete()
+        eod_status.status = 'processing'
+        eod_status.completed_at = None
+        eod_status.step = 3
+        eod_status.step_status = 'processing'
+    session.commit()
+    yield session
+    session.close()
+    db_service.SessionLocal.configure(bind=original_bind)
+    engine.dispose()
+
+
+def compare_all(session):
+    """对每个日结分别用原实现和批量实现计算并比较"""
+    compared = 0
+    for eod_status in session.query(EODStatus).order_by(EODStatus.id).all():
+        branch = session.get(Branch, eod_status.branch_id)
+        currencies = session.query(Currency).order_by(Currency.id).all()
+        expected = EODService._calculate_balances_legacy(session, eod_status, branch, currencies)
+        actual = TheoreticalBalanceEngine.calculate(session, eod_status, branch, currencies)
+        assert actual == expected, f'EOD {eod_status.id}'
+        compared += len(actual)
+    return compared
+
+
+class TestTheoreticalBalanceEngine:
+    """测试日结理论余额批量计算"""
+
+    def test_parity_with_per_currency_calculation(self, history):
+        assert compare_all(history) > 0
+
+        # 回退路径：某币种没有日结验证记录；最近一次日结 completed_at 为空
+        history.query(EODBalanceVerification).filter(EODBalanceVerification.currency_id == 3).delete()
+        latest = history.query(EODStatus).filter(
+            EODStatus.branch_id == 2, EODStatus.status == 'completed'
+        ).order_by(EODStatus.completed_at.desc()).first()
+        latest.completed_at = None
+        history.commit()
+        assert compare_all(history) > 0
+
+    def test_step_uses_constant_number_of_statements(self, history, monkeypatch):
+        eod_status = history.query(EODStatus).filter_by(branch_id=1, status='processing').one()
+        branch = history.get(Branch, 1)
+        currencies = history.query(Currency).order_by(Currency.id).all()
+        expected = EODService._calculate_balances_legacy(history, eod_status, branch, currencies)
+        history.close()
+
+        monkeypatch.setattr('config.features.FeatureFlags.is_enabled', classmethod(lambda cls, name: True))
+        QueryBudget.reset()
+        with QueryBudget.limit(14, 'calculate_theoretical_balance'):
+            result = EODService.calculate_theoretical_balance(eod_status.id)
+        assert result['success'], result['message']
+        assert sorted(result['calculations'], key=lambda c: c['currency_id']) == expected
+        assert db_service.SessionLocal().get(EODStatus, eod_status.id).step == 4
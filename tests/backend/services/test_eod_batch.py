@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+批量日结测试
+验证多个网点并行执行完整日结流程并生成汇总、某个网点失败或余额不一致时不影响其他网点、
+中断后再次执行从已完成的步骤继续、心跳未超时的任务不能被其他进程接管，
+以及继续执行不存在的任务返回 404
+
+运行方式：
+    pytest tests/backend/services/test_eod_batch.py -v
+"""
+
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../..', 'src'))
+
+from models.exchange_models import CurrencyBalance, EODBatchItem, EODBatchRun, EODSessionLock, EODStatus
+from models import report_models  # noqa: F401  收入/库存报表表随 create_tables 创建
+from scripts.generate_synthetic_data import SyntheticDataGenerator, create_tables
+from services import db_service
+from services import eod_report_bundle_service
+from services.auth_service import generate_token
+from services.eod_batch_service import EODBatchService
+from services.eod_service import EODService
+from services.log_service import LogService
+from services.principal_cache import PrincipalCache
+
+OPTIONS = dict(start_date=date(2024, 3, 1), days=2, branches=3, currencies=3, tellers=2, tx_per_day=20,
+               customers=20, reversal_rate=0.1, adjust_rate=1.0, diff_rate=0.3, batch=500, progress=None)
+TARGET_DATE = date(2024, 3, 3)
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'batch.db'}", connect_args={'check_same_thread': False})
+    create_tables(engine)
+    generator = SyntheticDataGenerator(engine, seed=7, **OPTIONS)
+    generator.prepare()
+    generator.run()
+    original_bind = db_service.SessionLocal.kw['bind']
+    db_service.SessionLocal.configure(bind=engine)
+    monkeypatch.setattr(db_service, 'engine', engine)
+
+    def fake_renderer(name):
+        def render(*args):
+            if name in ('income', 'cashout'):
+                filename = args[1]
+            else:
+                filename = f"{name}_{args[0]}_{args[2]}.pdf"
+            file_path = str(tmp_path / filename)
+            open(file_path, 'w').close()
+            return {'success': True, 'file_path': file_path, 'filename': filename}
+        return render
+
+    monkeypatch.setattr(eod_report_bundle_service, 'RENDERERS',
+                        {name: fake_renderer(name) for name in eod_report_bundle_service.RENDERERS})
+    monkeypatch.setenv('EOD_REPORT_RENDER_WORKERS', '0')
+    # 系统日志另开会话写库，SQLite 下会等待写锁超时
+    monkeypatch.setattr(LogService, 'log_system_event', staticmethod(lambda *args, **kwargs: None))
+    monkeypatch.setattr(LogService, 'log_error', staticmethod(lambda *args, **kwargs: None))
+    session = db_service.SessionLocal()
+    yield session
+    session.close()
+    db_service.SessionLocal.configure(bind=original_bind)
+    engine.dispose()
+
+
+def create_run(session, branch_ids=(1, 2, 3), force_differences=True):
+    run = EODBatchService.create_run(session, branch_ids, 1, TARGET_DATE, workers=3,
+                                     force_differences=force_differences)
+    session.commit()
+    return run.id
+
+
+def by_branch(summary):
+    return {branch['branch_id']: branch for branch in summary['branches']}
+
+
+class TestEODBatch:
+    """测试批量日结"""
+
+    def test_runs_all_branches_in_parallel(self, history):
+        run_id = create_run(history)
+        summary = EODBatchService.run(run_id)
+
+        assert (summary['status'], summary['total'], summary['counts']) == ('completed', 3, {'completed': 3})
+        for branch in summary['branches']:
+            assert branch['stage'] == 'complete' and branch['attempts'] == 1
+            assert list(branch['durations']) == list(EODBatchService.STAGES)
+            eod_status = history.get(EODStatus, branch['eod_id'])
+            assert (eod_status.status, eod_status.step, eod_status.print_count) == ('completed', 9, 1)
+            assert eod_status.branch_id == branch['branch_id']
+        assert history.query(EODSessionLock).count() == 0
+        history.expire_all()
+        run = history.get(EODBatchRun, run_id)
+        assert (run.status, run.owner) == ('completed', None)
+        assert run.summary and run.finished_at
+
+    def test_branch_isolation(self, history, monkeypatch):
+        # 网点2 实际余额与理论余额不一致，网点3 收入统计出错
+        balance = history.query(CurrencyBalance).filter_by(branch_id=2).first()
+        balance.balance = balance.balance + 7
+        history.commit()
+        original = EODService.generate_income_statistics
+
+        def income(eod_id, operator_id, language='zh'):
+            if db_service.SessionLocal().get(EODStatus, eod_id).branch_id == 3:
+                raise RuntimeError('报表服务不可用')
+            return original(eod_id, operator_id, language)
+
+        monkeypatch.setattr(EODService, 'generate_income_statistics', staticmethod(income))
+        summary = EODBatchService.run(create_run(history, force_differences=False))
+
+        branches = by_branch(summary)
+        assert summary['status'] == 'partial'
+        assert summary['counts'] == {'completed': 1, 'attention': 1, 'failed': 1}
+        assert branches[1]['status'] == 'completed'
+        assert (branches[2]['status'], branches[2]['stage']) == ('attention', 'calculate')
+        assert '余额核对不一致' in branches[2]['message']
+        assert (branches[3]['status'], branches[3]['stage']) == ('failed', 'verify')
+        assert '报表服务不可用' in branches[3]['message']
+        # 未完成的网点日结保持进行中，会话锁定属于本任务
+        for branch_id in (2, 3):
+            eod_status = history.get(EODStatus, branches[branch_id]['eod_id'])
+            assert eod_status.status == 'processing'
+            lock = history.query(EODSessionLock).filter_by(eod_status_id=eod_status.id).one()
+            assert lock.session_id == EODBatchService.session_id(summary['run_id'], branch_id)
+
+    def test_resume_after_interruption(self, history, monkeypatch):
+        run_id = create_run(history)
+        original = EODService.print_report
+        monkeypatch.setattr(EODService, 'print_report', staticmethod(
+            lambda *args, **kwargs: (_ for _ in ()).throw(SystemError('进程中断'))))
+        first = EODBatchService.run(run_id)
+        assert first['counts'] == {'failed': 3}
+        assert {branch['stage'] for branch in first['branches']} == {'income'}
+        eod_ids = {branch['branch_id']: branch['eod_id'] for branch in first['branches']}
+
+        # 模拟进程在执行中被杀：任务停在 running，网点1 的会话锁定已过期被清理
+        run = history.get(EODBatchRun, run_id)
+        run.status, run.owner, run.heartbeat_at = 'running', 'other-host:1', datetime.now()
+        history.query(EODBatchItem).filter_by(run_id=run_id, branch_id=1).update({'status': 'running'})
+        history.query(EODSessionLock).filter_by(branch_id=1).delete()
+        history.commit()
+        with pytest.raises(ValueError, match='正由 other-host:1 执行'):
+            EODBatchService.run(run_id)
+
+        run.heartbeat_at = datetime.now() - timedelta(seconds=EODBatchService.stale_seconds() + 1)
+        history.commit()
+        monkeypatch.setattr(EODService, 'print_report', staticmethod(original))
+        calls = []
+        monkeypatch.setattr(EODService, 'extract_balance', staticmethod(lambda eod_id: calls.append(eod_id)))
+        second = EODBatchService.run(run_id)
+
+        assert (second['status'], second['counts']) == ('completed', {'completed': 3})
+        assert calls == []
+        for branch in second['branches']:
+            assert branch['eod_id'] == eod_ids[branch['branch_id']]
+            assert branch['attempts'] == 2
+        assert history.query(EODStatus).filter(EODStatus.date == TARGET_DATE).count() == 3
+
+    def test_heartbeat_refreshed_during_long_stage(self, history, monkeypatch):
+        monkeypatch.setenv('EOD_BATCH_HEARTBEAT_SECONDS', '0.1')
+        run_id = create_run(history, branch_ids=(1,))
+        original = EODService.extract_balance
+        seen = []
+
+        def slow_extract(eod_id):
+            session = db_service.SessionLocal()
+            try:
+                claimed = session.get(EODBatchRun, run_id).heartbeat_at
+                time.sleep(0.5)
+                session.expire_all()
+                seen.append((claimed, session.get(EODBatchRun, run_id).heartbeat_at))
+            finally:
+                session.close()
+            return original(eod_id)
+
+        monkeypatch.setattr(EODService, 'extract_balance', staticmethod(slow_extract))
+        assert EODBatchService.run(run_id)['status'] == 'completed'
+        claimed, during = seen[0]
+        assert during > claimed
+
+    def test_resume_unknown_run_returns_404(self, history, monkeypatch):
+        from routes.app_eod_batch import eod_batch_bp
+
+        user = {'id': 1, 'branch_id': 1, 'role_id': 1, 'permissions': ['system_manage'], 'is_admin': True}
+        monkeypatch.setattr(PrincipalCache, 'get_principal', classmethod(lambda cls, user_id, claims=None: dict(user)))
+        started = []
+        monkeypatch.setattr(EODBatchService, 'start_background', staticmethod(lambda run_id: started.append(run_id)))
+        app = Flask(__name__)
+        app.register_blueprint(eod_batch_bp)
+        headers = {'Authorization': f'Bearer {generate_token(str(user["id"]))}'}
+
+        response = app.test_client().post('/api/eod-batch/runs/999/resume', headers=headers)
+        assert response.status_code == 404
+        assert response.get_json()['success'] is False
+        assert started == []
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+日结会话租约测试
+验证租约令牌单调递增、被接管的旧持有者不能续期或完成日结、到期租约批量清理，
+以及营业锁定状态只在共享缓存后端上缓存、命中时不查询数据库、日结状态变更提交后立即失效，
+过账事务中的重新检查不受缓存影响，兑换接口每笔交易只查询一次营业锁定状态
+
+运行方式：
+    pytest tests/backend/services/test_eod_leases.py -v
+"""
+
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine, event, text
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../..', 'src'))
+
+from models.exchange_models import Branch, Currency, EODSessionLock, EODStatus
+from models import report_models  # noqa: F401  完成日结时更新收入/库存报表表
+from scripts.generate_synthetic_data import SyntheticDataGenerator, create_tables
+from services import db_service
+from services.eod_lease_service import BusinessLockedError, EODLeaseService
+from services.auth_service import generate_token
+from services.compliance_outbox_service import ComplianceOutboxWorker
+from services.eod_service import EODService
+from services.log_service import LogService
+from services.principal_cache import PrincipalCache
+from services.shared_cache import FileCacheBackend, SharedCache
+
+OPTIONS = dict(start_date=date(2024, 3, 1), days=2, branches=2, currencies=3, tellers=2, tx_per_day=10,
+               customers=10, reversal_rate=0.1, adjust_rate=1.0, diff_rate=0.3, batch=500, progress=None)
+TARGET_DATE = date(2024, 3, 3)
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'leases.db'}", connect_args={'check_same_thread': False})
+    create_tables(engine)
+    generator = SyntheticDataGenerator(engine, seed=9, **OPTIONS)
+    generator.prepare()
+    generator.run()
+    original_bind = db_service.SessionLocal.kw['bind']
+    db_service.SessionLocal.configure(bind=engine)
+    monkeypatch.setattr(db_service, 'engine', engine)
+    # 系统日志另开会话写库，SQLite 下会等待写锁超时
+    monkeypatch.setattr(LogService, 'log_system_event', staticmethod(lambda *args, **kwargs: None))
+    SharedCache.configure()
+    session = db_service.SessionLocal()
+    yield session
+    session.close()
+    SharedCache.configure()
+    db_service.SessionLocal.configure(bind=original_bind)
+    engine.dispose()
+
+
+@pytest.fixture
+def statements(history):
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    engine = db_service.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    yield executed
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+@pytest.fixture
+def exchange_client(history, monkeypatch):
+    from routes.exchange import exchange_bp
+
+    user = {'id': 1, 'branch_id': 1, 'role_id': 1, 'permissions': ['transaction_execute'], 'is_admin': False}
+    monkeypatch.setattr(PrincipalCache, 'get_principal', classmethod(lambda cls, user_id, claims=None: dict(user)))
+    monkeypatch.setattr(ComplianceOutboxWorker, 'submit', classmethod(lambda cls, outbox_id: None))
+    app = Flask(__name__)
+    app.register_blueprint(exchange_bp, url_prefix='/api/exchange')
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {generate_token(str(user["id"]))}'}
+    base_currency_id = history.get(Branch, 1).base_currency_id
+    currency_id = history.query(Currency.id).filter(Currency.id != base_currency_id).order_by(Currency.id).first()[0]
+
+    def perform():
+        return client.post('/api/exchange/perform', headers=headers, json={
+            'currency_id': currency_id, 'type': 'buy', 'amount': 10, 'local_amount': -350,
+            'exchange_rate': 35, 'customer_name': '测试客户'})
+    return perform
+
+
+def start(branch_id, session_id):
+    result = EODService.start_eod(branch_id, 1, TARGET_DATE, session_id=session_id, ip_address='127.0.0.1')
+    assert result['success'], result['message']
+    return result['eod_id'], result['fencing_token']
+
+
+class TestEODLeases:
+    """测试日结会话租约"""
+
+    def test_takeover_fences_previous_holder(self, history):
+        eod_id, first = start(1, 'terminal-a')
+        taken = EODService.continue_eod_session(eod_id, 'terminal-b', '127.0.0.2', 'ua')
+        assert taken['success'] and taken['fencing_token'] > first
+
+        # 原终端、以及同一会话ID但持有旧令牌的进程都不能再续期
+        assert not EODService.update_eod_session_activity('terminal-a', 1)['success']
+        assert not EODService.update_eod_session_activity('terminal-b', 1, first)['success']
+        assert EODService.update_eod_session_activity('terminal-b', 1, taken['fencing_token'])['success']
+        again = EODService.continue_eod_session(eod_id, 'terminal-b', '127.0.0.2', 'ua')
+        assert again['fencing_token'] > taken['fencing_token']
+
+        eod_status = history.get(EODStatus, eod_id)
+        eod_status.print_count = 1
+        history.commit()
+        stale = EODService.complete_eod(eod_id, 1, 'terminal-b', taken['fencing_token'])
+        assert (stale['success'], stale['message']) == (False, '会话锁定无效或已过期')
+        done = EODService.complete_eod(eod_id, 1, 'terminal-b', again['fencing_token'])
+        assert done['success'], done['message']
+        assert history.query(EODSessionLock).count() == 0
+
+        # 令牌在网点内单调递增，不因锁定删除而重置；其他网点独立计数
+        _, next_token = start(1, 'terminal-c')
+        assert next_token == again['fencing_token'] + 1
+        assert start(2, 'terminal-d')[1] == 1
+
+    def test_expired_leases_removed_in_bulk(self, history, statements):
+        eod_1, _ = start(1, 'terminal-a')
+        start(2, 'terminal-b')
+        history.query(EODSessionLock).filter_by(branch_id=1).update(
+            {'expires_at': datetime.now() - timedelta(seconds=1)})
+        history.query(EODSessionLock).filter_by(branch_id=2).update(
+            {'last_activity': datetime.now() - timedelta(hours=3)})
+        history.commit()
+
+        assert not EODService.update_eod_session_activity('terminal-a', 1)['success']
+        with db_service.SessionLocal() as session:
+            assert EODLeaseService.holder(session, eod_status_id=eod_1) is None
+        del statements[:]
+        result = EODService.cleanup_expired_eod_sessions(expire_hours=2)
+        assert result['cleaned_count'] == 2
+        assert len([s for s in statements if s.lstrip().upper().startswith('DELETE')]) == 1
+        assert history.query(EODSessionLock).count() == 0
+
+        # 租约到期的进行中日结在下次开始日结时自动取消
+        eod_2, _ = start(1, 'terminal-c')
+        history.expire_all()
+        assert history.get(EODStatus, eod_1).status == 'cancelled'
+        assert history.get(EODStatus, eod_2).status == 'processing'
+
+    def test_business_lock_cached_and_invalidated_on_commit(self, history, statements, tmp_path):
+        SharedCache.configure(FileCacheBackend(str(tmp_path / 'cache')))
+        assert EODService.check_business_lock(1)['is_locked'] is False
+        del statements[:]
+        for _ in range(5):
+            assert EODService.check_business_lock(1) == {
+                'success': True, 'is_locked': False, 'eod_id': None, 'lock_date': None}
+        assert statements == []
+
+        eod_id, _ = start(1, 'terminal-a')
+        assert EODService.check_business_lock(1) == {
+            'success': True, 'is_locked': True, 'eod_id': eod_id, 'lock_date': TARGET_DATE.isoformat()}
+        assert EODService.check_business_lock(2)['is_locked'] is False
+
+        EODService.handle_verification_result(eod_id, 'cancel', '测试')
+        assert EODService.check_business_lock(1)['is_locked'] is False
+
+        # 批量更新清除所有网点
+        EODService.check_business_lock(2)
+        history.query(EODStatus).filter_by(id=eod_id).update({'status': 'processing', 'is_locked': True})
+        history.commit()
+        assert EODService.check_business_lock(1)['eod_id'] == eod_id
+
+        # 回滚的修改不影响缓存
+        history.query(EODStatus).filter_by(id=eod_id).update({'status': 'cancelled'})
+        history.rollback()
+        assert EODService.check_business_lock(1)['is_locked'] is True
+
+    def test_cache_disabled_reads_every_time(self, history, statements, monkeypatch, tmp_path):
+        # 进程内后端不能通知其他工作进程，不缓存
+        for _ in range(3):
+            assert EODService.check_business_lock(1)['is_locked'] is False
+        assert len([s for s in statements if 'eod_status' in s]) == 3
+
+        SharedCache.configure(FileCacheBackend(str(tmp_path / 'cache')))
+        monkeypatch.setenv('EOD_BUSINESS_LOCK_CACHE_TTL', '0')
+        for _ in range(3):
+            assert EODService.check_business_lock(1)['is_locked'] is False
+        assert len([s for s in statements if 'eod_status' in s]) == 6
+
+    def test_racing_load_does_not_store_stale_value(self, history, tmp_path):
+        SharedCache.configure(FileCacheBackend(str(tmp_path / 'cache')))
+        stale = EODLeaseService.load_business_lock(history, 1)
+
+        def load():
+            # 读取之后、写回之前另一个事务开始日结并提交
+            start(1, 'terminal-a')
+            return stale
+
+        assert EODLeaseService._business_locks.get_or_load(1, load, ttl=30)['is_locked'] is False
+        assert EODService.check_business_lock(1)['is_locked'] is True
+
+    def test_posting_rechecks_lock_in_transaction(self, history, tmp_path):
+        SharedCache.configure(FileCacheBackend(str(tmp_path / 'cache')))
+        eod_id, _ = start(1, 'terminal-a')
+        history.execute(text("UPDATE eod_status SET status = 'cancelled' WHERE id = :id"), {'id': eod_id})
+        history.commit()
+        EODLeaseService.invalidate_business_lock()
+        assert EODService.check_business_lock(1)['is_locked'] is False
+        with db_service.SessionLocal() as session:
+            EODLeaseService.ensure_business_unlocked(session, 1)
+
+        # 原生 SQL 修改不触发失效，缓存仍为未锁定，过账事务中的检查直接读库
+        history.execute(text("UPDATE eod_status SET status = 'processing' WHERE id = :id"), {'id': eod_id})
+        history.commit()
+        assert EODService.check_business_lock(1)['is_locked'] is False
+        with db_service.SessionLocal() as session:
+            with pytest.raises(BusinessLockedError) as excinfo:
+                EODLeaseService.ensure_business_unlocked(session, 1)
+        assert excinfo.value.lock['eod_id'] == eod_id
+        EODLeaseService.ensure_business_unlocked(history, 2)
+
+    def test_perform_reads_business_lock_once(self, history, statements, exchange_client):
+        # 默认的进程内后端：入口不查询，只有过账事务中的一次读取
+        for _ in range(2):
+            del statements[:]
+            response = exchange_client()
+            assert response.status_code == 200, response.get_json()
+            assert len([s for s in statements if 'FROM eod_status' in s]) == 1
+
+        eod_id, _ = start(1, 'terminal-a')
+        del statements[:]
+        response = exchange_client()
+        assert response.status_code == 423
+        assert response.get_json()['eod_id'] == eod_id
+        assert len([s for s in statements if 'FROM eod_status' in s]) == 1
+
+    def test_perform_fast_fails_from_shared_cache(self, history, statements, exchange_client, tmp_path):
+        SharedCache.configure(FileCacheBackend(str(tmp_path / 'cache')))
+        assert exchange_client().status_code == 200
+        eod_id, _ = start(1, 'terminal-a')
+        assert exchange_client().status_code == 423
+
+        # 缓存已有锁定状态，入口直接拒绝，不查询数据库
+        del statements[:]
+        response = exchange_client()
+        assert response.status_code == 423
+        assert response.get_json()['lock_reason'] == 'eod_in_progress'
+        assert [s for s in statements if 'eod_status' in s] == []
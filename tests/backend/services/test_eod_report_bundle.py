@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+日结报表数据包测试
+验证收入统计数据模型按日结只计算一次（新交易后重新计算）、各语言报表在进程池中生成（超时改在当前进程内生成）、
+内容不变时重印直接使用已生成的文件，以及结果中返回各阶段耗时
+
+运行方式：
+    pytest tests/backend/services/test_eod_report_bundle.py -v
+"""
+
+import json
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../..', 'src'))
+
+from models.exchange_models import EODBalanceVerification, EODStatus, ExchangeTransaction
+from models import report_models  # noqa: F401  收入/库存报表表随 create_tables 创建
+from scripts.generate_synthetic_data import SyntheticDataGenerator, create_tables
+from services import db_service
+from services import eod_report_bundle_service
+from services.eod_report_bundle_service import LANGUAGES, EODReportBundleService
+from services.eod_service import EODService
+from services.log_service import LogService
+from services.simple_pdf_service import SimplePDFService
+
+OPTIONS = dict(start_date=date(2024, 3, 1), days=3, branches=1, currencies=4, tellers=2, tx_per_day=30,
+               customers=20, reversal_rate=0.1, adjust_rate=1.0, diff_rate=0.3, batch=500, progress=None)
+
+# 测试用生成器的输出目录（进程池 fork 时复制到子进程）
+OUTPUT_DIR = None
+
+
+def fake_renderer(name):
+    def render(*args):
+        if name in ('income', 'cashout'):
+            filename, language = args[1], args[-1]
+        else:
+            filename, language = f"{name}_{args[0]}_{args[2]}.pdf", args[2]
+        file_path = os.path.join(OUTPUT_DIR, filename)
+        with open(file_path, 'w') as f:
+            # 交款汇总表写入表头，便于检查生成参数
+            f.write(json.dumps(args[0]['header']) if name == 'cashout' else language)
+        return {'success': True, 'file_path': file_path, 'filename': filename, 'pid': os.getpid()}
+    return render
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'bundle.db'}", connect_args={'check_same_thread': False})
+    create_tables(engine)
+    generator = SyntheticDataGenerator(engine, seed=3, **OPTIONS)
+    generator.prepare()
+    generator.run()
+    original_bind = db_service.SessionLocal.kw['bind']
+    db_service.SessionLocal.configure(bind=engine)
+    monkeypatch.setattr(db_service, 'engine', engine)
+    monkeypatch.setattr(sys.modules[__name__], 'OUTPUT_DIR', str(tmp_path))
+    monkeypatch.setattr(eod_report_bundle_service, 'RENDERERS',
+                        {name: fake_renderer(name) for name in eod_report_bundle_service.RENDERERS})
+    monkeypatch.setenv('EOD_REPORT_RENDER_WORKERS', '3')
+    # 测试用生成器是本模块中的闭包，只有 fork 的子进程能使用
+    monkeypatch.setenv('EOD_REPORT_RENDER_START_METHOD', 'fork')
+    # 系统日志在报表写入事务中另开会话写库，SQLite 下会等待写锁超时
+    monkeypatch.setattr(LogService, 'log_system_event', staticmethod(lambda *args, **kwargs: None))
+    monkeypatch.setattr(SimplePDFService, 'get_manager_file_path',
+                        staticmethod(lambda report_type, *args, **kwargs: str(tmp_path / f'{report_type}.pdf')))
+    session = db_service.SessionLocal()
+    # 最后一次日结改为进行中（待收入统计）
+    eod_status = session.query(EODStatus).order_by(EODStatus.id.desc()).first()
+    eod_status.status = 'processing'
+    eod_status.completed_at = None
+    eod_status.step = 5
+    session.commit()
+    yield session
+    EODReportBundleService.shutdown()
+    session.close()
+    db_service.SessionLocal.configure(bind=original_bind)
+    engine.dispose()
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    import routes.app_reports as app_reports
+
+    counts = {'CalGain': 0}
+    original = app_reports.CalGain
+
+    def counting(*args):
+        counts['CalGain'] += 1
+        return original(*args)
+
+    monkeypatch.setattr(app_reports, 'CalGain', counting)
+    return counts
+
+
+def processing_eod(session):
+    return session.query(EODStatus).filter_by(status='processing').one()
+
+
+def stored_results(session, eod_id, group):
+    session.expire_all()
+    return json.loads(EODReportBundleService.get(session, eod_id).artifacts)[group]['files']
+
+
+class TestEODReportBundle:
+    """测试日结报表数据包"""
+
+    def test_income_model_computed_once_and_rendered_in_pool(self, history, calls):
+        eod_id = processing_eod(history).id
+
+        first = EODService.generate_income_statistics(eod_id, 1)
+        assert first['success'], first['message']
+        assert first['pdf_generated'] and sorted(first['pdf_file_paths']) == ['en', 'th', 'zh']
+        assert all(os.path.exists(path) for path in first['pdf_file_paths'].values())
+        assert {'compute.income', 'compute.stock', 'compute.base_currency', 'render.income.wall'} <= set(first['timings'])
+        assert all(r['pid'] != os.getpid() for r in stored_results(history, eod_id, 'income').values())
+        assert calls['CalGain'] == 1
+
+        # 数据未变化：直接读取数据模型和已生成的文件
+        second = EODService.generate_income_statistics(eod_id, 1)
+        assert second['success'], second['message']
+        assert calls['CalGain'] == 1
+        assert {'compute.cached', 'reuse.income'} <= set(second['timings'])
+        assert second['income_data'] == first['income_data']
+        assert second['stock_data'] == first['stock_data']
+        assert second['pdf_file_paths'] == first['pdf_file_paths']
+
+        # 新增交易后重新计算
+        tx = history.query(ExchangeTransaction).order_by(ExchangeTransaction.id.desc()).first()
+        values = {c.name: getattr(tx, c.name) for c in ExchangeTransaction.__table__.columns if c.name != 'id'}
+        values['transaction_no'] = f"{tx.transaction_no}X"
+        history.add(ExchangeTransaction(**values))
+        history.commit()
+        third = EODService.generate_income_statistics(eod_id, 1)
+        assert third['success'], third['message']
+        assert calls['CalGain'] == 2
+        assert 'compute.income' in third['timings']
+
+    def test_legacy_time_range_reuses_model(self, history, calls):
+        # 日结记录没有业务时间范围时以当前时间为结束时间，每次调用都不同
+        eod_status = processing_eod(history)
+        eod_status.business_start_time = None
+        eod_status.business_end_time = None
+        history.commit()
+
+        first = EODService.generate_income_statistics(eod_status.id, 1)
+        assert first['success'], first['message']
+        second = EODService.generate_income_statistics(eod_status.id, 1)
+        assert second['success'], second['message']
+        assert calls['CalGain'] == 1
+        assert 'compute.cached' in second['timings']
+        assert second['income_data'] == first['income_data']
+
+        # 结束时间早于已保存的结束时间时重新计算
+        history.expire_all()
+        bundle = EODReportBundleService.get(history, eod_status.id)
+        EODReportBundleService.compute(history, processing_eod(history), bundle.start_time,
+                                       bundle.end_time - timedelta(seconds=1))
+        assert calls['CalGain'] == 2
+        history.rollback()
+
+    def test_reprints_use_stored_artifacts(self, history, calls, monkeypatch):
+        eod_id = processing_eod(history).id
+        generated = EODService.generate_income_statistics(eod_id, 1)['pdf_file_paths']
+
+        th = EODService.print_income_reports(eod_id, 1, 'th-TH')
+        assert th['success'], th['message']
+        assert (th['success'], th['source'], th['file_path']) == (True, 'synchronized', generated['th'])
+
+        # 综合报表（含本币库存）仍按报表表数据生成，不使用收入报表文件
+        comprehensive_calls = []
+
+        def comprehensive_pdf(data, filename, target_date, language='zh'):
+            comprehensive_calls.append(data)
+            return {'success': True, 'file_path': os.path.join(OUTPUT_DIR, 'comprehensive', filename)}
+
+        monkeypatch.setattr(SimplePDFService, 'generate_comprehensive_eod_report_pdf',
+                            staticmethod(comprehensive_pdf))
+        comprehensive = EODService.print_comprehensive_reports(eod_id, 1)
+        assert comprehensive['success'], comprehensive['message']
+        assert 'source' not in comprehensive
+        assert [data['eod_id'] for data in comprehensive_calls] == [eod_id]
+        assert comprehensive['file_path'] != generated['zh']
+
+        # 文件丢失时按已保存的数据模型只重新生成该语言
+        os.remove(generated['en'])
+        en = EODService.print_income_reports(eod_id, 1, 'en-US')
+        assert (en['success'], en['source']) == (True, 'regenerated')
+        assert os.path.exists(en['file_path'])
+        assert calls['CalGain'] == 1
+
+    def test_print_report_reuses_unchanged_content(self, history):
+        eod_status = processing_eod(history)
+        verification = history.query(EODBalanceVerification).filter_by(eod_status_id=eod_status.id).first()
+        verification.difference = 5
+        eod_status.step = 7
+        history.commit()
+
+        first = EODService.print_report(eod_status.id, 1)
+        assert first['success'], first['message']
+        assert [f['language'] for f in first['generated_files']] == ['zh', 'en', 'th']
+        assert 'render.print.wall' in first['timings']
+        files = stored_results(history, eod_status.id, 'print')
+        # 差额调节表或差额报告表（视合成数据中是否有差额调节）与交款汇总表一起生成
+        assert sorted(key for key in files if '.' not in key) == ['en', 'th', 'zh']
+        assert sorted(key.split('.')[1] for key in files if key.startswith('difference')) == ['en', 'th', 'zh']
+
+        # 交款汇总表的生成参数中没有操作员和打印时间，本次打印的操作员随结果返回
+        with open(first['generated_files'][0]['file_path']) as f:
+            header = json.loads(f.read())
+        assert header['eod_id'] == eod_status.id
+        assert 'operator_name' not in header and 'generated_time' not in header
+        assert first['printed_by']
+        again = EODService.print_report(eod_status.id, 2)
+        assert again['success'], again['message']
+        assert 'reuse.print' in again['timings']
+        assert again['printed_at'] >= first['printed_at']
+        assert again['print_count'] == first['print_count'] + 1
+        assert [f['file_path'] for f in again['generated_files']] == [f['file_path'] for f in first['generated_files']]
+
+    def test_sequential_rendering_without_pool(self, history, monkeypatch):
+        monkeypatch.setenv('EOD_REPORT_RENDER_WORKERS', '0')
+        eod_id = processing_eod(history).id
+        result = EODService.generate_income_statistics(eod_id, 1)
+        assert result['success'] and result['pdf_generated']
+        assert all(r['pid'] == os.getpid() for r in stored_results(history, eod_id, 'income').values())
+        assert EODReportBundleService._executor is None
+
+    def test_pool_timeout_falls_back_to_in_process(self, history, monkeypatch):
+        parent = os.getpid()
+
+        def slow(value):
+            if os.getpid() != parent:
+                time.sleep(30)
+            return {'success': True, 'value': value, 'pid': os.getpid()}
+
+        monkeypatch.setitem(eod_report_bundle_service.RENDERERS, 'slow', slow)
+        monkeypatch.setenv('EOD_REPORT_RENDER_TIMEOUT_SECONDS', '0.5')
+        started = time.monotonic()
+        results, timings = EODReportBundleService.render([(key, 'slow', (key,)) for key in LANGUAGES], 'test')
+        assert time.monotonic() - started < 10
+        assert {key: (r['value'], r['pid']) for key, r in results.items()} == {
+            key: (key, parent) for key in LANGUAGES}
+        assert 'render.test.wall' in timings
+        assert EODReportBundleService._executor is None
+
+    def test_default_start_method_does_not_fork(self, monkeypatch):
+        monkeypatch.delenv('EOD_REPORT_RENDER_START_METHOD', raising=False)
+        assert EODReportBundleService.start_method() in ('forkserver', 'spawn')
+        monkeypatch.setenv('EOD_REPORT_RENDER_START_METHOD', 'unknown')
+        assert EODReportBundleService.start_method() in ('forkserver', 'spawn')
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+交易预检测试
+验证整篮交易的余额推演、报警阈值、用途限额和AMLO/BOT触发检查
+
+运行方式：
+    pytest tests/backend/services/test_exchange_precheck.py -v
+"""
+
+import json
+import os
+import sys
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../..', 'src'))
+
+from models.exchange_models import (
+    Base, Branch, BranchBalanceAlert, Currency, CurrencyBalance, ExchangeRate, ExchangeTransaction,
+    TransactionPurposeLimit
+)
+from models.report_models import TriggerRule
+from services.exchange_precheck_service import ExchangePrecheckService
+from services.reference_data_cache import ReferenceDataCache
+from services.repform.rule_compiler import RuleCache
+
+
+def _rule(report_type, field, threshold, allow_continue=True):
+    return TriggerRule(
+        rule_name=f'{report_type} {field}', report_type=report_type, priority=10,
+        allow_continue=allow_continue, is_active=True, warning_message_cn=f'{report_type} 触发',
+        rule_expression=json.dumps({'logic': 'AND', 'conditions': [
+            {'field': field, 'operator': '>=', 'value': threshold}
+        ]})
+    )
+
+
+@pytest.fixture
+def session():
+    engine = create_engine(
+        'sqlite://',
+        connect_args={'check_same_thread': False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine, tables=[
+        Branch.__table__, Currency.__table__, CurrencyBalance.__table__, BranchBalanceAlert.__table__,
+        TransactionPurposeLimit.__table__, ExchangeRate.__table__, ExchangeTransaction.__table__,
+        TriggerRule.__table__
+    ])
+    session = sessionmaker(bind=engine)()
+    for currency_id, code in ((1, 'THB'), (2, 'USD'), (3, 'EUR')):
+        session.add(Currency(id=currency_id, currency_code=code, currency_name=code))
+    session.add(Branch(id=1, branch_name='Head Office', branch_code='A005', base_currency_id=1))
+    session.add_all([
+        CurrencyBalance(branch_id=1, currency_id=1, balance=Decimal('50000')),
+        CurrencyBalance(branch_id=1, currency_id=2, balance=Decimal('1000')),
+        BranchBalanceAlert(branch_id=1, currency_id=2, min_threshold=Decimal('500'), is_active=True),
+        TransactionPurposeLimit(branch_id=1, purpose_name='旅游', currency_code='USD',
+                                max_amount=Decimal('800'), display_message='旅游限额800美元'),
+        ExchangeRate(branch_id=1, currency_id=2, rate_date=date.today(), buy_rate=35, sell_rate=36, created_by=1),
+        ExchangeTransaction(
+            transaction_no='T0001', branch_id=1, currency_id=2, type='sell', amount=Decimal('-300'),
+            rate=Decimal('35'), local_amount=Decimal('10000'), customer_id='P1', operator_id=1,
+            transaction_date=date.today(), transaction_time='09:00:00', created_at=datetime.now(),
+            status='completed'
+        ),
+        _rule('AMLO-1-01', 'total_amount', 2000000, allow_continue=False),
+        _rule('AMLO-1-02', 'cumulative_amount_30d', 30000),
+        _rule('BOT_SellFX', 'usd_equivalent', 500),
+    ])
+    session.commit()
+
+    ReferenceDataCache.invalidate_all()
+    RuleCache.invalidate()
+    yield session
+    ReferenceDataCache.invalidate_all()
+    RuleCache.invalidate()
+    session.close()
+    engine.dispose()
+
+
+class TestExchangePrecheck:
+    """测试交易预检"""
+
+    def test_basket_is_evaluated_leg_by_leg(self, session):
+        result = ExchangePrecheckService.precheck(session, 1, [
+            {'currency_id': 2, 'type': 'sell', 'amount': 600, 'rate': 35, 'purpose': '旅游'},
+            {'currency_id': 2, 'type': 'sell', 'amount': 500, 'rate': 35},
+            {'currency_id': 3, 'type': 'buy', 'denominations': [{'denomination': 50, 'quantity': 2}], 'rate': 40},
+        ], customer_id='P1')
+
+        first, second, third = result['legs']
+        assert (first['balance']['before'], first['balance']['after']) == (1000, 400)
+        assert first['balance']['alert']['level'] == 'critical'
+        assert first['purpose_limit']['exceeded'] is False
+        assert first['amlo']['report_types'] == ['AMLO-1-02']
+        assert first['bot']['report_types'] == ['BOT_SellFX']
+        assert first['can_proceed'] is True
+
+        # 同币种第二笔在第一笔之后推演：余额不足
+        assert second['balance']['after'] == -100
+        assert second['blocking_reasons'] == ['foreign_balance_insufficient']
+
+        assert third['amount'] == 100
+        assert (third['balance']['before'], third['balance']['after']) == (0, 100)
+        assert third['base_balance']['after'] == 50000 + 21000 + 17500 - 4000
+
+        assert result['can_proceed'] is False
+        assert result['base_currency']['after'] == 84500
+        assert result['customer_stats']['transaction_count_30d'] == 1
+
+    def test_purpose_limit_and_blocking_trigger(self, session):
+        result = ExchangePrecheckService.precheck(session, 1, [
+            {'currency_id': 2, 'type': 'buy', 'amount': 900, 'rate': 3000},
+        ], purpose='旅游')
+
+        leg = result['legs'][0]
+        assert leg['purpose_limit']['exceeded'] is True
+        assert leg['amlo']['allow_continue'] is False
+        assert leg['blocking_reasons'] == ['base_balance_insufficient', 'purpose_limit_exceeded', 'amlo_blocked']
+        assert leg['bot']['triggered'] is False
+
+    def test_invalid_legs_are_rejected(self, session):
+        with pytest.raises(ValueError):
+            ExchangePrecheckService.precheck(session, 1, [{'currency_id': 2, 'type': 'swap', 'amount': 1}])
+        with pytest.raises(ValueError):
+            ExchangePrecheckService.precheck(session, 1, [])
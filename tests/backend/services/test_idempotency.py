@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+幂等请求测试
+验证 Idempotency-Key 的结果重放、请求指纹校验、失败释放和并发重复请求等待，
+以及检查记录表是否存在时不打开数据库会话
+
+运行方式：
+    pytest tests/backend/services/test_idempotency.py -v
+"""
+
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask, jsonify, request
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../..', 'src'))
+
+from models.exchange_models import Base, IdempotencyRecord
+from services import idempotency_service
+from services.idempotency_service import IdempotencyService, idempotent
+
+USER = {'id': 7, 'branch_id': 1}
+
+
+@pytest.fixture
+def Session(tmp_path, monkeypatch):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'idempotency.db'}",
+        connect_args={'check_same_thread': False, 'timeout': 30}
+    )
+    Base.metadata.create_all(engine, tables=[IdempotencyRecord.__table__])
+    Session = sessionmaker(bind=engine)
+    monkeypatch.setattr(idempotency_service.DatabaseService, 'get_session', staticmethod(Session))
+    monkeypatch.setattr(idempotency_service.DatabaseService, 'primary_engine', staticmethod(lambda: engine))
+    yield Session
+    engine.dispose()
+
+
+@pytest.fixture
+def client(Session):
+    app = Flask(__name__)
+    calls = {'count': 0, 'fail': False, 'delay': 0}
+
+    @app.route('/perform', methods=['POST'])
+    def perform():
+        return _perform(USER)
+
+    @idempotent('test.perform')
+    def _perform(current_user):
+        calls['count'] += 1
+        if calls['delay']:
+            time.sleep(calls['delay'])
+        if calls['fail']:
+            return jsonify({'success': False, 'message': '余额不足'}), 400
+        return jsonify({'success': True, 'transaction_no': f"T{calls['count']}", 'amount': request.get_json()['amount']})
+
+    app.config['calls'] = calls
+    return app.test_client()
+
+
+def _post(client, key, amount=100):
+    headers = {'Idempotency-Key': key} if key else {}
+    return client.post('/perform', json={'amount': amount}, headers=headers)
+
+
+class TestIdempotentDecorator:
+    """测试幂等请求装饰器"""
+
+    def test_retry_replays_stored_response(self, client):
+        first = _post(client, 'k1')
+        second = _post(client, 'k1')
+
+        assert first.status_code == second.status_code == 200
+        assert second.get_json() == first.get_json() == {'success': True, 'transaction_no': 'T1', 'amount': 100}
+        assert second.headers.get('Idempotent-Replayed') == 'true'
+        assert client.application.config['calls']['count'] == 1
+
+        # 不带请求头或使用新的 Key 正常执行
+        assert _post(client, None).get_json()['transaction_no'] == 'T2'
+        assert _post(client, 'k2').get_json()['transaction_no'] == 'T3'
+
+    def test_same_key_with_different_body_is_rejected(self, client):
+        assert _post(client, 'k1', amount=100).status_code == 200
+        response = _post(client, 'k1', amount=200)
+
+        assert response.status_code == 422
+        assert client.application.config['calls']['count'] == 1
+
+    def test_failed_request_releases_key(self, client):
+        calls = client.application.config['calls']
+        calls['fail'] = True
+        assert _post(client, 'k1').status_code == 400
+
+        calls['fail'] = False
+        response = _post(client, 'k1')
+        assert response.status_code == 200
+        assert 'Idempotent-Replayed' not in response.headers
+        assert calls['count'] == 2
+
+    def test_concurrent_duplicates_wait_for_first_execution(self, client):
+        calls = client.application.config['calls']
+        calls['delay'] = 0.3
+        results = []
+
+        def worker():
+            results.append(_post(client, 'k1').get_json())
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert calls['count'] == 1
+        assert [r['transaction_no'] for r in results] == ['T1'] * 4
+
+    def test_expired_record_is_executed_again(self, client, Session):
+        _post(client, 'k1')
+        session = Session()
+        session.execute(update(IdempotencyRecord).values(expires_at=datetime.now() - timedelta(seconds=1)))
+        session.commit()
+        session.close()
+
+        assert _post(client, 'k1').get_json()['transaction_no'] == 'T2'
+        assert IdempotencyService.purge_expired() == 0
+
+    def test_table_check_does_not_open_session(self, Session, monkeypatch):
+        def no_session():
+            raise AssertionError('is_enabled 不应打开数据库会话')
+
+        monkeypatch.setattr(idempotency_service.DatabaseService, 'get_session', staticmethod(no_session))
+        assert IdempotencyService.is_enabled()
+        assert IdempotencyService.is_enabled()
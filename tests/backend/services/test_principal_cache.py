@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+登录用户信息缓存测试
+验证缓存命中不访问数据库、版本号失效（含跨进程轮询）、LRU容量、令牌内携带的用户信息，
+以及修改个人信息和密码后缓存失效
+
+运行方式：
+    pytest tests/backend/services/test_principal_cache.py -v
+"""
+
+import os
+import sys
+
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine, event, update
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../..', 'src'))
+
+from models.exchange_models import AuthPrincipalVersion, Base, Operator, Permission, Role, RolePermission
+from services import principal_cache
+from services.principal_cache import PrincipalCache
+
+
+@pytest.fixture
+def Session(tmp_path, monkeypatch):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'principal.db'}",
+        connect_args={'check_same_thread': False, 'timeout': 30}
+    )
+    Base.metadata.create_all(engine, tables=[
+        Role.__table__, Permission.__table__, RolePermission.__table__, Operator.__table__,
+        AuthPrincipalVersion.__table__
+    ])
+    Session = sessionmaker(bind=engine)
+    session = Session()
+    session.add_all([
+        Role(id=1, role_name='admin'),
+        Role(id=2, role_name='Teller'),
+        Permission(id=1, permission_name='transaction_execute'),
+        Permission(id=2, permission_name='user_manage'),
+        RolePermission(role_id=1, permission_id=1),
+        RolePermission(role_id=1, permission_id=2),
+        RolePermission(role_id=2, permission_id=1),
+    ])
+    for user_id, role_id in ((1, 1), (2, 2), (3, 2)):
+        session.add(Operator(id=user_id, login_code=f'u{user_id}', password_hash='x', name=f'User {user_id}',
+                             branch_id=1, role_id=role_id, is_active=True))
+    session.commit()
+    session.close()
+
+    monkeypatch.setattr(principal_cache.DatabaseService, 'get_session', staticmethod(Session))
+    monkeypatch.setenv('AUTH_VERSION_POLL_SECONDS', '3600')
+    PrincipalCache.clear()
+    yield Session
+    PrincipalCache.clear()
+    engine.dispose()
+
+
+@pytest.fixture
+def statements(Session):
+    executed = []
+    engine = Session.kw['bind']
+    event.listen(engine, 'before_cursor_execute', lambda *args: executed.append(args[2]))
+    return executed
+
+
+class TestPrincipalCache:
+    """测试登录用户信息缓存"""
+
+    def test_cache_hit_does_not_touch_database(self, Session, statements):
+        principal = PrincipalCache.get_principal('2')
+        assert principal['role_name'] == 'Teller'
+        assert principal['permissions'] == ['transaction_execute']
+        assert principal['is_admin'] is False
+
+        statements.clear()
+        principal['permissions'].append('user_manage')
+        again = PrincipalCache.get_principal(2)
+        assert statements == []
+        assert again['permissions'] == ['transaction_execute']
+
+    def test_role_bump_invalidates_locally_and_in_version_table(self, Session):
+        assert PrincipalCache.get_principal(2)['permissions'] == ['transaction_execute']
+
+        session = Session()
+        session.add(RolePermission(role_id=2, permission_id=2))
+        session.commit()
+        PrincipalCache.bump_role(2)
+
+        assert PrincipalCache.get_principal(2)['permissions'] == ['transaction_execute', 'user_manage']
+        row = session.query(AuthPrincipalVersion).filter_by(scope='role', ref_id=2).one()
+        assert row.version == 1
+        session.close()
+
+    def test_other_worker_change_seen_after_poll(self, Session, monkeypatch):
+        assert PrincipalCache.get_principal(3)['branch_id'] == 1
+
+        # 模拟其他工作进程：直接修改数据并递增版本表
+        session = Session()
+        session.execute(update(Operator).where(Operator.id == 3).values(branch_id=5))
+        session.add(AuthPrincipalVersion(scope='user', ref_id=3, version=1))
+        session.commit()
+        session.close()
+
+        assert PrincipalCache.get_principal(3)['branch_id'] == 1
+        monkeypatch.setenv('AUTH_VERSION_POLL_SECONDS', '0')
+        assert PrincipalCache.get_principal(3)['branch_id'] == 5
+
+        session = Session()
+        session.execute(update(Operator).where(Operator.id == 3).values(is_active=False))
+        session.commit()
+        session.close()
+        PrincipalCache.bump_user(3)
+        assert PrincipalCache.get_principal(3) is None
+
+    def test_lru_bound_and_token_claims(self, Session, statements, monkeypatch):
+        monkeypatch.setenv('AUTH_PRINCIPAL_CACHE_SIZE', '2')
+        for user_id in (1, 2, 3):
+            PrincipalCache.get_principal(user_id)
+        assert PrincipalCache.stats()['size'] == 2
+
+        monkeypatch.setenv('AUTH_PERMISSIONS_IN_TOKEN', 'true')
+        claims = PrincipalCache.token_claims(1)
+        assert claims['pver'] == [0, 0, 0]
+        PrincipalCache.clear()
+        PrincipalCache.get_principal(2)  # 触发一次版本表轮询
+
+        statements.clear()
+        principal = PrincipalCache.get_principal(1, dict(claims, sub=1))
+        assert principal['permissions'] == ['transaction_execute', 'user_manage']
+        assert statements == []
+        assert PrincipalCache.stats()['token_claims'] == 1
+
+        # 版本变化后令牌内的用户信息不再使用
+        PrincipalCache.bump_user(1)
+        PrincipalCache.get_principal(1, dict(claims, sub=1))
+        assert PrincipalCache.stats()['token_claims'] == 1
+
+    def test_profile_and_password_updates_invalidate(self, Session, monkeypatch):
+        from routes import app_profile
+        from services.auth_service import generate_token
+
+        monkeypatch.setattr(app_profile, 'record_system_log', lambda **kwargs: None)
+        monkeypatch.setattr(app_profile.ActivityService, 'log_activity', staticmethod(lambda *args, **kwargs: None))
+        app = Flask(__name__)
+        app.register_blueprint(app_profile.profile_bp)
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {generate_token("2")}'}
+        assert PrincipalCache.get_principal(2)['name'] == 'User 2'
+
+        response = client.put('/api/user/profile', headers=headers, json={'name': 'Teller Two'})
+        assert response.get_json()['success'] is True
+        assert PrincipalCache.get_principal(2)['name'] == 'Teller Two'
+
+        response = client.put('/api/user/change-password', headers=headers,
+                              json={'current_password': 'x', 'new_password': 'new-password'})
+        assert response.get_json()['success'] is True
+        session = Session()
+        row = session.query(AuthPrincipalVersion).filter_by(scope='user', ref_id=2).one()
+        assert row.version == 2
+        session.close()
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+查询次数预算测试
+验证语句统计与重复语句识别、接口预算超出时测试失败、报告排序、与请求追踪的统计一致，
+以及机顶盒汇率恢复和票据文件列表的语句数不随数据量增长
+
+运行方式：
+    pytest tests/backend/services/test_query_budget.py -v
+"""
+
+import json
+import logging
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+import pytest
+from flask import Flask, jsonify
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../..', 'src'))
+
+from models.exchange_models import (
+    Branch, Currency, ExchangeTransaction, RatePublishDetail, RatePublishRecord
+)
+from services import db_service
+from services.db_service import DatabaseService, shutdown_session
+from services.query_budget import QueryBudget, QueryBudgetExceeded, normalize_statement
+from services.receipt_file_service import ReceiptFileService
+from services.request_tracing import RequestTracer
+
+
+@pytest.fixture
+def budget(tmp_path, monkeypatch):
+    # init_app 会启用请求追踪，追踪记录写到临时目录
+    monkeypatch.setenv('TRACE_LOG_FILE', str(tmp_path / 'request_trace.log'))
+    QueryBudget.reset()
+    QueryBudget.clear_budgets()
+    yield QueryBudget
+    QueryBudget.clear_budgets()
+    RequestTracer.stop()
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'budget.db'}", connect_args={'check_same_thread': False})
+    tables = [Branch, Currency, ExchangeTransaction, RatePublishRecord, RatePublishDetail]
+    Branch.metadata.create_all(engine, tables=[model.__table__ for model in tables])
+    original_bind = db_service.SessionLocal.kw['bind']
+    db_service.SessionLocal.configure(bind=engine)
+    monkeypatch.setattr(db_service, 'engine', engine)
+    yield engine
+    db_service.SessionLocal.configure(bind=original_bind)
+    engine.dispose()
+
+
+def make_app(strict=None):
+    app = Flask(__name__)
+    app.config['TESTING'] = True
+    app.teardown_appcontext(shutdown_session)
+
+    @app.route('/items/<int:count>')
+    def items(count):
+        session = DatabaseService.get_session()
+        values = [session.execute(text('SELECT :n'), {'n': n}).scalar() for n in range(count)]
+        return jsonify(values)
+
+    QueryBudget.init_app(app, strict=strict)
+    return app
+
+
+def seed_publishes(engine, records, currencies):
+    session = db_service.SessionLocal()
+    session.add(Branch(id=1, branch_name='总行', branch_code='A001', base_currency_id=1))
+    session.add(Currency(id=1, currency_code='THB', currency_name='泰铢'))
+    for i in range(2, currencies + 2):
+        session.add(Currency(id=i, currency_code=f'C{i:02d}', currency_name=f'币种{i}', flag_code=f'f{i}'))
+    now = datetime(2024, 5, 1, 9)
+    for r in range(records):
+        record = RatePublishRecord(branch_id=1, publish_date=date(2024, 5, 1), publish_time=now + timedelta(minutes=r),
+                                   publisher_id=1, publisher_name='管理员', access_token=f'token-{r}')
+        record.details = [
+            RatePublishDetail(currency_id=i, currency_code=f'C{i:02d}', currency_name=f'币种{i}',
+                              buy_rate=30 + i, sell_rate=31 + i, sort_order=i)
+            for i in range(2, currencies + 2) if (i + r) % 2 == 0 or r == 0
+        ]
+        session.add(record)
+    session.commit()
+    session.close()
+
+
+class TestQueryBudget:
+    """测试查询次数预算"""
+
+    def test_limit_reports_repeated_statements(self, budget, engine):
+        assert normalize_statement('SELECT *\n  FROM t WHERE id IN (?, ?, ?)') == 'SELECT * FROM t WHERE id IN (...)'
+
+        with budget.limit(6) as capture:
+            with engine.connect() as conn:
+                for n in range(5):
+                    conn.execute(text('SELECT :n'), {'n': n})
+        assert capture.count == 5
+
+        with pytest.raises(QueryBudgetExceeded) as error:
+            with budget.limit(3, 'N+1'):
+                with engine.connect() as conn:
+                    for n in range(5):
+                        conn.execute(text('SELECT :n'), {'n': n})
+        assert 'N+1 执行了 5 条SQL，预算 3 条' in str(error.value)
+        assert 'x5: SELECT ?' in str(error.value)
+
+    def test_endpoint_budget_and_report(self, budget, engine):
+        app = make_app()
+        budget.set_budget('GET /items/<int:count>', 3)
+        client = app.test_client()
+        assert client.get('/items/2').status_code == 200
+
+        # 测试应用默认 strict：超出预算和功能错误一样使测试失败
+        with pytest.raises(QueryBudgetExceeded):
+            client.get('/items/6')
+
+        report = budget.report()
+        assert report[0]['endpoint'] == 'GET /items/<int:count>'
+        assert report[0]['requests'] == 2 and report[0]['max_statements'] == 6
+        assert report[0]['repeated'] == [{'sql': 'SELECT ?', 'count': 6}]
+        assert budget.violations()[0]['count'] == 6
+        assert 'GET /items/<int:count>' in budget.render_report()
+
+        # 非 strict 时只记录违规
+        lenient = make_app(strict=False)
+        assert lenient.test_client().get('/items/5').status_code == 200
+        assert len(budget.violations()) == 2
+
+    def test_endpoint_numbers_match_request_trace(self, budget, engine, monkeypatch):
+        records = []
+
+        class ListHandler(logging.Handler):
+            def emit(self, record):
+                records.append(json.loads(record.getMessage()))
+
+        monkeypatch.setenv('TRACE_SAMPLE_RATE', '1')
+        app = Flask(__name__)
+        app.config['TESTING'] = True
+        app.teardown_appcontext(shutdown_session)
+
+        @app.route('/items/<int:count>')
+        def items(count):
+            session = DatabaseService.get_session()
+            return jsonify([session.execute(text('SELECT :n'), {'n': n}).scalar() for n in range(count)])
+
+        RequestTracer.init_app(app, handler=ListHandler())
+        QueryBudget.init_app(app)
+        try:
+            assert app.test_client().get('/items/4').status_code == 200
+        finally:
+            RequestTracer.stop()
+
+        # 预算读取的就是追踪记录的语句数和耗时
+        row = budget.report()[0]
+        assert records[0]['db']['count'] == row['max_statements'] == 4
+        assert records[0]['db']['ms'] == row['db_ms']
+        assert row['repeated'] == [{'sql': 'SELECT ?', 'count': 4}]
+
+    def test_display_rates_statements_do_not_grow_with_history(self, budget, engine):
+        from routes.app_dashboard import dashboard_bp, published_rates_cache
+
+        app = Flask(__name__)
+        app.config['TESTING'] = True
+        app.register_blueprint(dashboard_bp)
+        app.teardown_appcontext(shutdown_session)
+        QueryBudget.init_app(app)
+        endpoint = 'GET /api/dashboard/display-rates/<token>'
+        budget.set_budget(endpoint, 7)
+
+        seed_publishes(engine, records=8, currencies=10)
+        published_rates_cache.clear()
+        response = app.test_client().get('/api/dashboard/display-rates/token-0')
+        data = response.get_json()['data']
+        assert len(data['rates']) == 10
+        assert {rate['flag_code'] for rate in data['rates']} == {f'f{i}' for i in range(2, 12)}
+        assert budget.report()[0]['max_statements'] <= 7
+        published_rates_cache.clear()
+
+    def test_receipt_files_queried_in_batches(self, budget, engine, tmp_path, monkeypatch):
+        month = tmp_path / 'receipts' / '2024' / '05'
+        month.mkdir(parents=True)
+        session = db_service.SessionLocal()
+        for n in range(30):
+            filename = f'A001202405010{n:03d}.pdf'
+            (month / filename).write_bytes(b'%PDF')
+            if n % 3:
+                session.add(ExchangeTransaction(
+                    transaction_no=f'T{n:04d}', branch_id=1, currency_id=2, type='buy', amount=100, rate=35,
+                    local_amount=-3500, transaction_date=date(2024, 5, 1), transaction_time='10:00:00',
+                    operator_id=1, receipt_filename=filename, print_count=n))
+        (month / 'note.pdf').write_bytes(b'%PDF')
+        session.commit()
+        session.close()
+        monkeypatch.setattr(ReceiptFileService, 'RECEIPTS_ROOT', str(tmp_path / 'receipts'))
+
+        with budget.limit(2):
+            files = ReceiptFileService.get_receipt_files('2024', '05')
+        by_name = {f['filename']: f for f in files}
+        assert len(files) == 31
+        assert by_name['A001202405010004.pdf']['print_count'] == 4
+        assert by_name['A001202405010004.pdf']['transaction_no'] == 'T0004'
+        assert 'transaction_no' not in by_name['A001202405010003.pdf']
+        assert by_name['note.pdf']['print_count'] == 0
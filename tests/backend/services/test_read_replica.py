@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+只读副本路由测试
+验证 @read_replica 接口的读取走副本、写入仍走主库、延迟超限/副本不可用时回退主库，
+以及大导出在副本上执行时柜台写入的 P99 延迟不受影响
+
+运行方式：
+    pytest tests/backend/services/test_read_replica.py -v
+"""
+
+import os
+import shutil
+import sys
+import threading
+import time
+
+import pytest
+from flask import Flask, jsonify
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../..', 'src'))
+
+from services import db_service
+from services.db_service import DatabaseService, shutdown_session
+from services.read_replica import ReadReplica, read_replica
+
+EXPORT_SECONDS = 1.0
+
+
+def make_engine(path):
+    return create_engine(f'sqlite:///{path}', connect_args={'check_same_thread': False, 'timeout': 10})
+
+
+@pytest.fixture
+def databases(tmp_path, monkeypatch):
+    primary_path = tmp_path / 'primary.db'
+    primary = make_engine(primary_path)
+    with primary.begin() as conn:
+        conn.execute(text('CREATE TABLE trades (id INTEGER PRIMARY KEY, amount INTEGER)'))
+        conn.execute(text('CREATE TABLE logs (id INTEGER PRIMARY KEY, message VARCHAR(50))'))
+        conn.execute(text('INSERT INTO trades (amount) VALUES (:amount)'), [{'amount': i} for i in range(2000)])
+    shutil.copy(primary_path, tmp_path / 'replica.db')
+    replica = make_engine(tmp_path / 'replica.db')
+
+    original_bind = db_service.SessionLocal.kw['bind']
+    db_service.SessionLocal.configure(bind=primary)
+    monkeypatch.setattr(db_service, 'engine', primary)
+    monkeypatch.delenv('DB_SESSION_SCOPE', raising=False)
+    ReadReplica.configure(engine=replica)
+    ReadReplica.reset_stats()
+    yield primary, replica
+    ReadReplica.configure(url='')
+    db_service.SessionLocal.configure(bind=original_bind)
+    primary.dispose()
+    replica.dispose()
+
+
+@pytest.fixture
+def app(databases):
+    app = Flask(__name__)
+    app.teardown_appcontext(shutdown_session)
+
+    @app.route('/export')
+    @read_replica()
+    def export():
+        session = DatabaseService.get_session()
+        try:
+            # 模拟大导出：游标未读完前一直持有读锁
+            result = session.execute(text('SELECT id, amount FROM trades ORDER BY id'))
+            rows = 0
+            deadline = time.perf_counter() + EXPORT_SECONDS
+            while time.perf_counter() < deadline:
+                batch = result.fetchmany(20)
+                rows += len(batch)
+                time.sleep(0.01)
+            return jsonify({'rows': rows})
+        finally:
+            DatabaseService.close_session(session)
+
+    @app.route('/counter', methods=['POST'])
+    def counter():
+        session = DatabaseService.get_session()
+        try:
+            session.execute(text('INSERT INTO trades (amount) VALUES (1)'))
+            session.commit()
+            return jsonify({'success': True})
+        finally:
+            DatabaseService.close_session(session)
+
+    return app
+
+
+def counter_p99_during_export(app):
+    """导出进行期间连续执行柜台写入，返回写入延迟的 P99（秒）"""
+    export_thread = threading.Thread(target=lambda: app.test_client().get('/export'))
+    export_thread.start()
+    time.sleep(0.1)
+    client = app.test_client()
+    latencies = []
+    while export_thread.is_alive() and len(latencies) < 200:
+        started = time.perf_counter()
+        assert client.post('/counter').status_code == 200
+        latencies.append(time.perf_counter() - started)
+    export_thread.join()
+    latencies.sort()
+    return latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+
+
+class TestReadReplica:
+    """测试只读副本路由"""
+
+    def test_reads_use_replica_and_writes_go_to_primary(self, app, databases):
+        primary, replica = databases
+        with replica.begin() as conn:
+            conn.execute(text('DELETE FROM trades WHERE id > 10'))
+
+        with app.test_request_context('/'):
+            session = DatabaseService.get_read_session()
+            assert session.execute(text('SELECT COUNT(*) FROM trades')).scalar() == 10
+            session.execute(text("INSERT INTO logs (message) VALUES ('exported')"))
+            session.commit()
+            DatabaseService.close_session(session)
+
+        with primary.connect() as conn:
+            assert conn.execute(text('SELECT message FROM logs')).scalar() == 'exported'
+        assert ReadReplica.stats()['routed'] == 1
+
+    def test_lagging_or_unreachable_replica_falls_back(self, app, databases, monkeypatch):
+        primary, _ = databases
+        monkeypatch.setattr(ReadReplica, '_query_lag', staticmethod(lambda conn: 30.0))
+        assert ReadReplica.session_factory(max_lag_seconds=5) is db_service.SessionLocal
+        assert ReadReplica.session_factory(max_lag_seconds=60) is not db_service.SessionLocal
+
+        ReadReplica.configure(url='sqlite:////nonexistent-dir/replica.db')
+        with app.test_request_context('/'):
+            session = DatabaseService.get_read_session()
+            assert session.get_bind() is primary
+            DatabaseService.close_session(session)
+        stats = ReadReplica.stats()
+        assert stats['fallback'] == 2 and stats['error']
+
+    def test_counter_p99_stays_flat_while_export_runs_on_replica(self, app):
+        on_replica = counter_p99_during_export(app)
+
+        # 对照：不配置副本时导出在主库执行，柜台写入需等待导出释放读锁
+        ReadReplica.configure(url='')
+        on_primary = counter_p99_during_export(app)
+
+        assert on_replica < EXPORT_SECONDS / 4
+        assert on_primary > EXPORT_SECONDS / 2
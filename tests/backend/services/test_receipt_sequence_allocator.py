@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+票据编号分配器测试
+多线程并发分配同一网点的编号，验证无重复、无空号（作废记录计入已使用编号）
+
+运行方式：
+    pytest tests/backend/services/test_receipt_sequence_allocator.py -v
+"""
+
+import os
+import sys
+import threading
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../..', 'src'))
+
+from models.exchange_models import (
+    Base, Branch, ExchangeTransaction, ReceiptSequence, VoidedReceiptNumber
+)
+from services import receipt_sequence_allocator
+from services.receipt_sequence_allocator import ReceiptSequenceAllocator
+
+THREADS = 8
+PER_THREAD = 25
+
+
+@pytest.fixture
+def Session(tmp_path, monkeypatch):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'receipts.db'}",
+        connect_args={'check_same_thread': False, 'timeout': 30}
+    )
+    Base.metadata.create_all(engine, tables=[
+        Branch.__table__, ReceiptSequence.__table__,
+        VoidedReceiptNumber.__table__, ExchangeTransaction.__table__
+    ])
+    Session = sessionmaker(bind=engine, autoflush=False)
+    session = Session()
+    session.add(Branch(id=1, branch_name='Head Office', branch_code='A005'))
+    session.commit()
+    session.close()
+
+    monkeypatch.setattr(receipt_sequence_allocator.DatabaseService, 'get_session', staticmethod(Session))
+    ReceiptSequenceAllocator.invalidate_branch_code()
+    yield Session
+    ReceiptSequenceAllocator.invalidate_branch_code()
+    engine.dispose()
+
+
+def _prefix():
+    return f"A005{date.today().strftime('%Y%m%d')}"
+
+
+def _add_transaction(session, transaction_no):
+    session.add(ExchangeTransaction(
+        transaction_no=transaction_no, branch_id=1, currency_id=2, type='buy',
+        amount=100, rate=35, local_amount=-3500, operator_id=1,
+        transaction_date=date.today(), transaction_time='10:00:00', created_at=datetime.now()
+    ))
+
+
+class TestReceiptSequenceAllocator:
+    """测试票据编号分配器"""
+
+    def test_concurrent_allocation_has_no_gaps_or_duplicates(self, Session):
+        numbers = []
+        errors = []
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                for _ in range(PER_THREAD):
+                    number = ReceiptSequenceAllocator.allocate(1)[0]
+                    with lock:
+                        numbers.append(number)
+            except Exception as e:  # pragma: no cover - 失败时输出原因
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert not errors
+        assert len(numbers) == len(set(numbers)) == THREADS * PER_THREAD
+        assert sorted(numbers) == [f"{_prefix()}{seq:04d}" for seq in range(1, THREADS * PER_THREAD + 1)]
+
+    def test_block_allocation_is_consecutive(self, Session):
+        block = ReceiptSequenceAllocator.allocate(1, count=5)
+        following = ReceiptSequenceAllocator.allocate(1)
+
+        assert block == [f"{_prefix()}{seq:04d}" for seq in range(1, 6)]
+        assert following == [f"{_prefix()}0006"]
+
+    def test_sequence_resets_on_new_day(self, Session):
+        session = Session()
+        session.add(ReceiptSequence(branch_id=1, current_sequence=37,
+                                    last_date=date.today() - timedelta(days=1)))
+        session.commit()
+        session.close()
+
+        assert ReceiptSequenceAllocator.allocate(1) == [f"{_prefix()}0001"]
+
+    def test_outer_rollback_writes_void_records(self, Session):
+        outer = Session()
+        outer.query(Branch).first()
+        numbers = ReceiptSequenceAllocator.allocate(1, count=2, session=outer, autonomous=True)
+        outer.rollback()
+        outer.close()
+
+        session = Session()
+        voided = [v.receipt_number for v in session.query(VoidedReceiptNumber).order_by(VoidedReceiptNumber.sequence_no)]
+        session.close()
+        assert voided == numbers
+
+    def test_concurrent_commit_and_rollback_keeps_continuity(self, Session):
+        errors = []
+
+        def worker(worker_id):
+            try:
+                for i in range(PER_THREAD):
+                    outer = Session()
+                    try:
+                        number = ReceiptSequenceAllocator.allocate(1, session=outer, autonomous=True)[0]
+                        if (worker_id + i) % 3 == 0:
+                            raise RuntimeError('模拟交易失败')
+                        _add_transaction(outer, number)
+                        outer.commit()
+                    except RuntimeError:
+                        outer.rollback()
+                    finally:
+                        outer.close()
+            except Exception as e:  # pragma: no cover - 失败时输出原因
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert not errors
+        session = Session()
+        used = [no for (no,) in session.query(ExchangeTransaction.transaction_no)]
+        voided = [no for (no,) in session.query(VoidedReceiptNumber.receipt_number)]
+        assert voided
+        assert not set(used) & set(voided)
+        assert len(used) + len(voided) == THREADS * PER_THREAD
+        assert ReceiptSequenceAllocator.find_sequence_gaps(session, 1, date.today()) == []
+        session.close()
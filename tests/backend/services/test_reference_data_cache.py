@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+参考数据缓存测试
+验证网点/币种/网点币种启用状态的缓存命中、版本失效和命中统计
+
+运行方式：
+    pytest tests/backend/services/test_reference_data_cache.py -v
+"""
+
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../..', 'src'))
+
+from models.exchange_models import Base, Branch, BranchCurrency, Currency
+from services.reference_data_cache import ReferenceDataCache
+from services.report_number_generator import ReportNumberGenerator
+
+
+@pytest.fixture
+def session():
+    engine = create_engine(
+        'sqlite://',
+        connect_args={'check_same_thread': False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine, tables=[Branch.__table__, Currency.__table__, BranchCurrency.__table__])
+    session = sessionmaker(bind=engine)()
+    session.add(Currency(id=1, currency_code='THB', currency_name='Thai Baht'))
+    session.add(Currency(id=2, currency_code='USD', currency_name='US Dollar'))
+    session.add(Branch(id=1, branch_name='Head Office', branch_code='A005', base_currency_id=1,
+                       amlo_institution_code='12', amlo_branch_code='7'))
+    session.add(BranchCurrency(branch_id=1, currency_id=2, is_enabled=False))
+    session.commit()
+
+    ReferenceDataCache.invalidate_all()
+    ReferenceDataCache.reset_stats()
+    yield session
+    ReferenceDataCache.invalidate_all()
+    session.close()
+    engine.dispose()
+
+
+class TestReferenceDataCache:
+    """测试参考数据缓存"""
+
+    def test_branch_lookups_share_one_query(self, session):
+        assert ReferenceDataCache.get_branch(session, 1).branch_code == 'A005'
+        assert ReferenceDataCache.get_base_currency_id(session, 1) == 1
+        assert ReportNumberGenerator.get_branch_codes(session, 1) == {'institution_code': '012', 'branch_code': '007'}
+
+        stats = ReferenceDataCache.stats()['branch']
+        assert (stats['hits'], stats['misses'], stats['size']) == (2, 1, 1)
+
+    def test_snapshot_is_detached_from_session(self, session):
+        currency = ReferenceDataCache.get_currency(session, 2)
+        session.close()
+
+        assert currency.currency_code == 'USD'
+        assert ReferenceDataCache.get_currency_by_code(session, 'USD').id == 2
+        with pytest.raises(AttributeError):
+            currency.currency_code = 'EUR'
+
+    def test_invalidation_reloads_changed_rows(self, session):
+        assert ReferenceDataCache.get_currency(session, 2).currency_name == 'US Dollar'
+        assert ReferenceDataCache.get_disabled_currency_ids(session, 1) == {2}
+
+        session.query(Currency).filter_by(id=2).update({'currency_name': 'Dollar'})
+        session.query(BranchCurrency).filter_by(branch_id=1, currency_id=2).update({'is_enabled': True})
+        session.commit()
+        assert ReferenceDataCache.get_currency(session, 2).currency_name == 'US Dollar'
+
+        version = ReferenceDataCache.stats()['currency']['version']
+        ReferenceDataCache.invalidate_currencies()
+        ReferenceDataCache.invalidate_branch_currencies()
+        assert ReferenceDataCache.get_currency(session, 2).currency_name == 'Dollar'
+        assert ReferenceDataCache.get_disabled_currency_ids(session, 1) == frozenset()
+        assert ReferenceDataCache.stats()['currency']['version'] == version + 1
+
+    def test_missing_rows_are_not_cached(self, session):
+        assert ReferenceDataCache.get_branch(session, 2) is None
+        assert ReportNumberGenerator.get_branch_codes(session, 2) == {'institution_code': '001', 'branch_code': '001'}
+
+        session.add(Branch(id=2, branch_name='Pattaya', branch_code='B001'))
+        session.commit()
+        assert ReferenceDataCache.get_branch(session, 2).branch_code == 'B001'
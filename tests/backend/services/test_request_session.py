@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+请求级会话测试
+验证请求内共享一个连接、内层会话按外层是否有未提交写入（含未 flush 的对象）决定并入外层事务或直接提交、
+内层回滚只影响自身、独立事务和连接池指标
+
+运行方式：
+    pytest tests/backend/services/test_request_session.py -v
+"""
+
+import os
+import sys
+
+import pytest
+from flask import Flask
+from sqlalchemy import Column, Integer, String, create_engine, text
+from sqlalchemy.orm import declarative_base
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../..', 'src'))
+
+from services import db_service
+from services.db_service import DatabaseService, MeteredQueuePool, RequestScopedSession, shutdown_session
+
+Base = declarative_base()
+
+
+class Item(Base):
+    __tablename__ = 'items'
+    id = Column(Integer, primary_key=True)
+    name = Column(String(20))
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'request_session.db'}",
+        poolclass=MeteredQueuePool, pool_size=2, max_overflow=1,
+        connect_args={'check_same_thread': False}
+    )
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE items (id INTEGER PRIMARY KEY, name VARCHAR(20))'))
+
+    original_bind = db_service.SessionLocal.kw['bind']
+    db_service.SessionLocal.configure(bind=engine)
+    monkeypatch.setattr(db_service, 'engine', engine)
+    monkeypatch.delenv('DB_SESSION_SCOPE', raising=False)
+
+    app = Flask(__name__)
+    app.teardown_appcontext(shutdown_session)
+    yield app
+    db_service.SessionLocal.configure(bind=original_bind)
+    engine.dispose()
+
+
+def names(engine):
+    with engine.connect() as conn:
+        return [row[0] for row in conn.execute(text('SELECT name FROM items ORDER BY id'))]
+
+
+def insert(session, name):
+    session.execute(text('INSERT INTO items (name) VALUES (:name)'), {'name': name})
+
+
+class TestRequestSession:
+    """测试请求级会话"""
+
+    def test_sessions_share_one_connection(self, app):
+        with app.test_request_context('/'):
+            outer = DatabaseService.get_session()
+            outer.execute(text('SELECT 1'))
+            inner = DatabaseService.get_session()
+            inner.execute(text('SELECT 2'))
+            assert isinstance(inner, RequestScopedSession)
+            assert inner._session is outer._session
+            assert db_service.engine.pool.checkedout() == 1
+            DatabaseService.close_session(inner)
+            DatabaseService.close_session(outer)
+
+            with DatabaseService.autonomous_transaction():
+                independent = DatabaseService.get_session()
+            assert not isinstance(independent, RequestScopedSession)
+            independent.close()
+
+        assert db_service.engine.pool.checkedout() == 0
+        assert DatabaseService.pool_stats()['checkouts'] >= 1
+
+    def test_inner_commit_joins_outer_write_transaction(self, app):
+        with app.test_request_context('/'):
+            outer = DatabaseService.get_session()
+            insert(outer, 'outer')
+            inner = DatabaseService.get_session()
+            insert(inner, 'inner')
+            inner.commit()
+            DatabaseService.close_session(inner)
+            assert names(db_service.engine) == []
+
+            outer.rollback()
+            DatabaseService.close_session(outer)
+        assert names(db_service.engine) == []
+
+    def test_inner_commit_joins_outer_unflushed_changes(self, app):
+        with app.test_request_context('/'):
+            outer = DatabaseService.get_session()
+            outer.add(Item(name='outer'))
+            inner = DatabaseService.get_session()
+            insert(inner, 'inner')
+            inner.commit()
+            DatabaseService.close_session(inner)
+            assert names(db_service.engine) == []
+
+            outer.rollback()
+            DatabaseService.close_session(outer)
+        assert names(db_service.engine) == []
+
+    def test_inner_commit_without_outer_writes_is_committed(self, app):
+        with app.test_request_context('/'):
+            outer = DatabaseService.get_session()
+            outer.execute(text('SELECT COUNT(*) FROM items')).scalar()
+            inner = DatabaseService.get_session()
+            insert(inner, 'log')
+            inner.commit()
+            DatabaseService.close_session(inner)
+            # 外层只读且未提交即关闭，内层写入不受影响
+            DatabaseService.close_session(outer)
+        assert names(db_service.engine) == ['log']
+
+    def test_inner_rollback_only_undoes_own_work(self, app):
+        with app.test_request_context('/'):
+            outer = DatabaseService.get_session()
+            insert(outer, 'kept')
+            inner = DatabaseService.get_session()
+            insert(inner, 'discarded')
+            inner.rollback()
+            DatabaseService.close_session(inner)
+            outer.commit()
+            DatabaseService.close_session(outer)
+        assert names(db_service.engine) == ['kept']
+
+    def test_leaked_outer_session_is_rolled_back(self, app):
+        def leaky():
+            session = DatabaseService.get_session()
+            insert(session, 'leaked')
+
+        with app.test_request_context('/'):
+            leaky()
+            session = DatabaseService.get_session()
+            assert session._nested is False
+            session.commit()
+            DatabaseService.close_session(session)
+        assert names(db_service.engine) == []
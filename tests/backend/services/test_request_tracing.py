@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+请求追踪测试
+验证请求ID、接口/片段直方图、数据库语句汇总、采样写出、队列满丢弃和 /metrics 输出
+
+运行方式：
+    pytest tests/backend/services/test_request_tracing.py -v
+"""
+
+import json
+import logging
+import os
+import queue
+import sys
+
+import pytest
+from flask import Flask, jsonify
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../..', 'src'))
+
+from routes.app_metrics import metrics_bp
+from services.request_tracing import RequestTracer, _DroppingQueueHandler, span
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(json.loads(record.getMessage()))
+
+
+@pytest.fixture
+def traced_app(tmp_path, monkeypatch):
+    monkeypatch.setenv('TRACE_SAMPLE_RATE', '0')
+    monkeypatch.delenv('METRICS_TOKEN', raising=False)
+    monkeypatch.delenv('METRICS_PUBLIC', raising=False)
+    engine = create_engine(f"sqlite:///{tmp_path / 'trace.db'}")
+    handler = ListHandler()
+
+    app = Flask(__name__)
+    RequestTracer.reset()
+    RequestTracer.init_app(app, handler=handler)
+    app.register_blueprint(metrics_bp)
+
+    @app.route('/api/items/<int:item_id>')
+    def get_item(item_id):
+        with span('auth'):
+            with engine.connect() as conn:
+                conn.execute(text('SELECT 1')).scalar()
+                conn.execute(text('SELECT 2')).scalar()
+        return jsonify({'id': item_id})
+
+    @app.route('/api/fail')
+    def fail():
+        return jsonify({'message': 'error'}), 500
+
+    yield app, handler
+    RequestTracer.stop()
+    RequestTracer.reset()
+    engine.dispose()
+
+
+class TestRequestTracing:
+    """测试请求追踪"""
+
+    def test_request_id_and_endpoint_histogram(self, traced_app):
+        app, handler = traced_app
+        client = app.test_client()
+
+        response = client.get('/api/items/1', headers={'X-Request-ID': 'abc123'})
+        assert response.headers['X-Request-ID'] == 'abc123'
+        assert client.get('/api/items/2').headers['X-Request-ID']
+
+        snapshot = RequestTracer.snapshot()
+        item = snapshot['endpoints']['GET /api/items/<int:item_id>']
+        assert item['count'] == 2
+        assert item['status'] == {'2xx': 2}
+        assert item['buckets']['+Inf'] == 2
+        assert snapshot['spans']['auth']['count'] == 2
+        assert snapshot['spans']['db']['count'] >= 4
+
+        # 采样率为0且请求不慢，不写出追踪记录
+        RequestTracer.stop()
+        assert handler.records == []
+
+    def test_errors_always_emitted_with_db_summary(self, traced_app, monkeypatch):
+        app, handler = traced_app
+        client = app.test_client()
+        client.get('/api/fail')
+        monkeypatch.setenv('TRACE_SAMPLE_RATE', '1')
+        client.get('/api/items/7', headers={'X-Request-ID': 'req-7'})
+        RequestTracer.stop()
+
+        assert [record['reason'] for record in handler.records] == ['error', 'sampled']
+        sampled = handler.records[1]
+        assert sampled['request_id'] == 'req-7'
+        assert sampled['db']['count'] == 2
+        assert [s['name'] for s in sampled['spans']] == ['auth']
+
+    def test_full_queue_drops_instead_of_blocking(self, traced_app):
+        RequestTracer.stop()
+        full_queue = queue.Queue(maxsize=1)
+        queue_handler = _DroppingQueueHandler(full_queue)
+        record = logging.LogRecord('request_trace', logging.INFO, __file__, 0, '{}', None, None)
+        queue_handler.emit(record)
+        queue_handler.emit(record)
+        assert full_queue.qsize() == 1
+        assert RequestTracer.snapshot()['tracing']['dropped'] == 1
+
+    def test_metrics_endpoint(self, traced_app, monkeypatch):
+        app, _ = traced_app
+        client = app.test_client()
+        client.get('/api/items/1')
+
+        # 默认不公开
+        assert client.get('/metrics').status_code == 401
+
+        monkeypatch.setenv('METRICS_PUBLIC', 'true')
+        body = client.get('/metrics').get_data(as_text=True)
+        assert 'http_request_duration_ms_bucket{method="GET",endpoint="/api/items/<int:item_id>",le="+Inf"} 1' in body
+        assert 'span_duration_ms_count{span="auth"} 1' in body
+
+        data = client.get('/metrics?format=json').get_json()
+        assert 'principal' in data['metrics']['caches']
+
+        monkeypatch.delenv('METRICS_PUBLIC')
+        monkeypatch.setenv('METRICS_TOKEN', 'secret')
+        assert client.get('/metrics').status_code == 401
+        assert client.get('/metrics?token=wrong').status_code == 401
+        assert client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code == 200
+        assert client.get('/metrics?token=secret').status_code == 200
+
+    def test_metrics_admin_login(self, traced_app, monkeypatch):
+        pytest.importorskip('jwt')
+        from services.auth_service import generate_token
+        from services.principal_cache import PrincipalCache
+
+        app, _ = traced_app
+        client = app.test_client()
+        users = {
+            1: {'id': 1, 'is_admin': False, 'permissions': ['system_manage']},
+            2: {'id': 2, 'is_admin': True, 'permissions': []},
+            3: {'id': 3, 'is_admin': False, 'permissions': ['exchange']},
+        }
+        monkeypatch.setattr(PrincipalCache, 'get_principal', classmethod(lambda cls, user_id, claims=None: users.get(int(user_id))))
+
+        def status(user_id):
+            headers = {'Authorization': f'Bearer {generate_token(str(user_id))}'}
+            return client.get('/metrics', headers=headers).status_code
+
+        assert status(1) == 200
+        assert status(2) == 200
+        assert status(3) == 401
+        assert status(4) == 401
+        assert client.get('/metrics', headers={'Authorization': 'Bearer not-a-jwt'}).status_code == 401
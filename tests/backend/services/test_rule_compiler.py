@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+触发规则编译器测试
+验证编译后的规则与 RuleEngine.evaluate_rule_with_details 结果一致，以及规则缓存的失效
+
+运行方式：
+    pytest tests/backend/services/test_rule_compiler.py -v
+"""
+
+import json
+import os
+import sys
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../..', 'src'))
+
+from services.repform.rule_compiler import RuleCache, compile_expression
+from services.repform.rule_engine import RuleEngine
+
+EXPRESSIONS = [
+    {'logic': 'AND', 'conditions': [
+        {'field': 'total_amount', 'operator': '>=', 'value': 5000000},
+        {'field': 'currency_code', 'operator': '!=', 'value': 'THB'},
+    ]},
+    {'logic': 'or', 'conditions': [
+        {'field': 'is_manual_flag', 'operator': '=', 'value': True},
+        {'field': 'is_manual_flag', 'operator': '!=', 'value': True},
+        {'logic': 'AND', 'conditions': [
+            {'field': 'cumulative_amount_30d', 'operator': '>', 'value': '8000000'},
+            {'field': 'transaction_count_30d', 'operator': '<', 'value': 10},
+        ]},
+    ]},
+    {'logic': 'NOT', 'conditions': [
+        {'field': 'customer_country_code', 'operator': 'IN', 'value': ['TH', 'LA']},
+        {'field': 'customer_country_code', 'operator': 'NOT IN', 'value': ['US']},
+        {'field': 'customer_name', 'operator': 'LIKE', 'value': 'Smith'},
+        {'field': 'customer_name', 'operator': 'NOT LIKE', 'value': 'x'},
+    ]},
+    {'conditions': [
+        {'field': 'currency_code', 'operator': '=', 'value': 'USD'},
+        {'field': 'total_amount', 'operator': '==', 'value': 'abc'},
+        {'field': 'total_amount', 'operator': '<=', 'value': 'abc'},
+        {'field': 'total_amount', 'operator': 'BETWEEN', 'value': 1},
+        {'field': 'missing', 'operator': '!=', 'value': 1},
+        {'field': 'missing', 'operator': '>', 'value': 1},
+    ]},
+    {'logic': 'AND', 'conditions': []},
+    {'logic': 'AND', 'conditions': ['not-a-condition']},
+]
+
+DATASETS = [
+    {'total_amount': 5200000, 'currency_code': 'USD', 'is_manual_flag': False,
+     'cumulative_amount_30d': Decimal('9000000'), 'transaction_count_30d': 3,
+     'customer_country_code': 'US', 'customer_name': 'John Smith'},
+    {'total_amount': '4800000', 'currency_code': 'THB', 'is_manual_flag': True,
+     'cumulative_amount_30d': 0, 'transaction_count_30d': 12,
+     'customer_country_code': 'TH', 'customer_name': None},
+    {'total_amount': 'abc', 'currency_code': 'usd'},
+    {},
+]
+
+
+def _evaluate_or_error(evaluator, *args):
+    try:
+        return evaluator(*args)
+    except Exception as e:
+        return type(e)
+
+
+@pytest.mark.parametrize('expression', EXPRESSIONS)
+def test_compiled_evaluation_matches_interpreter(expression):
+    compiled = compile_expression(expression)
+    for data in DATASETS:
+        assert _evaluate_or_error(compiled, data) == \
+            _evaluate_or_error(RuleEngine.evaluate_rule_with_details, expression, data)
+
+
+@pytest.fixture
+def session():
+    engine = create_engine(
+        'sqlite://',
+        connect_args={'check_same_thread': False},
+        poolclass=StaticPool
+    )
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE trigger_rules (
+                id INTEGER PRIMARY KEY, rule_name VARCHAR(100), report_type VARCHAR(20),
+                rule_expression TEXT, description_cn TEXT, description_en TEXT, description_th TEXT,
+                priority INTEGER, allow_continue BOOLEAN, warning_message_cn TEXT,
+                warning_message_en TEXT, warning_message_th TEXT, branch_id INTEGER,
+                is_active BOOLEAN
+            )
+        """))
+    session = sessionmaker(bind=engine)()
+    RuleCache.invalidate()
+    yield session
+    RuleCache.invalidate()
+    session.close()
+    engine.dispose()
+
+
+def _add_rule(session, rule_id, threshold, priority=10, branch_id=None):
+    session.execute(text("""
+        INSERT INTO trigger_rules (id, rule_name, report_type, rule_expression, priority,
+                                   allow_continue, branch_id, is_active)
+        VALUES (:id, :name, 'AMLO-1-01', :expr, :priority, 1, :branch_id, 1)
+    """), {
+        'id': rule_id, 'name': f'rule {rule_id}', 'priority': priority, 'branch_id': branch_id,
+        'expr': json.dumps({'logic': 'AND', 'conditions': [
+            {'field': 'total_amount', 'operator': '>=', 'value': threshold}
+        ]})
+    })
+    session.commit()
+
+
+class TestCheckTriggersWithCache:
+    """测试 check_triggers 使用编译规则缓存"""
+
+    def test_returns_highest_priority_rule_with_details(self, session):
+        _add_rule(session, 1, 1000, priority=10)
+        _add_rule(session, 2, 500, priority=20)
+        _add_rule(session, 3, 100, priority=30, branch_id=2)
+
+        result = RuleEngine.check_triggers(session, 'AMLO-1-01', {'total_amount': 2000}, branch_id=1)
+
+        assert result['triggered'] is True
+        assert [r['id'] for r in result['trigger_rules']] == [2, 1]
+        assert result['highest_priority_rule']['id'] == 2
+        assert result['matched_conditions'][0]['actual_value'] == 2000
+        assert result['unmatched_conditions'] == []
+        assert result['rule_expression']['conditions'][0]['value'] == 500
+
+    def test_cache_is_reused_until_invalidated(self, session):
+        _add_rule(session, 1, 1000)
+        assert RuleEngine.check_triggers(session, 'AMLO-1-01', {'total_amount': 600}, branch_id=1)['triggered'] is False
+
+        # 直接改库时命中缓存，仍按旧规则评估
+        _add_rule(session, 2, 500)
+        assert RuleEngine.check_triggers(session, 'AMLO-1-01', {'total_amount': 600}, branch_id=1)['triggered'] is False
+
+        RuleEngine.invalidate_rule_cache()
+        assert RuleEngine.check_triggers(session, 'AMLO-1-01', {'total_amount': 600}, branch_id=1)['triggered'] is True
+
+    def test_returned_rules_are_independent_copies(self, session):
+        _add_rule(session, 1, 1000)
+        first = RuleEngine.check_triggers(session, 'AMLO-1-01', {'total_amount': 2000}, branch_id=1)
+        first['highest_priority_rule']['rule_name'] = 'changed'
+        first['rule_expression']['conditions'].clear()
+
+        second = RuleEngine.check_triggers(session, 'AMLO-1-01', {'total_amount': 2000}, branch_id=1)
+        assert second['highest_priority_rule']['rule_name'] == 'rule 1'
+        assert second['rule_expression']['conditions']
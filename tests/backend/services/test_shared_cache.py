@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+共享缓存测试
+验证命名空间的 TTL、LRU 淘汰和加载期间失效，文件后端跨进程共享值与失效通知，
+Redis 后端（LocalRedisClient）以及迁移到共享缓存的币种翻译配置
+
+运行方式：
+    pytest tests/backend/services/test_shared_cache.py -v
+"""
+
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..', 'src'))
+sys.path.insert(0, SRC)
+
+from services import shared_cache
+from services.currency_translation_service import CurrencyTranslationService
+from services.shared_cache import (
+    FileCacheBackend, LocalRedisClient, MemoryLRUBackend, RedisBackend, SharedCache
+)
+
+
+@pytest.fixture
+def memory():
+    SharedCache.configure(MemoryLRUBackend(max_entries=3))
+    yield SharedCache
+    SharedCache.configure(None)
+
+
+@pytest.fixture
+def file_cache(tmp_path):
+    SharedCache.configure(FileCacheBackend(str(tmp_path / 'cache')))
+    yield tmp_path / 'cache'
+    SharedCache.configure(None)
+
+
+def run_worker(cache_dir, code):
+    """在另一个进程中使用同一缓存目录执行代码"""
+    script = textwrap.dedent(f"""
+        import sys
+        sys.path.insert(0, {SRC!r})
+        from services.shared_cache import SharedCache
+    """) + textwrap.dedent(code)
+    env = dict(os.environ, CACHE_BACKEND='file', CACHE_DIR=str(cache_dir))
+    result = subprocess.run([sys.executable, '-c', script], env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    return result.stdout.strip()
+
+
+class TestSharedCache:
+    """测试共享缓存"""
+
+    def test_namespaces_ttl_and_lru(self, memory, monkeypatch):
+        rates = SharedCache.namespace('test_rates')
+        names = SharedCache.namespace('test_names', ttl=10)
+        rates.set('a', {'rate': 1})
+        names.set('a', 'USD')
+        assert rates.get('a') == {'rate': 1} and names.get('a') == 'USD'
+
+        now = shared_cache.time.time()
+        monkeypatch.setattr(shared_cache.time, 'time', lambda: now + 11)
+        assert names.get('a') is None
+        assert 'a' in rates
+
+        # 容量为3，最久未使用的条目被淘汰
+        rates.set('b', 2)
+        rates.set('c', 3)
+        rates.get('a')
+        rates.set('d', 4)
+        assert sorted(key for key, _ in rates.items()) == ['a', 'c', 'd']
+
+        rates.clear()
+        assert len(rates) == 0 and names.get('a') is None
+        assert SharedCache.stats()['test_rates']['generation'] == 1
+
+    def test_get_or_load_skips_stale_values(self, memory):
+        namespace = SharedCache.namespace('test_loader')
+        calls = []
+
+        def loader():
+            calls.append(1)
+            namespace.clear()  # 加载期间其他请求清除了缓存
+            return 'old'
+
+        assert namespace.get_or_load('k', loader) == 'old'
+        assert namespace.get_or_load('k', lambda: 'new') == 'new'
+        assert namespace.get_or_load('k', lambda: 'other') == 'new'
+        assert namespace.get_or_load('missing', lambda: None) is None and 'missing' not in namespace
+        assert len(calls) == 1
+
+    def test_file_backend_shared_between_processes(self, file_cache):
+        rates = SharedCache.namespace('test_published')
+        local = SharedCache.namespace('test_local', local=True)
+        notified = []
+        SharedCache.subscribe('test_local', notified.append)
+
+        rates.set('token-1', {'branch': {'code': 'B1'}})
+        local.set('config', {'USD': 'ดอลลาร์'})
+        assert local.get('config') is not None
+
+        output = run_worker(file_cache, """
+            rates = SharedCache.namespace('test_published')
+            print(rates.get('token-1')['branch']['code'])
+            rates.set('token-2', {'branch': {'code': 'B2'}})
+            rates.delete('token-1')
+            SharedCache.namespace('test_local', local=True).clear()
+        """)
+        assert output == 'B1'
+        assert [key for key, _ in rates.items()] == ['token-2']
+
+        # 其他进程清除了 local 命名空间：本进程的值失效并收到通知
+        assert local.get('config') is None
+        assert notified == ['test_local']
+
+        rates.clear()
+        assert run_worker(file_cache, "print(len(SharedCache.namespace('test_published')))") == '0'
+
+    def test_redis_backend_with_local_client(self):
+        client = LocalRedisClient()
+        messages = []
+        client.subscribe('exchange:cache:invalidate', messages.append)
+        SharedCache.configure(RedisBackend(client, poll_seconds=0))
+        try:
+            namespace = SharedCache.namespace('test_redis', ttl=60)
+            namespace.set(('B1', 'USD'), 35.5)
+            assert namespace.get(('B1', 'USD')) == 35.5
+            assert namespace.items() == [(('B1', 'USD'), 35.5)]
+
+            namespace.clear()
+            assert namespace.get(('B1', 'USD')) is None
+            assert messages == [b'test_redis']
+            assert list(client.scan_iter('exchange:cache:test_redis:*')) == [
+                'exchange:cache:test_redis:__generation__']
+        finally:
+            SharedCache.configure(None)
+
+    def test_redis_backend_keeps_generation_with_bytes_keys(self):
+        class BytesKeyClient(LocalRedisClient):
+            """与 redis-py 默认行为一致：SCAN 返回 bytes 键"""
+
+            def scan_iter(self, match='*'):
+                return [name.encode() for name in super().scan_iter(match)]
+
+            def delete(self, *names):
+                return super().delete(*(n.decode() if isinstance(n, bytes) else n for n in names))
+
+        client = BytesKeyClient()
+        backend = RedisBackend(client, poll_seconds=0)
+        SharedCache.configure(backend)
+        try:
+            namespace = SharedCache.namespace('test_redis_bytes', ttl=60)
+            namespace.set('USD', 35.5)
+            namespace.clear()
+            namespace.clear()
+            assert backend.generation('test_redis_bytes') == 2
+            assert namespace.get('USD') is None
+            assert list(client.scan_iter('exchange:cache:test_redis_bytes:*')) == [
+                b'exchange:cache:test_redis_bytes:__generation__']
+        finally:
+            SharedCache.configure(None)
+
+    def test_currency_translations_reload_across_workers(self, file_cache, tmp_path, monkeypatch):
+        config = tmp_path / 'currency_translations.json'
+        config.write_text(json.dumps({'USD': {'th': 'ดอลลาร์สหรัฐ'}}), encoding='utf-8')
+        monkeypatch.setattr(CurrencyTranslationService, 'CONFIG_FILE_PATH', str(config))
+        CurrencyTranslationService.reload_config()
+        assert CurrencyTranslationService._get_from_config('USD', 'th') == 'ดอลลาร์สหรัฐ'
+
+        # 另一个工作进程修改配置并通知失效
+        config.write_text(json.dumps({'USD': {'th': 'ดอลลาร์'}}), encoding='utf-8')
+        assert CurrencyTranslationService._get_from_config('USD', 'th') == 'ดอลลาร์สหรัฐ'
+        run_worker(file_cache, "SharedCache.namespace('currency_translations', local=True).clear()")
+        assert CurrencyTranslationService._get_from_config('USD', 'th') == 'ดอลลาร์'
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+双向交易批量过账测试
+验证 execute_split_transaction 的余额、票据编号和业务组反结算兼容性
+
+运行方式：
+    pytest tests/backend/services/test_transaction_split_batch.py -v
+"""
+
+import os
+import sys
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../..', 'src'))
+
+from models.exchange_models import (
+    Base, Branch, Currency, CurrencyBalance, EODStatus, ExchangeTransaction, ReceiptSequence, VoidedReceiptNumber
+)
+from services import receipt_sequence_allocator, transaction_split_service
+from services.receipt_sequence_allocator import ReceiptSequenceAllocator
+from services.transaction_split_service import TransactionSplitService
+
+BASE_CURRENCY_ID = 1
+
+
+@pytest.fixture
+def Session(tmp_path, monkeypatch):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'split.db'}",
+        connect_args={'check_same_thread': False, 'timeout': 30}
+    )
+    Base.metadata.create_all(engine, tables=[
+        Branch.__table__, Currency.__table__, CurrencyBalance.__table__, ExchangeTransaction.__table__,
+        ReceiptSequence.__table__, VoidedReceiptNumber.__table__,
+        EODStatus.__table__  # 提交前重新检查营业锁定状态
+    ])
+    Session = sessionmaker(bind=engine, autoflush=False)
+    session = Session()
+    session.add(Branch(id=1, branch_name='Head Office', branch_code='A005'))
+    for currency_id, code in ((1, 'THB'), (2, 'USD'), (3, 'EUR')):
+        session.add(Currency(id=currency_id, currency_code=code, currency_name=code))
+    session.add_all([
+        CurrencyBalance(branch_id=1, currency_id=1, balance=Decimal('100000.00')),
+        CurrencyBalance(branch_id=1, currency_id=2, balance=Decimal('1000.00')),
+    ])
+    session.commit()
+    session.close()
+
+    monkeypatch.setattr(transaction_split_service.DatabaseService, 'get_session', staticmethod(Session))
+    monkeypatch.setattr(receipt_sequence_allocator.DatabaseService, 'get_session', staticmethod(Session))
+    ReceiptSequenceAllocator.invalidate_branch_code()
+    yield Session
+    ReceiptSequenceAllocator.invalidate_branch_code()
+    engine.dispose()
+
+
+def _balance(Session, currency_id):
+    session = Session()
+    try:
+        return Decimal(str(session.query(CurrencyBalance.balance).filter_by(
+            branch_id=1, currency_id=currency_id
+        ).scalar()))
+    finally:
+        session.close()
+
+
+def _execute(exchange_mode, combinations):
+    return TransactionSplitService.execute_split_transaction(
+        denomination_data={'combinations': combinations},
+        branch_id=1,
+        base_currency_id=BASE_CURRENCY_ID,
+        operator_id=1,
+        customer_info={'name': 'John Smith', 'id_number': 'P123'},
+        exchange_mode=exchange_mode
+    )
+
+
+class TestExecuteSplitTransactionBatch:
+    """测试批量过账"""
+
+    def test_basket_posts_balances_and_consecutive_receipts(self, Session):
+        result = _execute('buy_foreign', [
+            {'currency_id': 2, 'subtotal': 100, 'rate': 35},
+            {'currency_id': 2, 'subtotal': 200, 'rate': 35},
+            {'currency_id': 3, 'subtotal': 50, 'rate': 40},
+        ])
+
+        assert result['success'] is True
+        data = result['data']
+        assert data['transaction_count'] == 2
+
+        prefix = f"A005{date.today().strftime('%Y%m%d')}"
+        assert [t['transaction_no'] for t in data['transactions']] == [f"{prefix}0001", f"{prefix}0002"]
+
+        # 网点卖出外币：外币减少、本币增加；EUR 没有余额记录时新建
+        assert _balance(Session, 2) == Decimal('700.00')
+        assert _balance(Session, 3) == Decimal('-50.00')
+        assert _balance(Session, 1) == Decimal('100000.00') + 300 * 35 + 50 * 40
+
+        session = Session()
+        rows = session.query(ExchangeTransaction).order_by(ExchangeTransaction.group_sequence).all()
+        assert [r.business_group_id for r in rows] == [data['business_group_id']] * 2
+        assert [r.group_sequence for r in rows] == [1, 2]
+        assert (Decimal(str(rows[0].balance_before)), Decimal(str(rows[0].balance_after))) == \
+            (Decimal('1000.00'), Decimal('700.00'))
+        assert (Decimal(str(rows[1].balance_before)), Decimal(str(rows[1].balance_after))) == \
+            (Decimal('0'), Decimal('-50.00'))
+        session.close()
+
+    def test_reverse_business_group_restores_foreign_balances(self, Session):
+        data = _execute('sell_foreign', [
+            {'currency_id': 2, 'subtotal': 100, 'rate': 34},
+            {'currency_id': 3, 'subtotal': 20, 'rate': 39},
+        ])['data']
+
+        assert _balance(Session, 2) == Decimal('1100.00')
+        assert _balance(Session, 1) == Decimal('100000.00') - 100 * 34 - 20 * 39
+
+        reversal = TransactionSplitService.reverse_business_group(data['business_group_id'], operator_id=1)
+
+        assert reversal['success'] is True
+        assert reversal['data']['reversed_transaction_count'] == 2
+        assert _balance(Session, 2) == Decimal('1000.00')
+        assert _balance(Session, 3) == Decimal('0.00')
+        assert TransactionSplitService.get_business_group_transactions(data['business_group_id'])[0]['status'] == 'reversed'
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+合成数据生成工具测试
+验证生成的流水余额链、CurrencyBalance、日结验证与 eod_service 口径一致，以及按种子可重复生成
+
+运行方式：
+    pytest tests/backend/test_synthetic_data.py -v
+"""
+
+import os
+import sys
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../..', 'src'))
+
+from scripts.generate_synthetic_data import SyntheticDataGenerator, create_tables
+
+OPTIONS = dict(start_date=date(2024, 3, 1), days=6, branches=2, currencies=4, tellers=2, tx_per_day=60,
+               customers=50, reversal_rate=0.1, adjust_rate=1.0, diff_rate=0.2, batch=500, progress=None)
+
+
+def build(path, seed=7, reset=False):
+    engine = create_engine(f'sqlite:///{path}')
+    create_tables(engine)
+    generator = SyntheticDataGenerator(engine, seed=seed, **OPTIONS)
+    generator.prepare(reset=reset)
+    stats = generator.run()
+    return engine, generator, stats
+
+
+def _d(value):
+    return Decimal(str(value)).quantize(Decimal('0.01'))
+
+
+@pytest.fixture(scope='module')
+def dataset(tmp_path_factory):
+    engine, generator, stats = build(tmp_path_factory.mktemp('synthetic') / 'data.db')
+    yield engine, generator, stats
+    engine.dispose()
+
+
+class TestSyntheticData:
+    """测试合成数据"""
+
+    def test_ledger_chain_and_balances(self, dataset):
+        engine, generator, stats = dataset
+        with engine.connect() as conn:
+            rows = conn.execute(text(
+                'SELECT branch_id, currency_id, type, amount, local_amount, balance_before, balance_after, status '
+                'FROM exchange_transactions ORDER BY created_at, id')).all()
+            balances = {(b, c): _d(v) for b, c, v in conn.execute(text(
+                'SELECT branch_id, currency_id, balance FROM currency_balances'))}
+
+        assert {r.type for r in rows} == {'initial_balance', 'buy', 'sell', 'reversal', 'adjust_balance', 'Eod_diff'}
+        assert sum(r.type == 'reversal' for r in rows) == sum(r.status == 'reversed' for r in rows)
+        assert stats['eod_status'] == OPTIONS['days'] * OPTIONS['branches']
+        assert stats['BOT_BuyFX'] + stats['BOT_SellFX'] > 0 and stats['Reserved_Transaction'] > 0
+
+        running = defaultdict(Decimal)
+        for r in rows:
+            key = (r.branch_id, r.currency_id)
+            assert _d(r.balance_before) == running[key]
+            if r.currency_id == generator.base_id:
+                running[key] += _d(r.local_amount)
+            else:
+                running[key] += _d(r.amount)
+                running[(r.branch_id, generator.base_id)] += _d(r.local_amount)
+            assert _d(r.balance_after) == running[key]
+            assert running[key] >= 0
+        assert balances == dict(running)
+
+    def test_eod_verification_follows_eod_service_rules(self, dataset):
+        engine, generator, _ = dataset
+        with engine.connect() as conn:
+            eods = conn.execute(text(
+                'SELECT id, branch_id, started_at, completed_at FROM eod_status ORDER BY branch_id, completed_at'
+            )).all()
+            checked = mismatched = 0
+            previous = {}
+            for eod in eods:
+                verifications = conn.execute(text(
+                    'SELECT currency_id, opening_balance, theoretical_balance, actual_balance, is_match, difference '
+                    'FROM eod_balance_verification WHERE eod_status_id = :id'), {'id': eod.id}).all()
+                for v in verifications:
+                    key = (eod.branch_id, v.currency_id)
+                    if key in previous:
+                        opening, start = previous[key]
+                        window = 'created_at >= :start'
+                    else:
+                        # 首个日结：第一笔交易（期初余额）的金额为期初，之后开始统计
+                        first = conn.execute(text(
+                            'SELECT amount, local_amount, created_at FROM exchange_transactions '
+                            'WHERE branch_id = :b AND currency_id = :c ORDER BY created_at, id LIMIT 1'
+                        ), {'b': eod.branch_id, 'c': v.currency_id}).one()
+                        base = v.currency_id == generator.base_id
+                        opening = _d(first.local_amount if base else first.amount)
+                        start = first.created_at
+                        window = 'created_at > :start'
+                    if v.currency_id == generator.base_id:
+                        change_sql = 'SELECT COALESCE(SUM(local_amount), 0) FROM exchange_transactions WHERE branch_id = :b'
+                    else:
+                        change_sql = ('SELECT COALESCE(SUM(amount), 0) FROM exchange_transactions '
+                                      'WHERE branch_id = :b AND currency_id = :c')
+                    change = conn.execute(text(
+                        f"{change_sql} AND {window} AND created_at < :end "
+                        f"AND status IN ('completed', 'reversed') AND type != 'Eod_diff'"
+                    ), {'b': eod.branch_id, 'c': v.currency_id, 'start': start, 'end': eod.started_at}).scalar()
+
+                    assert _d(v.opening_balance) == opening
+                    assert _d(v.theoretical_balance) == opening + _d(change)
+                    assert _d(v.difference) == _d(v.theoretical_balance) - _d(v.actual_balance)
+                    assert bool(v.is_match) == (_d(v.difference) == 0)
+                    previous[key] = (_d(v.actual_balance), eod.completed_at)
+                    checked += 1
+                    mismatched += not v.is_match
+        assert checked == len(eods) * (OPTIONS['currencies'] + 1)
+        assert mismatched > 0
+
+    def test_deterministic_from_seed(self, dataset, tmp_path):
+        query = ('SELECT transaction_no, type, amount, local_amount, rate, customer_id, created_at, status '
+                 'FROM exchange_transactions ORDER BY id')
+        engine = dataset[0]
+        with engine.connect() as conn:
+            expected = conn.execute(text(query)).all()
+
+        same, _, _ = build(tmp_path / 'same.db')
+        other, _, _ = build(tmp_path / 'other.db', seed=8)
+        with same.connect() as conn:
+            assert conn.execute(text(query)).all() == expected
+        with other.connect() as conn:
+            assert conn.execute(text(query)).all() != expected
+
+        # 已有合成数据时需要 --reset；重置后重新生成的数据相同
+        generator = SyntheticDataGenerator(same, seed=7, **OPTIONS)
+        with pytest.raises(RuntimeError):
+            generator.prepare()
+        generator.prepare(reset=True)
+        generator.run()
+        with same.connect() as conn:
+            assert conn.execute(text(query)).all() == expected
+            assert conn.execute(text('SELECT COUNT(*) FROM eod_status')).scalar() == (
+                OPTIONS['days'] * OPTIONS['branches'])
+        same.dispose()
+        other.dispose()